@@ -0,0 +1,114 @@
+# -----------------------------------------------------------------------------
+# 压测: 人工审批队列
+#
+# 用与 phase3_human_in_the_loop.py 结构相同的图（假模型 + 只等待一段时间的假工具，不访问网络），
+# 让 N 个会话停在工具节点之前并入队，然后报告:
+#   - 入队吞吐量（运行到中断点 + 写入队列）；
+#   - 在数千条待审批记录中查询第一页 / 最后一页、统计数量的耗时（走 (status, created_at) 索引）；
+#   - 批量批准 / 拒绝全部记录的耗时；
+#   - 以不同并发度恢复所有会话的吞吐量。
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_approvals --threads 2000 --concurrency 1 16 --tool-latency 0.01
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import operator
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AnyMessage, HumanMessage
+from langchain_core.tools import tool
+from langgraph.graph import StateGraph
+from langgraph.prebuilt import ToolNode
+
+from src.chat.approvals import ApprovalQueue
+from src.chat.checkpointer import PooledSqliteSaver
+from src.chat.fakes import ToolCallingFakeChatModel
+
+
+class AgentState(TypedDict):
+    messages: Annotated[List[AnyMessage], operator.add]
+
+
+def build_app(saver, tool_latency: float):
+    @tool
+    def write_summary_to_file(query: str):
+        """假的文件写入工具: 只等待一段时间，模拟真实的 I/O。"""
+        time.sleep(tool_latency)
+        return "已保存"
+
+    llm = ToolCallingFakeChatModel(tool_name="write_summary_to_file").bind_tools([write_summary_to_file])
+    workflow = StateGraph(AgentState)
+    workflow.add_node("agent", lambda state: {"messages": [llm.invoke(state["messages"])]})
+    workflow.add_node("tools", ToolNode([write_summary_to_file]))
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", lambda state: "tools" if state["messages"][-1].tool_calls else "__end__")
+    workflow.add_edge("tools", "__end__")
+    return workflow.compile(checkpointer=saver, interrupt_before=["tools"])
+
+
+def timed(fn, *args, **kwargs):
+    begin = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - begin) * 1000
+
+
+def bench(args, concurrency: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = PooledSqliteSaver(os.path.join(tmp, "checkpoints.sqlite"))
+        app = build_app(saver, args.tool_latency)
+        queue = ApprovalQueue(saver.conn, lock=saver.lock)
+
+        def submit(i: int):
+            queue.submit(app, {"messages": [HumanMessage(content=f"summary-{i}.md")]}, {"configurable": {"thread_id": f"t{i}"}})
+
+        begin = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(submit, range(args.threads)))
+        submit_s = time.perf_counter() - begin
+
+        pending = queue.count()
+        _, first_page_ms = timed(queue.list, limit=50)
+        _, last_page_ms = timed(queue.list, limit=50, offset=pending - 50)
+        _, count_ms = timed(queue.count)
+        ids = [p.id for p in queue.list(limit=pending)]
+        # 每 10 个拒绝 1 个，其余批准。
+        _, approve_ms = timed(queue.approve, [i for i in ids if i % 10])
+        _, reject_ms = timed(queue.reject, [i for i in ids if not i % 10], "benchmark")
+
+        report = queue.resume(app, concurrency=concurrency)
+        saver.close()
+    return {
+        "threads": args.threads,
+        "pending": pending,
+        "submit_per_s": round(args.threads / submit_s, 1),
+        "list_first_page_ms": round(first_page_ms, 3),
+        "list_last_page_ms": round(last_page_ms, 3),
+        "count_ms": round(count_ms, 3),
+        "bulk_approve_ms": round(approve_ms, 3),
+        "bulk_reject_ms": round(reject_ms, 3),
+        "resume_concurrency": concurrency,
+        "resumed": len(report.resumed),
+        "rejected": len(report.rejected),
+        "failed": len(report.failed),
+        "resume_per_s": round(report.threads / report.elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="人工审批队列的吞吐量")
+    parser.add_argument("--threads", type=int, default=2000, help="停在中断点的会话数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16], help="恢复会话的并发度")
+    parser.add_argument("--tool-latency", type=float, default=0.01, help="假工具每次执行的耗时（秒）")
+    args = parser.parse_args()
+    for concurrency in args.concurrency:
+        print(json.dumps(bench(args, concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# -----------------------------------------------------------------------------
+# 压测: 多线程下检查点的写入和读取吞吐量
+#
+# N 个线程各自代表一个会话，交替执行 put（写入一个带消息历史的检查点）和
+# get_tuple（读取会话最新状态），报告总吞吐量和 put 在请求路径上的中位耗时，对比:
+#   - baseline:           SqliteSaver + 单个共享连接（旧做法，默认 synchronous=FULL）
+#   - pooled:             PooledSqliteSaver，WAL + 读连接池，同步提交
+#   - pooled-write-behind: PooledSqliteSaver，后写队列批量提交
+# 另外单独测量纯读场景（预先写好数据，只执行 get_tuple）。
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_checkpointer --threads 8 --ops 300 --durability normal
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from src.chat.checkpointer import DURABILITY_LEVELS, PooledSqliteSaver
+
+
+def make_saver(kind: str, path: str, durability: str, readers: int):
+    if kind == "baseline":
+        # 与旧代码完全相同: 默认的 synchronous=FULL，不受 --durability 影响。
+        return SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    return PooledSqliteSaver(path, readers=readers, durability=durability, write_behind=kind == "pooled-write-behind")
+
+
+def close_saver(saver):
+    if isinstance(saver, PooledSqliteSaver):
+        saver.close()
+    else:
+        saver.conn.close()
+
+
+def checkpoint_for(step: int):
+    checkpoint = create_checkpoint(empty_checkpoint(), {}, step)
+    checkpoint["channel_values"] = {
+        "messages": [HumanMessage(content="问题" * 20), AIMessage(content="回答" * 100)] * 5,
+    }
+    return checkpoint
+
+
+def run_threads(threads: int, target) -> float:
+    workers = [threading.Thread(target=target, args=(n,)) for n in range(threads)]
+    begin = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - begin
+
+
+def bench_mixed(kind, path, args) -> dict:
+    saver = make_saver(kind, path, args.durability, args.threads)
+    checkpoint = checkpoint_for(1)
+    put_latencies = []
+
+    def worker(n):
+        config = {"configurable": {"thread_id": f"thread-{n}", "checkpoint_ns": ""}}
+        for step in range(args.ops):
+            begin = time.perf_counter()
+            saver.put(config, {**checkpoint, "id": create_checkpoint(checkpoint, {}, step)["id"]}, {"step": step}, {})
+            # list.append 是线程安全的
+            put_latencies.append(time.perf_counter() - begin)
+            if step % args.read_every == 0:
+                saver.get_tuple({"configurable": {"thread_id": f"thread-{n}"}})
+
+    seconds = run_threads(args.threads, worker)
+    close_saver(saver)
+    return {
+        "kind": kind,
+        "mode": "mixed",
+        "puts_per_s": round(args.threads * args.ops / seconds),
+        # put 在请求路径上的耗时: 后写模式下只是入队。
+        "put_p50_ms": round(statistics.median(put_latencies) * 1000, 3),
+    }
+
+
+def bench_reads(kind, path, args) -> dict:
+    saver = make_saver(kind, path, args.durability, args.threads)
+
+    def worker(n):
+        config = {"configurable": {"thread_id": f"thread-{n}"}}
+        for _ in range(args.ops):
+            saver.get_tuple(config)
+
+    seconds = run_threads(args.threads, worker)
+    close_saver(saver)
+    return {"kind": kind, "mode": "read-only", "gets_per_s": round(args.threads * args.ops / seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多线程检查点写入/读取吞吐量")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=300, help="每个线程的 put 次数")
+    parser.add_argument("--read-every", type=int, default=1, help="每隔几次 put 执行一次 get_tuple")
+    parser.add_argument("--durability", choices=list(DURABILITY_LEVELS), default="normal")
+    args = parser.parse_args()
+
+    for kind in ("baseline", "pooled", "pooled-write-behind"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "checkpoints.sqlite")
+            print(json.dumps(bench_mixed(kind, path, args)))
+            print(json.dumps(bench_reads(kind, path, args)))
+
+
+if __name__ == "__main__":
+    main()
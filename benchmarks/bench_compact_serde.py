@@ -0,0 +1,165 @@
+# -----------------------------------------------------------------------------
+# 压测: 紧凑的检查点序列化
+#
+# 先录制一批对话: 用与 app.py 相同的聊天图（假模型 + 返回 Tavily 格式长结果的假搜索，不访问网络），
+# 每个会话进行若干轮“提问 → 搜索 → 回答”，检查点以默认格式写入数据库；
+# 也可以用 --db 指定已有的聊天数据库（例如 chat_history.sqlite）作为录制好的对话。
+#
+# 然后把录制的检查点按原顺序重放写入三种格式的数据库，报告每个检查点的平均字节数
+# （含正文表）、写入 (put) 和读取 (get_tuple) 的耗时，以及纯序列化 / 反序列化的耗时:
+#   - default:       默认的 JsonPlusSerializer (msgpack)
+#   - compact:       CompactSerializer (msgpack + zstd)
+#   - compact+blobs: CompactSerializer + 长消息正文按内容只存一份
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_compact_serde --threads 20 --turns 8
+#   python -m benchmarks.bench_compact_serde --db chat_history.sqlite
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest.mock import patch
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from src.chat.app import cached_search, get_compiled_app
+from src.chat.checkpointer import PooledSqliteSaver
+from src.chat.compact_serde import DEFAULT_BLOB_THRESHOLD, CompactSerializer, blob_stats
+from src.chat.fakes import ToolCallingFakeChatModel
+
+# 生成搜索结果正文用的词表: 随机组合，避免全是重复文本导致压缩率虚高。
+WORDS = (
+    "LangGraph 检查点 模型 会话 工具 搜索 结果 延迟 吞吐量 数据库 索引 事务 缓存 用户 问题 回答 "
+    "the of and to in agent state graph node edge stream token latency python sqlite search news report"
+).split()
+
+
+def fake_tavily(query: str) -> dict:
+    rng = random.Random(query)
+    return {
+        "query": query,
+        "results": [
+            {
+                "title": f"{query} - 来源 {i}",
+                "url": f"https://example.com/{abs(hash((query, i))) % 10**8}",
+                "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(150, 300))),
+                "score": round(rng.random(), 4),
+            }
+            for i in range(3)
+        ],
+    }
+
+
+def record(path: str, threads: int, turns: int):
+    """录制对话，检查点以默认格式写入 `path`。"""
+    app = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=path)
+    with patch.object(cached_search, "backend", fake_tavily), redirect_stdout(StringIO()):
+        for t in range(threads):
+            for turn in range(turns):
+                question = f"会话 {t} 的第 {turn} 个问题"
+                app.invoke({"messages": [HumanMessage(content=question)]}, {"configurable": {"thread_id": f"t{t}"}})
+    app.checkpointer.close()
+
+
+def load_recorded(path: str) -> list:
+    """按写入顺序读出全部检查点: [(config, checkpoint, metadata)]。"""
+    saver = PooledSqliteSaver(path)
+    tuples = sorted(saver.list(None), key=lambda t: (t.config["configurable"]["thread_id"], t.config["configurable"]["checkpoint_id"]))
+    saver.close()
+    entries = []
+    for t in tuples:
+        configurable = t.config["configurable"]
+        parent = t.parent_config["configurable"]["checkpoint_id"] if t.parent_config else None
+        config = {"configurable": {"thread_id": configurable["thread_id"], "checkpoint_ns": configurable["checkpoint_ns"], "checkpoint_id": parent}}
+        entries.append((config, t.checkpoint, t.metadata))
+    return entries
+
+
+def bench_format(name: str, entries: list, options: dict) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{name}.sqlite")
+        saver = PooledSqliteSaver(path, durability="off", **options)
+
+        begin = time.perf_counter()
+        for config, checkpoint, metadata in entries:
+            saver.put(config, checkpoint, metadata, {})
+        put_s = time.perf_counter() - begin
+
+        configs = [
+            {"configurable": {**config["configurable"], "checkpoint_id": checkpoint["id"]}}
+            for config, checkpoint, _ in entries
+        ]
+        begin = time.perf_counter()
+        for config in configs:
+            saver.get_tuple(config)
+        get_s = time.perf_counter() - begin
+
+        conn = sqlite3.connect(path)
+        (checkpoint_bytes,) = conn.execute("SELECT SUM(LENGTH(checkpoint)) FROM checkpoints").fetchone()
+        blobs = blob_stats(conn)
+        conn.close()
+        saver.close()
+    n = len(entries)
+    return {
+        "format": name,
+        "checkpoints": n,
+        "bytes_per_checkpoint": round((checkpoint_bytes + blobs["blob_bytes"]) / n, 1),
+        "blobs": blobs["blobs"],
+        "put_ms": round(put_s / n * 1000, 4),
+        "get_tuple_ms": round(get_s / n * 1000, 4),
+    }
+
+
+def bench_serde(name: str, serde, entries: list) -> dict:
+    checkpoints = [checkpoint for _, checkpoint, _ in entries]
+    begin = time.perf_counter()
+    payloads = [serde.dumps_typed(checkpoint) for checkpoint in checkpoints]
+    dumps_s = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for payload in payloads:
+        serde.loads_typed(payload)
+    loads_s = time.perf_counter() - begin
+    n = len(checkpoints)
+    return {
+        "serializer": name,
+        "bytes_per_checkpoint": round(sum(len(data) for _, data in payloads) / n, 1),
+        "dumps_us": round(dumps_s / n * 1e6, 1),
+        "loads_us": round(loads_s / n * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查点序列化格式的大小和耗时对比")
+    parser.add_argument("--db", help="已有的聊天数据库；为空时录制新的对话")
+    parser.add_argument("--threads", type=int, default=20, help="录制的会话数")
+    parser.add_argument("--turns", type=int, default=8, help="每个会话的轮数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            path = os.path.join(tmp, "recorded.sqlite")
+            record(path, args.threads, args.turns)
+        entries = load_recorded(path)
+
+    for name, serde in (("default", JsonPlusSerializer()), ("compact", CompactSerializer())):
+        print(json.dumps(bench_serde(name, serde, entries)))
+    formats = {
+        "default": {},
+        "compact": {"serde": CompactSerializer()},
+        "compact+blobs": {"serde": CompactSerializer(), "blob_threshold": DEFAULT_BLOB_THRESHOLD},
+    }
+    for name, options in formats.items():
+        print(json.dumps(bench_format(name, entries, options)))
+
+
+if __name__ == "__main__":
+    main()
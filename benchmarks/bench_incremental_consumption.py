@@ -0,0 +1,99 @@
+# -----------------------------------------------------------------------------
+# 压测: 增量消费 (updates) vs 全量重扫 (values)
+#
+# 预先向会话写入 1k ~ 10k 条历史消息，然后测量一轮对话中:
+#   - consumer_ms: 聊天循环处理流事件本身花费的时间
+#   - turn_ms:     整轮对话的总耗时（包括图的执行和检查点写入）
+#
+# values 模式下 consumer_ms 随历史长度线性增长；updates 模式下保持不变。
+# 注意 turn_ms 中还包含 SqliteSaver 写检查点的开销，它与历史长度相关，
+# 需要通过上下文裁剪或检查点压缩来解决，不属于本压测的范围。
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_incremental_consumption --sizes 1000 5000 10000
+# -----------------------------------------------------------------------------
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.chat.app import get_compiled_app
+from src.chat.fakes import FakeChatModel
+from src.chat.streaming import iter_new_messages
+
+
+def consume_values(chatapp, inputs, config) -> float:
+    """旧实现: 每个事件都重扫完整历史。返回消费者耗时。"""
+    consumer = 0.0
+    final_response = None
+    for event in chatapp.stream(inputs, config, stream_mode="values"):
+        start = time.perf_counter()
+        ai_messages = [msg for msg in event["messages"] if isinstance(msg, AIMessage)]
+        if ai_messages:
+            final_response = ai_messages[-1]
+        consumer += time.perf_counter() - start
+    assert final_response is not None
+    return consumer
+
+
+def consume_updates(chatapp, inputs, config) -> float:
+    """新实现: 只处理每一步新增的消息。返回消费者耗时。"""
+    consumer = 0.0
+    final_response = None
+    for update in chatapp.stream(inputs, config, stream_mode="updates"):
+        start = time.perf_counter()
+        for message in iter_new_messages(update):
+            if isinstance(message, AIMessage):
+                final_response = message
+        consumer += time.perf_counter() - start
+    assert final_response is not None
+    return consumer
+
+
+def seed_history(chatapp, config, size: int):
+    history = []
+    for i in range(size // 2):
+        history.append(HumanMessage(content=f"问题 {i}"))
+        history.append(AIMessage(content=f"回答 {i}"))
+    chatapp.update_state(config, {"messages": history}, as_node="agent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量消费 vs 全量重扫")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        chatapp = get_compiled_app(llm=FakeChatModel(), db_path=os.path.join(tmp, "bench.sqlite"))
+        for size in args.sizes:
+            for mode, consume in (("values", consume_values), ("updates", consume_updates)):
+                config = {"configurable": {"thread_id": f"{mode}-{size}"}}
+                consumer_samples, turn_samples = [], []
+                with contextlib.redirect_stdout(io.StringIO()):
+                    seed_history(chatapp, config, size)
+                    for turn in range(args.turns):
+                        start = time.perf_counter()
+                        consumer_samples.append(consume(chatapp, {"messages": [HumanMessage(content=f"新问题 {turn}")]}, config))
+                        turn_samples.append(time.perf_counter() - start)
+                print(json.dumps({
+                    "mode": mode,
+                    "history": size,
+                    "consumer_ms": round(statistics.median(consumer_samples) * 1000, 3),
+                    "turn_ms": round(statistics.median(turn_samples) * 1000, 1),
+                }))
+        chatapp.checkpointer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -----------------------------------------------------------------------------
+# 压测: 不调用 LLM 的预路由
+#
+# 用一组混合的用户输入（问候 / 致谢 / "/help" 命令 / FAQ 原题 / 分类器能识别的闲聊 / 需要模型的真正问题）
+# 模拟线上流量，分别在不开启和开启预路由 (PreRouter) 的聊天图上跑同样的轮次。
+# 假模型每次调用固定耗时 `--llm-latency` 秒（模拟 DeepSeek 的一次往返，不访问网络）。
+#
+# 报告:
+#   - 预路由直接回答的轮次比例（即省下的 LLM 调用比例）和各来源的命中次数；
+#   - 两种配置下每轮的端到端延迟（p50 / 平均）以及模型调用次数；
+#   - 开启预路由时，直接回答的轮次与交给模型的轮次的延迟对比。
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_prerouter --turns 400 --trivial-ratio 0.3
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from langchain_core.messages import HumanMessage
+
+from src.chat.app import get_compiled_app
+from src.chat.fakes import FakeChatModel
+from src.chat.prerouter import FAQIndex, NaiveBayesClassifier, PreRouter
+
+TRIVIAL = ["你好", "您好！", "hi", "Hello", "在吗？", "谢谢", "谢谢你！", "thanks", "/help", "再见"]
+FAQ = {
+    "怎么开始新的对话": "重新启动程序，在会话列表中输入 N 即可开始新的对话。",
+    "聊天记录保存在哪里": "聊天记录保存在当前目录的 chat_history.sqlite 中。",
+    "支持哪些模型": "默认使用 DeepSeek，也可以通过 CHAT_LLM_PROVIDERS 配置多个提供方。",
+}
+CHITCHAT_TRAIN = [
+    ("你是谁", "identity"), ("你叫什么名字", "identity"), ("你是什么模型", "identity"),
+    ("介绍一下你自己", "identity"), ("你是机器人吗", "identity"), ("你是人工智能吗", "identity"),
+]
+CHITCHAT = ["你是谁呀", "你叫什么", "你是机器人吧"]
+QUESTIONS = [
+    "今天有什么科技新闻", "LangGraph 的检查点怎么配置", "帮我查一下明天北京的天气", "Python 的 GIL 是什么",
+    "介绍一下 SQLite 的 WAL 模式", "DeepSeek 最新发布了什么模型", "最近的诺贝尔奖得主是谁", "怎么用 asyncio 并发请求",
+]
+
+
+def workload(turns: int, trivial_ratio: float, seed: int = 0) -> list:
+    """按比例生成输入: `trivial_ratio` 的轮次是可以直接回答的输入，其余是需要模型的真正问题。"""
+    rng = random.Random(seed)
+    trivial = TRIVIAL + list(FAQ) + CHITCHAT
+    return [rng.choice(trivial) if rng.random() < trivial_ratio else rng.choice(QUESTIONS) for _ in range(turns)]
+
+
+def make_prerouter() -> PreRouter:
+    training = CHITCHAT_TRAIN + [(q, "other") for q in QUESTIONS]
+    return PreRouter(
+        faq=FAQIndex(FAQ),
+        classifier=NaiveBayesClassifier().fit(training),
+        answers={"identity": "我是一个基于 LangGraph 的 AI 聊天助手。"},
+        min_confidence=0.8,
+    )
+
+
+def quantile(values, q: float) -> float:
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2) if values else 0.0
+
+
+def bench(inputs: list, llm_latency: float, prerouter) -> tuple:
+    llm = FakeChatModel(latency=llm_latency)
+    latencies = {"prerouter": [], "llm": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        chatapp = get_compiled_app(llm=llm, db_path=os.path.join(tmp, "chat.sqlite"), prerouter=prerouter)
+        with redirect_stdout(StringIO()):
+            for i, question in enumerate(inputs):
+                config = {"configurable": {"thread_id": f"t{i % 20}"}}
+                begin = time.perf_counter()
+                result = chatapp.invoke({"messages": [HumanMessage(content=question)]}, config)
+                elapsed = time.perf_counter() - begin
+                routed = "prerouter" in result["messages"][-1].response_metadata
+                latencies["prerouter" if routed else "llm"].append(elapsed)
+        chatapp.checkpointer.close()
+    all_latencies = latencies["prerouter"] + latencies["llm"]
+    report = {
+        "mode": "prerouter" if prerouter is not None else "baseline",
+        "turns": len(inputs),
+        "llm_calls": llm.calls,
+        "p50_ms": quantile(all_latencies, 0.5),
+        "mean_ms": round(statistics.mean(all_latencies) * 1000, 2),
+    }
+    return report, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预路由省下的 LLM 调用比例和延迟对比")
+    parser.add_argument("--turns", type=int, default=400, help="总轮数")
+    parser.add_argument("--trivial-ratio", type=float, default=0.3, help="可以直接回答的输入所占比例")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="假模型每次调用的耗时（秒）")
+    args = parser.parse_args()
+
+    inputs = workload(args.turns, args.trivial_ratio)
+    baseline, _ = bench(inputs, args.llm_latency, None)
+    print(json.dumps(baseline))
+
+    prerouter = make_prerouter()
+    routed, latencies = bench(inputs, args.llm_latency, prerouter)
+    stats = prerouter.stats()
+    routed.update({
+        "saved_rate": round(stats["saved_rate"], 4),
+        "routes": stats["routes"],
+        "prerouter_overhead_ms": round(stats["avg_overhead_ms"], 4),
+        "short_circuit_p50_ms": quantile(latencies["prerouter"], 0.5),
+        "llm_turn_p50_ms": quantile(latencies["llm"], 0.5),
+        "mean_saved_ms": round((baseline["mean_ms"] - statistics.mean(latencies["prerouter"] + latencies["llm"]) * 1000), 2),
+    })
+    print(json.dumps(routed, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
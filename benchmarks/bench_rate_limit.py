@@ -0,0 +1,117 @@
+# -----------------------------------------------------------------------------
+# 压测: 限流调度器
+#
+# 用一个每秒只接受 R 个请求的假上游（超出时返回 429，不访问网络）模拟 DeepSeek 的速率限制，
+# 同时发起在线聊天请求和批处理请求，对比:
+#   - 不限流: 每个请求直接调用上游，遇到 429 按指数退避重试；
+#   - 限流: 请求先经过 RateLimitScheduler 排队（在线聊天优先），再调用上游。
+# 报告上游实际收到的请求数、429 次数，以及在线请求和批处理请求的延迟分位数。
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_rate_limit --rps 50 --interactive 100 --batch 200
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.chat.rate_limit import ProviderLimit, RateLimitScheduler, TokenBucket
+
+
+class TooManyRequests(Exception):
+    pass
+
+
+class FakeUpstream:
+    """每秒最多接受 `rps` 个请求的假上游，每个请求耗时 `latency` 秒。"""
+
+    def __init__(self, rps: float, latency: float):
+        self.bucket = TokenBucket(rps, max(1.0, rps / 10), time.monotonic())
+        self.latency = latency
+        self.calls = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            now = time.monotonic()
+            if self.bucket.delay(1, now) > 0:
+                self.rejected += 1
+                raise TooManyRequests()
+            self.bucket.take(1, now)
+        time.sleep(self.latency)
+
+
+def call_with_retry(upstream: FakeUpstream, retries: int = 8):
+    for attempt in range(retries):
+        try:
+            return upstream()
+        except TooManyRequests:
+            time.sleep(0.05 * 2 ** attempt * random.random())
+    raise TooManyRequests()
+
+
+def quantile(values, q: float) -> float:
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1) if values else 0.0
+
+
+def bench(args, limited: bool) -> dict:
+    upstream = FakeUpstream(args.rps, args.latency)
+    scheduler = RateLimitScheduler({"llm": ProviderLimit(requests_per_s=args.rps, burst=max(1.0, args.rps / 10), timeout=None)})
+    latencies = {"interactive": [], "batch": []}
+    failures = 0
+
+    def request(i: int, priority: str):
+        nonlocal failures
+        begin = time.monotonic()
+        try:
+            if limited:
+                scheduler.acquire("llm", priority=priority, thread_id=f"{priority}-{i % 20}")
+            call_with_retry(upstream)
+        except TooManyRequests:
+            failures += 1
+            return
+        latencies[priority].append(time.monotonic() - begin)
+
+    jobs = [(i, "batch") for i in range(args.batch)] + [(i, "interactive") for i in range(args.interactive)]
+    begin = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.batch + args.interactive) as executor:
+        # 批处理请求先到，在线请求随后陆续到达。
+        for i, priority in jobs:
+            executor.submit(request, i, priority)
+            if priority == "interactive":
+                time.sleep(1 / args.rps)
+    elapsed = time.monotonic() - begin
+    scheduler.close()
+    return {
+        "mode": "scheduler" if limited else "retry",
+        "upstream_calls": upstream.calls,
+        "upstream_429": upstream.rejected,
+        "failed": failures,
+        "elapsed_s": round(elapsed, 2),
+        "interactive_p50_ms": quantile(latencies["interactive"], 0.5),
+        "interactive_p95_ms": quantile(latencies["interactive"], 0.95),
+        "batch_p50_ms": quantile(latencies["batch"], 0.5),
+        "batch_mean_ms": round(statistics.mean(latencies["batch"]) * 1000, 1) if latencies["batch"] else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="限流调度器与 429 重试的对比")
+    parser.add_argument("--rps", type=float, default=50, help="假上游每秒接受的请求数")
+    parser.add_argument("--latency", type=float, default=0.02, help="假上游每个请求的耗时（秒）")
+    parser.add_argument("--interactive", type=int, default=100, help="在线聊天请求数")
+    parser.add_argument("--batch", type=int, default=200, help="批处理请求数")
+    args = parser.parse_args()
+    for limited in (False, True):
+        print(json.dumps(bench(args, limited)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# -----------------------------------------------------------------------------
+# 压测: 检查点清理前后的数据库大小和 get_tuple 延迟
+#
+# 先用真实的 SqliteSaver 写入一个检查点作为模板，再直接用 SQL 批量复制出
+# 一个含有大量检查点的合成数据库（默认 1000 个会话 × 1000 个检查点 = 一百万个），
+# 然后执行 keep-last-N + 增量 VACUUM，比较前后的:
+#   - 数据库文件大小
+#   - SqliteSaver.get_tuple（读取会话最新状态）的延迟
+#
+# 运行方式 (在项目根目录，一百万个检查点需要几分钟和数百 MB 磁盘):
+#   python -m benchmarks.bench_retention --threads 1000 --per-thread 1000 --keep-last 10
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from src.chat.retention import CheckpointRetention, checkpoint_id_at
+
+
+def template_row(path: str):
+    """用真实的 SqliteSaver 写入一个检查点，返回 (type, checkpoint, metadata) 模板。"""
+    from langgraph.checkpoint.base import empty_checkpoint
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+    saver = SqliteSaver(conn)
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {
+        "messages": [HumanMessage(content="问题" * 20), AIMessage(content="回答" * 50)],
+    }
+    config = {"configurable": {"thread_id": "template", "checkpoint_ns": ""}}
+    saver.put(config, checkpoint, {"source": "loop", "step": 1}, {})
+    row = conn.execute("SELECT type, checkpoint, metadata FROM checkpoints").fetchone()
+    conn.execute("DELETE FROM checkpoints")
+    conn.commit()
+    conn.close()
+    return row
+
+
+def build_db(path: str, threads: int, per_thread: int):
+    type_, checkpoint, metadata = template_row(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    start = time.time() - threads * per_thread * 0.001
+
+    def rows():
+        tick = 0
+        for step in range(per_thread):
+            for t in range(threads):
+                tick += 1
+                yield (f"thread-{t}", "", checkpoint_id_at(start + tick * 0.001), None, type_, checkpoint, metadata)
+
+    conn.executemany(
+        "INSERT INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows(),
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure_get_tuple(path: str, threads: int, samples: int) -> float:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    saver = SqliteSaver(conn)
+    # 先预热一次，排除建表检查的开销。
+    saver.get_tuple({"configurable": {"thread_id": "thread-0"}})
+    timings = []
+    for _ in range(samples):
+        config = {"configurable": {"thread_id": f"thread-{random.randrange(threads)}"}}
+        begin = time.perf_counter()
+        assert saver.get_tuple(config) is not None
+        timings.append(time.perf_counter() - begin)
+    conn.close()
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查点清理前后的数据库大小和 get_tuple 延迟")
+    parser.add_argument("--threads", type=int, default=1000)
+    parser.add_argument("--per-thread", type=int, default=1000)
+    parser.add_argument("--keep-last", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoints.sqlite")
+        begin = time.perf_counter()
+        build_db(path, args.threads, args.per_thread)
+        print(json.dumps({"phase": "build", "checkpoints": args.threads * args.per_thread,
+                          "seconds": round(time.perf_counter() - begin, 1)}))
+
+        before = {"file_mb": round(os.path.getsize(path) / 2**20, 1),
+                  "get_tuple_ms": round(measure_get_tuple(path, args.threads, args.samples), 3)}
+
+        retention = CheckpointRetention(path)
+        begin = time.perf_counter()
+        report = retention.apply(keep_last=args.keep_last)
+        retention.close()
+        prune_seconds = time.perf_counter() - begin
+
+        after = {"file_mb": round(os.path.getsize(path) / 2**20, 1),
+                 "get_tuple_ms": round(measure_get_tuple(path, args.threads, args.samples), 3)}
+
+        print(json.dumps({"phase": "before", **before}))
+        print(json.dumps({"phase": "after", **after, "deleted": report.checkpoints_deleted,
+                          "prune_seconds": round(prune_seconds, 1)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# -----------------------------------------------------------------------------
+# 微基准: 每次新建 TavilySearch vs 共享 TavilyClient 的单次调用开销
+#
+# 两种方式都请求本地的桩服务器 (StubSearchServer)，服务器本身没有延迟，
+# 因此测得的时间几乎全部是客户端构造、建立连接和请求本身的开销。
+#   - before: 旧实现，每次调用 `TavilySearch(max_results=3).invoke(query)`
+#   - after:  新实现，复用 `TavilyClient` 的 keep-alive 连接池
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_search_client --calls 200
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from langchain_tavily import TavilySearch
+
+from src.chat.fakes import StubSearchServer
+from src.chat.search_client import TavilyClient
+
+
+def measure(call, calls: int) -> list:
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        call(f"问题 {i}")
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="搜索客户端单次调用开销")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    for mode in ("before", "after"):
+        with StubSearchServer() as server:
+            if mode == "before":
+                call = lambda q: TavilySearch(max_results=3, api_base_url=server.url).invoke(q)
+                samples = measure(call, args.calls)
+            else:
+                client = TavilyClient(base_url=server.url)
+                samples = measure(lambda q: client.search(q, max_results=3), args.calls)
+                client.close()
+            print(json.dumps({
+                "mode": mode,
+                "calls": args.calls,
+                "median_ms": round(statistics.median(samples) * 1000, 3),
+                "p95_ms": round(sorted(samples)[int(len(samples) * 0.95) - 1] * 1000, 3),
+                "tcp_connections": server.connections,
+            }))
+
+
+if __name__ == "__main__":
+    main()
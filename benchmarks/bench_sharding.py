@@ -0,0 +1,81 @@
+# -----------------------------------------------------------------------------
+# 压测: 按 thread_id 分片的多进程运行时
+#
+# C 个客户端线程各自代表一个会话，连续发送若干轮对话（假模型，不访问网络），报告每秒完成的轮数，对比:
+#   - single:     单进程，所有会话共用一个已编译的图和一个数据库（现在的做法）；
+#   - shards=N:   ShardedRuntime，N 个工作进程，每个进程使用自己的数据库分片。
+# 假模型的 `--latency` 模拟 LLM 等待（不占 CPU），图本身的执行和检查点提交占 CPU，
+# 分片的收益取决于机器的核数: 单核机器上多进程只会多出进程间通信的开销。
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_sharding --clients 32 --turns 10 --shards 1 2 4
+# -----------------------------------------------------------------------------
+
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.chat.fakes import FakeChatModel
+from src.chat.registry import close_apps, get_app
+from src.chat.sharding import ShardedRuntime
+from src.chat.streaming import final_reply
+
+
+def run_clients(invoke, clients: int, turns: int) -> float:
+    """C 个客户端各自在自己的会话中连续对话 `turns` 轮，返回每秒完成的轮数。"""
+    def client(i: int):
+        for turn in range(turns):
+            invoke(f"bench-{i}", f"问题 {turn}")
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client, range(clients)))
+    return clients * turns / (time.perf_counter() - begin)
+
+
+def bench_single(llm, path: str, args) -> dict:
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        chatapp = get_app(db_path=path, llm=llm)
+
+        def invoke(thread_id, content):
+            return final_reply(chatapp, {"messages": [HumanMessage(content=content)]}, {"configurable": {"thread_id": thread_id}})
+
+        throughput = run_clients(invoke, args.clients, args.turns)
+        close_apps()
+    return {"mode": "single", "turns_per_s": round(throughput, 1)}
+
+
+def bench_sharded(llm, path: str, shards: int, args) -> dict:
+    with ShardedRuntime(shards, db_path=path, app_options={"llm": llm}, threads_per_shard=args.clients) as runtime:
+        throughput = run_clients(runtime.invoke, args.clients, args.turns)
+    return {"mode": f"shards={shards}", "turns_per_s": round(throughput, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分片多进程运行时的吞吐量")
+    parser.add_argument("--clients", type=int, default=32, help="并发的客户端（会话）数")
+    parser.add_argument("--turns", type=int, default=10, help="每个客户端的对话轮数")
+    parser.add_argument("--latency", type=float, default=0.0, help="假模型每次调用的延迟（秒）")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    llm = FakeChatModel(responses=[AIMessage(content="好的")], latency=args.latency)
+    print(json.dumps({"cpus": os.cpu_count()}))
+    with tempfile.TemporaryDirectory() as tmp:
+        print(json.dumps(bench_single(llm, os.path.join(tmp, "single.sqlite"), args)))
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(json.dumps(bench_sharded(llm, os.path.join(tmp, "sharded.sqlite"), shards, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# -----------------------------------------------------------------------------
+# 压测: 流式输出的首字延迟 (time-to-first-token)
+#
+# 对比 main_loop 的两种输出方式下，用户看到第一个字之前需要等待多久:
+#   - values:   旧方式，整个图运行结束后一次性打印最终回复
+#   - messages: 新方式，逐 token 打印
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.bench_streaming_ttft --latency 0.3 --token-latency 0.02 --tokens 200
+# -----------------------------------------------------------------------------
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.chat.app import get_compiled_app
+from src.chat.fakes import FakeChatModel
+from src.chat.streaming import stream_reply
+
+
+def run_values_mode(chatapp, config) -> dict:
+    start = time.perf_counter()
+    for _ in chatapp.stream({"messages": [HumanMessage(content="你好")]}, config, stream_mode="values"):
+        pass
+    total = time.perf_counter() - start
+    # values 模式下，第一个字和最后一个字同时出现。
+    return {"ttft": total, "total": total}
+
+
+def run_messages_mode(chatapp, config) -> dict:
+    stats = stream_reply(chatapp, {"messages": [HumanMessage(content="你好")]}, config, out=io.StringIO())
+    return {"ttft": stats.time_to_first_token, "total": stats.total_latency}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式输出首字延迟压测")
+    parser.add_argument("--latency", type=float, default=0.3, help="首个 token 之前的模型延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="token 之间的间隔（秒）")
+    parser.add_argument("--tokens", type=int, default=100, help="回复长度（字符数）")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    reply = AIMessage(content="字" * args.tokens)
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, run in (("values", run_values_mode), ("messages", run_messages_mode)):
+            llm = FakeChatModel(responses=[reply], latency=args.latency, token_latency=args.token_latency)
+            chatapp = get_compiled_app(llm=llm, db_path=os.path.join(tmp, f"{mode}.sqlite"))
+            samples = []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(args.runs):
+                    samples.append(run(chatapp, {"configurable": {"thread_id": f"{mode}-{i}"}}))
+            chatapp.checkpointer.close()
+            print(json.dumps({
+                "mode": mode,
+                "ttft_ms": round(statistics.median(s["ttft"] for s in samples) * 1000, 1),
+                "total_ms": round(statistics.median(s["total"] for s in samples) * 1000, 1),
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# -----------------------------------------------------------------------------
+# 压测: HTTP / SSE 聊天服务
+#
+# 在本进程的后台线程中启动聊天服务（内置的最小 HTTP 服务器 + 假模型 + 假搜索，见 server.py），
+# 然后用 aiohttp 同时打开 N 个 SSE 流，每个流在自己的会话中发送若干条消息，报告:
+#   - 吞吐量（每秒完成的请求数）；
+#   - 整轮延迟和首个 token 延迟的 p50 / p99。
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.load_test_server --streams 200 --requests 2 --latency 0.2 --token-latency 0.01
+# -----------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+import aiohttp
+
+from src.chat.app import get_compiled_app
+from src.chat.asgi_server import serve_in_thread
+from src.chat.fakes import FakeChatModel
+from src.chat.server import ChatServer
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def stream_turn(session: aiohttp.ClientSession, base_url: str, thread_id: str, content: str) -> dict:
+    """发送一条消息并读完整个 SSE 流，返回 done 事件的内容以及客户端测得的延迟。"""
+    begin = time.perf_counter()
+    first_token = None
+    done = None
+    event = None
+    async with session.post(f"{base_url}/threads/{thread_id}/stream", json={"content": content}) as response:
+        response.raise_for_status()
+        async for raw in response.content:
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - begin
+                elif event == "done":
+                    done = json.loads(line[len("data: "):])
+                elif event == "error":
+                    raise RuntimeError(line)
+    return {"latency": time.perf_counter() - begin, "ttft": first_token, "done": done}
+
+
+async def run_load(base_url: str, streams: int, requests: int) -> dict:
+    # 客户端与服务端共用 CPU，压测客户端用 aiohttp: 上百个并发连接时 httpx 连接池本身的开销会明显拉高延迟。
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=streams),
+                                     timeout=aiohttp.ClientTimeout(total=120)) as session:
+        async def run_session(i: int):
+            async with session.post(f"{base_url}/threads") as response:
+                thread_id = (await response.json())["thread_id"]
+            return [await stream_turn(session, base_url, thread_id, f"问题 {i}-{turn}") for turn in range(requests)]
+
+        begin = time.perf_counter()
+        results = [r for rs in await asyncio.gather(*(run_session(i) for i in range(streams))) for r in rs]
+        elapsed = time.perf_counter() - begin
+    latencies = [r["latency"] for r in results]
+    ttfts = [r["ttft"] for r in results if r["ttft"] is not None]
+    return {
+        "streams": streams,
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(results) / elapsed, 2),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "latency_p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+        "ttft_p50_ms": round(statistics.median(ttfts) * 1000, 1) if ttfts else None,
+        "ttft_p99_ms": round(_percentile(ttfts, 0.99) * 1000, 1) if ttfts else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP / SSE 聊天服务压测")
+    parser.add_argument("--streams", type=int, default=200, help="并发的 SSE 流（会话）数")
+    parser.add_argument("--requests", type=int, default=2, help="每个会话发送的消息数")
+    parser.add_argument("--latency", type=float, default=0.2, help="假模型首个 token 之前的延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="假模型 token 之间的延迟（秒）")
+    parser.add_argument("--max-workers", type=int, default=256, help="服务端同时运行的对话轮数上限")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        llm = FakeChatModel(latency=args.latency, token_latency=args.token_latency)
+        chatapp = get_compiled_app(llm=llm, db_path=os.path.join(tmp, "server.sqlite"))
+        chat_server = ChatServer(chatapp, max_workers=args.max_workers)
+        with serve_in_thread(chat_server) as base_url:
+            report = asyncio.run(run_load(base_url, args.streams, args.requests))
+        chat_server.close()
+        chatapp.checkpointer.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# -----------------------------------------------------------------------------
+# 压测: 同步 vs 异步聊天应用的并发会话吞吐量
+#
+# 使用带固定延迟的假模型代替 DeepSeek，模拟 N 个会话各自进行若干轮对话，
+# 对比三种驱动方式:
+#   - sync-sequential: 与 main_loop 相同，一个进程一次只处理一个会话
+#   - sync-threads:    同步应用 + 线程池
+#   - async:           异步应用 + asyncio.gather
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.load_test_sessions --sessions 200 --turns 2 --latency 0.05
+# -----------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from langchain_core.messages import HumanMessage
+
+from src.chat.app import get_compiled_app
+from src.chat.async_app import async_chat_app
+from src.chat.async_main import chat_turn
+from src.chat.fakes import FakeChatModel
+
+
+def _run_sync_session(chatapp, session_id: str, turns: int):
+    config = {"configurable": {"thread_id": session_id}}
+    for turn in range(turns):
+        chatapp.invoke({"messages": [HumanMessage(content=f"问题 {turn}")]}, config)
+
+
+def bench_sync(sessions: int, turns: int, latency: float, workers: int, db_path: str) -> float:
+    chatapp = get_compiled_app(llm=FakeChatModel(latency=latency), db_path=db_path)
+    start = time.perf_counter()
+    if workers <= 1:
+        for i in range(sessions):
+            _run_sync_session(chatapp, f"sync-{i}", turns)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda i: _run_sync_session(chatapp, f"sync-{workers}-{i}", turns), range(sessions)))
+    elapsed = time.perf_counter() - start
+    chatapp.checkpointer.close()
+    return elapsed
+
+
+async def _bench_async(sessions: int, turns: int, latency: float, db_path: str) -> float:
+    async with async_chat_app(llm=FakeChatModel(latency=latency), db_path=db_path) as chatapp:
+        async def run_session(session_id: str):
+            for turn in range(turns):
+                await chat_turn(chatapp, session_id, f"问题 {turn}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(f"async-{i}") for i in range(sessions)))
+        return time.perf_counter() - start
+
+
+def bench_async(sessions: int, turns: int, latency: float, db_path: str) -> float:
+    return asyncio.run(_bench_async(sessions, turns, latency, db_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步 vs 异步聊天应用并发会话压测")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.05, help="假模型每次调用的延迟（秒）")
+    parser.add_argument("--threads", type=int, default=16, help="sync-threads 模式的线程数")
+    args = parser.parse_args()
+
+    # 节点中的 print 语句会淹没压测结果，因此每次运行都通过 _quiet 屏蔽标准输出。
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [
+            ("sync-sequential", lambda db: bench_sync(args.sessions, args.turns, args.latency, 1, db)),
+            ("sync-threads", lambda db: bench_sync(args.sessions, args.turns, args.latency, args.threads, db)),
+            ("async", lambda db: bench_async(args.sessions, args.turns, args.latency, db)),
+        ]
+        for name, run in runs:
+            elapsed = _quiet(run, os.path.join(tmp, f"{name}.sqlite"))
+            total_turns = args.sessions * args.turns
+            results.append({
+                "mode": name,
+                "sessions": args.sessions,
+                "turns": total_turns,
+                "seconds": round(elapsed, 3),
+                "turns_per_second": round(total_turns / elapsed, 1),
+            })
+
+    for row in results:
+        print(json.dumps(row, ensure_ascii=False))
+
+
+def _quiet(func, *args):
+    """执行 func，同时屏蔽节点中的调试输出。"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+# -----------------------------------------------------------------------------
+# 离线基准测试套件
+#
+# 不需要 DeepSeek / Gemini / Tavily: LLM 使用脚本化的假模型，搜索使用带固定延迟的假后端。
+# 覆盖三个图:
+#   - workflow: 项目根目录 main.py 中的示例工作流
+#   - phase1:   src/phase1_simple_chatbot.py 中的简单问答机器人
+#   - chat:     聊天应用的 agent ⇄ tools 循环（带 SQLite 检查点）
+# 对每个图报告:
+#   - 每个节点的延迟（p50 / 平均值）和每次调用的执行次数；
+#   - 图本身在每个 super-step 上的额外开销（总耗时减去节点耗时，再除以 super-step 数）；
+#   - 检查点写入的耗时和次数（只有 chat 图带检查点）；
+#   - 不同并发度下的吞吐量（每秒完成的调用数）。
+# 结果写入 JSON；传入 --baseline 时与之前的结果比较，超过阈值的退化会让进程以 1 退出。
+#
+# 运行方式 (在项目根目录):
+#   python -m benchmarks.suite --output bench.json
+#   python -m benchmarks.suite --baseline bench.json --threshold 0.25
+# -----------------------------------------------------------------------------
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from unittest.mock import patch
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+
+from src.chat.app import cached_search, get_compiled_app
+from src.chat.fakes import FakeSearchBackend, ToolCallingFakeChatModel
+
+GRAPHS = ("workflow", "phase1", "chat")
+
+
+# --- 计时工具 ---
+class NodeTimer(BaseCallbackHandler):
+    """通过 LangChain 回调记录每个节点的耗时。节点的运行带有 `graph:step:N` 标签。"""
+
+    def __init__(self):
+        self._starts: Dict = {}
+        self._lock = threading.Lock()
+        self.records: List[tuple] = []
+
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+        if any(tag.startswith("graph:step:") for tag in tags or ()):
+            node = (metadata or {}).get("langgraph_node")
+            step = (metadata or {}).get("langgraph_step")
+            self._starts[run_id] = (node, step, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            node, step, began = start
+            with self._lock:
+                self.records.append((node, step, time.perf_counter() - began))
+
+    on_chain_error = on_chain_end
+
+    def reset(self):
+        self._starts.clear()
+        self.records = []
+
+
+class CheckpointTimer:
+    """包装检查点后端的 put / put_writes，累计写入耗时和次数。"""
+
+    def __init__(self, saver):
+        self.seconds = 0.0
+        self.writes = 0
+        self._lock = threading.Lock()
+        for name in ("put", "put_writes"):
+            setattr(saver, name, self._wrap(getattr(saver, name)))
+
+    def _wrap(self, method):
+        def timed(*args, **kwargs):
+            begin = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.seconds += time.perf_counter() - begin
+                    self.writes += 1
+        return timed
+
+    def reset(self):
+        self.seconds, self.writes = 0.0, 0
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽节点中的调试输出。"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 4)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# --- 场景 ---
+@dataclass
+class Scenario:
+    name: str
+    app: object
+    # make_input(i) 返回第 i 次调用的 (inputs, config)
+    make_input: Callable[[int], tuple]
+    checkpoints: Optional[CheckpointTimer] = None
+    cleanup: List[Callable] = field(default_factory=list)
+
+    def close(self):
+        for fn in self.cleanup:
+            fn()
+
+
+def load_demo_app(module_name: str):
+    """导入一个在模块级别编译图的示例脚本，返回其中的 `app`（导入时运行的演示输出会被屏蔽）。"""
+    with quiet():
+        module = importlib.import_module(module_name)
+    return module.app
+
+
+def build_scenario(name: str, args) -> Scenario:
+    if name == "workflow":
+        app = load_demo_app("main")
+        return Scenario(name, app, lambda i: ({"question": f"请介绍一下 LangGraph {i}" if i % 2 else f"你好 {i}", "next": "agent"}, {"recursion_limit": 5}))
+    if name == "phase1":
+        app = load_demo_app("src.phase1_simple_chatbot")
+        return Scenario(name, app, lambda i: ({"question": f"什么是 LangGraph {i}" if i % 2 else f"你好吗 {i}"}, {}))
+    if name == "chat":
+        tmp = tempfile.TemporaryDirectory()
+        backend = patch.object(cached_search, "backend", FakeSearchBackend(latency=args.tool_latency))
+        backend.start()
+        llm = ToolCallingFakeChatModel(latency=args.llm_latency)
+        app = get_compiled_app(llm=llm, db_path=os.path.join(tmp.name, "bench.sqlite"), write_behind=args.write_behind)
+        scenario = Scenario(
+            name,
+            app,
+            # 每次调用使用新的会话和不同的问题，避免命中搜索缓存。
+            lambda i: ({"messages": [HumanMessage(content=f"问题 {i}")]}, {"configurable": {"thread_id": f"bench-{i}"}}),
+            checkpoints=CheckpointTimer(app.checkpointer),
+        )
+        scenario.cleanup += [backend.stop, app.checkpointer.close, tmp.cleanup]
+        return scenario
+    raise ValueError(f"未知的图: {name}")
+
+
+# --- 测量 ---
+def measure_latency(scenario: Scenario, iterations: int, warmup: int = 3) -> dict:
+    timer = NodeTimer()
+    offset = 10_000_000  # 与吞吐量测试使用不同的输入编号
+    totals, node_times, overheads, steps = [], {}, [], []
+    checkpoint_ms, checkpoint_writes = [], []
+    for i in range(warmup + iterations):
+        inputs, config = scenario.make_input(offset + i)
+        timer.reset()
+        if scenario.checkpoints:
+            scenario.checkpoints.reset()
+        begin = time.perf_counter()
+        scenario.app.invoke(inputs, {**config, "callbacks": [timer]})
+        total = time.perf_counter() - begin
+        if i < warmup:
+            continue
+        totals.append(total)
+        per_node: Dict[str, List[float]] = {}
+        for node, _, seconds in timer.records:
+            per_node.setdefault(node, []).append(seconds)
+        for node, values in per_node.items():
+            node_times.setdefault(node, []).append(values)
+        n_steps = len({step for _, step, _ in timer.records}) or 1
+        steps.append(n_steps)
+        overheads.append((total - sum(seconds for _, _, seconds in timer.records)) / n_steps)
+        if scenario.checkpoints:
+            checkpoint_ms.append(scenario.checkpoints.seconds)
+            checkpoint_writes.append(scenario.checkpoints.writes)
+
+    result = {
+        "invoke_p50_ms": _ms(statistics.median(totals)),
+        "invoke_p95_ms": _ms(_percentile(totals, 0.95)),
+        "supersteps_per_invoke": round(statistics.mean(steps), 2),
+        "graph_overhead_per_step_ms": _ms(statistics.median(overheads)),
+        "nodes": {
+            node: {
+                "p50_ms": _ms(statistics.median([v for run in runs for v in run])),
+                "mean_ms": _ms(statistics.mean([v for run in runs for v in run])),
+                "calls_per_invoke": round(sum(len(run) for run in runs) / iterations, 2),
+            }
+            for node, runs in sorted(node_times.items())
+        },
+    }
+    if scenario.checkpoints:
+        result["checkpoint"] = {
+            "per_invoke_ms": _ms(statistics.median(checkpoint_ms)),
+            "per_write_ms": _ms(sum(checkpoint_ms) / max(sum(checkpoint_writes), 1)),
+            "writes_per_invoke": round(statistics.mean(checkpoint_writes), 2),
+        }
+    return result
+
+
+def measure_throughput(scenario: Scenario, concurrency: int, invocations: int) -> float:
+    """用 `concurrency` 个线程完成 `invocations` 次调用，返回每秒完成的调用数。"""
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: scenario.app.invoke(*scenario.make_input(i)), range(invocations)))
+    return round(invocations / (time.perf_counter() - begin), 2)
+
+
+def run_suite(args) -> dict:
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {
+                "iterations": args.iterations,
+                "concurrency": args.concurrency,
+                "invocations": args.invocations,
+                "llm_latency": args.llm_latency,
+                "tool_latency": args.tool_latency,
+                "write_behind": args.write_behind,
+            },
+        },
+        "graphs": {},
+    }
+    for name in args.graphs:
+        scenario = build_scenario(name, args)
+        try:
+            with quiet():
+                graph = measure_latency(scenario, args.iterations)
+                graph["throughput"] = {
+                    str(c): measure_throughput(scenario, c, max(args.invocations, c)) for c in args.concurrency
+                }
+        finally:
+            scenario.close()
+        results["graphs"][name] = graph
+    return results
+
+
+# --- 回归检查 ---
+def flatten(results: dict) -> Dict[str, float]:
+    """把结果展开为 {"graphs.chat.nodes.agent.p50_ms": 1.2, ...}。"""
+    flat = {}
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, inner in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, inner)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix] = value
+
+    walk("", results.get("graphs", {}))
+    return flat
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25, min_delta_ms: float = 0.05) -> List[dict]:
+    """返回超过阈值的退化: 延迟 (`*_ms`) 变大或吞吐量 (`throughput.*`) 变小超过 `threshold`（相对值）。
+
+    延迟的绝对变化小于 `min_delta_ms` 时忽略，避免亚毫秒级指标的噪声触发误报。
+    结构性指标（每次调用的节点次数、super-step 数、写入次数）不参与比较。
+    """
+    regressions = []
+    now, before = flatten(current), flatten(baseline)
+    for metric, old in before.items():
+        new = now.get(metric)
+        if new is None or old <= 0:
+            continue
+        if ".throughput." in f".{metric}":
+            change = (old - new) / old
+        elif metric.endswith("_ms"):
+            if new - old < min_delta_ms:
+                continue
+            change = (new - old) / old
+        else:
+            continue
+        if change > threshold:
+            regressions.append({"metric": metric, "baseline": old, "current": new, "change": round(change, 3)})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="离线基准测试套件（假模型 + 假搜索）")
+    parser.add_argument("--graphs", nargs="+", choices=GRAPHS, default=list(GRAPHS))
+    parser.add_argument("--iterations", type=int, default=50, help="测量延迟的调用次数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="测量吞吐量的并发度")
+    parser.add_argument("--invocations", type=int, default=200, help="每个并发度下的调用次数")
+    parser.add_argument("--llm-latency", type=float, default=0.005, help="假模型每次调用的延迟（秒）")
+    parser.add_argument("--tool-latency", type=float, default=0.005, help="假搜索每次调用的延迟（秒）")
+    parser.add_argument("--write-behind", action="store_true", help="chat 图的检查点使用后写队列")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的相对退化（默认 25%%）")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="忽略小于该值的延迟变化（毫秒）")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args)
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for r in regressions:
+            print(f"退化: {r['metric']} {r['baseline']} -> {r['current']} ({r['change']:+.0%})", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"没有超过 {args.threshold:.0%} 的退化。", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
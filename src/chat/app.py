@@ -8,20 +8,23 @@
 
 # --- 核心库导入 ---
 # Python 标准库
-import os
-from dotenv import load_dotenv
 import operator
-import sqlite3
-from typing import TypedDict, Annotated, List
+from typing import TypedDict, Annotated, List, NotRequired
 
 # LangChain & LangGraph 库
 from langchain_core.messages import AnyMessage, HumanMessage, AIMessage, ToolMessage
-from langchain_core.tools import tool
-from langchain_tavily import TavilySearch
-from langchain_deepseek import ChatDeepSeek
+from langchain_core.tools import StructuredTool, tool
 from langgraph.graph import StateGraph
-from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.sqlite import SqliteSaver
+
+from .cache import CachedSearch, MemoryCache, SqliteCache, TieredCache
+from .checkpointer import PooledCatalogSqliteSaver
+from .compact_serde import compact_options
+from .context import make_context_manager
+from .llm_cache import coalesce
+from .llm_router import configured_providers, router_from_env
+from .prerouter import add_prerouter
+from .providers import ChatDeepSeek, require_env
+from .tool_executor import ParallelToolNode
 
 # --- Python 语法详解: `import` ---
 # `import` 语句用于将其他 Python 文件（称为模块）中的代码引入到当前文件中。
@@ -32,30 +35,45 @@ from langgraph.checkpoint.sqlite import SqliteSaver
 # --- 步骤 1: 设置 API Keys ---
 # 最佳实践是从操作系统的环境变量中读取敏感信息，而不是将它们硬编码在代码里。
 # `os.getenv("KEY_NAME")` 会安全地读取环境变量。如果不存在，它会返回 None。
-# 为了方便运行，如果环境变量不存在，我们在此处提供一个备用的假 Key，但这会导致程序在调用 API 时失败。
-# 请确保您已经在您的环境中正确设置了这些环境变量。
-load_dotenv()
-
-# 从环境变量中获取 API Key，如果未设置则抛出异常
-if not os.getenv("DEEPSEEK_API_KEY"):
-    raise ValueError("DEEPSEEK_API_KEY not set")
-if not os.getenv("TAVILY_API_KEY"):
-    raise ValueError("TAVILY_API_KEY not set")
+# 请确保您已经在您的环境中（或 .env 文件中）正确设置了这些环境变量。
+# API Key 在构建应用时（`get_compiled_app`）才检查，而不是在导入本模块时，
+# 这样命令行启动、测试收集等只导入模块的场景不需要任何 Key。
+# DeepSeek 等模型提供方的库也是在第一次使用时才导入（见 providers.py）。
+REQUIRED_ENV = ("DEEPSEEK_API_KEY", "TAVILY_API_KEY")
 
 
 # --- 步骤 2: 定义 Agent 可以使用的工具 (Tools) ---
 # "工具"是 Agent 可以执行的特殊函数，用来与外部世界交互（如搜索、读文件等）。
-@tool
-def search_tool(query: str):
-    """当需要回答关于最新事件、人物或具体事实的问题时，使用此工具进行网页搜索。"""
-    # --- Python 语法详解: `@tool` 装饰器 ---
-    # 这是一个“装饰器”。装饰器是一个函数，它接收另一个函数作为输入，并返回一个新的函数，
-    # 通常用于在不修改原函数代码的情况下增加额外功能。
-    # LangChain 的 `@tool` 装饰器会自动将这个 Python 函数转换成一个 LLM 可以理解和调用的“工具”对象。
-    # 它会自动解析函数名、文档字符串（作为工具描述）和参数类型。
+
+def get_search_client():
+    """返回共享的 Tavily 客户端。search_client（以及 httpx）在第一次搜索时才导入。"""
+    from .search_client import get_search_client as _get_search_client
+
+    return _get_search_client()
+
+def tavily_search(query: str):
+    """直接调用 Tavily 搜索，不经过缓存。
+
+    使用进程内共享的客户端（见 search_client.py），多次搜索复用同一个 HTTP 连接池。
+    """
+    return get_search_client().search(query, max_results=3)
+
+# 搜索缓存: 同一个问题（忽略大小写和多余空白）在有效期内只真正搜索一次，
+# 无论是同一会话内重复提问，还是不同用户问了同样的问题。
+# 默认只有进程内缓存；调用 `configure_search_cache(db_path=...)` 可以开启磁盘缓存。
+cached_search = CachedSearch(tavily_search, namespace="tavily:max_results=3", provider="tavily")
+
+def configure_search_cache(maxsize: int = 1024, ttl: float = 3600, db_path: str | None = None):
+    """重新配置搜索缓存的容量、有效期（秒）以及可选的 SQLite 磁盘缓存路径。"""
+    disk = SqliteCache(db_path, ttl=ttl, table="search_cache") if db_path else None
+    cached_search.cache = TieredCache(MemoryCache(maxsize=maxsize, ttl=ttl), disk)
+    return cached_search
+
+def _search(query: str, scheduler=None):
+    """search_tool 的实现。`scheduler` 是这个应用的限流调度器（见 `make_search_tool`），为空时不限流。"""
     print(f"---TOOL: 正在执行搜索，查询: '{query}'---")
     try:
-        search_results = TavilySearch(max_results=3).invoke(query)
+        search_results = cached_search(query, scheduler=scheduler)
         return search_results
     except Exception as e:
         # --- Python 语法详解: `try...except` ---
@@ -65,6 +83,31 @@ def search_tool(query: str):
         # 这使得我们的工具更加健壮。
         return f"搜索时发生错误: {e}"
 
+@tool
+def search_tool(query: str):
+    """当需要回答关于最新事件、人物或具体事实的问题时，使用此工具进行网页搜索。"""
+    # --- Python 语法详解: `@tool` 装饰器 ---
+    # 这是一个“装饰器”。装饰器是一个函数，它接收另一个函数作为输入，并返回一个新的函数，
+    # 通常用于在不修改原函数代码的情况下增加额外功能。
+    # LangChain 的 `@tool` 装饰器会自动将这个 Python 函数转换成一个 LLM 可以理解和调用的“工具”对象。
+    # 它会自动解析函数名、文档字符串（作为工具描述）和参数类型。
+    return _search(query)
+
+def make_search_tool(scheduler=None):
+    """返回一个应用专用的搜索工具: 未命中缓存、真正发往 Tavily 的搜索经过 `scheduler` 限流（见 rate_limit.py）。
+
+    名称、描述和参数与 `search_tool` 完全相同，LLM 看到的工具定义不变；搜索缓存仍然由所有应用共享。
+    `scheduler` 为空或没有配置 "tavily" 的配额时直接返回 `search_tool`。
+    """
+    if scheduler is None or cached_search.provider not in scheduler.limits:
+        return search_tool
+    return StructuredTool.from_function(
+        func=lambda query: _search(query, scheduler),
+        name=search_tool.name,
+        description=search_tool.description,
+        args_schema=search_tool.args_schema,
+    )
+
 # 将所有我们希望 Agent 使用的工具放入一个列表中。
 tools = [search_tool]
 
@@ -82,6 +125,11 @@ class AgentState(TypedDict):
     #             当更新 `messages` 字段时，不要用新列表“替换”旧列表，
     #             而是应该用 `operator.add`（等同于 `+`）将新消息“追加”到旧列表的末尾。
     #             这是实现对话历史累积的关键。
+    # 以下两个字段只在 context_strategy="summarize" 时使用（见 context.py）:
+    # `summary` 是早期对话的滚动总结，`summary_index` 是已被总结的消息数量。
+    # `NotRequired` 表示状态中可以没有这个键。
+    summary: NotRequired[str]
+    summary_index: NotRequired[int]
 
 
 # --- 步骤 4: 定义图的节点 (Nodes) 和边 (Edges) ---
@@ -101,7 +149,9 @@ def agent_node(state: AgentState):
 # 节点 2: Tool 节点 (手臂)
 # 这个节点负责执行 Agent 请求的工具调用。
 # LangGraph 提供了预构建的 `ToolNode`，它会自动处理工具的解析和执行，非常方便。
-tool_node = ToolNode(tools)
+# 这里使用我们自己的 `ParallelToolNode`（见 tool_executor.py），它与 `ToolNode` 的输入输出相同，
+# 另外支持并发执行同一批次的多个工具调用，并为每个工具设置超时。
+tool_node = ParallelToolNode(tools)
 
 # 边: 条件路由 (决策中心)
 # 这条边决定了在 Agent 思考之后，流程应该走向何方。
@@ -122,28 +172,106 @@ def router(state: AgentState) -> str:
         return "__end__" # 返回特殊字符串 `__end__`，告诉图这个流程分支结束了。
 
 
-def get_compiled_app():
-    """构建并返回带持久化的已编译 LangGraph 应用。"""
+def default_llm():
+    """创建默认的模型: 设置了 CHAT_LLM_PROVIDERS 时在多个提供方之间路由（见 llm_router.py），否则使用 DeepSeek。
+
+    使用真实的模型和搜索时，在这里（而不是导入时）检查 API Key。
+    """
+    if configured_providers():
+        require_env("TAVILY_API_KEY")
+        return router_from_env()
+    require_env(*REQUIRED_ENV)
+    return ChatDeepSeek(model="deepseek-chat", temperature=0)
+
+
+def wrap_llm(llm, tools=(), scheduler=None, llm_cache=None, llm_singleflight=None):
+    """给模型绑定工具（`tools` 为空时不绑定），再按需套上限流、缓存和合并请求，返回提供 `invoke` / `ainvoke` 的对象。"""
+    bound = llm.bind_tools(tools) if tools else llm
+    # 限流包在最里层: 缓存命中和被合并的请求不占配额。
+    if scheduler is not None:
+        bound = scheduler.wrap_model(llm, bound)
+    if llm_cache is not None:
+        bound = llm_cache.wrap(llm, tools, bound)
+    if llm_singleflight is not None:
+        bound = coalesce(llm_singleflight, llm, tools, bound)
+    return bound
+
+
+def get_compiled_app(
+    llm=None,
+    db_path: str = "chat_history.sqlite",
+    context_budget: int | None = None,
+    context_strategy: str = "trim",
+    tool_timeout: float | None = None,
+    llm_cache=None,
+    write_behind: bool = False,
+    checkpointer=None,
+    tracer=None,
+    llm_singleflight=None,
+    scheduler=None,
+    compact_checkpoints: bool = False,
+    prerouter=None,
+):
+    """构建并返回带持久化的已编译 LangGraph 应用。
+
+    每次调用都会重新构建和编译整个图，并打开新的数据库连接。
+    长期运行的进程请使用 registry.py 中的 `get_app()`，它对同一配置只编译一次。
+
+    `llm` 为空时使用 `default_llm()`（DeepSeek，或 CHAT_LLM_PROVIDERS 指定的多提供方路由）；测试和压测可以传入假模型。
+    `context_budget` 是发给 LLM 的提示的 token 上限，为空时发送完整历史；
+    `context_strategy` 可选 "trim"（丢弃早期消息）或 "summarize"（滚动总结早期消息）。
+    `tool_timeout` 是单个工具调用的超时时间（秒），为空时不限制。
+    `llm_cache` 是可选的 `LLMResponseCache`（见 llm_cache.py），相同的历史直接复用缓存的回复。
+    `write_behind` 为 True 时检查点由后台线程批量提交，不占用请求路径（见 checkpointer.py）。
+    `checkpointer` 不为空时直接使用它（此时忽略 `db_path`），由调用方负责关闭。
+    `tracer` 是可选的 `LocalTracer`（见 tracing.py），记录每次运行的节点耗时、token 用量、工具延迟和检查点写入耗时。
+    `llm_singleflight` 是可选的 `SingleFlight`（见 singleflight.py），多个会话同时发出相同的 LLM 请求时只调用一次模型。
+    `scheduler` 是可选的 `RateLimitScheduler`（见 rate_limit.py），按提供方的配额、优先级和 thread_id 公平地排队调用模型；
+    它配置了 "tavily" 的配额时，这个应用的搜索也经过它限流（见 `make_search_tool`）。
+    `compact_checkpoints` 为 True 时压缩检查点，并把长消息正文（例如搜索结果）按内容只存一份（见 compact_serde.py）；
+    已有的未压缩检查点仍然可以读取。它只作用于 `get_compiled_app` 自己打开的后端:
+    与 `checkpointer` 同时传入时抛出 ValueError（此时请用 `compact_options()` 创建后端）。
+    `prerouter` 是可选的 `PreRouter`（见 prerouter.py），在 `agent` 之前用规则、FAQ 和本地分类器直接回答
+    问候、/help、常见问题等简单输入，这些轮次不调用 LLM。
+    """
+    if checkpointer is not None and (compact_checkpoints or write_behind):
+        raise ValueError("传入 checkpointer 时不能再指定 compact_checkpoints / write_behind，请在创建检查点后端时设置")
+    context = make_context_manager(context_budget, context_strategy)
+
     # 初始化 LLM 并绑定工具
-    llm = ChatDeepSeek(model="deepseek-chat", temperature=0)
-    llm_with_tools = llm.bind_tools(tools)
+    if llm is None:
+        llm = default_llm()
+    # 每个应用使用自己的搜索工具: 限流调度器只作用于这个应用，不修改共享的 `cached_search`。
+    app_tools = [make_search_tool(scheduler)]
+    llm_with_tools = wrap_llm(llm, app_tools, scheduler, llm_cache, llm_singleflight)
+    # summarize 策略生成总结的调用同样经过限流、缓存和合并请求。
+    summarizer = wrap_llm(llm, (), scheduler, llm_cache, llm_singleflight) if context is not None else None
 
     # 节点 1: Agent 节点 (大脑)
     def agent_node(state: AgentState):
         """调用 LLM 来决定下一步行动。"""
         print("---AGENT: 思考中...---")
-        response = llm_with_tools.invoke(state['messages'])
-        return {"messages": [response]}
+        if context is None:
+            response = llm_with_tools.invoke(state['messages'])
+            return {"messages": [response]}
+        # 只把预算内的消息发给 LLM；summarize 策略还会返回新的总结，一并写回状态。
+        prompt, update = context.prepare(state, summarizer)
+        response = llm_with_tools.invoke(prompt)
+        return {"messages": [response], **update}
 
     # 初始化图状态
     workflow = StateGraph(AgentState)
 
     # 添加节点到图中
     workflow.add_node("agent", agent_node)
-    workflow.add_node("tools", tool_node)
+    metrics = tracer.metrics if tracer is not None else None
+    workflow.add_node("tools", ParallelToolNode(app_tools, timeout=tool_timeout, metrics=metrics))
 
-    # 设置图的入口点
-    workflow.set_entry_point("agent")
+    # 设置图的入口点: 开启预路由时先经过预路由节点，简单的输入在那里直接回答。
+    if prerouter is not None:
+        add_prerouter(workflow, prerouter)
+    else:
+        workflow.set_entry_point("agent")
 
     # 添加条件边
     workflow.add_conditional_edges("agent", router)
@@ -152,9 +280,16 @@ def get_compiled_app():
     workflow.add_edge("tools", "agent")
 
     # 设置持久化/记忆
-    conn = sqlite3.connect("chat_history.sqlite", check_same_thread=False)
-    memory = SqliteSaver(conn=conn)
+    # `PooledCatalogSqliteSaver` 使用 WAL + 读连接池 + 单写连接，
+    # 并在写入检查点的同时维护 `sessions` 会话目录表，列出历史会话时不必再扫描整张检查点表。
+    memory = checkpointer if checkpointer is not None else PooledCatalogSqliteSaver(
+        db_path, write_behind=write_behind, **compact_options(compact_checkpoints)
+    )
 
+    # 本地追踪: 包装检查点写入方法，并把追踪器作为默认回调绑定到图上，每次调用都会生效。
+    if tracer is not None:
+        tracer.instrument(memory)
+        return workflow.compile(checkpointer=memory).with_config(callbacks=[tracer])
     return workflow.compile(checkpointer=memory)
 
 if __name__ == "__main__":
@@ -0,0 +1,382 @@
+# -----------------------------------------------------------------------------
+# 非阻塞的人工审批队列 (Approval Queue)
+#
+# phase3 / phase4 的 `run_agent` 在 `interrupt_before=["tools"]` 处暂停后，
+# 用 `input()` 阻塞整个进程直到有人回答，一次只能审核一个待执行的工具调用。
+#
+# 这里把待审批的工具调用（`get_state(config).values["messages"][-1].tool_calls`）
+# 持久化到 `pending_approvals` 表中，运行图的一方写入后立即返回，不再等待:
+#   - `submit(app, inputs, config)`: 运行到中断点，把待执行的工具调用入队；
+#   - `list(...)` / `count(...)`: 按状态（以及会话、工具名）分页查询，(status, created_at) 有索引；
+#   - `approve(ids)` / `reject(ids, reason)`: 批量审批，一条 UPDATE 完成；
+#   - `resume(app, concurrency=8)`: 在线程池中并发恢复已经审批完的会话，每个会话完成后立即认领下一个；
+#   - `review(queue, app)`: phase3 / phase4 共用的命令行审批。
+#
+# 审批的单位是一个工具调用，恢复的单位是一个会话: 一个会话的全部工具调用都审批过后才会恢复。
+#   - 全部批准: 从中断点继续运行图，由工具节点执行这些调用；
+#   - 有任何一个被拒绝: 不执行任何调用，以工具节点的身份为每个调用写入一条说明结果的 ToolMessage，
+#     如果工具节点之后还有节点（例如回到 agent），继续运行，模型能看到操作被拒绝（以及原因）。
+# 恢复之后如果会话再次停在中断点，新的工具调用会自动入队。
+#
+# 状态流转: pending → decided（已批准或已拒绝）→ resuming → done / failed。
+# 认领为 resuming 时记录 `claimed_at`；进程在恢复途中退出时，超过 `lease` 秒仍是 resuming 的会话
+# 会在下一次 `resume` 时被重新认领。重新恢复前先检查会话是否还停在这些调用之前，已经恢复过的不会再执行一次。
+#
+# 队列表可以与检查点放在同一个数据库里:
+#   queue = ApprovalQueue(memory.conn, lock=memory.lock)
+# -----------------------------------------------------------------------------
+
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from langchain_core.messages import ToolMessage
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_approvals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    thread_id TEXT NOT NULL,
+    tool_call_id TEXT NOT NULL,
+    tool_name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    decision TEXT,
+    reason TEXT,
+    created_at REAL NOT NULL,
+    decided_at REAL,
+    claimed_at REAL,
+    UNIQUE (thread_id, tool_call_id)
+);
+CREATE INDEX IF NOT EXISTS pending_approvals_status ON pending_approvals (status, created_at);
+CREATE INDEX IF NOT EXISTS pending_approvals_thread ON pending_approvals (thread_id, status);
+"""
+
+_COLUMNS = "id, thread_id, tool_call_id, tool_name, args, status, decision, reason, created_at, decided_at"
+
+_TABLE_COLUMNS = "PRAGMA table_info(pending_approvals)"
+_ADD_CLAIMED_AT = "ALTER TABLE pending_approvals ADD COLUMN claimed_at REAL"
+
+_INSERT = """
+INSERT OR IGNORE INTO pending_approvals (thread_id, tool_call_id, tool_name, args, created_at)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+# 已经全部审批完（没有 pending 的调用）、还没有开始恢复的会话，按最早的审批时间排序。
+_READY_THREADS = """
+SELECT thread_id FROM pending_approvals d WHERE status = 'decided'
+AND NOT EXISTS (SELECT 1 FROM pending_approvals p WHERE p.thread_id = d.thread_id AND p.status = 'pending')
+GROUP BY thread_id ORDER BY MIN(decided_at) LIMIT ?
+"""
+
+# 认领后超过租约仍未完成的会话（恢复它的进程已经退出）放回 decided，可以被重新认领。
+_RECLAIM = """
+UPDATE pending_approvals SET status = 'decided', claimed_at = NULL
+WHERE status = 'resuming' AND (claimed_at IS NULL OR claimed_at < ?)
+"""
+
+# SQLite 一条语句中的参数个数有上限，批量操作按这个大小分批。
+_BATCH = 500
+
+# 批准的调用因为同一会话中有其他调用被拒绝而没有执行时，写给模型的说明。
+SKIPPED_MESSAGE = "未执行: 同一次请求中的其他工具调用被拒绝。"
+
+# 认领为 resuming 之后，超过这个秒数还没有完成的会话被认为恢复它的进程已经退出。
+DEFAULT_LEASE = 300.0
+
+
+@dataclass
+class PendingApproval:
+    """队列中的一个工具调用。"""
+
+    id: int
+    thread_id: str
+    tool_call_id: str
+    tool_name: str
+    args: dict
+    status: str
+    decision: Optional[str]
+    reason: Optional[str]
+    created_at: float
+    decided_at: Optional[float]
+
+    @property
+    def config(self) -> dict:
+        return {"configurable": {"thread_id": self.thread_id}}
+
+
+@dataclass
+class ResumeReport:
+    """一次 `resume` 的结果。"""
+
+    resumed: List[str] = field(default_factory=list)
+    rejected: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def threads(self) -> int:
+        return len(self.resumed) + len(self.rejected) + len(self.failed)
+
+
+def _row(row) -> PendingApproval:
+    values = list(row)
+    values[4] = json.loads(values[4])
+    return PendingApproval(*values)
+
+
+def _rejection(approval: PendingApproval) -> str:
+    if approval.decision != "rejected":
+        return SKIPPED_MESSAGE
+    return f"用户拒绝执行 {approval.tool_name}" + (f": {approval.reason}" if approval.reason else "")
+
+
+def _batches(ids: Iterable[int]) -> Iterable[List[int]]:
+    ids = list(ids)
+    for start in range(0, len(ids), _BATCH):
+        yield ids[start:start + _BATCH]
+
+
+class ApprovalQueue:
+    """读写 `pending_approvals` 表。可以与检查点共用同一个数据库连接（传入检查点的 `lock`）。
+
+    `lease` 是认领的租约（秒）: 超过这个时间仍是 resuming 的会话会被下一次 `resume` 重新认领，
+    应当比单个会话恢复所需的时间长得多。
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: Optional[threading.Lock] = None, lease: float = DEFAULT_LEASE):
+        self.conn = conn
+        self.lock = lock or threading.Lock()
+        self.lease = lease
+        with self.lock:
+            self.conn.executescript(_SCHEMA)
+            # 旧版本创建的表没有 claimed_at 列。
+            if "claimed_at" not in {row[1] for row in self.conn.execute(_TABLE_COLUMNS)}:
+                self.conn.execute(_ADD_CLAIMED_AT)
+                self.conn.commit()
+
+    # --- 入队 ---
+    def enqueue(self, app, config: dict) -> List[PendingApproval]:
+        """读取会话当前的状态，如果它停在中断点，把最后一条消息中的工具调用入队。
+
+        重复入队同一个调用不会产生新行。返回这个会话中仍在等待审批的调用。
+        """
+        state = app.get_state(config)
+        thread_id = config["configurable"]["thread_id"]
+        if not state.next:
+            return []
+        tool_calls = getattr(state.values["messages"][-1], "tool_calls", None) or []
+        now = time.time()
+        rows = [
+            (thread_id, call["id"], call["name"], json.dumps(call["args"], ensure_ascii=False), now)
+            for call in tool_calls
+        ]
+        with self.lock:
+            self.conn.executemany(_INSERT, rows)
+            self.conn.commit()
+        return self.list(thread_id=thread_id)
+
+    def submit(self, app, inputs, config: dict) -> List[PendingApproval]:
+        """运行图直到结束或中断点，把待执行的工具调用入队后立即返回，不等待审批。"""
+        app.invoke(inputs, config)
+        return self.enqueue(app, config)
+
+    # --- 查询 ---
+    def _where(self, status: Optional[str], thread_id: Optional[str], tool: Optional[str]):
+        clauses, params = [], []
+        for column, value in (("status", status), ("thread_id", thread_id), ("tool_name", tool)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def list(
+        self,
+        status: Optional[str] = "pending",
+        limit: int = 50,
+        offset: int = 0,
+        thread_id: Optional[str] = None,
+        tool: Optional[str] = None,
+    ) -> List[PendingApproval]:
+        """按入队时间分页列出工具调用。`status` 为 None 时列出所有状态。"""
+        where, params = self._where(status, thread_id, tool)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {_COLUMNS} FROM pending_approvals{where} ORDER BY created_at, id LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return [_row(row) for row in rows]
+
+    def count(self, status: Optional[str] = "pending", thread_id: Optional[str] = None, tool: Optional[str] = None) -> int:
+        where, params = self._where(status, thread_id, tool)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM pending_approvals{where}", params).fetchone()[0]
+
+    def get(self, approval_id: int) -> Optional[PendingApproval]:
+        with self.lock:
+            row = self.conn.execute(f"SELECT {_COLUMNS} FROM pending_approvals WHERE id = ?", (approval_id,)).fetchone()
+        return _row(row) if row else None
+
+    # --- 审批 ---
+    def _decide(self, ids: Iterable[int], decision: str, reason: Optional[str]) -> int:
+        now = time.time()
+        changed = 0
+        with self.lock:
+            for batch in _batches(ids):
+                marks = ",".join("?" * len(batch))
+                changed += self.conn.execute(
+                    "UPDATE pending_approvals SET status = 'decided', decision = ?, reason = ?, decided_at = ? "
+                    f"WHERE status = 'pending' AND id IN ({marks})",
+                    (decision, reason, now, *batch),
+                ).rowcount
+            self.conn.commit()
+        return changed
+
+    def approve(self, ids: Iterable[int]) -> int:
+        """批准一批工具调用，返回实际更新的数量（已经审批过的调用不受影响）。"""
+        return self._decide(ids, "approved", None)
+
+    def reject(self, ids: Iterable[int], reason: Optional[str] = None) -> int:
+        """拒绝一批工具调用，返回实际更新的数量。`reason` 会写进给模型的 ToolMessage。"""
+        return self._decide(ids, "rejected", reason)
+
+    # --- 恢复 ---
+    def _claim(self, limit: int) -> Dict[str, List[PendingApproval]]:
+        """把最多 `limit` 个已经审批完的会话标记为 resuming 并返回它们的调用，避免被重复恢复。
+
+        认领之前先收回租约已经过期的 resuming 会话。
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute(_RECLAIM, (now - self.lease,))
+            threads = [row[0] for row in self.conn.execute(_READY_THREADS, (limit,)).fetchall()]
+            if not threads:
+                return {}
+            marks = ",".join("?" * len(threads))
+            rows = self.conn.execute(
+                f"SELECT {_COLUMNS} FROM pending_approvals WHERE status = 'decided' AND thread_id IN ({marks}) ORDER BY id",
+                threads,
+            ).fetchall()
+            self.conn.execute(
+                "UPDATE pending_approvals SET status = 'resuming', claimed_at = ? "
+                f"WHERE status = 'decided' AND thread_id IN ({marks})",
+                (now, *threads),
+            )
+            self.conn.commit()
+        claimed: Dict[str, List[PendingApproval]] = {}
+        for row in rows:
+            approval = _row(row)
+            claimed.setdefault(approval.thread_id, []).append(approval)
+        return claimed
+
+    def _finish(self, approvals: List[PendingApproval], status: str, reason: Optional[str] = None):
+        ids = [a.id for a in approvals]
+        with self.lock:
+            for batch in _batches(ids):
+                marks = ",".join("?" * len(batch))
+                self.conn.execute(
+                    f"UPDATE pending_approvals SET status = ?, reason = COALESCE(?, reason) WHERE id IN ({marks})",
+                    (status, reason, *batch),
+                )
+            self.conn.commit()
+
+    def resume_thread(self, app, thread_id: str, approvals: List[PendingApproval]) -> bool:
+        """按审批结果恢复一个会话。返回 True 表示工具被执行，False 表示请求被拒绝。
+
+        会话已经不在这些调用之前（被重新认领、上一次恢复其实已经完成）时不再重复执行。
+        """
+        config = {"configurable": {"thread_id": thread_id}}
+        rejected = [a for a in approvals if a.decision == "rejected"]
+        if self._waiting_for(app, config, approvals):
+            if rejected:
+                messages = [ToolMessage(content=_rejection(a), tool_call_id=a.tool_call_id, name=a.tool_name) for a in approvals]
+                app.update_state(config, {"messages": messages}, as_node="tools")
+                # 工具节点之后还有节点（例如回到 agent）时继续运行，让模型回应被拒绝的请求。
+                if app.get_state(config).next:
+                    app.invoke(None, config)
+            else:
+                app.invoke(None, config)
+        self.enqueue(app, config)
+        return not rejected
+
+    @staticmethod
+    def _waiting_for(app, config: dict, approvals: List[PendingApproval]) -> bool:
+        """会话是否仍停在包含这些工具调用的中断点。"""
+        state = app.get_state(config)
+        if not state.next:
+            return False
+        tool_calls = getattr(state.values["messages"][-1], "tool_calls", None) or []
+        return {a.tool_call_id for a in approvals} <= {call["id"] for call in tool_calls}
+
+    def _run(self, app, thread_id: str, approvals: List[PendingApproval]):
+        try:
+            executed = self.resume_thread(app, thread_id, approvals)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            self._finish(approvals, "failed", error)
+            return thread_id, None, error
+        self._finish(approvals, "done")
+        return thread_id, executed, None
+
+    def resume(self, app, concurrency: int = 8, limit: Optional[int] = None) -> ResumeReport:
+        """并发恢复所有（或最多 `limit` 个）已经审批完的会话。单个会话出错不影响其他会话。
+
+        同时在途的会话不超过 `concurrency` 个，任何一个完成后立即记录结果并认领下一个，
+        慢的会话不会挡住其他会话；只认领马上能开始的会话，不会有会话在排队时耗掉租约。
+        """
+        report = ResumeReport()
+        begin = time.perf_counter()
+        workers = max(concurrency, 1)
+        remaining = limit
+        running = set()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="approvals") as executor:
+            while True:
+                free = workers - len(running)
+                if remaining is not None:
+                    free = min(free, remaining)
+                claimed = self._claim(free) if free > 0 else {}
+                for thread_id, approvals in claimed.items():
+                    running.add(executor.submit(self._run, app, thread_id, approvals))
+                if remaining is not None:
+                    remaining -= len(claimed)
+                if not running:
+                    break
+                # 等到第一个完成的会话就回去补位；其余已经完成的在下一轮立即返回。
+                for future in as_completed(running):
+                    running.discard(future)
+                    thread_id, executed, error = future.result()
+                    if error is not None:
+                        report.failed[thread_id] = error
+                    else:
+                        (report.resumed if executed else report.rejected).append(thread_id)
+                    break
+        report.elapsed = time.perf_counter() - begin
+        return report
+
+
+def review(queue: ApprovalQueue, app, ask: Callable[[str], str] = input, concurrency: int = 8) -> Optional[ResumeReport]:
+    """命令行审批: 列出所有待审批的工具调用，批量批准或拒绝，然后并发恢复已经审批完的会话。
+
+    `ask` 用于读取输入（默认 `input`）。没有待审批的调用时返回 None。
+    """
+    pending = queue.list(limit=1000)
+    if not pending:
+        print("没有待审批的操作。")
+        return None
+    for item in pending:
+        print(f"#{item.id} [{item.thread_id}] {item.tool_name}: {item.args}")
+
+    answer = ask("输入要批准的编号（空格或逗号分隔，'all' 表示全部），其余的将被拒绝: ").strip().lower()
+    if answer == "all":
+        chosen = {item.id for item in pending}
+    else:
+        chosen = {int(part) for part in answer.replace(",", " ").split() if part.isdigit()}
+    queue.approve([item.id for item in pending if item.id in chosen])
+    queue.reject([item.id for item in pending if item.id not in chosen])
+
+    report = queue.resume(app, concurrency=concurrency)
+    print(f"--- 已执行 {len(report.resumed)} 个会话，拒绝 {len(report.rejected)} 个，失败 {len(report.failed)} 个 ---")
+    return report
@@ -0,0 +1,245 @@
+# -----------------------------------------------------------------------------
+# 最小的 ASGI HTTP/1.1 服务器
+#
+# server.py 中的聊天服务是一个标准的 ASGI 应用，生产环境推荐用 uvicorn 运行:
+#   uvicorn src.chat.server:app --host 0.0.0.0 --port 8000
+# 项目的依赖里没有 uvicorn，这里提供一个只依赖 asyncio 的最小实现，用于本地运行和压测:
+#   - 支持 HTTP/1.1 keep-alive 和带 Content-Length 的请求体；
+#   - 格式错误的请求行或 Content-Length 返回 400，请求体超过 `max_body` 字节返回 413，然后关闭连接；
+#   - 响应没有 Content-Length 时使用分块传输编码 (chunked)，每次 `send` 立即写出，适合 SSE；
+#   - 不支持 HTTP/2、TLS、WebSocket 和 Expect: 100-continue。
+# -----------------------------------------------------------------------------
+
+import asyncio
+import contextlib
+import threading
+from typing import Iterator, Optional
+from urllib.parse import unquote
+
+_REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+            503: "Service Unavailable"}
+
+# 默认的请求体上限（字节）。聊天消息通常只有几 KB。
+MAX_BODY_BYTES = 1 << 20
+
+
+class _BadRequest(Exception):
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+def _content_length(header_map: dict, max_body: int) -> int:
+    try:
+        length = int(header_map.get(b"content-length", b"0"))
+    except ValueError:
+        raise _BadRequest(400)
+    if length < 0:
+        raise _BadRequest(400)
+    if length > max_body:
+        raise _BadRequest(413)
+    return length
+
+
+async def _reject(writer: asyncio.StreamWriter, status: int):
+    writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\ncontent-length: 0\r\nconnection: close\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+
+
+async def _handle_connection(app, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_body: int = MAX_BODY_BYTES):
+    server = writer.get_extra_info("sockname")
+    client = writer.get_extra_info("peername")
+    try:
+        while True:
+            try:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+                    raise _BadRequest(400)
+                method, target, _ = parts
+                headers = []
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers.append((name.strip().lower().encode("latin-1"), value.strip().encode("latin-1")))
+                header_map = dict(headers)
+                length = _content_length(header_map, max_body)
+            except ValueError:
+                # StreamReader.readline 在单行超过缓冲区上限时抛出 ValueError。
+                await _reject(writer, 400)
+                break
+            except _BadRequest as e:
+                # 请求体没有读取，连接上的后续数据已经无法解析，回复后直接关闭。
+                await _reject(writer, e.status)
+                break
+            body = await reader.readexactly(length) if length else b""
+            path, _, query = target.partition("?")
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0", "spec_version": "2.3"},
+                "http_version": "1.1",
+                "method": method.upper(),
+                "scheme": "http",
+                "path": unquote(path),
+                "raw_path": path.encode("latin-1"),
+                "query_string": query.encode("latin-1"),
+                "root_path": "",
+                "headers": headers,
+                "client": client[:2] if client else None,
+                "server": server[:2] if server else None,
+            }
+
+            request_sent = False
+            response_done = asyncio.Event()
+
+            async def receive():
+                nonlocal request_sent
+                if not request_sent:
+                    request_sent = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                # 请求体已经读完: 之后的 receive 一直等到响应结束，再报告断开。
+                await response_done.wait()
+                return {"type": "http.disconnect"}
+
+            chunked = response_started = False
+
+            async def send(message):
+                nonlocal chunked, response_started
+                if message["type"] == "http.response.start":
+                    response_started = True
+                    status = message["status"]
+                    response_headers = list(message.get("headers", []))
+                    if not any(name.lower() == b"content-length" for name, _ in response_headers):
+                        chunked = True
+                        response_headers.append((b"transfer-encoding", b"chunked"))
+                    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}\r\n".encode("latin-1")]
+                    lines += [name + b": " + value + b"\r\n" for name, value in response_headers]
+                    writer.write(b"".join(lines) + b"\r\n")
+                elif message["type"] == "http.response.body":
+                    data = message.get("body", b"")
+                    more = message.get("more_body", False)
+                    if chunked:
+                        if data:
+                            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        if not more:
+                            writer.write(b"0\r\n\r\n")
+                    elif data:
+                        writer.write(data)
+                    if not more:
+                        response_done.set()
+                    # 客户端断开时 drain 抛出 ConnectionError，应用随之停止发送。
+                    await writer.drain()
+
+            try:
+                await app(scope, receive, send)
+            except (ConnectionError, asyncio.CancelledError):
+                raise
+            except Exception:
+                # 应用出错: 还没有开始响应时返回 500，否则只能关闭连接。
+                if response_started:
+                    break
+                writer.write(b"HTTP/1.1 500 Internal Server Error\r\ncontent-length: 0\r\n\r\n")
+                await writer.drain()
+            finally:
+                response_done.set()
+            if header_map.get(b"connection", b"").lower() == b"close":
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+class _Lifespan:
+    """按 ASGI lifespan 协议通知应用启动和关闭。应用不支持 lifespan（抛出异常）时直接跳过。"""
+
+    def __init__(self, app):
+        self.app = app
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.completed: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        try:
+            await self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, self.messages.get, self.completed.put)
+        except Exception:
+            pass
+        finally:
+            # 应用退出后不会再回复任何事件，让等待中的 startup / shutdown 直接返回。
+            await self.completed.put(None)
+
+    async def _event(self, name: str):
+        await self.messages.put({"type": f"lifespan.{name}"})
+        waiter = asyncio.ensure_future(self.completed.get())
+        await asyncio.wait([waiter, self.task], return_when=asyncio.FIRST_COMPLETED)
+        if not waiter.done():
+            waiter.cancel()
+
+    async def startup(self):
+        self.task = asyncio.ensure_future(self._run())
+        await self._event("startup")
+
+    async def shutdown(self):
+        if not self.task.done():
+            await self._event("shutdown")
+
+
+async def serve(
+    app, host: str = "127.0.0.1", port: int = 8000, started: Optional[asyncio.Future] = None, max_body: int = MAX_BODY_BYTES
+):
+    """运行服务器直到被取消。`started` 不为空时，开始监听后把实际端口写入它（port=0 时由系统分配）。
+
+    `max_body` 是请求体的最大字节数，超过时返回 413。
+    """
+    lifespan = _Lifespan(app)
+    await lifespan.startup()
+    server = await asyncio.start_server(lambda r, w: _handle_connection(app, r, w, max_body), host, port, backlog=1024)
+    if started is not None:
+        started.set_result(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await lifespan.shutdown()
+
+
+@contextlib.contextmanager
+def serve_in_thread(app, host: str = "127.0.0.1", port: int = 0, max_body: int = MAX_BODY_BYTES) -> Iterator[str]:
+    """在后台线程的事件循环中运行服务器，返回它的地址（例如 "http://127.0.0.1:54321"），退出时关闭。
+
+    用于测试和压测，让客户端与服务器在同一个进程中运行。
+    """
+    loop = asyncio.new_event_loop()
+    started = loop.create_future()
+    task = loop.create_task(serve(app, host, port, started, max_body))
+
+    def run():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # 取消仍在处理的连接，再关闭事件循环。
+            pending = asyncio.all_tasks(loop)
+            for t in pending:
+                t.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+
+    async def wait_started():
+        return await started
+
+    thread = threading.Thread(target=run, name="asgi-server", daemon=True)
+    thread.start()
+    bound_port = asyncio.run_coroutine_threadsafe(wait_started(), loop).result(timeout=30)
+    try:
+        yield f"http://{host}:{bound_port}"
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(timeout=10)
@@ -0,0 +1,146 @@
+# -----------------------------------------------------------------------------
+# AI 聊天应用 - 异步版本
+#
+# 与 app.py 中的同步版本相比，这里的 LLM 调用、工具调用和检查点读写全部是异步的。
+# 一个进程内的事件循环可以同时服务成百上千个 thread_id：
+# 某个会话在等待 DeepSeek 或 Tavily 返回时，其他会话可以继续执行。
+# -----------------------------------------------------------------------------
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from langchain_core.tools import StructuredTool
+from langgraph.graph import StateGraph
+
+from .app import AgentState, cached_search, default_llm, get_search_client, make_search_tool, router, search_tool, wrap_llm
+from .compact_serde import compact_options
+from .context import make_context_manager
+from .prerouter import add_prerouter
+from .session_catalog import AsyncCatalogSqliteSaver
+from .tool_executor import ParallelToolNode
+
+
+# --- 异步工具 ---
+# `StructuredTool.from_function` 允许同时提供同步实现 `func` 和异步实现 `coroutine`。
+# 工具的名字和描述与同步版本保持一致，这样 LLM 看到的工具定义完全相同。
+async def _atavily_search(query: str):
+    return await get_search_client().asearch(query, max_results=3)
+
+async def _asearch(query: str, scheduler=None):
+    print(f"---TOOL: 正在执行异步搜索，查询: '{query}'---")
+    try:
+        # 与同步工具共享同一个缓存；未命中时才真正发起异步搜索。
+        return await cached_search.ainvoke(query, _atavily_search, scheduler=scheduler)
+    except Exception as e:
+        return f"搜索时发生错误: {e}"
+
+async_search_tool = StructuredTool.from_function(
+    func=search_tool.func,
+    coroutine=_asearch,
+    name=search_tool.name,
+    description=search_tool.description,
+)
+
+async_tools = [async_search_tool]
+
+
+def make_async_search_tool(scheduler=None):
+    """`make_search_tool` 的异步版本: 这个应用未命中缓存的搜索经过 `scheduler` 限流。"""
+    if scheduler is None or cached_search.provider not in scheduler.limits:
+        return async_search_tool
+    return StructuredTool.from_function(
+        func=make_search_tool(scheduler).func,
+        coroutine=lambda query: _asearch(query, scheduler),
+        name=search_tool.name,
+        description=search_tool.description,
+        args_schema=search_tool.args_schema,
+    )
+
+
+def build_async_workflow(
+    llm=None, tools=None, tool_timeout: float | None = None, llm_cache=None, llm_singleflight=None, scheduler=None,
+    prerouter=None, context_budget: int | None = None, context_strategy: str = "trim", metrics=None,
+) -> StateGraph:
+    """构建异步版本的 Agent 工作流（尚未编译）。参数含义与 `get_compiled_app` 相同。
+
+    `metrics` 是可选的 `Metrics`（见 tracing.py），工具节点用它导出工具耗时和超时指标。
+    """
+    context = make_context_manager(context_budget, context_strategy)
+    if llm is None:
+        llm = default_llm()
+    if tools is None:
+        # 每个应用使用自己的搜索工具，限流不影响共享的 `cached_search` 和其他应用。
+        tools = [make_async_search_tool(scheduler)]
+    llm_with_tools = wrap_llm(llm, tools, scheduler, llm_cache, llm_singleflight)
+    summarizer = wrap_llm(llm, (), scheduler, llm_cache, llm_singleflight) if context is not None else None
+
+    # `async def` 定义的节点会被 LangGraph 在事件循环中 await，
+    # 等待 LLM 返回期间不会阻塞其他会话。
+    async def agent_node(state: AgentState):
+        """异步调用 LLM 来决定下一步行动。"""
+        print("---AGENT: 思考中...---")
+        if context is None:
+            response = await llm_with_tools.ainvoke(state['messages'])
+            return {"messages": [response]}
+        # 与同步版本相同: 只把预算内的消息发给 LLM，summarize 策略的新总结一并写回状态。
+        prompt, update = await context.aprepare(state, summarizer)
+        response = await llm_with_tools.ainvoke(prompt)
+        return {"messages": [response], **update}
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("agent", agent_node)
+    # 同一批次的工具调用以 asyncio 任务并发执行，超时的调用会被真正取消。
+    workflow.add_node("tools", ParallelToolNode(tools, timeout=tool_timeout, metrics=metrics))
+    if prerouter is not None:
+        add_prerouter(workflow, prerouter)
+    else:
+        workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", router)
+    workflow.add_edge("tools", "agent")
+    return workflow
+
+
+async def get_async_compiled_app(
+    llm=None, db_path: str = "chat_history.sqlite", tools=None, tracer=None, compact_checkpoints: bool = False, **options
+):
+    """构建并返回带异步持久化的已编译 LangGraph 应用。
+
+    返回的应用只能通过 `ainvoke` / `astream` 调用。
+    `options` 会传给 `build_async_workflow`，例如 `context_budget`、`context_strategy`、`tool_timeout`、`llm_cache`、
+    `llm_singleflight`、`scheduler`、`prerouter`。
+    `tracer` 是可选的 `LocalTracer`（见 tracing.py）。
+    `compact_checkpoints` 与 `get_compiled_app` 相同（见 compact_serde.py）；不论是否开启，
+    都能读取同步应用以紧凑格式写入同一个数据库文件的检查点。
+    调用方负责在结束时执行 `await app.checkpointer.conn.close()`，
+    或者直接使用下面的 `async_chat_app` 上下文管理器。
+    """
+    conn = await aiosqlite.connect(db_path)
+    memory = AsyncCatalogSqliteSaver(conn, **compact_options(compact_checkpoints))
+    metrics = tracer.metrics if tracer is not None else None
+    chatapp = build_async_workflow(llm, tools, metrics=metrics, **options).compile(checkpointer=memory)
+    if tracer is not None:
+        tracer.instrument(memory)
+        chatapp = chatapp.with_config(callbacks=[tracer])
+    return chatapp
+
+
+@asynccontextmanager
+async def async_chat_app(llm=None, db_path: str = "chat_history.sqlite", tools=None, **options):
+    """以 `async with` 的方式获取异步应用，退出时自动关闭数据库连接。"""
+    chatapp = await get_async_compiled_app(llm, db_path, tools, **options)
+    try:
+        yield chatapp
+    finally:
+        await chatapp.checkpointer.conn.close()
+
+
+if __name__ == "__main__":
+    async def _smoke_test():
+        async with async_chat_app() as chatapp:
+            print("异步 AI 聊天应用已成功初始化！")
+            config = {"configurable": {"thread_id": "test-thread"}}
+            async for chunk in chatapp.astream(None, config=config):
+                print(chunk)
+
+    asyncio.run(_smoke_test())
@@ -0,0 +1,54 @@
+# -----------------------------------------------------------------------------
+# AI 聊天应用 - 异步交互主程序
+#
+# 使用 async_app.py 中的异步应用。`chat_turn` 可以被任意多个会话并发调用，
+# 命令行循环 `amain_loop` 只是它的一个简单使用者。
+# -----------------------------------------------------------------------------
+
+import asyncio
+import sys
+import uuid
+
+from langchain_core.messages import HumanMessage
+
+from .async_app import async_chat_app
+from .streaming import afinal_reply, astream_reply
+
+
+async def chat_turn(chatapp, session_id: str, user_input: str):
+    """在指定会话中执行一轮对话，返回 AI 的最终回复（可能为 None）。"""
+    config = {"configurable": {"thread_id": session_id}}
+    inputs = {"messages": [HumanMessage(content=user_input)]}
+    return await afinal_reply(chatapp, inputs, config)
+
+
+async def amain_loop(session_id: str | None = None):
+    """异步版本的主交互循环。"""
+    print("欢迎来到 LangGraph AI 聊天应用（异步版）！")
+    print("------------------------------------")
+    session_id = session_id or str(uuid.uuid4())
+    print(f"当前会话 ID: {session_id}")
+    print("输入 '/exit' 退出程序。")
+    print("------------------------------------")
+
+    config = {"configurable": {"thread_id": session_id}}
+    async with async_chat_app() as chatapp:
+        while True:
+            # `input()` 是阻塞调用，放到线程中执行，避免卡住事件循环。
+            user_input = await asyncio.to_thread(input, "You: ")
+            if user_input.lower() == '/exit':
+                print("感谢使用，再见！")
+                break
+            # 逐 token 打印回复，结束后显示首字延迟和总耗时。
+            print("AI: ", end="", flush=True)
+            inputs = {"messages": [HumanMessage(content=user_input)]}
+            stats = await astream_reply(chatapp, inputs, config)
+            print(f"({stats.summary()})")
+
+
+if __name__ == "__main__":
+    # 可选参数: 要继续的会话 ID，例如 `python -m src.chat.async_main <thread_id>`
+    try:
+        asyncio.run(amain_loop(sys.argv[1] if len(sys.argv) > 1 else None))
+    except KeyboardInterrupt:
+        print("\n检测到 Ctrl+C，程序退出。感谢使用！")
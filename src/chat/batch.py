@@ -0,0 +1,315 @@
+# -----------------------------------------------------------------------------
+# 批量运行器 (Batch Runner)
+#
+# 根目录 main.py 的示例工作流、phase1_simple_chatbot 和聊天 Agent 原本只能用写死的输入一次调用一次。
+# 本模块从 JSONL 文件流式读取问题，用有界的工作池并发运行，并把结果按完成顺序流式写入 JSONL:
+#   - 输入按需读取，同时在途的问题最多为并发度的两倍，内存占用与输入文件大小无关；
+#   - 每完成一个问题立即写出一行并 flush，输出文件本身就是进度检查点:
+#     进程崩溃后用同样的命令重新运行，已经写出的问题会被跳过（失败的问题默认也跳过，见 --retry-failed）；
+#     聊天图的问题在运行前先清空自己的会话 "batch-<id>"，崩溃时只写了一半的检查点不会让重跑的问题在历史里出现两次；
+#   - 无法解析的输入行不会中止整个运行，而是写出一行 ok 为 false 的结果（id 为行号）；
+#   - 默认使用线程池（LLM / 搜索等 I/O 密集的节点），`--processes` 改用进程池，
+#     每个子进程各自加载一次图，适合 CPU 密集的节点；
+#   - 运行期间定期报告进度，结束时报告总吞吐量。
+#
+# 输入每行一个 JSON 对象: {"id": "q1", "question": "..."}，id 缺省时使用行号；
+# 聊天图还可以指定 "thread_id"，缺省为 "batch-<id>"（指定的会话属于调用方，运行前不会被清空）。
+# 输出每行: {"id": ..., "ok": true, "output": ..., "ms": ...} 或 {"id": ..., "ok": false, "error": ...}。
+#
+# 运行方式 (在项目根目录):
+#   python -m src.chat.batch questions.jsonl results.jsonl --graph chat --concurrency 16
+# -----------------------------------------------------------------------------
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from langchain_core.messages import HumanMessage
+
+
+# --- 图的定义 ---
+@dataclass(frozen=True)
+class GraphSpec:
+    """一个可以批量运行的图: 如何加载、如何把一条输入记录转换成调用参数、如何从最终状态取出结果。
+
+    `reset(app, record)` 在每次运行一条记录之前调用，清除之前的（可能中途崩溃的）尝试留下的状态。
+    """
+
+    load: Callable[[], Any]
+    to_input: Callable[[dict], Tuple[dict, dict]]
+    to_output: Callable[[dict], Any]
+    reset: Optional[Callable[[Any, dict], None]] = None
+
+
+def load_demo_app(module_name: str):
+    """导入一个在模块级别编译图的示例脚本，返回其中的 `app`（导入时运行的演示输出会被丢弃）。"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        module = importlib.import_module(module_name)
+    return module.app
+
+
+def _load_chat_app():
+    from .registry import get_app
+
+    return get_app()
+
+
+def _chat_thread_id(record: dict) -> str:
+    return record.get("thread_id") or f"batch-{record['id']}"
+
+
+def _reset_chat_thread(app, record: dict) -> None:
+    """删除批量运行自己的会话 "batch-<id>"，重跑的问题从空白会话开始；调用方指定的会话保持不动。"""
+    if not record.get("thread_id"):
+        app.checkpointer.delete_thread(_chat_thread_id(record))
+
+
+GRAPHS: Dict[str, GraphSpec] = {
+    # 根目录 main.py 的示例工作流
+    "workflow": GraphSpec(
+        load=lambda: load_demo_app("main"),
+        to_input=lambda record: ({"question": record["question"], "next": "agent"}, {"recursion_limit": 5}),
+        to_output=lambda state: state.get("answer"),
+    ),
+    "phase1": GraphSpec(
+        load=lambda: load_demo_app("src.phase1_simple_chatbot"),
+        to_input=lambda record: ({"question": record["question"]}, {}),
+        to_output=lambda state: state.get("answer"),
+    ),
+    # 聊天 Agent: 每个问题默认使用独立的会话
+    "chat": GraphSpec(
+        load=_load_chat_app,
+        to_input=lambda record: (
+            {"messages": [HumanMessage(content=record["question"])]},
+            # 离线任务使用 "batch" 优先级: 配置了限流调度器（见 rate_limit.py）时让位于在线聊天。
+            {"configurable": {"thread_id": _chat_thread_id(record), "priority": "batch"}},
+        ),
+        to_output=lambda state: state["messages"][-1].content,
+        reset=_reset_chat_thread,
+    ),
+}
+
+
+# --- 输入与进度 ---
+# 无法解析的输入行被读成 {"id": 行号, INVALID: 错误信息}，由 run_batch 直接写成失败的结果。
+INVALID = "invalid"
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    """逐行读取输入记录。没有 id 的记录使用从 0 开始的行号作为 id；空行会被跳过。"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield {"id": line_no, INVALID: f"{type(e).__name__}: {e}"}
+                continue
+            if not isinstance(record, dict):
+                yield {"id": line_no, INVALID: f"输入行不是 JSON 对象: {type(record).__name__}"}
+                continue
+            record.setdefault("id", line_no)
+            yield record
+
+
+def completed_ids(output_path: str, retry_failed: bool = False) -> Set[str]:
+    """读取已有的输出文件，返回已经完成的 id（统一为字符串）。
+
+    崩溃时最后一行可能只写了一半: 把它截掉，之后的输出从完整的行后面继续追加。
+    `retry_failed` 为 True 时，失败过且之后没有成功的问题不算完成，会重新运行。
+    """
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as f:
+        valid_end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+            except ValueError:
+                break
+            valid_end += len(line)
+            if result.get("ok") or not retry_failed:
+                done.add(str(result["id"]))
+        f.truncate(valid_end)
+    return done
+
+
+# --- 执行 ---
+def run_one(app, spec: GraphSpec, record: dict) -> dict:
+    """运行一个问题，把结果或异常转换为一行输出。"""
+    begin = time.perf_counter()
+    try:
+        if spec.reset is not None:
+            spec.reset(app, record)
+        inputs, config = spec.to_input(record)
+        output = spec.to_output(app.invoke(inputs, config))
+        result = {"id": record["id"], "ok": True, "output": output}
+    except Exception as e:
+        result = {"id": record["id"], "ok": False, "error": f"{type(e).__name__}: {e}"}
+    result["ms"] = round((time.perf_counter() - begin) * 1000, 3)
+    return result
+
+
+# 进程池的每个子进程各自加载一次图。
+_worker: Optional[Tuple[Any, GraphSpec]] = None
+
+
+def _init_process(graph: str):
+    global _worker
+    sys.stdout = open(os.devnull, "w")
+    spec = GRAPHS[graph]
+    _worker = (spec.load(), spec)
+
+
+def _run_in_process(record: dict) -> dict:
+    app, spec = _worker
+    return run_one(app, spec, record)
+
+
+@dataclass
+class BatchStats:
+    """一次批量运行的统计。"""
+
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def completed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def throughput(self) -> float:
+        """每秒完成的问题数（不含跳过的问题）。"""
+        return self.completed / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"完成 {self.completed} 个（成功 {self.succeeded}，失败 {self.failed}），跳过 {self.skipped} 个，"
+            f"耗时 {self.elapsed:.1f} 秒，吞吐量 {self.throughput:.1f} 个/秒"
+        )
+
+
+def run_batch(
+    records: Iterable[dict],
+    output_path: str,
+    submit: Callable[[dict], Any],
+    *,
+    concurrency: int,
+    resume: bool = True,
+    retry_failed: bool = False,
+    report_every: float = 0.0,
+    report: Callable[[str], None] = lambda text: print(text, file=sys.stderr),
+) -> BatchStats:
+    """用 `submit` 运行 `records`，结果按完成顺序追加写入 `output_path`。
+
+    `submit(record)` 提交一个问题并返回 Future，例如 `lambda r: executor.submit(run_one, app, spec, r)`。
+    同时在途的问题最多为 `concurrency * 2`，输入按需读取。
+    `resume` 为 True 时跳过输出文件中已经完成的问题；为 False 时清空输出文件重新开始。
+    `report_every` 大于 0 时每隔这么多秒报告一次进度。
+    """
+    done = completed_ids(output_path, retry_failed) if resume else set()
+    stats = BatchStats()
+    max_in_flight = max(concurrency, 1) * 2
+    begin = last_report = time.perf_counter()
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+        pending = set()
+
+        def write(result):
+            out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            if result["ok"]:
+                stats.succeeded += 1
+            else:
+                stats.failed += 1
+
+        def drain():
+            nonlocal last_report
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                pending.discard(future)
+                write(future.result())
+            out.flush()
+            now = time.perf_counter()
+            if report_every and now - last_report >= report_every:
+                last_report = now
+                stats.elapsed = now - begin
+                report(stats.summary())
+
+        for record in records:
+            if str(record["id"]) in done:
+                stats.skipped += 1
+                continue
+            if INVALID in record:
+                write({"id": record["id"], "ok": False, "error": record[INVALID], "ms": 0.0})
+                out.flush()
+                continue
+            pending.add(submit(record))
+            if len(pending) >= max_in_flight:
+                drain()
+        while pending:
+            drain()
+
+    stats.elapsed = time.perf_counter() - begin
+    return stats
+
+
+def run_graph_batch(
+    graph: str,
+    input_path: str,
+    output_path: str,
+    *,
+    concurrency: int = 8,
+    processes: bool = False,
+    **options,
+) -> BatchStats:
+    """按名称批量运行一个图（"workflow" / "phase1" / "chat"）。其余参数见 `run_batch`。"""
+    spec = GRAPHS[graph]
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=concurrency, initializer=_init_process, initargs=(graph,))
+        submit = lambda record: executor.submit(_run_in_process, record)
+    else:
+        app = spec.load()
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        submit = lambda record: executor.submit(run_one, app, spec, record)
+    with executor:
+        return run_batch(read_jsonl(input_path), output_path, submit, concurrency=concurrency, **options)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="从 JSONL 批量运行问题，结果按完成顺序写入 JSONL")
+    parser.add_argument("input", help="输入 JSONL，每行 {\"id\": ..., \"question\": ...}")
+    parser.add_argument("output", help="输出 JSONL；已存在时从中断处继续")
+    parser.add_argument("--graph", choices=sorted(GRAPHS), default="chat")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发的工作线程（或进程）数")
+    parser.add_argument("--processes", action="store_true", help="使用进程池，适合 CPU 密集的节点")
+    parser.add_argument("--restart", action="store_true", help="忽略已有的输出，从头开始")
+    parser.add_argument("--retry-failed", action="store_true", help="继续时重新运行之前失败的问题")
+    parser.add_argument("--report-every", type=float, default=10.0, help="进度报告间隔（秒），0 表示不报告")
+    args = parser.parse_args(argv)
+
+    # 节点中的调试输出会淹没进度报告，批量运行时丢弃。
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        stats = run_graph_batch(
+            args.graph, args.input, args.output,
+            concurrency=args.concurrency, processes=args.processes,
+            resume=not args.restart, retry_failed=args.retry_failed, report_every=args.report_every,
+        )
+    print(stats.summary(), file=sys.stderr)
+    return 0 if stats.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+# -----------------------------------------------------------------------------
+# 带过期时间 (TTL) 和容量上限 (LRU) 的缓存
+#
+# 用于缓存搜索工具等外部调用的结果。分为两层:
+#   - MemoryCache: 进程内缓存，速度最快，进程退出即失效。
+#   - SqliteCache: 可选的磁盘缓存，多个进程 / 多次运行之间共享。
+# TieredCache 把两层组合起来，先查内存，再查磁盘，并统计命中 / 未命中次数。
+# CachedSearch 在缓存未命中时用 SingleFlight 合并同时进行的相同查询（见 singleflight.py）。
+# -----------------------------------------------------------------------------
+
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from .singleflight import SingleFlight
+
+# 未命中时 get 返回的哨兵对象，用于区分“没有缓存”和“缓存的值恰好是 None”。
+MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询字符串: 去掉首尾空白、合并连续空白并转为小写。"""
+    return re.sub(r"\s+", " ", query.strip()).lower()
+
+
+@dataclass
+class CacheStats:
+    """缓存命中统计。"""
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class MemoryCache:
+    """线程安全的进程内 TTL + LRU 缓存。"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        # OrderedDict 记住插入顺序，`move_to_end` 把最近使用的键移到末尾，
+        # 淘汰时从头部弹出最久未使用的键，这就是 LRU。
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISSING
+            value, expires_at = item
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self.clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        """删除所有以 `prefix` 开头的键。"""
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteCache:
+    """基于 SQLite 的磁盘 TTL + LRU 缓存。
+
+    值默认用 JSON 序列化，可以通过 `dumps` / `loads` 替换成其他格式。
+    过期时间使用墙上时钟 (time.time)，因为它需要在不同进程之间保持一致。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        maxsize: int = 100_000,
+        ttl: Optional[float] = 24 * 3600,
+        table: str = "cache",
+        dumps: Callable[[Any], str] = lambda v: json.dumps(v, ensure_ascii=False),
+        loads: Callable[[str], Any] = json.loads,
+        clock: Callable[[], float] = time.time,
+    ):
+        if not table.isidentifier():
+            raise ValueError(f"非法的表名: {table}")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.table = table
+        self.dumps = dumps
+        self.loads = loads
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            f"""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used);
+            """
+        )
+
+    def get(self, key: str) -> Any:
+        now = self.clock()
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return MISSING
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self.conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.conn.commit()
+                return MISSING
+            self.conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return self.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = self.clock()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, self.dumps(value), expires_at, now),
+            )
+            # 超出容量时删除最久未使用的条目。
+            (count,) = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+            if count > self.maxsize:
+                self.conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+                    (count - self.maxsize,),
+                )
+            self.conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def delete_prefix(self, prefix: str):
+        """删除所有以 `prefix` 开头的键。"""
+        with self._lock:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute(f"DELETE FROM {self.table}")
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class TieredCache:
+    """内存 + 可选磁盘的两级缓存，并统计命中情况。"""
+
+    def __init__(self, memory: Optional[MemoryCache] = None, disk: Optional[SqliteCache] = None):
+        self.memory = memory if memory is not None else MemoryCache()
+        self.disk = disk
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Tuple[Any, bool, bool]:
+        value = self.memory.get(key)
+        if value is not MISSING:
+            return value, True, False
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not MISSING:
+                # 磁盘命中后回填到内存层，下次直接从内存读取。
+                self.memory.set(key, value)
+                return value, False, True
+        return MISSING, False, False
+
+    def get(self, key: str) -> Any:
+        value, memory_hit, disk_hit = self._lookup(key)
+        self._count(memory_hit=memory_hit, disk_hit=disk_hit)
+        return value
+
+    def peek(self, key: str) -> Any:
+        """与 `get` 相同，但不计入命中统计，用于已经统计过一次未命中之后的再次检查。"""
+        return self._lookup(key)[0]
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def delete_prefix(self, prefix: str):
+        self.memory.delete_prefix(prefix)
+        if self.disk is not None:
+            self.disk.delete_prefix(prefix)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def _count(self, memory_hit: bool = False, disk_hit: bool = False):
+        with self._lock:
+            if memory_hit or disk_hit:
+                self.stats.hits += 1
+                self.stats.memory_hits += memory_hit
+                self.stats.disk_hits += disk_hit
+            else:
+                self.stats.misses += 1
+
+
+class CachedSearch:
+    """在搜索后端前面加一层缓存。
+
+    `backend` 是任意 `query -> 结果` 的函数。结果必须能被 JSON 序列化才能写入磁盘层。
+    后端抛出的异常不会被缓存，会原样向上抛出。
+    缓存未命中时，同时进行的相同查询（按缓存键）只调用一次后端，结果或异常共享给所有调用方。
+    `scheduler` 是可选的 `RateLimitScheduler`（见 rate_limit.py），真正调用后端之前按 `provider` 的配额排队；
+    缓存命中和被合并的查询不占配额。
+    """
+
+    def __init__(
+        self,
+        backend: Callable[[str], Any],
+        cache: Optional[TieredCache] = None,
+        namespace: str = "search",
+        flight: Optional[SingleFlight] = None,
+        scheduler=None,
+        provider: str = "search",
+    ):
+        self.backend = backend
+        self.cache = cache if cache is not None else TieredCache()
+        self.namespace = namespace
+        self.flight = flight if flight is not None else SingleFlight()
+        self.scheduler = scheduler
+        self.provider = provider
+
+    def key(self, query: str) -> str:
+        return f"{self.namespace}:{normalize_query(query)}"
+
+    # 调用方未命中之后、加入 single-flight 之前，上一个领头者可能刚好写入缓存并退出，
+    # 这时调用方会成为新的领头者。领头者调用后端之前先再查一次缓存，避免重复调用。
+    def _fetch(self, key: str, query: str, scheduler) -> Any:
+        value = self.cache.peek(key)
+        if value is not MISSING:
+            return value
+        if scheduler is not None:
+            scheduler.acquire(self.provider)
+        value = self.backend(query)
+        self.cache.set(key, value)
+        return value
+
+    async def _afetch(self, key: str, query: str, abackend: Optional[Callable[[str], Awaitable[Any]]], scheduler) -> Any:
+        value = self.cache.peek(key)
+        if value is not MISSING:
+            return value
+        if scheduler is not None:
+            await scheduler.aacquire(self.provider)
+        if abackend is not None:
+            value = await abackend(query)
+        else:
+            value = await asyncio.to_thread(self.backend, query)
+        self.cache.set(key, value)
+        return value
+
+    def __call__(self, query: str, scheduler=None) -> Any:
+        """`scheduler` 不为空时代替 `self.scheduler` 用于这次查询，各应用可以用自己的调度器共享同一个缓存。"""
+        key = self.key(query)
+        value = self.cache.get(key)
+        if value is MISSING:
+            value = self.flight.do(key, self._fetch, key, query, scheduler or self.scheduler)
+        return value
+
+    async def ainvoke(self, query: str, abackend: Optional[Callable[[str], Awaitable[Any]]] = None, scheduler=None) -> Any:
+        """异步版本。`abackend` 是可选的异步后端，未提供时在线程中执行同步后端。"""
+        key = self.key(query)
+        value = self.cache.get(key)
+        if value is MISSING:
+            value = await self.flight.ado(key, self._afetch, key, query, abackend, scheduler or self.scheduler)
+        return value
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.cache.stats
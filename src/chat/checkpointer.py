@@ -0,0 +1,295 @@
+# -----------------------------------------------------------------------------
+# 高吞吐量的 SQLite 检查点后端
+#
+# 默认的 `SqliteSaver(sqlite3.connect(..., check_same_thread=False))` 只有一个连接:
+# 所有线程的读写都排队通过同一把锁，每次写入都在请求路径上同步提交。
+#
+# `PooledSqliteSaver` 做了三件事:
+#   1. WAL 模式 + 可配置的 `synchronous` 级别（见下方 DURABILITY_LEVELS）；
+#   2. 一个写连接 + 一个读连接池: 读 (get_tuple / list) 不再等待写锁，
+#      WAL 模式下读者之间、读者与写者之间都可以并发；
+#   3. 可选的后写队列 (write-behind): put / put_writes 放入队列后立即返回，
+#      由后台线程把多次写入合并到一个事务中提交，提交不再位于请求路径上。
+#      整个批次持有 `self.lock`，共用写连接的目录、审批队列和清理不会看到或提前提交未完成的批次；
+#      每次写入在一个保存点中执行，失败的写入只回滚它自己，错误在下一次 put 或读取时抛出。
+#      读取一个会话之前，会先等待该会话排队中的写入提交，保证能读到刚写入的检查点；
+#      其他会话的积压写入不会阻塞这次读取。
+# 另外可以传入 `serde=CompactSerializer()` 压缩检查点，并用 `blob_threshold` 把长消息正文
+# 按内容寻址只存一份（见 compact_serde.py）。
+#
+# 用法:
+#   saver = PooledSqliteSaver("checkpoints.sqlite", readers=4, write_behind=True)
+#   app = workflow.compile(checkpointer=saver)
+#   ...
+#   saver.close()   # 写完队列中剩余的检查点并关闭所有连接
+#
+# 开启 write_behind 时 `put` 只是入队；需要真正的写入耗时时设置
+# `saver.write_observer = fn(op, config, seconds)`，由后台写线程在每次写入后调用（见 tracing.py）。
+# -----------------------------------------------------------------------------
+
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import closing, contextmanager
+from typing import Callable, Iterator, Optional
+
+from .compact_serde import BlobSqliteSaver
+from .session_catalog import CatalogSqliteSaver, _atomic
+
+# 持久化级别，对应 SQLite 的 `PRAGMA synchronous`:
+#   "full":   每次提交都 fsync，断电也不会丢失已提交的检查点。
+#   "normal": WAL 模式下只在 checkpoint 时 fsync。进程崩溃不会丢数据，
+#             断电可能丢失最近的几次提交，但数据库不会损坏。（默认）
+#   "off":    完全不 fsync，最快，断电可能损坏数据库，只适合测试和压测。
+# 开启 write_behind 时，进程崩溃还会丢失队列中尚未提交的写入。
+DURABILITY_LEVELS = {"full": "FULL", "normal": "NORMAL", "off": "OFF"}
+
+# 后台写线程的停止信号。
+_STOP = object()
+
+
+class PooledSqliteSaver(BlobSqliteSaver):
+    """WAL + 读连接池 + 单写连接（可选后写队列）的 SqliteSaver。
+
+    `self.conn` 是唯一的写连接，仍然受 `self.lock` 保护，
+    因此 `CheckpointRetention(saver.conn, lock=saver.lock)` 等已有用法保持不变。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        readers: int = 4,
+        durability: str = "normal",
+        write_behind: bool = False,
+        max_batch: int = 256,
+        busy_timeout_ms: int = 5000,
+        serde=None,
+        blob_threshold: Optional[int] = None,
+    ):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"未知的持久化级别: {durability}")
+        if readers < 1:
+            raise ValueError("readers 至少为 1")
+        if path == ":memory:" or path.startswith("file::memory:"):
+            raise ValueError("PooledSqliteSaver 需要数据库文件，内存数据库无法在多个连接之间共享")
+        self.path = path
+        self.durability = durability
+        self.busy_timeout_ms = busy_timeout_ms
+        super().__init__(self._connect(), serde=serde, blob_threshold=blob_threshold)
+
+        # --- 读连接池 ---
+        self.max_readers = readers
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all_readers = []
+        self._readers_lock = threading.Lock()
+
+        # --- 后写队列 ---
+        self.write_behind = write_behind
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._batching = threading.local()
+        # 每个会话排队中、尚未提交的写入数量。
+        self._pending: Counter = Counter()
+        self._pending_changed = threading.Condition()
+        self._error: Optional[BaseException] = None
+        # 后台写线程每完成一次写入调用一次: (操作名, config, 耗时秒数)，不含批次结束时的提交。
+        self.write_observer: Optional[Callable[[str, dict, float], None]] = None
+        self._closed = False
+        if write_behind:
+            self._writer = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+            self._writer.start()
+
+    # --- 连接 ---
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        # 读连接使用自动提交模式 (isolation_level=None)，由 `cursor()` 显式开启读事务。
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None if readonly else "")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(f"PRAGMA synchronous = {DURABILITY_LEVELS[self.durability]}")
+        return conn
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if len(self._all_readers) < self.max_readers:
+                conn = self._connect(readonly=True)
+                self._all_readers.append(conn)
+                return conn
+        return self._readers.get()
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        # 后台写线程在整个批次期间已经持有 `self.lock`（锁不可重入），批次中的写入不再获取。
+        if getattr(self._batching, "active", False):
+            yield
+            return
+        with self.lock:
+            yield
+
+    @contextmanager
+    def cursor(self, transaction: bool = True) -> Iterator[sqlite3.Cursor]:
+        """写操作使用写连接；只读操作 (`transaction=False`) 从读连接池中取一个连接。"""
+        if transaction:
+            with self._write_lock():
+                self.setup()
+                cur = self.conn.cursor()
+                try:
+                    yield cur
+                finally:
+                    # 后台线程批量写入时，由批次结束时统一提交。
+                    if not getattr(self._batching, "active", False):
+                        self.conn.commit()
+                    cur.close()
+            return
+
+        if not self.is_setup:
+            with self.lock:
+                self.setup()
+        conn = self._acquire_reader()
+        cur = conn.cursor()
+        try:
+            # 在同一个读事务中执行，保证 get_tuple 读到的检查点和 pending writes 来自同一个快照。
+            cur.execute("BEGIN")
+            yield cur
+        finally:
+            try:
+                cur.execute("COMMIT")
+            finally:
+                cur.close()
+                self._readers.put(conn)
+
+    # --- 后写队列 ---
+    def _raise_pending_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("后台写入检查点失败") from error
+
+    def _wait_for_writes(self, thread_id: Optional[str] = None):
+        """等待 `thread_id`（为空时为全部会话）排队中的写入提交。"""
+        # 后台写线程内部（例如 put 内部需要读）不能等待自己。
+        if self._writer is None or threading.current_thread() is self._writer:
+            return
+        key = None if thread_id is None else str(thread_id)
+        with self._pending_changed:
+            self._pending_changed.wait_for(
+                lambda: not (self._pending[key] if key is not None else any(self._pending.values()))
+            )
+        self._raise_pending_error()
+
+    def _submit(self, thread_id, fn, *args) -> None:
+        if self._closed:
+            raise RuntimeError("检查点后端已经关闭")
+        self._raise_pending_error()
+        with self._pending_changed:
+            self._pending[str(thread_id)] += 1
+        self._queue.put((str(thread_id), fn, args))
+
+    def _write_one(self, fn, args):
+        began = time.perf_counter()
+        try:
+            with closing(self.conn.cursor()) as cur, _atomic(cur):
+                fn(*args)
+        except Exception as e:  # 记录下来，在下一次 put 或读取时抛出
+            self._error = e
+        observer = self.write_observer
+        if observer is not None:
+            observer(fn.__name__, args[0], time.perf_counter() - began)
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # 把队列中已经积压的写入合并到同一个事务中，最多 max_batch 个。
+            while item is not _STOP and len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            # 整个批次持有写锁: 共用写连接的目录、审批队列和清理在批次提交之前看不到其中的写入，
+            # 也不会用自己的 commit() 提前提交它。每次写入在一个保存点中执行，失败时只回滚这一次。
+            try:
+                with self.lock:
+                    self.setup()
+                    self._batching.active = True
+                    try:
+                        for entry in batch:
+                            if entry is not _STOP:
+                                self._write_one(*entry[1:])
+                    finally:
+                        self._batching.active = False
+                        self.conn.commit()
+            finally:
+                with self._pending_changed:
+                    for entry in batch:
+                        if entry is not _STOP:
+                            self._pending[entry[0]] -= 1
+                    self._pending += Counter()  # 去掉计数为 0 的会话
+                    self._pending_changed.notify_all()
+            if batch[-1] is _STOP:
+                return
+
+    def flush(self):
+        """等待后写队列中的全部写入提交。"""
+        self._wait_for_writes()
+
+    def get_tuple(self, config):
+        self._wait_for_writes(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        self._wait_for_writes(config["configurable"]["thread_id"] if config else None)
+        return super().list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        if not self.write_behind or threading.current_thread() is self._writer:
+            return super().put(config, checkpoint, metadata, new_versions)
+        self._submit(config["configurable"]["thread_id"], super().put, config, checkpoint, metadata, new_versions)
+        # 与 SqliteSaver.put 的返回值相同，无需等待写入完成。
+        return {
+            "configurable": {
+                "thread_id": config["configurable"]["thread_id"],
+                "checkpoint_ns": config["configurable"]["checkpoint_ns"],
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        if not self.write_behind or threading.current_thread() is self._writer:
+            return super().put_writes(config, writes, task_id, task_path)
+        self._submit(config["configurable"]["thread_id"], super().put_writes, config, list(writes), task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._wait_for_writes(thread_id)
+        super().delete_thread(thread_id)
+
+    def close(self):
+        """写完后写队列中剩余的检查点，然后关闭所有连接。可以重复调用。"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join()
+        with self._readers_lock:
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers.clear()
+        with self.lock:
+            self.conn.close()
+        self._raise_pending_error()
+
+
+class PooledCatalogSqliteSaver(PooledSqliteSaver, CatalogSqliteSaver):
+    """同时维护会话目录（见 session_catalog.py）的 PooledSqliteSaver，供聊天应用使用。"""
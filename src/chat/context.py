@@ -0,0 +1,181 @@
+# -----------------------------------------------------------------------------
+# 上下文窗口管理
+#
+# `AgentState.messages` 使用 `operator.add` 不断累积，如果每次都把完整历史发给 LLM，
+# 延迟和费用都会随对话长度线性增长。本文件提供两种策略，把发给 LLM 的提示控制在
+# 一个 token 预算之内:
+#
+#   - "trim":      只保留最近的消息，丢弃更早的部分。
+#   - "summarize": 把超出预算的早期消息滚动总结进 `summary` 字段，提示 = 总结 + 最近的消息。
+#
+# 两种策略都只会在 HumanMessage 处切分历史，因此 AIMessage 的 tool_calls
+# 和对应的 ToolMessage 总是成对保留或成对丢弃，不会出现“孤儿” ToolMessage。
+#
+# 生成总结的 LLM 调用带有 `SUMMARY_TAG` 和 LangGraph 的 "nostream" 标签:
+# 它的 token 不会出现在 `stream_mode="messages"` 的流里（命令行和 SSE 只推送回复本身）。
+# 调用方应传入与 agent 相同的包装模型（限流 / 缓存 / 合并请求），见 app.py 的 `wrap_llm`。
+# -----------------------------------------------------------------------------
+
+import os
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.messages import (
+    AnyMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    trim_messages,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.constants import TAG_NOSTREAM
+
+# 估算 token 数的函数类型: 接收消息列表，返回 token 数。
+TokenCounter = Callable[[Sequence[BaseMessage]], int]
+
+SUMMARY_PROMPT = (
+    "请把下面的对话内容浓缩成一段简洁的总结，保留事实、结论和用户的偏好，供后续对话参考。"
+)
+
+# 生成总结的 LLM 调用所带的标签，追踪和流式输出据此区分它与 agent 的回复。
+SUMMARY_TAG = "context_summary"
+_SUMMARY_CONFIG = {"tags": [SUMMARY_TAG, TAG_NOSTREAM]}
+
+
+def _last_turn(messages: Sequence[AnyMessage]) -> List[AnyMessage]:
+    """返回从最后一条 HumanMessage 开始的消息，即当前正在进行的一轮对话。"""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return list(messages[i:])
+    return list(messages)
+
+
+def trim_to_budget(
+    messages: Sequence[AnyMessage],
+    max_tokens: int,
+    token_counter: TokenCounter = count_tokens_approximately,
+) -> List[AnyMessage]:
+    """保留不超过 `max_tokens` 的最近消息。
+
+    裁剪后的列表总是从 HumanMessage 开始（开头的 SystemMessage 除外）。
+    如果连当前这一轮都放不下，则保留当前这一轮，宁可超出预算也不能丢掉用户的问题。
+    """
+    trimmed = trim_messages(
+        messages,
+        max_tokens=max_tokens,
+        token_counter=token_counter,
+        strategy="last",
+        start_on="human",
+        include_system=True,
+        allow_partial=False,
+    )
+    if not any(isinstance(m, HumanMessage) for m in trimmed):
+        return _last_turn(messages)
+    return trimmed
+
+
+class ContextManager:
+    """根据预算和策略，为 agent 节点准备发给 LLM 的消息。
+
+    `prepare(state, llm)` 返回 `(prompt, update)`：
+    `prompt` 是要发送给 LLM 的消息列表，`update` 是需要合并进状态的额外字段
+    （只有 "summarize" 策略会产生更新）。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        strategy: str = "trim",
+        token_counter: TokenCounter = count_tokens_approximately,
+    ):
+        if strategy not in ("trim", "summarize"):
+            raise ValueError(f"未知的上下文策略: {strategy}")
+        self.max_tokens = max_tokens
+        self.strategy = strategy
+        self.token_counter = token_counter
+
+    def prepare(self, state: dict, llm=None):
+        messages = state["messages"]
+        if self.strategy == "trim":
+            return trim_to_budget(messages, self.max_tokens, self.token_counter), {}
+        summary, start, cut = self._pending_summary(state)
+        if cut > start:
+            summary = self._summarize(llm, summary, messages[start:cut])
+        return self._summarized_prompt(messages, summary, start, cut)
+
+    async def aprepare(self, state: dict, llm=None):
+        """`prepare` 的异步版本: 需要总结时使用 `llm.ainvoke`。"""
+        messages = state["messages"]
+        if self.strategy == "trim":
+            return trim_to_budget(messages, self.max_tokens, self.token_counter), {}
+        summary, start, cut = self._pending_summary(state)
+        if cut > start:
+            summary = await self._asummarize(llm, summary, messages[start:cut])
+        return self._summarized_prompt(messages, summary, start, cut)
+
+    def _pending_summary(self, state: dict):
+        """返回 (已有总结, 总结起点, 切分点)；`messages[start:cut]` 是需要总结进 `summary` 的消息，不需要时 cut == start。"""
+        messages = state["messages"]
+        summary = state.get("summary", "")
+        start = state.get("summary_index", 0)
+        if self._prompt_tokens(summary, messages[start:]) <= self.max_tokens:
+            return summary, start, start
+        return summary, start, self._find_cut(summary, messages, start)
+
+    def _summarized_prompt(self, messages: Sequence[AnyMessage], summary: str, start: int, cut: int):
+        update = {"summary": summary, "summary_index": cut} if cut > start else {}
+        # 总结之后仍可能超出预算（例如当前这一轮本身就很长），这里再做一次裁剪兜底。
+        budget = self.max_tokens - self._summary_tokens(summary)
+        prompt = trim_to_budget(list(messages[cut:]), max(budget, 0), self.token_counter)
+        if summary:
+            prompt = [self._summary_message(summary)] + prompt
+        return prompt, update
+
+    def _find_cut(self, summary: str, messages: Sequence[AnyMessage], start: int) -> int:
+        """找到最早的 HumanMessage 位置，使其之后的消息能放进预算；找不到时返回最后一轮的起点。"""
+        last_human = start
+        for i in range(start, len(messages)):
+            if not isinstance(messages[i], HumanMessage):
+                continue
+            last_human = i
+            if self._prompt_tokens(summary, messages[i:]) <= self.max_tokens:
+                return i
+        return last_human
+
+    def _summary_request(self, summary: str, messages: Sequence[AnyMessage]) -> List[BaseMessage]:
+        transcript = "\n".join(f"{m.type}: {m.content}" for m in messages if m.content)
+        if summary:
+            transcript = f"已有总结: {summary}\n\n{transcript}"
+        return [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=transcript)]
+
+    def _summarize(self, llm, summary: str, messages: Sequence[AnyMessage]) -> str:
+        return llm.invoke(self._summary_request(summary, messages), _SUMMARY_CONFIG).content
+
+    async def _asummarize(self, llm, summary: str, messages: Sequence[AnyMessage]) -> str:
+        return (await llm.ainvoke(self._summary_request(summary, messages), _SUMMARY_CONFIG)).content
+
+    def _summary_message(self, summary: str) -> SystemMessage:
+        return SystemMessage(content=f"此前对话的总结: {summary}")
+
+    def _summary_tokens(self, summary: str) -> int:
+        return self.token_counter([self._summary_message(summary)]) if summary else 0
+
+    def _prompt_tokens(self, summary: str, messages: Sequence[AnyMessage]) -> int:
+        return self._summary_tokens(summary) + self.token_counter(messages)
+
+
+def make_context_manager(max_tokens: Optional[int], strategy: str = "trim") -> Optional[ContextManager]:
+    """`max_tokens` 为空时不做任何上下文管理，返回 None。"""
+    if max_tokens is None:
+        return None
+    return ContextManager(max_tokens, strategy)
+
+
+def context_options_from_env() -> dict:
+    """从环境变量 `CHAT_CONTEXT_BUDGET` / `CHAT_CONTEXT_STRATEGY` 读取上下文选项，可直接传给 `get_compiled_app`。
+
+    没有设置预算时返回空字典（发送完整历史）。
+    """
+    budget = os.getenv("CHAT_CONTEXT_BUDGET")
+    if not budget:
+        return {}
+    return {"context_budget": int(budget), "context_strategy": os.getenv("CHAT_CONTEXT_STRATEGY", "trim")}
@@ -0,0 +1,240 @@
+# -----------------------------------------------------------------------------
+# 离线测试替身 (Fakes)
+#
+# 本文件提供不依赖网络的假聊天模型和假搜索后端，用于单元测试和压测脚本。
+# 它们实现了与真实 ChatDeepSeek 相同的接口（invoke / ainvoke / bind_tools），
+# 因此可以直接传给 get_compiled_app 等工厂函数。
+# -----------------------------------------------------------------------------
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+class FakeChatModel(BaseChatModel):
+    """按脚本依次返回回复的假聊天模型，可模拟固定的调用延迟。"""
+
+    # 依次返回的回复，用完后从头循环；为空时回显最后一条消息的内容。
+    responses: List[AIMessage] = []
+    # 每次调用模拟的延迟（秒）。同步调用使用 time.sleep，异步调用使用 asyncio.sleep。
+    latency: float = 0.0
+    # 流式输出时每个 token 之间的延迟（秒）。文本按字符切分为 token。
+    token_latency: float = 0.0
+
+    _calls: int = PrivateAttr(default=0)
+    _prompts: list = PrivateAttr(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def calls(self) -> int:
+        """模型被调用的总次数。"""
+        return self._calls
+
+    @property
+    def prompts(self) -> List[List[BaseMessage]]:
+        """每次调用收到的消息列表，便于测试断言发给模型的内容。"""
+        return self._prompts
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeChatModel":
+        # 假模型不需要真正把工具描述发给服务端，直接返回自身即可。
+        return self
+
+    def _next_response(self, messages: List[BaseMessage]) -> AIMessage:
+        index = self._calls
+        self._calls += 1
+        self._prompts.append(list(messages))
+        if not self.responses:
+            return AIMessage(content=f"回复: {messages[-1].content}")
+        return self.responses[index % len(self.responses)].model_copy()
+
+    def _generation_time(self, message: AIMessage) -> float:
+        # 非流式调用要等整段回复生成完毕才返回，耗时与流式输出完全部 token 相同。
+        return self.latency + self.token_latency * (len(self._chunks(message)) - 1)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._next_response(messages)
+        time.sleep(self._generation_time(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._next_response(messages)
+        await asyncio.sleep(self._generation_time(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    # --- 流式输出 ---
+    # 实现 `_stream` / `_astream` 后，LangGraph 的 stream_mode="messages" 可以逐 token 拿到回复。
+    # `latency` 模拟首个 token 之前的等待，`token_latency` 模拟后续 token 之间的间隔。
+    def _chunks(self, message: AIMessage) -> List[AIMessageChunk]:
+        if message.tool_calls:
+            return [AIMessageChunk(
+                content=message.content,
+                tool_call_chunks=[
+                    tool_call_chunk(name=call["name"], args=json.dumps(call["args"], ensure_ascii=False), id=call["id"], index=i)
+                    for i, call in enumerate(message.tool_calls)
+                ],
+            )]
+        return [AIMessageChunk(content=char) for char in message.content] or [AIMessageChunk(content="")]
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(self._next_response(messages))):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(self._next_response(messages))):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+class ToolCallingFakeChatModel(FakeChatModel):
+    """每一轮先请求一次工具调用，拿到工具结果后再回答的假模型。
+
+    与按固定顺序循环回复的 FakeChatModel 不同，它根据最后一条消息决定回复，
+    因此多个会话并发调用时，每个会话仍然严格走完 “agent → tools → agent” 的循环。
+    """
+
+    # 请求调用的工具名，参数为 {"query": 用户问题}。
+    tool_name: str = "search_tool"
+
+    def _next_response(self, messages: List[BaseMessage]) -> AIMessage:
+        self._calls += 1
+        self._prompts.append(list(messages))
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"根据搜索结果回答: {str(last.content)[:40]}")
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": self.tool_name, "args": {"query": str(last.content)}, "id": f"call_{uuid.uuid4().hex[:8]}"}],
+        )
+
+
+class FakeSearchBackend:
+    """假搜索后端: 返回固定格式的结果，并统计被调用的次数。"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.queries: List[str] = []
+        self._lock = threading.Lock()
+
+    def _record(self, query: str) -> dict:
+        with self._lock:
+            self.calls += 1
+            self.queries.append(query)
+        return {"query": query, "results": [{"title": f"关于 {query} 的结果", "content": "..."}]}
+
+    def __call__(self, query: str) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._record(query)
+
+    async def ainvoke(self, query: str) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._record(query)
+
+
+class StubSearchServer:
+    """本地 HTTP 桩服务器，模拟 Tavily 的 `/search` 接口。
+
+    支持 HTTP/1.1 keep-alive，并记录建立过的 TCP 连接数，用于验证连接是否被复用。
+    用法:
+        with StubSearchServer() as server:
+            client = TavilyClient(api_key="test", base_url=server.url)
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写出，关闭 Nagle 算法以免 keep-alive 连接上出现 40ms 的延迟确认等待。
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub._lock:
+                    stub.requests += 1
+                payload = json.dumps({
+                    "query": body["query"],
+                    "results": [{"title": f"关于 {body['query']} 的结果", "url": "http://example.com", "content": "..."}],
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StubSearchServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,54 @@
+# -----------------------------------------------------------------------------
+# 会话历史的懒加载与分页
+#
+# 恢复一个会话时，旧的做法是读取最新的检查点，检查点里包含整段对话的全部消息，
+# 必须整体反序列化之后才能打印。对话很长时（几万条消息）这会非常慢。
+#
+# `HistoryPager` 基于会话目录中的 `session_messages` 索引（见 session_catalog.py）:
+# 先只加载最近的一页消息，用户需要时再按页向前加载更早的消息。
+# 每一页只反序列化这一页的消息。
+# -----------------------------------------------------------------------------
+
+from typing import Iterator, List, Optional
+
+from langchain_core.messages import AnyMessage
+
+from .session_catalog import SessionCatalog
+
+
+class HistoryPager:
+    """从新到旧分页读取一个会话的历史消息。每一页内部按时间正序排列。"""
+
+    def __init__(self, catalog: SessionCatalog, thread_id: str, page_size: int = 20):
+        if page_size < 1:
+            raise ValueError("page_size 至少为 1")
+        self.catalog = catalog
+        self.thread_id = thread_id
+        self.page_size = page_size
+        # 已加载的最早一条消息的序号；None 表示还没有加载任何一页。
+        self._oldest: Optional[int] = None
+
+    @property
+    def has_more(self) -> bool:
+        """是否还有更早的消息没有加载。"""
+        return self._oldest is None or self._oldest > 0
+
+    def latest(self) -> List[AnyMessage]:
+        """加载最近的一页消息，并把分页位置重置到这里。"""
+        self._oldest = None
+        return self.older()
+
+    def older(self) -> List[AnyMessage]:
+        """加载上一次加载位置之前的一页消息；没有更早的消息时返回空列表。"""
+        if not self.has_more:
+            return []
+        rows = self.catalog.messages(self.thread_id, limit=self.page_size, before=self._oldest)
+        self._oldest = rows[0][0] if rows else 0
+        return [message for _, message in rows]
+
+    def pages(self) -> Iterator[List[AnyMessage]]:
+        """从最近的一页开始，依次向前产出每一页，直到会话的第一条消息。"""
+        page = self.latest()
+        while page:
+            yield page
+            page = self.older()
@@ -0,0 +1,161 @@
+# -----------------------------------------------------------------------------
+# LLM 回复缓存
+#
+# 我们的模型都使用 temperature=0，同样的消息历史 + 同样的模型 + 同样的工具定义，
+# 得到的回复是可以复用的（例如重放会话、重复的测试问题、常见问题）。
+# 本缓存是可选的 (opt-in)，键是以下三者的稳定哈希:
+#   - 消息历史: 只取类型、内容、工具调用的名字和参数，忽略每次都会变化的消息 ID；
+#   - 模型标识: 模型类型和参数（模型名、温度等）；
+#   - 工具定义: 绑定到模型上的工具 schema。
+# 存储复用 cache.py 中的内存层和 SQLite 磁盘层，支持 TTL 和 LRU 淘汰。
+#
+# 同样的键也用于合并同时进行中的相同请求（`coalesce`，见 singleflight.py）:
+# 多个会话同时发出相同的请求时只调用一次模型。它不依赖缓存，可以单独使用。
+# -----------------------------------------------------------------------------
+
+import hashlib
+import json
+from typing import Any, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from .cache import MISSING, MemoryCache, SqliteCache, TieredCache
+from .singleflight import SingleFlight
+
+
+def _stable_hash(payload: Any) -> str:
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _message_fingerprint(message: BaseMessage) -> dict:
+    fingerprint = {"type": message.type, "content": message.content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        fingerprint["tool_calls"] = [{"name": c["name"], "args": c["args"]} for c in tool_calls]
+    return fingerprint
+
+
+def model_fingerprint(llm, tools: Sequence = ()) -> str:
+    """模型和工具定义的哈希，作为缓存键的前缀。"""
+    return _stable_hash({
+        "model": llm._llm_type,
+        "params": llm._identifying_params,
+        "tools": [convert_to_openai_tool(t) for t in tools],
+    })
+
+
+def messages_fingerprint(messages: Sequence[BaseMessage]) -> str:
+    """消息历史的哈希。"""
+    return _stable_hash([_message_fingerprint(m) for m in messages])
+
+
+def _dumps(message: AIMessage) -> str:
+    return json.dumps(message_to_dict(message), ensure_ascii=False)
+
+
+def _loads(data: str) -> AIMessage:
+    return messages_from_dict([json.loads(data)])[0]
+
+
+class LLMResponseCache:
+    """LLM 回复缓存。`db_path` 为空时只使用进程内缓存。"""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = 24 * 3600,
+        db_path: Optional[str] = None,
+        disk_maxsize: int = 100_000,
+    ):
+        disk = None
+        if db_path:
+            disk = SqliteCache(db_path, maxsize=disk_maxsize, ttl=ttl, table="llm_cache", dumps=_dumps, loads=_loads)
+        self.cache = TieredCache(MemoryCache(maxsize=maxsize, ttl=ttl), disk)
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def key(self, llm, tools: Sequence, messages: Sequence[BaseMessage]) -> str:
+        return f"{model_fingerprint(llm, tools)}:{messages_fingerprint(messages)}"
+
+    def wrap(self, llm, tools: Sequence = (), bound=None) -> "CachedModel":
+        """返回一个带缓存的模型包装，`bound` 为空时使用 `llm.bind_tools(tools)`。"""
+        if bound is None:
+            bound = llm.bind_tools(tools) if tools else llm
+        return CachedModel(self, bound, model_fingerprint(llm, tools))
+
+    # --- 失效 (invalidation) ---
+    def invalidate(self, llm, tools: Sequence, messages: Sequence[BaseMessage]):
+        """删除某一段消息历史对应的缓存回复。"""
+        self.cache.delete(self.key(llm, tools, messages))
+
+    def invalidate_model(self, llm, tools: Sequence = ()):
+        """删除某个模型 + 工具组合的全部缓存，例如更换了提示词或工具实现之后。"""
+        self.cache.delete_prefix(f"{model_fingerprint(llm, tools)}:")
+
+    def clear(self):
+        """清空全部缓存。"""
+        self.cache.clear()
+
+
+class CachedModel:
+    """带缓存的 `llm_with_tools`，提供与之相同的 `invoke` / `ainvoke`。"""
+
+    def __init__(self, cache: LLMResponseCache, bound, prefix: str):
+        self.cache = cache
+        self.bound = bound
+        self.prefix = prefix
+
+    def _key(self, messages: Sequence[BaseMessage]) -> str:
+        return f"{self.prefix}:{messages_fingerprint(messages)}"
+
+    def invoke(self, messages: Sequence[BaseMessage], config=None, **kwargs) -> AIMessage:
+        key = self._key(messages)
+        response = self.cache.cache.get(key)
+        if response is MISSING:
+            response = self.bound.invoke(messages, config, **kwargs)
+            self.cache.cache.set(key, response)
+        # 返回副本，避免多个会话的状态共享同一个消息对象。
+        return response.model_copy()
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], config=None, **kwargs) -> AIMessage:
+        key = self._key(messages)
+        response = self.cache.cache.get(key)
+        if response is MISSING:
+            response = await self.bound.ainvoke(messages, config, **kwargs)
+            self.cache.cache.set(key, response)
+        return response.model_copy()
+
+
+def coalesce(flight: SingleFlight, llm, tools: Sequence = (), bound=None) -> "CoalescedModel":
+    """返回一个合并并发相同请求的模型包装，`bound` 为空时使用 `llm.bind_tools(tools)`（也可以是 CachedModel）。"""
+    if bound is None:
+        bound = llm.bind_tools(tools) if tools else llm
+    return CoalescedModel(flight, bound, model_fingerprint(llm, tools))
+
+
+class CoalescedModel:
+    """合并同时进行中的相同请求的 `llm_with_tools`，提供与之相同的 `invoke` / `ainvoke`。
+
+    被合并的调用方直接拿到 leader 的回复，不会收到逐 token 的流式回调。
+    """
+
+    def __init__(self, flight: SingleFlight, bound, prefix: str):
+        self.flight = flight
+        self.bound = bound
+        self.prefix = prefix
+
+    def _key(self, messages: Sequence[BaseMessage]) -> str:
+        return f"{self.prefix}:{messages_fingerprint(messages)}"
+
+    def invoke(self, messages: Sequence[BaseMessage], config=None, **kwargs) -> AIMessage:
+        response = self.flight.do(self._key(messages), self.bound.invoke, messages, config, **kwargs)
+        # 返回副本，避免多个会话的状态共享同一个消息对象。
+        return response.model_copy()
+
+    async def ainvoke(self, messages: Sequence[BaseMessage], config=None, **kwargs) -> AIMessage:
+        response = await self.flight.ado(self._key(messages), self.bound.ainvoke, messages, config, **kwargs)
+        return response.model_copy()
@@ -0,0 +1,389 @@
+# -----------------------------------------------------------------------------
+# 多提供方的 LLM 路由 (LLM Router)
+#
+# phase2 通过写死的 MODEL_TO_USE 在 DeepSeek 和 Gemini 之间二选一，聊天应用则固定使用 DeepSeek。
+# `LLMRouter` 把多个提供方包装成一个模型，用法与单个模型相同（invoke / ainvoke / bind_tools）:
+#   - 为每个提供方维护最近若干次调用的延迟和成败（滑动窗口），优先选择预期延迟最低的健康提供方；
+#   - 连续失败达到阈值的提供方进入冷却期，期间排到最后，冷却结束后重新参与排序；
+#   - 调用出错或超时（`timeout`）时按顺序回退到下一个提供方；
+#   - `hedge=True` 时，如果首选提供方超过其 p95 延迟仍未返回，再向下一个提供方发出同样的请求，
+#     先返回的结果胜出（对冲请求，削减长尾延迟）；
+#   - `bind_tools` 对每个提供方分别绑定同一组工具，绑定前后的路由共用同一份统计。
+#
+# 路由本身不是一个聊天模型: 真正的 LLM 调用仍由各提供方完成，回调（追踪、流式输出）看到的是
+# 实际被调用的那个模型。注意对冲时落选的同步请求不会被中止（线程无法取消），它的流式 token
+# 也可能出现在 stream_mode="messages" 中；需要逐 token 输出时建议不开启对冲。
+#
+# 每次尝试只记录一次统计: 超时的尝试在超时时记为失败，之后它自己返回的结果不再记录；
+# 落选的对冲请求不记录。同步调用的每次尝试在自己的守护线程中运行（不占用共享线程池），
+# 被放弃（超时或落选）但仍在运行的调用数达到 `max_abandoned` 时暂停对冲，避免慢提供方拖出大量线程。
+#
+# 用法:
+#   llm = LLMRouter({"deepseek": make_chat_model("deepseek"), "gemini": make_chat_model("gemini")}, timeout=30, hedge=True)
+#   chatapp = get_compiled_app(llm=llm)
+# 或者设置环境变量 CHAT_LLM_PROVIDERS=deepseek,gemini（另有 CHAT_LLM_TIMEOUT、CHAT_LLM_HEDGE）。
+# -----------------------------------------------------------------------------
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.runnables import Runnable, RunnableConfig, ensure_config
+
+from .providers import load_env, make_chat_model
+
+
+class ProviderStats:
+    """一个提供方最近 `window` 次调用的延迟与成败，以及熔断状态。"""
+
+    def __init__(self, window: int = 100, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        # 已被放弃（超时或对冲落选）但仍在运行的同步调用数。
+        self.abandoned = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, seconds: float):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.unhealthy_until = time.monotonic() + self.cooldown
+
+    @property
+    def samples(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def error_rate(self) -> float:
+        outcomes = list(self.outcomes)
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """成功调用延迟的分位数；还没有样本时返回 None。"""
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def add_abandoned(self, delta: int):
+        with self._lock:
+            self.abandoned += delta
+
+    def healthy(self, now: Optional[float] = None) -> bool:
+        return (now or time.monotonic()) >= self.unhealthy_until
+
+    def expected_latency(self) -> float:
+        """预期延迟: p50 按失败率放大（失败之后还要再等一次回退）。没有样本时为 0，新提供方会先被尝试。"""
+        p50 = self.quantile(0.5) or 0.0
+        return p50 / max(1.0 - self.error_rate, 0.1)
+
+    def snapshot(self) -> dict:
+        return {
+            "samples": self.samples,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "error_rate": round(self.error_rate, 3),
+            "healthy": self.healthy(),
+        }
+
+
+class _Attempt:
+    """对一个提供方的一次调用。`settle()` 只有第一次返回 True，保证每次尝试只记录一次统计。"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.monotonic()
+        self.future: Future = Future()
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def settle(self) -> bool:
+        with self._lock:
+            settled, self._settled = self._settled, True
+        return not settled
+
+
+class LLMRouter(Runnable):
+    """按延迟和健康状况在多个提供方之间路由的模型，支持出错回退、超时和对冲请求。
+
+    `providers` 是 {名称: 模型} 的有序字典，统计相同时按这里的顺序选择。
+    `timeout` 是单个提供方的超时时间（秒），为空时不限制。
+    `hedge` 为 True 时，首选提供方积累了至少 `min_samples` 个样本后，
+    超过其 `hedge_quantile` 分位延迟仍未返回就向下一个提供方发出对冲请求；
+    被放弃但仍在运行的同步调用达到 `max_abandoned` 个时暂停对冲。
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, Any],
+        *,
+        timeout: Optional[float] = None,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        min_samples: int = 10,
+        window: int = 100,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_abandoned: int = 8,
+        stats: Optional[Dict[str, ProviderStats]] = None,
+    ):
+        if not providers:
+            raise ValueError("LLMRouter 至少需要一个提供方")
+        self.providers = dict(providers)
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.max_abandoned = max_abandoned
+        self.stats = stats if stats is not None else {
+            name: ProviderStats(window, failure_threshold, cooldown) for name in self.providers
+        }
+
+    # --- 与聊天模型相同的接口 ---
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    @property
+    def _identifying_params(self) -> dict:
+        # LLM 回复缓存用它区分模型（见 llm_cache.py）: 提供方集合相同的路由共用缓存。
+        return {
+            name: {"type": getattr(model, "_llm_type", type(model).__name__), **getattr(model, "_identifying_params", {})}
+            for name, model in self.providers.items()
+        }
+
+    def bind_tools(self, tools: Sequence, **kwargs) -> "LLMRouter":
+        """对每个提供方绑定同一组工具。返回的路由与当前路由共用统计。"""
+        return self.with_providers({name: model.bind_tools(tools, **kwargs) for name, model in self.providers.items()})
+
+    def with_providers(self, providers: Dict[str, Any]) -> "LLMRouter":
+        """返回选项和统计都相同、但使用 `providers` 中的模型的路由（例如加上限流的模型）。"""
+        return LLMRouter(
+            providers,
+            timeout=self.timeout,
+            hedge=self.hedge,
+            hedge_quantile=self.hedge_quantile,
+            min_samples=self.min_samples,
+            max_abandoned=self.max_abandoned,
+            stats=self.stats,
+        )
+
+    # --- 路由 ---
+    def ranked(self) -> List[str]:
+        """按尝试顺序排列的提供方: 健康的在前，各组内按预期延迟从低到高。"""
+        now = time.monotonic()
+        order = {name: i for i, name in enumerate(self.providers)}
+        return sorted(
+            self.providers,
+            key=lambda name: (not self.stats[name].healthy(now), self.stats[name].expected_latency(), order[name]),
+        )
+
+    def abandoned(self) -> int:
+        """已被放弃（超时或对冲落选）但仍在运行的同步调用数。"""
+        return sum(stats.abandoned for stats in self.stats.values())
+
+    def _hedge_at(self, attempt: _Attempt) -> Optional[float]:
+        stats = self.stats[attempt.name]
+        if not self.hedge or stats.samples < self.min_samples or self.abandoned() >= self.max_abandoned:
+            return None
+        return attempt.started + stats.quantile(self.hedge_quantile)
+
+    def _call(self, name: str, input, config: RunnableConfig, kwargs: dict):
+        begin = time.monotonic()
+        try:
+            result = self.providers[name].invoke(input, config, **kwargs)
+        except Exception:
+            self.stats[name].record_failure()
+            raise
+        self.stats[name].record_success(time.monotonic() - begin)
+        return result
+
+    def _run(self, attempt: _Attempt, input, config: RunnableConfig, kwargs: dict):
+        """在后台线程中执行一次同步调用，结果写入 `attempt.future`。"""
+        stats = self.stats[attempt.name]
+        try:
+            result = self.providers[attempt.name].invoke(input, config, **kwargs)
+        except BaseException as e:
+            if attempt.settle():
+                stats.record_failure()
+            attempt.future.set_exception(e)
+            return
+        if attempt.settle():
+            stats.record_success(time.monotonic() - attempt.started)
+        attempt.future.set_result(result)
+
+    def _start(self, name: str, input, config: RunnableConfig, kwargs: dict) -> _Attempt:
+        attempt = _Attempt(name)
+        threading.Thread(
+            target=self._run, args=(attempt, input, config, kwargs), name=f"llm-router-{name}", daemon=True
+        ).start()
+        return attempt
+
+    def _abandon(self, attempt: _Attempt):
+        """不再等待一次仍在运行的同步调用，之后它返回的结果不再记录（超时已由 `_timeout_error` 记为失败）。"""
+        attempt.settle()
+        stats = self.stats[attempt.name]
+        stats.add_abandoned(1)
+        attempt.future.add_done_callback(lambda _: stats.add_abandoned(-1))
+
+    async def _acall(self, attempt: _Attempt, input, config: RunnableConfig, kwargs: dict):
+        try:
+            result = await self.providers[attempt.name].ainvoke(input, config, **kwargs)
+        except asyncio.CancelledError:
+            # 落选的对冲请求或超时的请求被取消，由取消方决定是否记录。
+            raise
+        except Exception:
+            if attempt.settle():
+                self.stats[attempt.name].record_failure()
+            raise
+        if attempt.settle():
+            self.stats[attempt.name].record_success(time.monotonic() - attempt.started)
+        return result
+
+    def _timeout_error(self, attempt: _Attempt) -> TimeoutError:
+        """超时的尝试记为一次失败（它之后返回的结果不再记录）。"""
+        if attempt.settle():
+            self.stats[attempt.name].record_failure()
+        return TimeoutError(f"{attempt.name} 在 {self.timeout} 秒内没有返回")
+
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        # 在调用方线程中合并上下文中的配置（回调等），再显式传给后台线程。
+        config = ensure_config(config)
+        remaining = self.ranked()
+        if self.timeout is None and not self.hedge:
+            # 不需要计时: 直接在当前线程中依次尝试，出错时回退。
+            for i, name in enumerate(remaining):
+                try:
+                    return self._call(name, input, config, kwargs)
+                except Exception:
+                    if i == len(remaining) - 1:
+                        raise
+
+        pending: Dict[Future, _Attempt] = {}
+        last_error: Optional[BaseException] = None
+        hedged = False
+
+        def launch():
+            attempt = self._start(remaining.pop(0), input, config, kwargs)
+            pending[attempt.future] = attempt
+
+        launch()
+        try:
+            while pending:
+                hedge_at = None
+                if not hedged and remaining and len(pending) == 1:
+                    hedge_at = self._hedge_at(next(iter(pending.values())))
+                wakeups = [a.started + self.timeout for a in pending.values()] if self.timeout is not None else []
+                if hedge_at is not None:
+                    wakeups.append(hedge_at)
+                timeout = max(min(wakeups) - time.monotonic(), 0) if wakeups else None
+
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.pop(future)
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        last_error = e
+
+                now = time.monotonic()
+                if self.timeout is not None:
+                    for future, attempt in list(pending.items()):
+                        if now - attempt.started >= self.timeout:
+                            del pending[future]
+                            last_error = self._timeout_error(attempt)
+                            self._abandon(attempt)
+                if remaining and (not pending or (hedge_at is not None and now >= hedge_at)):
+                    hedged = hedged or bool(pending)
+                    launch()
+            raise last_error
+        finally:
+            # 已经有结果时，落选的请求仍在各自的线程中运行: 不再等待，也不记录它们的结果。
+            for attempt in pending.values():
+                self._abandon(attempt)
+
+    async def ainvoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        config = ensure_config(config)
+        remaining = self.ranked()
+        pending: Dict[asyncio.Task, _Attempt] = {}
+        last_error: Optional[BaseException] = None
+        hedged = False
+
+        def launch():
+            attempt = _Attempt(remaining.pop(0))
+            pending[asyncio.ensure_future(self._acall(attempt, input, config, kwargs))] = attempt
+
+        launch()
+        try:
+            while pending:
+                hedge_at = None
+                if not hedged and remaining and len(pending) == 1:
+                    hedge_at = self._hedge_at(next(iter(pending.values())))
+                wakeups = [a.started + self.timeout for a in pending.values()] if self.timeout is not None else []
+                if hedge_at is not None:
+                    wakeups.append(hedge_at)
+                timeout = max(min(wakeups) - time.monotonic(), 0) if wakeups else None
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        last_error = e
+
+                now = time.monotonic()
+                if self.timeout is not None:
+                    for task, attempt in list(pending.items()):
+                        if now - attempt.started >= self.timeout:
+                            del pending[task]
+                            task.cancel()
+                            last_error = self._timeout_error(attempt)
+                if remaining and (not pending or (hedge_at is not None and now >= hedge_at)):
+                    hedged = hedged or bool(pending)
+                    launch()
+            raise last_error
+        finally:
+            # 已经有结果（或调用方被取消）时，取消仍在进行的请求。
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """每个提供方的统计，便于日志和调试。"""
+        return {name: self.stats[name].snapshot() for name in self.providers}
+
+
+def configured_providers() -> Optional[List[str]]:
+    """环境变量 CHAT_LLM_PROVIDERS（逗号分隔，例如 "deepseek,gemini"）中的提供方；未设置时返回 None。"""
+    load_env()
+    value = os.getenv("CHAT_LLM_PROVIDERS", "")
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    return names or None
+
+
+def router_from_env(names: Optional[Sequence[str]] = None, **options) -> LLMRouter:
+    """按名称创建各提供方的模型（见 providers.PROVIDERS）并组成路由。
+
+    `names` 为空时读取 CHAT_LLM_PROVIDERS；CHAT_LLM_TIMEOUT（秒）和 CHAT_LLM_HEDGE=1 作为默认选项。
+    """
+    names = list(names or configured_providers() or ["deepseek"])
+    if os.getenv("CHAT_LLM_TIMEOUT"):
+        options.setdefault("timeout", float(os.getenv("CHAT_LLM_TIMEOUT")))
+    if os.getenv("CHAT_LLM_HEDGE"):
+        options.setdefault("hedge", os.getenv("CHAT_LLM_HEDGE").lower() in ("1", "true", "yes"))
+    return LLMRouter({name: make_chat_model(name) for name in names}, **options)
@@ -7,83 +7,134 @@
 # -----------------------------------------------------------------------------
 
 # --- 核心库导入 ---
+import sys
+import time
 import uuid
-import sqlite3
-from .app import chatapp, memory # 从同一个文件夹下的 app.py 文件中导入 chatapp 和 memory
-from langchain_core.messages import HumanMessage, AIMessage
-
-# --- Python 语法详解: `from .app import ...` ---
+from .history import HistoryPager
+from .registry import get_app, get_checkpointer # 从同一个文件夹下的 registry.py 文件中导入 get_app 和 get_checkpointer
+from .session_catalog import SessionCatalog
+from .streaming import final_reply, stream_reply
+from .tracing import tracer_from_env
+from langchain_core.messages import HumanMessage
+
+# --- Python 语法详解: `from .registry import ...` ---
 # `.` 在 import 语句中代表“当前文件夹”。
-# 这条语句的意思是：“从当前文件夹下的 `app.py` 模块中，导入 `chatapp` 和 `memory` 这两个变量。”
+# 这条语句的意思是：“从当前文件夹下的 `registry.py` 模块中，导入 `get_app` 和 `get_checkpointer` 这两个函数。”
 # 这种相对导入是组织一个包内多个文件之间关系的标准方式。
 
+# 会话列表每页显示的数量。
+PAGE_SIZE = 10
+# 恢复会话时每页显示的历史消息数量。
+HISTORY_PAGE_SIZE = 20
+
+
+def get_session_history(session_id: str, catalog: SessionCatalog = None, page_size: int = HISTORY_PAGE_SIZE) -> HistoryPager:
+    """获取指定会话 ID 的历史记录分页器。
+
+    分页器先只加载最近 `page_size` 条消息，更早的消息按需逐页加载，
+    不会为了显示预览而反序列化整段对话。
+    """
+    return HistoryPager(catalog or open_session_catalog(), session_id, page_size)
+
+
+def open_session_catalog(db_path: str = "chat_history.sqlite") -> SessionCatalog:
+    """打开会话目录。第一次打开旧数据库时，会从已有检查点中回填会话信息。
+
+    会话目录与聊天应用共用注册表中的同一个检查点后端（同一个数据库连接）。
+    """
+    saver = get_checkpointer(db_path)
+    with saver.lock:
+        saver.setup()
+    return saver.catalog
+
+def get_all_sessions(limit: int = PAGE_SIZE, offset: int = 0, query: str = None, catalog: SessionCatalog = None):
+    """分页获取历史会话，按最后更新时间倒序排列。
+
+    会话信息来自 `sessions` 目录表（见 session_catalog.py），
+    只按索引读取一页，而不是对检查点表执行 `SELECT DISTINCT thread_id`。
+    `query` 不为空时按标题或会话 ID 搜索。
+    """
+    catalog = catalog or open_session_catalog()
+    if query:
+        return catalog.search(query, limit=limit, offset=offset)
+    return catalog.list(limit=limit, offset=offset)
 
-def get_session_history(session_id: str):
-    """获取指定会话 ID 的历史记录。"""
-    # `memory` 是我们在 app.py 中创建的 SqliteSaver 实例。
-    # 我们可以用它来直接与数据库交互。
-    return memory.get_tuple(config={"configurable": {"thread_id": session_id}})
-
-def get_all_sessions():
-    """通过直接查询数据库来获取所有唯一的会话 ID。"""
-    try:
-        conn = sqlite3.connect("chat_history.sqlite")
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT thread_id FROM checkpoints")
-        sessions = cursor.fetchall()
-        conn.close()
-        return [{ "configurable": { "thread_id": session[0] } } for session in sessions]
-    except sqlite3.OperationalError:
-        # 如果表不存在，说明还没有任何会话被保存。
-        return []
-
-def main_loop():
-    """应用的主交互循环。"""
+def format_session(session) -> str:
+    """把一个会话格式化为列表中的一行: 标题、最后更新时间、消息数量。"""
+    updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(session.updated_at))
+    title = session.title or session.thread_id
+    return f"{title}  [{updated}, {session.message_count} 条消息]"
+
+def choose_session(catalog: SessionCatalog):
+    """分页显示历史会话，让用户选择一个继续。返回 (session_id, 是否为历史会话)。"""
+    offset, query = 0, None
+    while True:
+        sessions = get_all_sessions(PAGE_SIZE, offset, query, catalog)
+        if not sessions and offset == 0 and query is None:
+            print("未找到历史对话。将开始一个新对话。")
+            return str(uuid.uuid4()), False
+
+        print("找到以下历史对话:" if query is None else f"搜索 '{query}' 的结果:")
+        for i, session in enumerate(sessions):
+            print(f"  {i + 1}: {format_session(session)}")
+        print("  N: 开始一个新对话")
+        if len(sessions) == PAGE_SIZE:
+            print("  >: 下一页")
+        if offset > 0:
+            print("  <: 上一页")
+        print("  /关键词: 搜索对话，单独输入 / 返回完整列表")
+
+        choice = input("请选择一个对话继续，或输入 'N' 开始新对话: ").strip()
+        if choice.lower() == 'n':
+            return str(uuid.uuid4()), False
+        if choice == '>' and len(sessions) == PAGE_SIZE:
+            offset += PAGE_SIZE
+            continue
+        if choice == '<' and offset > 0:
+            offset = max(offset - PAGE_SIZE, 0)
+            continue
+        if choice.startswith('/'):
+            query, offset = (choice[1:].strip() or None), 0
+            continue
+        try:
+            choice_index = int(choice) - 1
+        except ValueError:
+            print("无效的输入，请输入一个数字或 'N'。")
+            continue
+        if 0 <= choice_index < len(sessions):
+            return sessions[choice_index].thread_id, True
+        print("无效的选择，请输入列表中的数字。")
+
+def main_loop(stream_tokens: bool = True):
+    """应用的主交互循环。
+
+    `stream_tokens` 为 True 时逐 token 打印回复，并在每轮结束后显示首字延迟和总耗时；
+    为 False 时与旧版本一样，等整个图运行结束后一次性打印最终回复。
+    """
     print("欢迎来到 LangGraph AI 聊天应用！")
     print("------------------------------------")
 
     # --- 会话管理 ---
-    sessions = get_all_sessions()
-    session_id = None
-
-    if not sessions:
-        print("未找到历史对话。将开始一个新对话。")
-        # --- Python 语法详解: `uuid.uuid4()` ---
-        # `uuid.uuid4()` 生成一个全球唯一的随机标识符。
-        # 我们用它来作为新对话的 `thread_id`，以保证每个对话都是独立、不冲突的。
-        session_id = str(uuid.uuid4())
-    else:
-        print("找到以下历史对话:")
-        for i, config in enumerate(sessions):
-            print(f"  {i + 1}: {config['configurable']['thread_id']}")
-        
-        print("  N: 开始一个新对话")
-
-        while True:
-            choice = input("请选择一个对话继续，或输入 'N' 开始新对话: ")
-            if choice.lower() == 'n':
-                session_id = str(uuid.uuid4())
-                break
-            try:
-                choice_index = int(choice) - 1
-                if 0 <= choice_index < len(sessions):
-                    session_id = sessions[choice_index]['configurable']['thread_id']
-                    print("\n--- 继续历史对话 --- ")
-                    history = get_session_history(session_id)
-                    for message in history.messages:
-                        message.pretty_print()
-                    print("--- 对话已加载 ---\n")
-                    break
-                else:
-                    print("无效的选择，请输入列表中的数字。")
-            except ValueError:
-                print("无效的输入，请输入一个数字或 'N'。")
+    # 已编译的应用来自进程级注册表: 无论获取多少次，图只编译一次、数据库只打开一次。
+    # 设置了 CHAT_TRACE_FILE / CHAT_METRICS_PORT 时开启本地追踪（见 tracing.py）。
+    tracer = tracer_from_env()
+    chatapp = get_app(tracer=tracer) if tracer else get_app()
+    catalog = open_session_catalog()
+    session_id, resumed = choose_session(catalog)
+    history = get_session_history(session_id, catalog)
+    if resumed:
+        print("\n--- 继续历史对话 --- ")
+        for message in history.latest():
+            message.pretty_print()
+        print("--- 对话已加载 ---\n")
 
     # --- Python 语法详解: `f-string` ---
     # f"..." 是一种现代的、易读的格式化字符串的方式。
     # 你可以直接在字符串中用 `{}` 包裹变量名，Python 会自动将变量的值替换进去。
     print(f"\n当前会话 ID: {session_id}")
     print("输入 '/exit' 退出程序。")
+    if resumed and history.has_more:
+        print("输入 '/more' 查看更早的消息。")
     print("------------------------------------")
 
     # 为当前会话创建一个配置字典
@@ -102,23 +153,34 @@ def main_loop():
             if user_input.lower() == '/exit':
                 print("感谢使用，再见！")
                 break # 跳出无限循环
+            if user_input.lower() == '/more':
+                # 向前加载一页更早的历史消息。
+                page = history.older()
+                for message in page:
+                    message.pretty_print()
+                if not history.has_more:
+                    print("--- 已经到达对话的开头 ---")
+                continue
 
             # 将用户的输入封装成 HumanMessage 对象
             inputs = {"messages": [HumanMessage(content=user_input)]}
             
+            # --- 流式模式 ---
+            # LLM 每生成一个 token 就立即打印，工具调用也会实时显示。
+            if stream_tokens:
+                print("AI: ", end="", flush=True)
+                stats = stream_reply(chatapp, inputs, config)
+                print(f"({stats.summary()})")
+                continue
+
             # --- 调用 LangGraph 应用 ---
-            # `chatapp.stream()` 是我们与 Agent 交互的核心。
-            # 我们传入用户的输入和当前会话的配置。
-            # Agent 会自动加载这个会话的历史记录，并在此基础上进行思考。
-            final_response = None
+            # `final_reply` 内部使用 `chatapp.stream(..., stream_mode="updates")`。
+            # 我们传入用户的输入和当前会话的配置，Agent 会自动加载这个会话的历史记录，
+            # 并在此基础上进行思考。每个事件只包含节点本步新增的消息，
+            # 因此无论历史有多长，处理一个事件的开销都是固定的。
             print("AI: ", end="", flush=True)
-            for event in chatapp.stream(inputs, config, stream_mode="values"):
-                # `stream` 会返回每一步的状态更新。我们只关心最终的回复。
-                # AIMessage 类型的消息就是 AI 的回复。
-                ai_messages = [msg for msg in event["messages"] if isinstance(msg, AIMessage)]
-                if ai_messages:
-                    final_response = ai_messages[-1]
-            
+            final_response = final_reply(chatapp, inputs, config)
+
             # 打印最终回复
             if final_response:
                 print(final_response.content)
@@ -140,4 +202,5 @@ def main_loop():
 # 如果这个文件被其他文件作为模块 `import`，那么 `if` 下面的代码就**不会**被执行。
 # 这使得我们可以安全地从其他文件中导入 `main_loop` 函数，而不用担心它会自动运行。
 if __name__ == "__main__":
-    main_loop()
+    # `--no-stream` 关闭逐 token 输出，恢复一次性打印最终回复的行为。
+    main_loop(stream_tokens="--no-stream" not in sys.argv[1:])
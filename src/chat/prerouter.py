@@ -0,0 +1,263 @@
+# -----------------------------------------------------------------------------
+# 不调用 LLM 的预路由 (Pre-Router)
+#
+# main.py 和 phase1_simple_chatbot.py 用关键字（`"langgraph" in question.lower()`）决定走哪条路，
+# 不需要模型；而 app.py 的聊天图对每一轮都要完整调用一次 DeepSeek，
+# 哪怕用户只是说了句“你好”、输入了 "/help"，或者问的是一个答案固定的常见问题。
+#
+# `PreRouter` 是放在 `agent` 节点之前的图节点，依次尝试三种廉价的匹配方式:
+#   1. 规则 (`Rule`): 对规范化后的整句做正则全匹配，例如问候、致谢、"/help" 等命令；
+#   2. FAQ 精确匹配 (`FAQIndex`): 规范化（忽略大小写、多余空白和句末标点）后完全相同的问题直接返回固定答案；
+#   3. 可选的本地小分类器 (`NaiveBayesClassifier`): 字符 n-gram 朴素贝叶斯，纯 Python、无额外依赖，
+#      只对较短的输入生效，置信度达到 `min_confidence` 且该类别有固定答案时才直接回答。
+# 命中时写入一条 AIMessage（`response_metadata["prerouter"]` 记录命中来源）并结束本轮，
+# 否则什么都不写，交给 `agent` 节点正常处理。只看本轮最后一条用户消息，工具循环不受影响。
+#
+# `stats()` 报告经过预路由的轮数、直接回答（省下 LLM 调用）的比例和各来源的命中次数；
+# 传入 `Metrics`（见 tracing.py）时还会导出 chat_prerouter_turns_total{route=...}。
+# 命中与未命中轮次的端到端延迟对比见 benchmarks/bench_prerouter.py。
+#
+# 用法:
+#   prerouter = PreRouter(faq=FAQIndex.from_file("faq.jsonl"))
+#   chatapp = get_compiled_app(prerouter=prerouter)
+#   print(prerouter.stats())
+# -----------------------------------------------------------------------------
+
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from .cache import normalize_query
+
+# 预路由节点在图中的名称。
+NODE = "prerouter"
+
+# 句末可以忽略的标点和语气符号。
+_TRAILING = "?？!！。.,，~～…、 "
+
+HELP_TEXT = (
+    "可用的命令:\n"
+    "  /help  显示本帮助\n"
+    "  /more  查看更早的历史消息\n"
+    "  /exit  退出程序\n"
+    "其他输入会作为问题发给 AI 助手，需要时它会联网搜索。"
+)
+
+
+def normalize_text(text: str) -> str:
+    """规范化用户输入: 在 `normalize_query` 的基础上去掉句末标点，用于规则和 FAQ 的匹配。"""
+    return normalize_query(text).rstrip(_TRAILING)
+
+
+@dataclass
+class Rule:
+    """对规范化后的整句做正则全匹配的规则。
+
+    `answer` 是固定的回答，或者接收 `re.Match` 返回回答的函数。`name` 用于统计和指标。
+    """
+    name: str
+    pattern: str
+    answer: Union[str, Callable[[re.Match], str]]
+
+    def __post_init__(self):
+        self._regex = re.compile(self.pattern, re.IGNORECASE)
+
+    def match(self, text: str) -> Optional[str]:
+        found = self._regex.fullmatch(text)
+        if found is None:
+            return None
+        return self.answer(found) if callable(self.answer) else self.answer
+
+
+DEFAULT_RULES = (
+    Rule("help", r"/help|/\?|帮助", HELP_TEXT),
+    Rule("greeting", r"(你好|您好|嗨|哈喽|在吗|在么|hi|hello|hey)(呀|啊|哇)?", "你好！有什么可以帮你的吗？"),
+    Rule("thanks", r"(谢谢|多谢|感谢|谢啦|thanks|thank you|thx)(你|您)?(啦|了|呀)?", "不客气！还有其他问题随时问我。"),
+    Rule("goodbye", r"(再见|拜拜|bye|goodbye)", "再见！"),
+)
+
+
+class FAQIndex:
+    """常见问题的精确匹配索引: 规范化后完全相同的问题返回固定答案。"""
+
+    def __init__(self, entries: Optional[Dict[str, str]] = None):
+        self._answers: Dict[str, str] = {}
+        for question, answer in (entries or {}).items():
+            self.add(question, answer)
+
+    @classmethod
+    def from_file(cls, path: str) -> "FAQIndex":
+        """从 JSON 文件（{问题: 答案} 或 [{"question", "answer"}]）或 JSONL 文件（每行一个 {"question", "answer"}）加载。"""
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                items = [json.loads(line) for line in f if line.strip()]
+            else:
+                items = json.load(f)
+        if isinstance(items, dict):
+            return cls(items)
+        return cls({item["question"]: item["answer"] for item in items})
+
+    def add(self, question: str, answer: str):
+        self._answers[normalize_text(question)] = answer
+
+    def get(self, question: str) -> Optional[str]:
+        return self._answers.get(normalize_text(question))
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+
+class NaiveBayesClassifier:
+    """字符 n-gram 的多项式朴素贝叶斯分类器，用于识别闲聊、问候等不需要模型的输入。
+
+    纯 Python 实现，训练几百条样本只需要几毫秒；`predict` 返回 (类别, 置信度)，置信度是各类别后验概率中的最大值。
+    """
+
+    def __init__(self, ngram: Tuple[int, int] = (1, 2), alpha: float = 1.0):
+        self.ngram = ngram
+        self.alpha = alpha
+        self._priors: Dict[str, float] = {}
+        self._counts: Dict[str, Counter] = {}
+        self._totals: Dict[str, int] = {}
+        self._vocabulary: set = set()
+
+    def _features(self, text: str) -> list:
+        text = normalize_text(text)
+        low, high = self.ngram
+        return [text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1)]
+
+    def fit(self, examples: Iterable[Tuple[str, str]]) -> "NaiveBayesClassifier":
+        """用 (文本, 类别) 样本训练，返回自身。"""
+        docs: Dict[str, int] = defaultdict(int)
+        counts: Dict[str, Counter] = defaultdict(Counter)
+        for text, label in examples:
+            docs[label] += 1
+            counts[label].update(self._features(text))
+        total_docs = sum(docs.values())
+        self._priors = {label: math.log(n / total_docs) for label, n in docs.items()}
+        self._counts = dict(counts)
+        self._totals = {label: sum(c.values()) for label, c in counts.items()}
+        self._vocabulary = set().union(*counts.values()) if counts else set()
+        return self
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        if not self._priors:
+            return None, 0.0
+        features = self._features(text)
+        vocabulary = len(self._vocabulary) + 1
+        scores = {}
+        for label, prior in self._priors.items():
+            counts, denominator = self._counts[label], self._totals[label] + self.alpha * vocabulary
+            scores[label] = prior + sum(math.log((counts[f] + self.alpha) / denominator) for f in features)
+        best = max(scores, key=scores.get)
+        # 对数后验做 softmax 得到置信度。
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / norm
+
+
+class PreRouter:
+    """`agent` 之前的预路由节点: 用规则、FAQ 和可选的本地分类器直接回答简单的输入。
+
+    `rules` 默认是 `DEFAULT_RULES`（问候、致谢、告别和 /help），传入空元组可以关闭规则。
+    `classifier` 是带 `predict(text) -> (label, confidence)` 方法的分类器，`answers` 是类别到固定回答的映射，
+    没有回答的类别（例如 "other"）总是交给模型；分类器只用于不超过 `max_classify_length` 个字符的输入。
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[Rule] = DEFAULT_RULES,
+        faq: Optional[FAQIndex] = None,
+        classifier=None,
+        answers: Optional[Dict[str, str]] = None,
+        min_confidence: float = 0.9,
+        max_classify_length: int = 20,
+        metrics=None,
+    ):
+        self.rules = tuple(rules)
+        self.faq = faq
+        self.classifier = classifier
+        self.answers = dict(answers or {})
+        self.min_confidence = min_confidence
+        self.max_classify_length = max_classify_length
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._turns = 0
+        self._routes: Counter = Counter()
+        self._seconds = 0.0
+
+    def match(self, text: str) -> Optional[Tuple[str, str]]:
+        """返回 (命中来源, 回答)；需要模型时返回 None。命中来源为 "rule:<名称>"、"faq" 或 "classifier:<类别>"。"""
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+        for rule in self.rules:
+            answer = rule.match(normalized)
+            if answer is not None:
+                return f"rule:{rule.name}", answer
+        if self.faq is not None:
+            answer = self.faq.get(normalized)
+            if answer is not None:
+                return "faq", answer
+        if self.classifier is not None and len(normalized) <= self.max_classify_length:
+            label, confidence = self.classifier.predict(normalized)
+            if label in self.answers and confidence >= self.min_confidence:
+                return f"classifier:{label}", self.answers[label]
+        return None
+
+    def __call__(self, state) -> dict:
+        """图节点: 命中时返回包含回答的状态更新，否则返回空更新。"""
+        begin = time.perf_counter()
+        messages = state["messages"]
+        hit = None
+        # 只处理以用户消息结尾的状态，即新一轮对话的开始。
+        if messages and isinstance(messages[-1], HumanMessage) and isinstance(messages[-1].content, str):
+            hit = self.match(messages[-1].content)
+        self._record(hit[0] if hit else "llm", time.perf_counter() - begin)
+        if hit is None:
+            return {}
+        source, answer = hit
+        return {"messages": [AIMessage(content=answer, response_metadata={"prerouter": source})]}
+
+    def _record(self, route: str, seconds: float):
+        with self._lock:
+            self._turns += 1
+            self._routes[route] += 1
+            self._seconds += seconds
+        if self.metrics is not None:
+            self.metrics.inc("chat_prerouter_turns_total", route=route.split(":")[0])
+
+    def stats(self) -> dict:
+        """经过预路由的轮数、直接回答的轮数和比例、各来源的命中次数，以及预路由本身的平均耗时。"""
+        with self._lock:
+            turns, routes, seconds = self._turns, dict(self._routes), self._seconds
+        saved = turns - routes.get("llm", 0)
+        return {
+            "turns": turns,
+            "short_circuited": saved,
+            "saved_rate": saved / turns if turns else 0.0,
+            "routes": routes,
+            "avg_overhead_ms": seconds / turns * 1000 if turns else 0.0,
+        }
+
+
+def route_after_prerouter(state) -> str:
+    """预路由写入了回答时结束本轮，否则交给 `agent` 节点。"""
+    last = state["messages"][-1]
+    if isinstance(last, AIMessage) and "prerouter" in last.response_metadata:
+        return "__end__"
+    return "agent"
+
+
+def add_prerouter(workflow, prerouter: PreRouter):
+    """把预路由节点加到工作流中并设为入口点，位于 `agent` 之前；调用方不要再把 `agent` 设为入口点。"""
+    workflow.add_node(NODE, prerouter)
+    workflow.set_entry_point(NODE)
+    workflow.add_conditional_edges(NODE, route_after_prerouter, ["agent", "__end__"])
+    return workflow
@@ -0,0 +1,83 @@
+# -----------------------------------------------------------------------------
+# 模型提供方的懒加载与配置校验
+#
+# `langchain_deepseek`（连带 openai、langchain_openai）和 `langchain_google_genai`
+# 的导入开销很大，而大多数时候一个进程只会用到其中一个，测试和命令行启动甚至一个都用不到。
+# 这里把它们包装成“第一次调用时才导入”的对象，用法与原来的类完全相同:
+#
+#   llm = ChatDeepSeek(model="deepseek-chat", temperature=0)
+#
+# API Key 也不再在导入模块时检查，而是在真正构建应用时由 `require_env` 检查。
+# `make_chat_model(name)` 按名称创建一个提供方的模型，并只检查它自己需要的 Key。
+# -----------------------------------------------------------------------------
+
+import importlib
+import os
+import threading
+
+_dotenv_loaded = False
+_dotenv_lock = threading.Lock()
+
+
+def load_env():
+    """读取 .env 文件（只读取一次）。"""
+    global _dotenv_loaded
+    if _dotenv_loaded:
+        return
+    with _dotenv_lock:
+        if not _dotenv_loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _dotenv_loaded = True
+
+
+def require_env(*names: str):
+    """检查环境变量（包括 .env 中的）是否都已设置，缺少时抛出 ValueError。"""
+    load_env()
+    for name in names:
+        if not os.getenv(name):
+            raise ValueError(f"{name} not set")
+
+
+class LazyImport:
+    """一个在第一次调用时才导入 `module.attr` 的代理，调用它等同于调用被代理的类或函数。"""
+
+    def __init__(self, module: str, attr: str):
+        self.module = module
+        self.attr = attr
+        self._target = None
+
+    def load(self):
+        if self._target is None:
+            self._target = getattr(importlib.import_module(self.module), self.attr)
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"LazyImport({self.module}.{self.attr})"
+
+
+ChatDeepSeek = LazyImport("langchain_deepseek", "ChatDeepSeek")
+ChatGoogleGenerativeAI = LazyImport("langchain_google_genai", "ChatGoogleGenerativeAI")
+
+
+# 提供方名称 -> (需要的 API Key, 创建模型的函数)。两个模型都使用 temperature=0。
+PROVIDERS = {
+    "deepseek": ("DEEPSEEK_API_KEY", lambda: ChatDeepSeek(model="deepseek-chat", temperature=0)),
+    "gemini": (
+        "GEMINI_API_KEY",
+        lambda: ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0, google_api_key=os.getenv("GEMINI_API_KEY")),
+    ),
+}
+
+
+def make_chat_model(name: str):
+    """创建指定提供方的聊天模型。未知的名称或缺少 API Key 时抛出 ValueError。"""
+    if name not in PROVIDERS:
+        raise ValueError(f"未知的模型: {name}")
+    key, factory = PROVIDERS[name]
+    require_env(key)
+    return factory()
@@ -0,0 +1,501 @@
+# -----------------------------------------------------------------------------
+# 按提供方限流的全局调度器 (Rate Limiting & Priority Scheduling)
+#
+# app.py 和 phase2_tool_agent.py 调用 DeepSeek / Gemini / Tavily 时没有任何速率控制，
+# 高负载下所有会话一起撞上 429，各自重试又把请求量放大。
+#
+# `RateLimitScheduler` 是进程内共享的调度器，每个提供方有自己的令牌桶和等待队列:
+#   - 令牌桶: 每秒请求数 (`requests_per_s`，桶容量 `burst`) 和每分钟 token 数 (`tokens_per_min`)，
+#     两个桶都有余量时请求才放行。LLM 请求先按提示估算 token，返回后用 usage_metadata 的实际用量校正；
+#     超过桶容量的单个请求在桶满时放行，之后的请求等它“还清欠账”。
+#   - 优先级: "interactive"（默认，在线聊天）总是先于 "batch"（batch.py 的离线任务）放行。
+#   - 公平排队: 同一优先级内按 thread_id 做 start-time fair queuing，
+#     一个会话排了很多请求时，其他会话的请求不会排在它们全部之后。
+#   - 背压: 队列长度达到 `max_queue` 或排队超过 `timeout` 秒时抛出 `RateLimitExceeded`，
+#     而不是无限堆积请求。
+#   - 指标: 传入 `Metrics`（见 tracing.py）时导出每个提供方的队列深度、排队耗时和拒绝次数。
+#
+# 队列为空且桶有余量时在调用方线程直接放行；否则由一个后台线程按桶的补充时间依次唤醒等待者。
+# priority 和 thread_id 默认从当前运行的 config["configurable"] 中读取，
+# 所以图节点和工具里的调用不需要任何改动。
+#
+# 用法:
+#   scheduler = RateLimitScheduler({
+#       "deepseek": ProviderLimit(requests_per_s=5, tokens_per_min=60000),
+#       "tavily": ProviderLimit(requests_per_s=2),
+#   })
+#   chatapp = get_compiled_app(scheduler=scheduler)
+#   chatapp.invoke(inputs, {"configurable": {"thread_id": "t1", "priority": "batch"}})
+#   scheduler = scheduler_from_env()   # 或者从 CHAT_RATE_LIMITS="deepseek:rps=5,tpm=60000;tavily:rps=2" 读取
+# -----------------------------------------------------------------------------
+
+import asyncio
+import functools
+import heapq
+import inspect
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables.config import ensure_config
+
+from .llm_router import LLMRouter
+from .providers import load_env
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# 优先级名称 -> 排序值，越小越先放行。
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1}
+
+# 常见模型的 `_llm_type` -> 提供方名称（与 providers.PROVIDERS 一致）。
+_LLM_TYPES = {"chat-deepseek": "deepseek", "chat-google-generative-ai": "gemini"}
+
+
+class RateLimitExceeded(RuntimeError):
+    """队列已满或排队超时: 调用方应当降级或稍后重试，而不是继续堆积请求。"""
+
+
+@dataclass
+class ProviderLimit:
+    """一个提供方的配额。为空的限制表示不限。
+
+    `burst` 是请求桶的容量（默认等于每秒请求数，至少为 1）；token 桶的容量是一分钟的配额。
+    `max_queue` 是等待队列的最大长度，`timeout` 是单个请求最长的排队时间（秒），为空时一直等待。
+    """
+    requests_per_s: Optional[float] = None
+    tokens_per_min: Optional[float] = None
+    burst: Optional[float] = None
+    max_queue: int = 1000
+    timeout: Optional[float] = 60.0
+
+
+# `parse_limits` 中的简写 -> ProviderLimit 的字段。
+_LIMIT_KEYS = {
+    "rps": "requests_per_s",
+    "tpm": "tokens_per_min",
+    "burst": "burst",
+    "queue": "max_queue",
+    "timeout": "timeout",
+}
+
+
+def parse_limits(spec: str) -> Dict[str, ProviderLimit]:
+    """解析配额字符串，例如 "deepseek:rps=5,tpm=60000;tavily:rps=2"。
+
+    提供方之间用分号分隔；可用的键为 rps、tpm、burst、queue（最大排队数）和 timeout（秒，"none" 表示一直等待）。
+    """
+    limits = {}
+    for part in spec.split(";"):
+        if not part.strip():
+            continue
+        name, sep, fields = part.partition(":")
+        if not sep or not name.strip():
+            raise ValueError(f"配额格式应为 <提供方>:<键>=<值>,...，实际为 {part!r}")
+        options = {}
+        for field in fields.split(","):
+            if not field.strip():
+                continue
+            key, sep, value = field.partition("=")
+            key = key.strip().lower()
+            if not sep or key not in _LIMIT_KEYS:
+                raise ValueError(f"未知的配额项 {field!r}，可用的键: {', '.join(_LIMIT_KEYS)}")
+            value = value.strip()
+            if key == "queue":
+                options[_LIMIT_KEYS[key]] = int(value)
+            else:
+                options[_LIMIT_KEYS[key]] = None if value.lower() == "none" else float(value)
+        limits[name.strip()] = ProviderLimit(**options)
+    return limits
+
+
+def limits_from_env() -> Optional[Dict[str, ProviderLimit]]:
+    """环境变量 CHAT_RATE_LIMITS 中的配额（格式见 `parse_limits`）；未设置时返回 None。"""
+    load_env()
+    spec = os.getenv("CHAT_RATE_LIMITS", "").strip()
+    return parse_limits(spec) if spec else None
+
+
+def scheduler_from_env(metrics=None) -> Optional["RateLimitScheduler"]:
+    """按 CHAT_RATE_LIMITS 创建调度器；未设置时返回 None（不限流）。"""
+    limits = limits_from_env()
+    return RateLimitScheduler(limits, metrics=metrics) if limits else None
+
+
+class TokenBucket:
+    """按 `rate`（每秒）补充、最多存 `capacity` 的令牌桶。余量可以为负（欠账）。"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """还要等多少秒才能取出 `amount`。超过容量的请求只需等到桶满。"""
+        self._refill(now)
+        need = min(amount, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+    def adjust(self, amount: float):
+        """多扣（正数）或退还（负数）`amount`，用于按实际用量校正估算值。"""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class _Waiter:
+    __slots__ = ("tokens", "thread_id", "priority", "enqueued", "notify", "granted", "cancelled")
+
+    def __init__(self, tokens: float, thread_id: Hashable, priority: str, enqueued: float, notify: Callable[[], None]):
+        self.tokens = tokens
+        self.thread_id = thread_id
+        self.priority = priority
+        self.enqueued = enqueued
+        self.notify = notify
+        self.granted = False
+        self.cancelled = False
+
+
+class _Provider:
+    """一个提供方的令牌桶、等待队列和统计。"""
+
+    def __init__(self, limit: ProviderLimit, now: float):
+        self.limit = limit
+        self.requests = None
+        self.tokens = None
+        if limit.requests_per_s:
+            self.requests = TokenBucket(limit.requests_per_s, limit.burst or max(1.0, limit.requests_per_s), now)
+        if limit.tokens_per_min:
+            self.tokens = TokenBucket(limit.tokens_per_min / 60, limit.tokens_per_min, now)
+        # (优先级, 虚拟开始时间, 序号, 等待者)
+        self.heap: list = []
+        self.depth = 0
+        # 公平排队的虚拟时钟，以及每个 thread_id 最后一个请求的虚拟结束时间。
+        self.vtime = 0.0
+        self.finish: Dict[Hashable, float] = {}
+        self.granted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def delay(self, tokens: float, now: float) -> float:
+        delay = self.requests.delay(1, now) if self.requests else 0.0
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return delay
+
+    def take(self, tokens: float, now: float):
+        if self.requests is not None:
+            self.requests.take(1, now)
+        if self.tokens is not None and tokens:
+            self.tokens.take(tokens, now)
+
+
+def request_class(config=None, priority: Optional[str] = None, thread_id: Optional[Hashable] = None):
+    """返回 (priority, thread_id)。未显式给出的值从 config（或当前运行的 config）的 configurable 中读取。"""
+    configurable = ensure_config(config).get("configurable") or {}
+    priority = priority or configurable.get("priority") or INTERACTIVE
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}，可选: {', '.join(PRIORITIES)}")
+    return priority, thread_id if thread_id is not None else configurable.get("thread_id")
+
+
+def provider_name(llm) -> str:
+    """模型对应的提供方名称，例如 ChatDeepSeek -> "deepseek"；未知的模型使用它的 `_llm_type`。"""
+    llm_type = getattr(llm, "_llm_type", type(llm).__name__)
+    return _LLM_TYPES.get(llm_type, llm_type)
+
+
+class RateLimitScheduler:
+    """线程安全、同步和异步调用方共用的限流调度器。`limits` 中没有的提供方不限流。"""
+
+    def __init__(self, limits: Dict[str, ProviderLimit], metrics=None, clock: Callable[[], float] = time.monotonic):
+        self.limits = dict(limits)
+        self.metrics = metrics
+        self._clock = clock
+        now = clock()
+        self._providers = {name: _Provider(limit, now) for name, limit in self.limits.items()}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._closed = False
+
+    # --- 排队与放行（都在 self._cond 内调用） ---
+    def _set_depth(self, name: str, provider: _Provider, delta: int):
+        provider.depth += delta
+        if self.metrics is not None:
+            self.metrics.set("chat_ratelimit_queue_depth", provider.depth, provider=name)
+
+    def _grant(self, name: str, provider: _Provider, waiter: _Waiter, now: float):
+        waited = now - waiter.enqueued
+        provider.granted += 1
+        provider.wait_seconds += waited
+        if self.metrics is not None:
+            self.metrics.observe("chat_ratelimit_wait_seconds", waited, provider=name, priority=waiter.priority)
+
+    def _reject(self, name: str, provider: _Provider, reason: str):
+        provider.rejected += 1
+        if self.metrics is not None:
+            self.metrics.inc("chat_ratelimit_rejected_total", provider=name, reason=reason)
+
+    def _enqueue(self, name: str, tokens: float, priority: str, thread_id: Hashable, notify: Callable[[], None]):
+        """立即放行时返回 None，否则返回排队中的等待者。队列已满时抛出 RateLimitExceeded。"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("RateLimitScheduler 已关闭")
+            provider = self._providers[name]
+            now = self._clock()
+            waiter = _Waiter(tokens, thread_id, priority, now, notify)
+            if provider.depth == 0 and provider.delay(tokens, now) == 0:
+                provider.take(tokens, now)
+                self._grant(name, provider, waiter, now)
+                return None
+            if provider.depth >= provider.limit.max_queue:
+                self._reject(name, provider, "queue_full")
+                raise RateLimitExceeded(f"{name} 的等待队列已满（{provider.limit.max_queue}）")
+            start = max(provider.vtime, provider.finish.get(thread_id, 0.0))
+            provider.finish[thread_id] = start + 1
+            heapq.heappush(provider.heap, (PRIORITIES[priority], start, next(self._seq), waiter))
+            provider.queued += 1
+            self._set_depth(name, provider, 1)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._run, name="rate-limit-dispatcher", daemon=True)
+                self._dispatcher.start()
+            self._cond.notify()
+            return waiter
+
+    def _cancel(self, name: str, waiter: _Waiter, reason: str) -> bool:
+        """放弃一个还没放行的等待者。已经放行时返回 False。"""
+        with self._cond:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            provider = self._providers[name]
+            self._set_depth(name, provider, -1)
+            self._reject(name, provider, reason)
+            self._cond.notify()
+            return True
+
+    def _pump(self, name: str, provider: _Provider, now: float) -> Optional[float]:
+        """按顺序放行桶余量允许的等待者，返回距离下一次能放行还要等多少秒（队列为空时为 None）。"""
+        while provider.heap:
+            _, start, _, waiter = provider.heap[0]
+            if waiter.cancelled:
+                heapq.heappop(provider.heap)
+                continue
+            delay = provider.delay(waiter.tokens, now)
+            if delay > 0:
+                return delay
+            heapq.heappop(provider.heap)
+            provider.take(waiter.tokens, now)
+            provider.vtime = start
+            waiter.granted = True
+            self._set_depth(name, provider, -1)
+            self._grant(name, provider, waiter, now)
+            waiter.notify()
+        if len(provider.finish) > 1024:
+            # 虚拟结束时间不晚于虚拟时钟的会话已经没有影响，清掉避免无限增长。
+            provider.finish = {k: v for k, v in provider.finish.items() if v > provider.vtime}
+        return None
+
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                now = self._clock()
+                timeout = None
+                for name, provider in self._providers.items():
+                    delay = self._pump(name, provider, now)
+                    if delay is not None:
+                        timeout = delay if timeout is None else min(timeout, delay)
+                self._cond.wait(timeout)
+
+    # --- 公共接口 ---
+    def acquire(
+        self,
+        provider: str,
+        tokens: float = 0,
+        priority: Optional[str] = None,
+        thread_id: Optional[Hashable] = None,
+        timeout: Optional[float] = None,
+    ) -> float:
+        """等待 `provider` 放行一个消耗 `tokens` 个 token 的请求，返回排队的秒数。
+
+        `timeout` 为空时使用提供方配置的超时。队列已满或超时抛出 `RateLimitExceeded`。
+        """
+        if provider not in self._providers:
+            return 0.0
+        priority, thread_id = request_class(None, priority, thread_id)
+        begin = time.monotonic()
+        event = threading.Event()
+        waiter = self._enqueue(provider, tokens, priority, thread_id, event.set)
+        if waiter is None:
+            return 0.0
+        timeout = self.limits[provider].timeout if timeout is None else timeout
+        if not event.wait(timeout) and self._cancel(provider, waiter, "timeout"):
+            raise RateLimitExceeded(f"{provider} 排队超过 {timeout} 秒")
+        return time.monotonic() - begin
+
+    async def aacquire(
+        self,
+        provider: str,
+        tokens: float = 0,
+        priority: Optional[str] = None,
+        thread_id: Optional[Hashable] = None,
+        timeout: Optional[float] = None,
+    ) -> float:
+        """`acquire` 的异步版本，等待期间不阻塞事件循环。调用方被取消时放弃排队。"""
+        if provider not in self._providers:
+            return 0.0
+        priority, thread_id = request_class(None, priority, thread_id)
+        begin = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def resolve():
+            if not granted.done():
+                granted.set_result(None)
+
+        def notify():
+            try:
+                loop.call_soon_threadsafe(resolve)
+            except RuntimeError:
+                # 事件循环已经关闭，没有人在等了。
+                pass
+
+        waiter = self._enqueue(provider, tokens, priority, thread_id, notify)
+        if waiter is None:
+            return 0.0
+        timeout = self.limits[provider].timeout if timeout is None else timeout
+        try:
+            await asyncio.wait_for(granted, timeout)
+        except asyncio.TimeoutError:
+            if self._cancel(provider, waiter, "timeout"):
+                raise RateLimitExceeded(f"{provider} 排队超过 {timeout} 秒") from None
+        except asyncio.CancelledError:
+            self._cancel(provider, waiter, "cancelled")
+            raise
+        return time.monotonic() - begin
+
+    def adjust(self, provider: str, tokens: float):
+        """按实际用量校正 token 桶: 正数表示比估算多用了，负数表示退还。"""
+        with self._cond:
+            bucket = self._providers[provider].tokens if provider in self._providers else None
+            if bucket is None or not tokens:
+                return
+            bucket.adjust(tokens)
+            self._cond.notify()
+
+    def queue_depth(self, provider: Optional[str] = None) -> int:
+        """某个提供方（为空时为全部提供方）正在排队的请求数。"""
+        with self._cond:
+            if provider is not None:
+                return self._providers[provider].depth if provider in self._providers else 0
+            return sum(p.depth for p in self._providers.values())
+
+    def snapshot(self) -> Dict[str, dict]:
+        """每个提供方的队列深度、放行 / 排队 / 拒绝次数、平均排队时间和桶余量，便于日志和调试。"""
+        with self._cond:
+            now = self._clock()
+            result = {}
+            for name, p in self._providers.items():
+                buckets = {}
+                for key, bucket in (("requests", p.requests), ("tokens", p.tokens)):
+                    if bucket is not None:
+                        bucket._refill(now)
+                        buckets[key] = round(bucket.level, 3)
+                result[name] = {
+                    "depth": p.depth,
+                    "granted": p.granted,
+                    "queued": p.queued,
+                    "rejected": p.rejected,
+                    "mean_wait": round(p.wait_seconds / p.granted, 6) if p.granted else 0.0,
+                    **buckets,
+                }
+            return result
+
+    def wrap(self, fn: Callable, provider: str, tokens: Callable[..., float] | None = None) -> Callable:
+        """返回一个先排队再调用 `fn` 的同名函数（同步或 async 与 `fn` 一致）。
+
+        `tokens` 是可选的 `(*args, **kwargs) -> token 数` 函数，为空时只按请求数限流。
+        """
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def alimited(*args, **kwargs):
+                await self.aacquire(provider, tokens(*args, **kwargs) if tokens else 0)
+                return await fn(*args, **kwargs)
+            return alimited
+
+        @functools.wraps(fn)
+        def limited(*args, **kwargs):
+            self.acquire(provider, tokens(*args, **kwargs) if tokens else 0)
+            return fn(*args, **kwargs)
+        return limited
+
+    def wrap_model(self, llm, bound=None, provider: Optional[str] = None):
+        """给 `bound`（为空时为 `llm`）加上限流，提供与之相同的 `invoke` / `ainvoke`。
+
+        `LLMRouter` 的每个提供方分别限流，被限流的提供方排队变慢后，路由会自然偏向其他提供方。
+        """
+        if bound is None:
+            bound = llm
+        if isinstance(bound, LLMRouter):
+            return bound.with_providers({name: RateLimitedModel(self, model, name) for name, model in bound.providers.items()})
+        return RateLimitedModel(self, bound, provider or provider_name(llm))
+
+    def close(self):
+        """停止后台线程。仍在排队的同步调用方会等到各自超时。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+
+
+def _estimate_tokens(messages) -> int:
+    if isinstance(messages, Sequence) and messages and all(isinstance(m, BaseMessage) for m in messages):
+        return count_tokens_approximately(messages)
+    return 0
+
+
+class RateLimitedModel:
+    """带限流的 `llm_with_tools`，提供与之相同的 `invoke` / `ainvoke`。
+
+    请求前按提示估算 token 数排队；回复带有 usage_metadata 时，用实际用量校正 token 桶。
+    """
+
+    def __init__(self, scheduler: RateLimitScheduler, bound, provider: str):
+        self.scheduler = scheduler
+        self.bound = bound
+        self.provider = provider
+
+    def _reconcile(self, response: Any, estimate: int):
+        usage = getattr(response, "usage_metadata", None) if isinstance(response, AIMessage) else None
+        if usage and usage.get("total_tokens"):
+            self.scheduler.adjust(self.provider, usage["total_tokens"] - estimate)
+
+    def invoke(self, messages, config=None, **kwargs):
+        estimate = _estimate_tokens(messages)
+        priority, thread_id = request_class(config)
+        self.scheduler.acquire(self.provider, estimate, priority, thread_id)
+        response = self.bound.invoke(messages, config, **kwargs)
+        self._reconcile(response, estimate)
+        return response
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        estimate = _estimate_tokens(messages)
+        priority, thread_id = request_class(config)
+        await self.scheduler.aacquire(self.provider, estimate, priority, thread_id)
+        response = await self.bound.ainvoke(messages, config, **kwargs)
+        self._reconcile(response, estimate)
+        return response
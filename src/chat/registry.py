@@ -0,0 +1,142 @@
+# -----------------------------------------------------------------------------
+# 编译一次的图注册表 (Graph Registry)
+#
+# `get_compiled_app()` 每次调用都会新建模型、重新绑定工具、重新构建并编译 StateGraph，
+# 还会打开一个永远不会关闭的 SQLite 连接。
+#
+# 注册表按配置缓存编译好的图:
+#   - 同一组参数只编译一次，之后的获取只是一次字典查找；编译好的图本身是无状态的，
+#     会话状态都在检查点里（按 thread_id 区分），因此可以在线程和会话之间安全共享。
+#   - 同一个数据库文件只打开一个检查点后端（即只有一个写连接），由注册表持有，多个配置共用；
+#     后写 (write_behind) 和紧凑格式 (compact) 是这个后端的属性，同一文件请求不同的设置时抛出 ValueError；
+#   - `close()` 关闭全部检查点连接（写完后写队列），进程退出时自动调用。
+#
+# 用法:
+#   from src.chat.registry import get_app
+#   chatapp = get_app()                               # 默认配置
+#   chatapp = get_app(context_budget=4000)            # 另一组配置，单独编译一次
+# -----------------------------------------------------------------------------
+
+import atexit
+import os
+import threading
+from typing import Dict, Hashable, Optional, Tuple
+
+from .checkpointer import PooledCatalogSqliteSaver
+from .compact_serde import compact_options
+
+DEFAULT_DB_PATH = "chat_history.sqlite"
+
+
+def _freeze(value) -> Hashable:
+    """把一个参数值转换为可以作为字典键的形式。模型、缓存等对象按身份区分。"""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ("id", id(value))
+
+
+class GraphRegistry:
+    """进程级的已编译图和检查点后端注册表。"""
+
+    def __init__(self, builder=None):
+        # `builder` 默认为 app.get_compiled_app，测试可以替换。
+        self._builder = builder
+        self._apps: Dict[Tuple, object] = {}
+        # 注册表持有 llm 等参数对象的引用，保证按 id 生成的键在注册表的生命周期内不会被复用。
+        self._options: Dict[Tuple, dict] = {}
+        # 数据库文件的绝对路径 -> (检查点后端, (write_behind, compact))
+        self._checkpointers: Dict[str, Tuple[PooledCatalogSqliteSaver, Tuple[bool, bool]]] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _build(self, **options):
+        if self._builder is None:
+            from .app import get_compiled_app
+
+            self._builder = get_compiled_app
+        return self._builder(**options)
+
+    def checkpointer(
+        self, db_path: str = DEFAULT_DB_PATH, write_behind: Optional[bool] = None, compact: Optional[bool] = None
+    ) -> PooledCatalogSqliteSaver:
+        """返回数据库文件对应的共享检查点后端，第一次调用时打开。`compact` 见 compact_serde.py。
+
+        `write_behind` / `compact` 为 None 时沿用已打开的后端的设置（尚未打开时视为 False）；
+        与已打开的后端不一致时抛出 ValueError，而不是为同一个文件再打开一个写连接。
+        """
+        key = os.path.abspath(db_path)
+        entry = self._checkpointers.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._checkpointers.get(key)
+                if entry is None:
+                    settings = (bool(write_behind), bool(compact))
+                    saver = PooledCatalogSqliteSaver(db_path, write_behind=settings[0], **compact_options(settings[1]))
+                    entry = self._checkpointers[key] = (saver, settings)
+        saver, (opened_write_behind, opened_compact) = entry
+        if (write_behind is not None and write_behind != opened_write_behind) or (compact is not None and compact != opened_compact):
+            raise ValueError(
+                f"{db_path} 已经以 write_behind={opened_write_behind}, compact={opened_compact} 打开，"
+                "同一个数据库文件只能使用一种设置"
+            )
+        return saver
+
+    def get(
+        self, db_path: str = DEFAULT_DB_PATH, write_behind: Optional[bool] = None, compact_checkpoints: Optional[bool] = None, **options
+    ):
+        """返回给定配置的已编译图，第一次请求该配置时编译。参数与 `get_compiled_app` 相同。
+
+        `write_behind` / `compact_checkpoints` 的含义见 `checkpointer()`。
+        """
+        # 每个数据库文件只有一个检查点后端，所以编译好的图只按文件和其余参数区分。
+        saver = self.checkpointer(db_path, write_behind, compact_checkpoints)
+        key = (os.path.abspath(db_path), *sorted((name, _freeze(value)) for name, value in options.items()))
+        # 快速路径: 已经编译过的配置只需要一次字典查找，不加锁。
+        app = self._apps.get(key)
+        if app is not None:
+            return app
+        with self._lock:
+            app = self._apps.get(key)
+            if app is None:
+                app = self._build(checkpointer=saver, **options)
+                self._options[key] = options
+                self._apps[key] = app
+                self.builds += 1
+        return app
+
+    def close(self):
+        """关闭全部检查点后端并清空注册表。之后再次获取时会重新编译。"""
+        with self._lock:
+            savers = [saver for saver, _ in self._checkpointers.values()]
+            self._apps.clear()
+            self._options.clear()
+            self._checkpointers.clear()
+        for saver in savers:
+            saver.close()
+
+    def __len__(self) -> int:
+        return len(self._apps)
+
+
+# --- 进程级单例 ---
+registry = GraphRegistry()
+atexit.register(registry.close)
+
+
+def get_app(db_path: str = DEFAULT_DB_PATH, **options):
+    """从进程级注册表中获取已编译的聊天应用。"""
+    return registry.get(db_path, **options)
+
+
+def get_checkpointer(
+    db_path: str = DEFAULT_DB_PATH, write_behind: Optional[bool] = None, compact: Optional[bool] = None
+) -> PooledCatalogSqliteSaver:
+    """从进程级注册表中获取数据库文件对应的检查点后端。"""
+    return registry.checkpointer(db_path, write_behind, compact)
+
+
+def close_apps():
+    """关闭进程级注册表持有的全部数据库连接。"""
+    registry.close()
@@ -0,0 +1,281 @@
+# -----------------------------------------------------------------------------
+# 检查点保留策略、清理与压缩
+#
+# SqliteSaver 在每个 super-step 都会写入一个检查点，并且从不删除。
+# 本文件提供清理这些历史检查点的库函数和命令行维护工具:
+#   - 每个会话只保留最近 N 个检查点 (keep-last-N)；
+#   - 按时间过期: 删除早于某个时间点的检查点，或删除整段已不活跃的会话；
+#   - 删除指定会话；
+#   - 清理之后执行增量 VACUUM，把空闲页真正还给文件系统。
+#
+# 检查点 ID 是 UUIDv6，前 60 位是时间戳，因此按字符串排序就是按时间排序。
+# 按时间过期时，我们把截止时间编码成一个 UUIDv6，直接用主键索引做范围比较，
+# 不需要反序列化任何检查点。
+#
+# 命令行用法 (在项目根目录):
+#   python -m src.chat.retention chat_history.sqlite --keep-last 20 --max-age-days 30 --vacuum
+#   python -m src.chat.retention checkpoints.sqlite --delete-thread <thread_id>
+# -----------------------------------------------------------------------------
+
+import argparse
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+# UUID 纪元 (1582-10-15) 与 Unix 纪元之间相差的 100 纳秒间隔数。
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+# 删除检查点之后，清理不再属于任何检查点的 pending writes。
+_DELETE_ORPHAN_WRITES = """
+DELETE FROM writes WHERE NOT EXISTS (
+    SELECT 1 FROM checkpoints c
+    WHERE c.thread_id = writes.thread_id
+      AND c.checkpoint_ns = writes.checkpoint_ns
+      AND c.checkpoint_id = writes.checkpoint_id
+)
+"""
+
+
+def checkpoint_id_at(timestamp: float) -> str:
+    """返回给定 Unix 时间戳对应的最小 UUIDv6 字符串，可用于和检查点 ID 做范围比较。"""
+    ticks = int(timestamp * 10_000_000) + _UUID_EPOCH_OFFSET
+    value = ((ticks >> 12) & 0xFFFFFFFFFFFF) << 80
+    value |= 0x6 << 76
+    value |= (ticks & 0x0FFF) << 64
+    value |= 0x8 << 60
+    return str(uuid.UUID(int=value))
+
+
+def checkpoint_timestamp(checkpoint_id: str) -> float:
+    """从 UUIDv6 检查点 ID 中解析出 Unix 时间戳（秒）。"""
+    value = uuid.UUID(checkpoint_id).int
+    ticks = ((value >> 80) << 12) | ((value >> 64) & 0x0FFF)
+    return (ticks - _UUID_EPOCH_OFFSET) / 10_000_000
+
+
+@dataclass
+class RetentionReport:
+    """一次清理的结果。"""
+    checkpoints_deleted: int = 0
+    writes_deleted: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    def __add__(self, other: "RetentionReport") -> "RetentionReport":
+        return RetentionReport(
+            self.checkpoints_deleted + other.checkpoints_deleted,
+            self.writes_deleted + other.writes_deleted,
+            self.bytes_before or other.bytes_before,
+            other.bytes_after or self.bytes_after,
+        )
+
+
+class CheckpointRetention:
+    """对 SqliteSaver 使用的数据库执行保留策略。
+
+    可以传入已有的连接（例如 `app.checkpointer.conn`），也可以传入数据库路径。
+    传入正在被 SqliteSaver 使用的连接时，必须传入 `lock=saver.lock`（或者保证没有图在运行）:
+    删除、`size_bytes`、目录清理和 `vacuum` 都在持有这把锁时执行，不会与检查点写入交错，
+    VACUUM 也不会因为同一连接上还有未完成的语句而失败。
+    """
+
+    def __init__(self, conn_or_path, lock=None):
+        if isinstance(conn_or_path, sqlite3.Connection):
+            self.conn = conn_or_path
+            self._owns_conn = False
+        else:
+            self.conn = sqlite3.connect(conn_or_path, check_same_thread=False)
+            self._owns_conn = True
+        self.lock = lock
+
+    # --- 内部工具 ---
+    def _locked(self):
+        return self.lock if self.lock is not None else nullcontext()
+
+    def _execute(self, sql: str, params=()) -> int:
+        with self._locked():
+            return self._execute_unlocked(sql, params)
+
+    def _execute_unlocked(self, sql: str, params) -> int:
+        cursor = self.conn.execute(sql, params)
+        self.conn.commit()
+        return cursor.rowcount
+
+    def _delete(self, sql: str, params=()) -> RetentionReport:
+        checkpoints = self._execute(sql, params)
+        writes = self._execute(_DELETE_ORPHAN_WRITES)
+        return RetentionReport(checkpoints_deleted=checkpoints, writes_deleted=writes)
+
+    def _has_tables(self) -> bool:
+        with self._locked():
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('checkpoints', 'writes')"
+            ).fetchone()
+        return row[0] == 2
+
+    def _prune_catalog(self, thread_id: str | None = None):
+        """同步删除会话目录 (session_catalog.py) 和消息正文表 (compact_serde.py) 中已经没有检查点的会话。"""
+        with self._locked():
+            tables = [row[0] for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('sessions', 'session_messages', 'checkpoint_blobs')"
+            )]
+            for table in tables:
+                if thread_id is not None:
+                    self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                else:
+                    self.conn.execute(f"DELETE FROM {table} WHERE thread_id NOT IN (SELECT thread_id FROM checkpoints)")
+            self.conn.commit()
+
+    def size_bytes(self) -> int:
+        """数据库实际占用的字节数（页数 × 页大小，不含 WAL 文件）。"""
+        with self._locked():
+            return self._size_bytes_unlocked()
+
+    def _size_bytes_unlocked(self) -> int:
+        (page_count,) = self.conn.execute("PRAGMA page_count").fetchone()
+        (page_size,) = self.conn.execute("PRAGMA page_size").fetchone()
+        return page_count * page_size
+
+    # --- 保留策略 ---
+    def keep_last(self, n: int, thread_id: str | None = None) -> RetentionReport:
+        """每个会话（每个 checkpoint_ns）只保留最近 `n` 个检查点。"""
+        if n < 1:
+            raise ValueError("keep_last 至少要保留 1 个检查点")
+        where = "WHERE thread_id = ?" if thread_id is not None else ""
+        params = (thread_id, n) if thread_id is not None else (n,)
+        return self._delete(
+            f"""
+            DELETE FROM checkpoints WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                    ) AS rn
+                    FROM checkpoints {where}
+                ) WHERE rn > ?
+            )
+            """,
+            params,
+        )
+
+    def expire_checkpoints(self, max_age_seconds: float, now: float | None = None) -> RetentionReport:
+        """删除早于 `max_age_seconds` 的检查点，但每个会话的最新检查点总是保留。"""
+        cutoff = checkpoint_id_at((now if now is not None else time.time()) - max_age_seconds)
+        return self._delete(
+            """
+            DELETE FROM checkpoints
+            WHERE checkpoint_id < ?
+              AND checkpoint_id < (
+                  SELECT MAX(c.checkpoint_id) FROM checkpoints c
+                  WHERE c.thread_id = checkpoints.thread_id AND c.checkpoint_ns = checkpoints.checkpoint_ns
+              )
+            """,
+            (cutoff,),
+        )
+
+    def expire_threads(self, max_age_seconds: float, now: float | None = None) -> RetentionReport:
+        """删除最近一次活动早于 `max_age_seconds` 的整个会话。"""
+        cutoff = checkpoint_id_at((now if now is not None else time.time()) - max_age_seconds)
+        report = self._delete(
+            """
+            DELETE FROM checkpoints WHERE thread_id IN (
+                SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(checkpoint_id) < ?
+            )
+            """,
+            (cutoff,),
+        )
+        self._prune_catalog()
+        return report
+
+    def delete_thread(self, thread_id: str) -> RetentionReport:
+        """删除一个会话的全部检查点和 pending writes。"""
+        checkpoints = self._execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        writes = self._execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        self._prune_catalog(thread_id)
+        return RetentionReport(checkpoints_deleted=checkpoints, writes_deleted=writes)
+
+    # --- 压缩 ---
+    def vacuum(self, max_pages: int | None = None) -> RetentionReport:
+        """回收空闲页。
+
+        数据库第一次执行时会切换到 `auto_vacuum=INCREMENTAL`（需要一次完整的 VACUUM），
+        之后每次只执行增量 VACUUM，只释放空闲页而不重写整个文件。
+        """
+        with self._locked():
+            report = RetentionReport(bytes_before=self._size_bytes_unlocked())
+            # 后写队列（checkpointer.py）在批次之间可能留下一个尚未提交的事务，VACUUM 不能在事务中执行。
+            # 持有锁时每次写入都是完整的，可以直接提交。
+            if self.conn.in_transaction:
+                self.conn.commit()
+            (mode,) = self.conn.execute("PRAGMA auto_vacuum").fetchone()
+            if mode != 2:
+                self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                self.conn.execute("VACUUM")
+            elif max_pages is None:
+                self.conn.execute("PRAGMA incremental_vacuum")
+            else:
+                self.conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            # 把 WAL 中的内容写回主文件并截断 WAL。
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            report.bytes_after = self._size_bytes_unlocked()
+        return report
+
+    def apply(
+        self,
+        keep_last: int | None = None,
+        max_age_seconds: float | None = None,
+        expire_idle_threads: bool = False,
+        vacuum: bool = True,
+    ) -> RetentionReport:
+        """按配置依次执行保留策略，最后压缩数据库。"""
+        report = RetentionReport(bytes_before=self.size_bytes())
+        if not self._has_tables():
+            return report
+        if max_age_seconds is not None:
+            if expire_idle_threads:
+                report = report + self.expire_threads(max_age_seconds)
+            report = report + self.expire_checkpoints(max_age_seconds)
+        if keep_last is not None:
+            report = report + self.keep_last(keep_last)
+        if vacuum:
+            report = report + self.vacuum()
+        report.bytes_after = self.size_bytes()
+        return report
+
+    def close(self):
+        if self._owns_conn:
+            self.conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="清理 LangGraph SQLite 检查点数据库")
+    parser.add_argument("db", help="数据库路径，例如 chat_history.sqlite 或 checkpoints.sqlite")
+    parser.add_argument("--keep-last", type=int, help="每个会话保留的检查点数量")
+    parser.add_argument("--max-age-days", type=float, help="删除早于该天数的检查点（每个会话的最新检查点保留）")
+    parser.add_argument("--expire-threads", action="store_true", help="配合 --max-age-days，删除整段不活跃的会话")
+    parser.add_argument("--delete-thread", action="append", default=[], help="删除指定会话，可以重复使用")
+    parser.add_argument("--vacuum", action="store_true", help="清理后执行增量 VACUUM")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"数据库不存在: {args.db}")
+
+    retention = CheckpointRetention(args.db)
+    try:
+        report = RetentionReport(bytes_before=retention.size_bytes())
+        for thread_id in args.delete_thread:
+            report = report + retention.delete_thread(thread_id)
+        max_age = args.max_age_days * 86400 if args.max_age_days is not None else None
+        report = report + retention.apply(args.keep_last, max_age, args.expire_threads, vacuum=args.vacuum)
+    finally:
+        retention.close()
+
+    print(f"删除检查点: {report.checkpoints_deleted}")
+    print(f"删除 pending writes: {report.writes_deleted}")
+    print(f"数据库大小: {report.bytes_before / 1024:.1f} KiB -> {report.bytes_after / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
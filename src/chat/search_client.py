@@ -0,0 +1,140 @@
+# -----------------------------------------------------------------------------
+# 共享的 Tavily 搜索客户端
+#
+# `TavilySearch(max_results=3).invoke(query)` 每次调用都会新建工具对象，
+# 其内部使用 `requests.post` / 新的 `aiohttp.ClientSession`，用完即丢弃连接，
+# 于是每次搜索都要重新做 DNS、TCP 和 TLS 握手。
+#
+# 这里改为一个进程级共享、懒加载的客户端:
+#   - 同步调用使用 `httpx.Client`，它本身是线程安全的，内部维护 keep-alive 连接池。
+#   - 异步调用使用 `httpx.AsyncClient`。异步客户端与事件循环绑定，因此每个事件循环各持有一个。
+# -----------------------------------------------------------------------------
+
+import asyncio
+import atexit
+import os
+import threading
+import weakref
+from typing import Optional
+
+import httpx
+
+from .providers import load_env
+
+TAVILY_API_URL = "https://api.tavily.com"
+# 请求中标识调用方的客户端名称: 本项目自己的客户端，不冒充 langchain-tavily。
+CLIENT_SOURCE = "langgraphlearn"
+
+
+class TavilyClient:
+    """复用 HTTP 连接的 Tavily 搜索客户端。"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = TAVILY_API_URL,
+        timeout: float = 30.0,
+        max_connections: int = 20,
+    ):
+        self.api_key = api_key or os.getenv("TAVILY_API_KEY")
+        if not self.api_key:
+            raise ValueError("TAVILY_API_KEY not set")
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client: Optional[httpx.Client] = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "X-Client-Source": CLIENT_SOURCE,
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        """同步客户端，第一次使用时才创建。"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        base_url=self.base_url, headers=self._headers(), timeout=self.timeout, limits=self.limits
+                    )
+        return self._client
+
+    def async_client(self) -> httpx.AsyncClient:
+        """当前事件循环对应的异步客户端，第一次使用时才创建。"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    base_url=self.base_url, headers=self._headers(), timeout=self.timeout, limits=self.limits
+                )
+                self._async_clients[loop] = client
+        return client
+
+    @staticmethod
+    def _payload(query: str, max_results: int) -> dict:
+        return {"query": query, "max_results": max_results}
+
+    @staticmethod
+    def _parse(response: httpx.Response) -> dict:
+        if response.status_code != 200:
+            raise ValueError(f"Error {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    def search(self, query: str, max_results: int = 3) -> dict:
+        """同步搜索，返回与 TavilySearch 相同格式的原始结果字典。"""
+        return self._parse(self.client.post("/search", json=self._payload(query, max_results)))
+
+    async def asearch(self, query: str, max_results: int = 3) -> dict:
+        """异步搜索。"""
+        response = await self.async_client().post("/search", json=self._payload(query, max_results))
+        return self._parse(response)
+
+    def close(self):
+        """关闭同步连接池。异步客户端随事件循环一起回收，也可以调用 `aclose`。"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self):
+        """关闭当前事件循环对应的异步客户端。"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+
+# --- 进程级单例 ---
+_shared_client: Optional[TavilyClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_search_client() -> TavilyClient:
+    """返回进程内共享的搜索客户端，第一次调用时才创建（双重检查加锁，保证只创建一次）。"""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                # API Key 可能写在 .env 文件中。
+                load_env()
+                _shared_client = TavilyClient()
+    return _shared_client
+
+
+def close_search_client():
+    """关闭并丢弃共享客户端，下次调用 `get_search_client` 时会重新创建。"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is not None:
+            _shared_client.close()
+            _shared_client = None
+
+
+atexit.register(close_search_client)
@@ -0,0 +1,366 @@
+# -----------------------------------------------------------------------------
+# HTTP / SSE 聊天服务
+#
+# main.py 的 `input()` 循环一次只能服务一个会话，每个会话都要占用一个终端进程。
+# 这里把聊天应用包装成一个 ASGI 应用，所有连接共用注册表中同一个已编译的图和同一个检查点后端:
+#
+#   POST   /threads                      新建会话，返回 {"thread_id": ...}
+#   GET    /threads?limit=&offset=&q=    分页列出（或搜索）会话，按最后更新时间倒序
+#   GET    /threads/{id}                 会话信息
+#   GET    /threads/{id}/messages?limit=&before=   分页读取历史消息（最近的一页在前）
+#   DELETE /threads/{id}                 删除会话
+#   POST   /threads/{id}/messages        发送消息 {"content": ...}，等整轮结束后返回最终回复
+#   POST   /threads/{id}/stream          发送消息，并通过 Server-Sent Events 逐 token 推送回复
+#   GET    /healthz                      健康检查
+#   GET    /metrics                      开启本地追踪时的 Prometheus 指标（见 tracing.py）
+#
+# 同步的图在一个有界线程池中运行（检查点后端是线程安全的 PooledCatalogSqliteSaver），
+# 产生的流式事件通过 `loop.call_soon_threadsafe` 交给事件循环写出，一个进程可以同时服务上百个流。
+#
+# 运行方式 (在项目根目录):
+#   python -m src.chat.server --port 8000           # 内置的最小 HTTP 服务器（见 asgi_server.py）
+#   uvicorn src.chat.server:app --port 8000         # 或者使用 uvicorn
+#
+#   curl -N -X POST localhost:8000/threads/demo/stream -d '{"content": "你好"}'
+# -----------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Optional
+from urllib.parse import parse_qs
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage, message_to_dict
+
+from .streaming import final_reply
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+def _int_param(query: dict, name: str, default: Optional[int], minimum: int = 0) -> Optional[int]:
+    try:
+        value = int(query[name][0]) if name in query else default
+    except ValueError:
+        raise HTTPError(400, f"{name} 必须是整数")
+    # 负数会变成 SQLite 的 `LIMIT -1`（不限制），这里直接拒绝。
+    if value is not None and value < minimum:
+        raise HTTPError(400, f"{name} 不能小于 {minimum}")
+    return value
+
+
+class ChatServer:
+    """聊天应用的 ASGI 入口。
+
+    `chatapp` 为空时在第一次请求时从注册表获取（见 registry.py），并按环境变量开启本地追踪。
+    `max_workers` 是同时运行的对话轮数上限，超出的请求排队等待。
+    `app_options` 是从注册表获取图时传给 `get_compiled_app` 的选项，例如 `context_budget`；
+    为空时从环境变量读取上下文预算（见 context.py 的 `context_options_from_env`）。
+    """
+
+    ROUTES = [
+        ("POST", re.compile(r"^/threads/?$"), "create_thread"),
+        ("GET", re.compile(r"^/threads/?$"), "list_threads"),
+        ("GET", re.compile(r"^/threads/(?P<thread_id>[^/]+)$"), "get_thread"),
+        ("DELETE", re.compile(r"^/threads/(?P<thread_id>[^/]+)$"), "delete_thread"),
+        ("GET", re.compile(r"^/threads/(?P<thread_id>[^/]+)/messages$"), "list_messages"),
+        ("POST", re.compile(r"^/threads/(?P<thread_id>[^/]+)/messages$"), "post_message"),
+        ("POST", re.compile(r"^/threads/(?P<thread_id>[^/]+)/stream$"), "stream_message"),
+        ("GET", re.compile(r"^/healthz$"), "health"),
+        ("GET", re.compile(r"^/metrics$"), "metrics"),
+    ]
+
+    def __init__(self, chatapp=None, tracer=None, max_workers: int = 256, app_options: Optional[dict] = None):
+        self._chatapp = chatapp
+        self.tracer = tracer
+        self.app_options = app_options
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._catalog = None
+
+    # --- 共享资源 ---
+    @property
+    def chatapp(self):
+        if self._chatapp is None:
+            from .context import context_options_from_env
+            from .registry import get_app
+            from .tracing import tracer_from_env
+
+            self.tracer = self.tracer or tracer_from_env()
+            options = dict(context_options_from_env() if self.app_options is None else self.app_options)
+            if self.tracer:
+                options["tracer"] = self.tracer
+            self._chatapp = get_app(**options)
+        return self._chatapp
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            saver = self.chatapp.checkpointer
+            with saver.lock:
+                saver.setup()
+            self._catalog = saver.catalog
+        return self._catalog
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chat-server")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # --- ASGI ---
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        try:
+            handler, params = self._route(scope["method"], scope["path"])
+            await handler(scope, receive, send, **params)
+        except HTTPError as e:
+            await self._json(send, e.status, {"error": e.message})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(None, self.close)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _route(self, method: str, path: str):
+        allowed = False
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(path)
+            if match:
+                if route_method == method:
+                    return getattr(self, name), match.groupdict()
+                allowed = True
+        raise HTTPError(405 if allowed else 404, "method not allowed" if allowed else "not found")
+
+    @staticmethod
+    async def _body(receive) -> dict:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        raw = b"".join(chunks)
+        if not raw:
+            return {}
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            raise HTTPError(400, "请求体必须是 JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "请求体必须是 JSON 对象")
+        return body
+
+    @staticmethod
+    async def _json(send, status: int, payload, content_type: bytes = b"application/json; charset=utf-8"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _message_content(self, receive) -> str:
+        content = (await self._body(receive)).get("content")
+        if not isinstance(content, str) or not content.strip():
+            raise HTTPError(400, "content 不能为空")
+        return content
+
+    # --- 会话 ---
+    async def create_thread(self, scope, receive, send):
+        body = await self._body(receive)
+        thread_id = str(body.get("thread_id") or uuid.uuid4())
+        await self._json(send, 201, {"thread_id": thread_id})
+
+    async def list_threads(self, scope, receive, send):
+        query = parse_qs(scope["query_string"].decode())
+        limit = min(_int_param(query, "limit", 20, minimum=1), 100)
+        offset = _int_param(query, "offset", 0)
+        text = query.get("q", [None])[0]
+        if text:
+            sessions = await self._run(self.catalog.search, text, limit, offset)
+        else:
+            sessions = await self._run(self.catalog.list, limit, offset)
+        await self._json(send, 200, {"threads": [asdict(s) for s in sessions], "limit": limit, "offset": offset})
+
+    async def get_thread(self, scope, receive, send, thread_id: str):
+        session = await self._run(self.catalog.get, thread_id)
+        if session is None:
+            raise HTTPError(404, "thread not found")
+        await self._json(send, 200, asdict(session))
+
+    async def delete_thread(self, scope, receive, send, thread_id: str):
+        await self._run(self.chatapp.checkpointer.delete_thread, thread_id)
+        await send({"type": "http.response.start", "status": 204, "headers": [(b"content-length", b"0")]})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def list_messages(self, scope, receive, send, thread_id: str):
+        query = parse_qs(scope["query_string"].decode())
+        limit = min(_int_param(query, "limit", 20, minimum=1), 100)
+        before = _int_param(query, "before", None)
+        page = await self._run(self.catalog.messages, thread_id, limit, before)
+        await self._json(send, 200, {
+            "messages": [{"index": idx, **message_to_dict(message)} for idx, message in page],
+            # 下一页（更早的消息）从这一页最早的那条之前开始；None 表示已经到了开头。
+            "before": page[0][0] if page and page[0][0] > 0 else None,
+        })
+
+    # --- 对话 ---
+    def _inputs(self, thread_id: str, content: str):
+        return {"messages": [HumanMessage(content=content)]}, {"configurable": {"thread_id": thread_id}}
+
+    async def post_message(self, scope, receive, send, thread_id: str):
+        content = await self._message_content(receive)
+        begin = time.perf_counter()
+        reply = await self._run(final_reply, self.chatapp, *self._inputs(thread_id, content))
+        await self._json(send, 200, {
+            "thread_id": thread_id,
+            "reply": reply.content if reply is not None else None,
+            "total_ms": round((time.perf_counter() - begin) * 1000, 3),
+        })
+
+    async def stream_message(self, scope, receive, send, thread_id: str):
+        content = await self._message_content(receive)
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        inputs, config = self._inputs(thread_id, content)
+        # 客户端断开后，后台线程继续把这一轮跑完（保证检查点完整），只是不再推送事件。
+        disconnected = False
+
+        def produce():
+            try:
+                for chunk, _ in self.chatapp.stream(inputs, config, stream_mode="messages"):
+                    if not disconnected:
+                        loop.call_soon_threadsafe(events.put_nowait, ("chunk", chunk))
+                loop.call_soon_threadsafe(events.put_nowait, ("end", None))
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, ("error", e))
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        begin = time.perf_counter()
+        first_token: Optional[float] = None
+        tokens, tool_calls, parts = 0, [], []
+        self.executor.submit(produce)
+        try:
+            await send({"type": "http.response.body", "body": _sse("start", {"thread_id": thread_id}), "more_body": True})
+            while True:
+                kind, item = await events.get()
+                if kind == "error":
+                    await send({"type": "http.response.body", "body": _sse("error", {"error": f"{type(item).__name__}: {item}"})})
+                    return
+                if kind == "end":
+                    break
+                payload = b""
+                if isinstance(item, AIMessageChunk):
+                    for call in item.tool_call_chunks:
+                        if call.get("name"):
+                            tool_calls.append(call["name"])
+                            parts = []
+                            payload += _sse("tool_call", {"name": call["name"]})
+                    if item.content and isinstance(item.content, str):
+                        if first_token is None:
+                            first_token = time.perf_counter() - begin
+                        tokens += 1
+                        parts.append(item.content)
+                        payload += _sse("token", {"text": item.content})
+                elif isinstance(item, AIMessage) and isinstance(item.content, str) and item.content:
+                    # 预路由等不经过 LLM 的回复是一整条消息，作为一个 token 事件推送。
+                    if first_token is None:
+                        first_token = time.perf_counter() - begin
+                    tokens += 1
+                    parts = [item.content]
+                    payload += _sse("token", {"text": item.content})
+                elif isinstance(item, ToolMessage):
+                    payload += _sse("tool_result", {"name": item.name})
+                if payload:
+                    await send({"type": "http.response.body", "body": payload, "more_body": True})
+            await send({"type": "http.response.body", "body": _sse("done", {
+                "thread_id": thread_id,
+                "reply": "".join(parts),
+                "tokens": tokens,
+                "tool_calls": tool_calls,
+                "ttft_ms": None if first_token is None else round(first_token * 1000, 3),
+                "total_ms": round((time.perf_counter() - begin) * 1000, 3),
+            })})
+        except (ConnectionError, asyncio.CancelledError):
+            disconnected = True
+            raise
+
+    # --- 运维 ---
+    async def health(self, scope, receive, send):
+        await self._json(send, 200, {"status": "ok"})
+
+    async def metrics(self, scope, receive, send):
+        if self.tracer is None:
+            raise HTTPError(404, "tracing disabled")
+        await self._json(send, 200, self.tracer.metrics.render().encode(), b"text/plain; version=0.0.4; charset=utf-8")
+
+
+# 供 uvicorn 使用的模块级应用: `uvicorn src.chat.server:app`
+app = ChatServer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="聊天应用的 HTTP / SSE 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-workers", type=int, default=256, help="同时运行的对话轮数上限")
+    parser.add_argument("--context-budget", type=int, default=None, help="发给 LLM 的提示的 token 上限，默认读取 CHAT_CONTEXT_BUDGET")
+    parser.add_argument("--context-strategy", choices=("trim", "summarize"), default="trim")
+    args = parser.parse_args(argv)
+
+    from .asgi_server import serve
+
+    app_options = None
+    if args.context_budget is not None:
+        app_options = {"context_budget": args.context_budget, "context_strategy": args.context_strategy}
+    server = ChatServer(max_workers=args.max_workers, app_options=app_options)
+    server.chatapp  # 启动时就编译图并检查 API Key，而不是等到第一个请求
+    print(f"聊天服务已启动: http://{args.host}:{args.port}")
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
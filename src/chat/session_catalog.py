@@ -0,0 +1,332 @@
+# -----------------------------------------------------------------------------
+# 会话目录 (Session Catalog)
+#
+# 旧的 `get_all_sessions` 每次启动都执行 `SELECT DISTINCT thread_id FROM checkpoints`，
+# 这是对整张检查点表的全表扫描，而且会一次性返回所有会话。
+#
+# 这里维护两张单独的表:
+#   - `sessions`: 每个会话一行，包括 thread_id、标题（第一条用户消息）、创建时间、
+#     最后更新时间、消息数量。列表按 `updated_at` 索引倒序分页读取。
+#   - `session_messages`: 每条消息一行，按 (thread_id, idx) 索引。
+#     恢复会话时只读取最近的一页消息，不必反序列化包含全部消息的检查点。
+# `CatalogSqliteSaver` 在写入检查点的同一个事务中更新这两张表，崩溃时不会出现检查点已提交、目录却没更新的情况。
+# 每次写入只序列化新增的消息，以及已记录部分末尾 `EDIT_WINDOW` 条消息（按内容摘要 `digest` 比较，
+# 只改写变化的行），代价与历史长度无关。从旧检查点分叉或用 `update_state` 修改最近的消息
+# （消息数量不变或变少）时，被改动的行同样会被更新；更早的消息在写入后不会再被比较。
+# -----------------------------------------------------------------------------
+
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import AnyMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from .compact_serde import AsyncBlobSqliteSaver, BlobSqliteSaver, _next_config
+
+# 标题最多保留的字符数。
+TITLE_LENGTH = 40
+# 每次写入时与已存摘要比较的、已记录部分末尾的消息数。
+EDIT_WINDOW = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    thread_id TEXT PRIMARY KEY,
+    title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at DESC, thread_id);
+CREATE TABLE IF NOT EXISTS session_messages (
+    thread_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    type TEXT,
+    message BLOB,
+    digest TEXT,
+    PRIMARY KEY (thread_id, idx)
+);
+"""
+
+# 升级前创建的 session_messages 表没有 digest 列；这些行的摘要为 NULL，下次写入时会被重写一次。
+_MESSAGE_COLUMNS = "PRAGMA table_info(session_messages)"
+_ADD_DIGEST = "ALTER TABLE session_messages ADD COLUMN digest TEXT"
+
+_EXISTING_TABLES = """
+SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('sessions', 'session_messages')
+"""
+
+_UPSERT = """
+INSERT INTO sessions (thread_id, title, created_at, updated_at, message_count)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (thread_id) DO UPDATE SET
+    title = COALESCE(sessions.title, excluded.title),
+    updated_at = excluded.updated_at,
+    message_count = excluded.message_count
+"""
+
+_STORED_COUNT = "SELECT message_count FROM sessions WHERE thread_id = ?"
+_STORED_DIGESTS = "SELECT idx, digest FROM session_messages WHERE thread_id = ? AND idx >= ?"
+_TRUNCATE_MESSAGES = "DELETE FROM session_messages WHERE thread_id = ? AND idx >= ?"
+_INSERT_MESSAGE = "INSERT OR REPLACE INTO session_messages (thread_id, idx, type, message, digest) VALUES (?, ?, ?, ?, ?)"
+
+# 回填时读取每个会话（根命名空间）的最新检查点。
+_LATEST_CHECKPOINTS = """
+SELECT c.thread_id, c.type, c.checkpoint FROM checkpoints c
+JOIN (
+    SELECT thread_id, MAX(checkpoint_id) AS checkpoint_id FROM checkpoints
+    WHERE checkpoint_ns = '' GROUP BY thread_id
+) latest ON c.thread_id = latest.thread_id AND c.checkpoint_id = latest.checkpoint_id
+WHERE c.checkpoint_ns = ''
+"""
+
+
+@dataclass
+class SessionInfo:
+    """会话目录中的一行。"""
+    thread_id: str
+    title: Optional[str]
+    created_at: float
+    updated_at: float
+    message_count: int
+
+    @property
+    def config(self) -> dict:
+        return {"configurable": {"thread_id": self.thread_id}}
+
+
+def _upsert_params(thread_id: str, messages, timestamp: Optional[float] = None) -> tuple:
+    now = time.time() if timestamp is None else timestamp
+    return (thread_id, session_title(messages), now, now, len(messages))
+
+
+def _messages(checkpoint) -> list:
+    return checkpoint.get("channel_values", {}).get("messages", [])
+
+
+def _message_rows(serde, thread_id: str, messages, start: int) -> List[tuple]:
+    """`messages[start:]` 对应的 session_messages 行，最后一列是序列化结果的摘要。"""
+    rows = []
+    for idx in range(start, len(messages)):
+        type_, blob = serde.dumps_typed(messages[idx])
+        rows.append((thread_id, idx, type_, blob, hashlib.blake2b(blob, digest_size=16).hexdigest()))
+    return rows
+
+
+def _changed_rows(rows: List[tuple], stored: dict) -> List[tuple]:
+    """只保留与已存摘要不同（或尚未存储）的行。"""
+    return [row for row in rows if stored.get(row[1]) != row[4]]
+
+
+def _window_start(stored_count: int, message_count: int) -> Tuple[bool, int]:
+    """返回 (是否需要删除多出来的行, 需要重新比较的第一条消息的序号)。"""
+    truncate = message_count < stored_count
+    return truncate, max(min(stored_count, message_count) - EDIT_WINDOW, 0)
+
+
+@contextmanager
+def _atomic(cur: sqlite3.Cursor):
+    """在一个保存点中执行: 出错时只回滚这一次写入，再抛出异常。
+
+    外层可能已经有事务（后写队列把多次写入合并在同一个事务中），所以用保存点而不是直接 ROLLBACK；
+    没有事务时先显式 BEGIN，释放保存点不会单独提交，提交仍由 `cursor()` 负责。
+    """
+    if not cur.connection.in_transaction:
+        cur.execute("BEGIN")
+    cur.execute("SAVEPOINT checkpoint_put")
+    try:
+        yield cur
+    except BaseException:
+        cur.execute("ROLLBACK TO checkpoint_put")
+        cur.execute("RELEASE checkpoint_put")
+        raise
+    cur.execute("RELEASE checkpoint_put")
+
+
+def session_title(messages) -> Optional[str]:
+    """取第一条用户消息作为会话标题。"""
+    for message in messages:
+        if isinstance(message, HumanMessage) and isinstance(message.content, str):
+            title = " ".join(message.content.split())
+            return title[:TITLE_LENGTH] if title else None
+    return None
+
+
+class SessionCatalog:
+    """读写 `sessions` 和 `session_messages` 表。可以与检查点共用同一个数据库连接。"""
+
+    def __init__(self, conn: sqlite3.Connection, lock: Optional[threading.Lock] = None, serde=None):
+        self.conn = conn
+        self.lock = lock or threading.Lock()
+        self.serde = serde or JsonPlusSerializer()
+
+    def setup(self) -> bool:
+        """创建表和索引。返回 True 表示有表是新建的（此时需要回填）。"""
+        (existing,) = self.conn.execute(_EXISTING_TABLES).fetchone()
+        self.conn.executescript(_SCHEMA)
+        if "digest" not in {row[1] for row in self.conn.execute(_MESSAGE_COLUMNS)}:
+            self.conn.execute(_ADD_DIGEST)
+            self.conn.commit()
+        return existing < 2
+
+    def record(self, cursor: sqlite3.Cursor, thread_id: str, messages, timestamp: Optional[float] = None):
+        """在给定游标上更新一个会话的目录信息和消息索引，由调用方负责提交事务。
+
+        只序列化新增的消息和已记录部分末尾的 `EDIT_WINDOW` 条消息，按摘要比较后写入变化的行；
+        消息变少了（例如从更早的检查点分叉）时删除多余的部分。
+        """
+        row = cursor.execute(_STORED_COUNT, (thread_id,)).fetchone()
+        truncate, start = _window_start(row[0] if row else 0, len(messages))
+        if truncate:
+            cursor.execute(_TRUNCATE_MESSAGES, (thread_id, len(messages)))
+        stored = dict(cursor.execute(_STORED_DIGESTS, (thread_id, start)).fetchall())
+        cursor.executemany(_INSERT_MESSAGE, _changed_rows(_message_rows(self.serde, thread_id, messages, start), stored))
+        cursor.execute(_UPSERT, _upsert_params(thread_id, messages, timestamp))
+
+    def list(self, limit: int = 20, offset: int = 0) -> List[SessionInfo]:
+        """按最后更新时间倒序分页列出会话。"""
+        return self._query("ORDER BY updated_at DESC, thread_id LIMIT ? OFFSET ?", (limit, offset))
+
+    def search(self, text: str, limit: int = 20, offset: int = 0) -> List[SessionInfo]:
+        """按标题或 thread_id 搜索会话，结果同样按最后更新时间倒序。"""
+        pattern = f"%{text}%"
+        return self._query(
+            "WHERE title LIKE ? OR thread_id LIKE ? ORDER BY updated_at DESC, thread_id LIMIT ? OFFSET ?",
+            (pattern, pattern, limit, offset),
+        )
+
+    def get(self, thread_id: str) -> Optional[SessionInfo]:
+        rows = self._query("WHERE thread_id = ?", (thread_id,))
+        return rows[0] if rows else None
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def messages(self, thread_id: str, limit: int = 20, before: Optional[int] = None) -> List[Tuple[int, AnyMessage]]:
+        """读取一个会话中序号小于 `before` 的最近 `limit` 条消息，按时间正序返回 (序号, 消息)。
+
+        `before` 为空时返回最近的 `limit` 条。只反序列化这一页的消息。
+        """
+        if before is None:
+            before = 2**63 - 1
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT idx, type, message FROM session_messages WHERE thread_id = ? AND idx < ? "
+                "ORDER BY idx DESC LIMIT ?",
+                (thread_id, before, limit),
+            ).fetchall()
+        return [(idx, self.serde.loads_typed((type_, blob))) for idx, type_, blob in reversed(rows)]
+
+    def delete(self, thread_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM session_messages WHERE thread_id = ?", (thread_id,))
+            self.conn.commit()
+
+    def _query(self, clause: str, params) -> List[SessionInfo]:
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT thread_id, title, created_at, updated_at, message_count FROM sessions {clause}", params
+            ).fetchall()
+        return [SessionInfo(*row) for row in rows]
+
+
+class CatalogSqliteSaver(BlobSqliteSaver):
+    """在写入检查点时同步维护会话目录的 SqliteSaver。
+
+    只有 `messages` 通道发生变化时才更新目录，不会给没有新消息的检查点增加额外写入。
+    """
+
+    def __init__(self, conn: sqlite3.Connection, **kwargs):
+        super().__init__(conn, **kwargs)
+        self.catalog = SessionCatalog(conn, self.lock, self.serde)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        if self.catalog.setup():
+            self._backfill()
+
+    def _backfill(self):
+        """目录表新建时，从已有的检查点中补全会话信息（一次性迁移）。"""
+        cursor = self.conn.cursor()
+        for thread_id, type_, blob in self.conn.execute(_LATEST_CHECKPOINTS).fetchall():
+            checkpoint = self._resolve(self.conn, thread_id, self.serde.loads_typed((type_, blob)))
+            self.catalog.record(cursor, thread_id, _messages(checkpoint))
+        self.conn.commit()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        if "messages" not in new_versions or configurable.get("checkpoint_ns"):
+            return super().put(config, checkpoint, metadata, new_versions)
+        # 检查点和目录在同一个事务中写入: 要么都提交，要么都不提交。
+        with self.cursor() as cur, _atomic(cur):
+            self._put_row(cur, config, checkpoint, metadata)
+            self.catalog.record(cur, configurable["thread_id"], _messages(checkpoint))
+        return _next_config(config, checkpoint)
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        self.catalog.delete(thread_id)
+
+
+class AsyncCatalogSqliteSaver(AsyncBlobSqliteSaver):
+    """`CatalogSqliteSaver` 的异步版本，供 async_app.py 使用。"""
+
+    async def setup(self) -> None:
+        if self.is_setup:
+            return
+        await super().setup()
+        async with self.lock:
+            async with self.conn.execute(_EXISTING_TABLES) as cursor:
+                (existing,) = await cursor.fetchone()
+            await self.conn.executescript(_SCHEMA)
+            async with self.conn.execute(_MESSAGE_COLUMNS) as cursor:
+                if "digest" not in {row[1] for row in await cursor.fetchall()}:
+                    await self.conn.execute(_ADD_DIGEST)
+            if existing < 2:
+                async with self.conn.execute(_LATEST_CHECKPOINTS) as cursor:
+                    rows = await cursor.fetchall()
+                for thread_id, type_, blob in rows:
+                    checkpoint = await self._aresolve(thread_id, self.serde.loads_typed((type_, blob)))
+                    await self._arecord(thread_id, _messages(checkpoint))
+            await self.conn.commit()
+
+    async def _arecord(self, thread_id: str, messages):
+        async with self.conn.execute(_STORED_COUNT, (thread_id,)) as cursor:
+            row = await cursor.fetchone()
+        truncate, start = _window_start(row[0] if row else 0, len(messages))
+        if truncate:
+            await self.conn.execute(_TRUNCATE_MESSAGES, (thread_id, len(messages)))
+        async with self.conn.execute(_STORED_DIGESTS, (thread_id, start)) as cursor:
+            stored = dict(await cursor.fetchall())
+        await self.conn.executemany(_INSERT_MESSAGE, _changed_rows(_message_rows(self.serde, thread_id, messages, start), stored))
+        await self.conn.execute(_UPSERT, _upsert_params(thread_id, messages))
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        if "messages" not in new_versions or configurable.get("checkpoint_ns"):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+        await self.setup()
+        # 与同步版本相同，检查点和目录在同一个事务中写入。其他写入都在持有锁时提交，出错时可以直接回滚。
+        async with self.lock:
+            try:
+                await self._aput_row(config, checkpoint, metadata)
+                await self._arecord(configurable["thread_id"], _messages(checkpoint))
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            await self.conn.commit()
+        return _next_config(config, checkpoint)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await super().adelete_thread(thread_id)
+        async with self.lock:
+            await self.conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+            await self.conn.execute("DELETE FROM session_messages WHERE thread_id = ?", (thread_id,))
+            await self.conn.commit()
@@ -0,0 +1,312 @@
+# -----------------------------------------------------------------------------
+# 按 thread_id 分片的多进程运行时 (Sharded Runtime)
+#
+# 所有会话共用一个 `chat_history.sqlite` 和一个 Python 进程: 图的执行受 GIL 限制，
+# 检查点的提交受同一个 SQLite 写锁限制，多核机器上也只能用满一个核。
+#
+# `ShardedRuntime` 把 thread_id 哈希到 N 个工作进程，每个进程:
+#   - 通过注册表加载一次图（见 registry.py），使用自己的检查点分片 `chat_history.shard<i>.sqlite`；
+#   - 用一个线程池同时处理本分片的多个请求（LLM / 搜索等待期间不占用 CPU）。
+# 同一个会话总是落在同一个分片上，因此会话的全部检查点和目录信息都在一个数据库里，
+# 分片之间没有任何共享状态。前端调度器（本进程）只负责转发请求和分发结果:
+#   - 单个会话的操作（对话、历史消息、删除）直接转发给所属分片；
+#   - 会话列表和搜索向每个分片请求前 offset + limit 条，按最后更新时间归并后取出一页。
+#
+# `runtime.catalog` 提供与 SessionCatalog 相同的查询接口，可以直接传给
+# main.py 的 `get_all_sessions(catalog=...)`、`get_session_history(..., catalog=...)` 和 HistoryPager。
+#
+# 用法:
+#   with ShardedRuntime(shards=4) as runtime:
+#       reply = runtime.invoke("thread-1", "你好")
+#       sessions = get_all_sessions(catalog=runtime.catalog)
+#
+# 分片数决定了数据库文件的划分，更改分片数之后旧会话会被哈希到别的分片上，需要迁移。
+# -----------------------------------------------------------------------------
+
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import sys
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AnyMessage, HumanMessage
+
+from .registry import DEFAULT_DB_PATH
+from .session_catalog import SessionInfo
+
+
+def shard_index(thread_id: str, shards: int) -> int:
+    """返回会话所属的分片。使用 CRC32 而不是 `hash()`，保证在不同进程、不同运行之间结果一致。"""
+    return zlib.crc32(thread_id.encode("utf-8")) % shards
+
+
+def shard_db_path(db_path: str, index: int) -> str:
+    """分片的数据库文件: `chat_history.sqlite` → `chat_history.shard0.sqlite`。"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.shard{index}{ext}"
+
+
+# --- 工作进程 ---
+class _ShardWorker:
+    """在工作进程中运行，持有本分片的图和会话目录。方法名就是请求的操作名。"""
+
+    def __init__(self, db_path: str, app_options: dict):
+        from .registry import get_app
+
+        self.chatapp = get_app(db_path=db_path, **app_options)
+        saver = self.chatapp.checkpointer
+        with saver.lock:
+            saver.setup()
+        self.catalog = saver.catalog
+
+    def invoke(self, thread_id: str, content: str) -> Optional[str]:
+        from .streaming import final_reply
+
+        config = {"configurable": {"thread_id": thread_id}}
+        reply = final_reply(self.chatapp, {"messages": [HumanMessage(content=content)]}, config)
+        return reply.content if reply is not None else None
+
+    def list(self, limit: int, offset: int) -> List[SessionInfo]:
+        return self.catalog.list(limit=limit, offset=offset)
+
+    def search(self, text: str, limit: int, offset: int) -> List[SessionInfo]:
+        return self.catalog.search(text, limit=limit, offset=offset)
+
+    def get(self, thread_id: str) -> Optional[SessionInfo]:
+        return self.catalog.get(thread_id)
+
+    def count(self) -> int:
+        return self.catalog.count()
+
+    def messages(self, thread_id: str, limit: int, before: Optional[int]) -> List[Tuple[int, AnyMessage]]:
+        return self.catalog.messages(thread_id, limit=limit, before=before)
+
+    def delete(self, thread_id: str) -> None:
+        self.chatapp.checkpointer.delete_thread(thread_id)
+
+
+def _picklable_error(e: BaseException) -> BaseException:
+    try:
+        pickle.dumps(e)
+        return e
+    except Exception:
+        return RuntimeError(f"{type(e).__name__}: {e}")
+
+
+def _shard_main(index: int, db_path: str, app_options: dict, threads: int, requests, results):
+    """工作进程的入口: 从 `requests` 读取 (call_id, op, args)，在线程池中执行，把结果写入 `results`。"""
+    sys.stdout = open(os.devnull, "w")
+    try:
+        worker = _ShardWorker(db_path, app_options)
+    except BaseException as e:
+        results.put((None, index, False, _picklable_error(e)))
+        return
+    results.put((None, index, True, None))
+
+    def run(call_id, op, args):
+        try:
+            results.put((call_id, index, True, getattr(worker, op)(*args)))
+        except BaseException as e:
+            results.put((call_id, index, False, _picklable_error(e)))
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"shard{index}") as executor:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            executor.submit(run, *request)
+    from .registry import close_apps
+
+    close_apps()
+
+
+# --- 前端调度器 ---
+class ShardedRuntime:
+    """把会话按 thread_id 分配到 `shards` 个工作进程，每个进程使用独立的检查点数据库分片。
+
+    `shards` 默认为 CPU 核数。`app_options` 原样传给每个工作进程中的 `get_app()`（例如 `{"llm": FakeChatModel()}`），必须可以 pickle。
+    `threads_per_shard` 是每个分片同时运行的请求数上限。
+    所有方法都是线程安全的，可以在 HTTP 服务等多线程环境中直接调用。
+    """
+
+    def __init__(
+        self,
+        shards: Optional[int] = None,
+        db_path: str = DEFAULT_DB_PATH,
+        app_options: Optional[dict] = None,
+        threads_per_shard: int = 16,
+        start_timeout: float = 120.0,
+    ):
+        shards = shards or os.cpu_count() or 1
+        if shards < 1:
+            raise ValueError("shards 至少为 1")
+        self.shards = shards
+        self.db_path = db_path
+        # 使用 spawn: 前端进程里可能已经有打开的 SQLite 连接和后台线程，fork 之后的子进程无法安全地继承它们。
+        context = multiprocessing.get_context("spawn")
+        self._results = context.Queue()
+        self._requests = [context.Queue() for _ in range(shards)]
+        self._processes = [
+            context.Process(
+                target=_shard_main,
+                args=(i, shard_db_path(db_path, i), app_options or {}, threads_per_shard, self._requests[i], self._results),
+                name=f"chat-shard{i}",
+                daemon=True,
+            )
+            for i in range(shards)
+        ]
+        self._pending: Dict[int, Tuple[int, Future]] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._closed = False
+        self.catalog = ShardedCatalog(self)
+
+        for process in self._processes:
+            process.start()
+        try:
+            self._wait_started(start_timeout)
+        except BaseException:
+            self._stop_processes()
+            raise
+        self._reader = threading.Thread(target=self._read_results, name="shard-results", daemon=True)
+        self._reader.start()
+
+    def _wait_started(self, timeout: float):
+        started = 0
+        while started < self.shards:
+            try:
+                _, index, ok, error = self._results.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"分片工作进程在 {timeout} 秒内没有启动") from None
+            if not ok:
+                raise RuntimeError(f"分片 {index} 启动失败") from error
+            started += 1
+
+    def _read_results(self):
+        """后台线程: 把工作进程返回的结果交给对应的 Future；发现工作进程退出时让它的请求失败。"""
+        while True:
+            try:
+                item = self._results.get(timeout=0.5)
+            except queue.Empty:
+                self._fail_dead_shards()
+                continue
+            if item is None:
+                return
+            call_id, _, ok, value = item
+            with self._lock:
+                _, future = self._pending.pop(call_id, (None, None))
+            if future is None:
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _fail_dead_shards(self):
+        dead = {i for i, process in enumerate(self._processes) if not process.is_alive()}
+        if not dead:
+            return
+        with self._lock:
+            lost = [(call_id, future) for call_id, (index, future) in self._pending.items() if index in dead]
+            for call_id, _ in lost:
+                del self._pending[call_id]
+        for _, future in lost:
+            future.set_exception(RuntimeError("分片工作进程已退出"))
+
+    # --- 调度 ---
+    def submit_to(self, index: int, op: str, *args) -> Future:
+        """把一个操作发送给指定分片，返回 Future。"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ShardedRuntime 已关闭")
+            if not self._processes[index].is_alive():
+                raise RuntimeError(f"分片 {index} 的工作进程已退出")
+            call_id = next(self._ids)
+            self._pending[call_id] = (index, future)
+        self._requests[index].put((call_id, op, args))
+        return future
+
+    def submit(self, op: str, thread_id: str, *args) -> Future:
+        """把一个会话的操作发送给它所属的分片。"""
+        return self.submit_to(shard_index(thread_id, self.shards), op, thread_id, *args)
+
+    def broadcast(self, op: str, *args) -> List[Any]:
+        """把同一个操作发送给所有分片，按分片顺序返回结果。"""
+        futures = [self.submit_to(i, op, *args) for i in range(self.shards)]
+        return [future.result() for future in futures]
+
+    # --- 对话 ---
+    def invoke(self, thread_id: str, content: str) -> Optional[str]:
+        """在会话所属的分片上运行一轮对话，返回最终回复的文本。"""
+        return self.submit("invoke", thread_id, content).result()
+
+    async def ainvoke(self, thread_id: str, content: str) -> Optional[str]:
+        return await asyncio.wrap_future(self.submit("invoke", thread_id, content))
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.submit("delete", thread_id).result()
+
+    # --- 生命周期 ---
+    def _stop_processes(self, timeout: float = 30.0):
+        for requests, process in zip(self._requests, self._processes):
+            if process.is_alive():
+                requests.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def close(self):
+        """等待进行中的请求完成，然后停止所有工作进程。"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop_processes()
+        self._results.put(None)
+        self._reader.join()
+        self._fail_dead_shards()
+
+    def __enter__(self) -> "ShardedRuntime":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardedCatalog:
+    """跨所有分片的会话目录，接口与 SessionCatalog 的查询方法相同。"""
+
+    def __init__(self, runtime: ShardedRuntime):
+        self.runtime = runtime
+
+    def _merge(self, pages: List[List[SessionInfo]], limit: int, offset: int) -> List[SessionInfo]:
+        # 每个分片的结果已经按 (最后更新时间倒序, thread_id) 排列，归并后取出全局的一页。
+        merged = heapq.merge(*pages, key=lambda s: (-s.updated_at, s.thread_id))
+        return list(itertools.islice(merged, offset, offset + limit))
+
+    def list(self, limit: int = 20, offset: int = 0) -> List[SessionInfo]:
+        return self._merge(self.runtime.broadcast("list", offset + limit, 0), limit, offset)
+
+    def search(self, text: str, limit: int = 20, offset: int = 0) -> List[SessionInfo]:
+        return self._merge(self.runtime.broadcast("search", text, offset + limit, 0), limit, offset)
+
+    def get(self, thread_id: str) -> Optional[SessionInfo]:
+        return self.runtime.submit("get", thread_id).result()
+
+    def count(self) -> int:
+        return sum(self.runtime.broadcast("count"))
+
+    def messages(self, thread_id: str, limit: int = 20, before: Optional[int] = None) -> List[Tuple[int, AnyMessage]]:
+        return self.runtime.submit("messages", thread_id, limit, before).result()
+
+    def delete(self, thread_id: str):
+        self.runtime.delete_thread(thread_id)
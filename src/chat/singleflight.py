@@ -0,0 +1,117 @@
+# -----------------------------------------------------------------------------
+# 合并进行中的相同请求 (Single-flight)
+#
+# 缓存只能复用已经完成的结果。很多会话同时问同一个热门问题时，它们几乎同时未命中缓存，
+# 各自向 Tavily / DeepSeek 发出一模一样的请求。
+#
+# `SingleFlight` 按键（与缓存键相同）合并同时进行中的请求:
+#   - 第一个到达的调用方（leader）真正执行请求；
+#   - 请求完成之前到达的相同键的调用方（follower）不发请求，等待并共享 leader 的结果；
+#   - 请求抛出的异常同样传给所有等待者；请求结束后键立即释放，之后的调用重新执行（或命中缓存）。
+# 同步和异步调用方共用同一张表，可以互相合并。
+# 异步调用方被取消时只是自己不再等待，不会取消正在进行的请求。
+# 请求本身被取消时（例如 leader 所在的事件循环关闭），取消不会传给 follower:
+# 它们重新加入，第一个重新加入的成为新的 leader 再执行一次，其余的等待它的结果。
+#
+# 用法:
+#   flight = SingleFlight()
+#   value = flight.do(key, fetch, query)              # 同步
+#   value = await flight.ado(key, afetch, query)      # 异步，afetch 是 async 函数
+# -----------------------------------------------------------------------------
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+@dataclass
+class FlightStats:
+    """合并统计: `leaders` 是真正执行的请求数，`followers` 是被合并掉的请求数。"""
+    leaders: int = 0
+    followers: int = 0
+
+    @property
+    def coalesce_rate(self) -> float:
+        total = self.leaders + self.followers
+        return self.followers / total if total else 0.0
+
+
+class _LeaderCancelled(Exception):
+    """leader 的请求被取消: 告诉等待者重新加入，而不是把取消当成请求的结果。"""
+
+
+class SingleFlight:
+    """线程安全的请求合并表。"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = FlightStats()
+
+    def _join(self, key: Hashable):
+        """返回 (future, 是否为 leader)。"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats.followers += 1
+                return call, False
+            call = self._calls[key] = Future()
+            self.stats.leaders += 1
+            return call, True
+
+    def _finish(self, key: Hashable, call: Future):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """执行 `fn(*args, **kwargs)`；同一个键已有请求在进行时，等待并返回它的结果。"""
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                return self._lead(key, call, fn, args, kwargs)
+            try:
+                return call.result()
+            except _LeaderCancelled:
+                continue
+
+    def _lead(self, key: Hashable, call: Future, fn, args, kwargs) -> Any:
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            # 先释放键再通知等待者，等待者醒来后重试时不会再加入这个已经失败的请求。
+            self._finish(key, call)
+            call.set_exception(_LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+            raise
+        self._finish(key, call)
+        call.set_result(result)
+        return result
+
+    async def ado(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """`do` 的异步版本，`fn` 是 async 函数。"""
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                # 请求在独立的任务中运行: leader 自己被取消时，其他等待者仍然能拿到结果。
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                task.add_done_callback(lambda t, call=call: self._settle(key, call, t))
+            try:
+                return await asyncio.shield(asyncio.wrap_future(call))
+            except _LeaderCancelled:
+                if leader:
+                    raise asyncio.CancelledError() from None
+
+    def _settle(self, key: Hashable, call: Future, task: asyncio.Future):
+        self._finish(key, call)
+        if task.cancelled():
+            call.set_exception(_LeaderCancelled())
+        elif task.exception() is not None:
+            call.set_exception(task.exception())
+        else:
+            call.set_result(task.result())
+
+    def __len__(self) -> int:
+        """正在进行中的请求数。"""
+        return len(self._calls)
@@ -0,0 +1,131 @@
+# -----------------------------------------------------------------------------
+# 逐 token 流式输出
+#
+# `stream_mode="values"` 要等整个图运行结束才能拿到最终回复，
+# 用户在 LLM 生成完整答案（以及所有工具循环）之前什么都看不到。
+# 这里改用 `stream_mode="messages"`：LangGraph 会把节点内部 LLM 产生的每个 token
+# 以 `(消息块, 元数据)` 的形式实时推送出来，工具节点返回的 ToolMessage 也会一并推送。
+# -----------------------------------------------------------------------------
+
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Optional, TextIO
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+
+@dataclass
+class StreamStats:
+    """一轮对话的流式输出统计。"""
+    # 从发出请求到打印出第一个 token 的耗时（秒）；没有任何文本输出时为 None。
+    time_to_first_token: Optional[float] = None
+    # 整轮对话（包括所有工具循环）的总耗时（秒）。
+    total_latency: float = 0.0
+    # 打印出的文本 token 数量。
+    tokens: int = 0
+    # 本轮调用过的工具名称，按调用顺序排列。
+    tool_calls: list = field(default_factory=list)
+    # 最后一次 LLM 调用输出的完整文本，即 AI 的最终回复。
+    reply: str = ""
+
+    def summary(self) -> str:
+        ttft = "-" if self.time_to_first_token is None else f"{self.time_to_first_token:.2f}s"
+        return f"首字延迟 {ttft}，总耗时 {self.total_latency:.2f}s，{self.tokens} 个 token"
+
+
+class _StreamPrinter:
+    """把 messages 流中的事件打印出来，并同时记录统计数据。"""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.stats = StreamStats()
+        self.start = time.perf_counter()
+        self._parts: list = []
+
+    def handle(self, chunk, metadata: dict):
+        if isinstance(chunk, AIMessageChunk):
+            # 工具调用块: LLM 决定调用工具，打印一行提示，之后的文本属于下一次 LLM 调用。
+            for call in chunk.tool_call_chunks:
+                if call.get("name"):
+                    self.stats.tool_calls.append(call["name"])
+                    self._write(f"\n[调用工具: {call['name']}]\n")
+                    self._parts = []
+            if chunk.content and isinstance(chunk.content, str):
+                if self.stats.time_to_first_token is None:
+                    self.stats.time_to_first_token = time.perf_counter() - self.start
+                self.stats.tokens += 1
+                self._parts.append(chunk.content)
+                self._write(chunk.content)
+        elif isinstance(chunk, AIMessage) and isinstance(chunk.content, str) and chunk.content:
+            # 不经过 LLM 的完整回复（例如 prerouter.py 直接给出的回答）作为一整条消息推送，一次打印出来。
+            if self.stats.time_to_first_token is None:
+                self.stats.time_to_first_token = time.perf_counter() - self.start
+            self.stats.tokens += 1
+            self._parts = [chunk.content]
+            self._write(chunk.content)
+        elif isinstance(chunk, ToolMessage):
+            self._write(f"[工具 {chunk.name} 已返回结果]\n")
+
+    def finish(self) -> StreamStats:
+        self.stats.total_latency = time.perf_counter() - self.start
+        self.stats.reply = "".join(self._parts)
+        self._write("\n")
+        return self.stats
+
+    def _write(self, text: str):
+        self.out.write(text)
+        self.out.flush()
+
+
+def stream_reply(chatapp, inputs, config, out: TextIO = None) -> StreamStats:
+    """执行一轮对话，把 LLM 的 token 和工具活动实时写到 `out`（默认标准输出）。"""
+    printer = _StreamPrinter(out or sys.stdout)
+    for chunk, metadata in chatapp.stream(inputs, config, stream_mode="messages"):
+        printer.handle(chunk, metadata)
+    return printer.finish()
+
+
+async def astream_reply(chatapp, inputs, config, out: TextIO = None) -> StreamStats:
+    """`stream_reply` 的异步版本，用于 async_app 中的异步应用。"""
+    printer = _StreamPrinter(out or sys.stdout)
+    async for chunk, metadata in chatapp.astream(inputs, config, stream_mode="messages"):
+        printer.handle(chunk, metadata)
+    return printer.finish()
+
+
+# -----------------------------------------------------------------------------
+# 增量消费 (stream_mode="updates")
+#
+# `stream_mode="values"` 每一步都会推送完整的状态快照，如果在每个事件里都遍历
+# `event["messages"]`，一轮对话的开销就是 O(事件数 × 历史长度)，历史越长越慢。
+# `stream_mode="updates"` 只推送每个节点本步返回的增量，例如
+# `{"agent": {"messages": [AIMessage(...)]}}`，消费者只需处理新消息即可。
+# -----------------------------------------------------------------------------
+
+def iter_new_messages(update: dict):
+    """从一个 updates 事件中取出本步新增的消息。"""
+    for node_update in update.values():
+        # 中断事件 (`__interrupt__`) 的值是元组而不是字典，这里直接跳过。
+        if isinstance(node_update, dict):
+            yield from node_update.get("messages", [])
+
+
+def final_reply(chatapp, inputs, config) -> Optional[AIMessage]:
+    """执行一轮对话，只消费增量消息，返回 AI 的最终回复（可能为 None）。"""
+    final_response = None
+    for update in chatapp.stream(inputs, config, stream_mode="updates"):
+        for message in iter_new_messages(update):
+            if isinstance(message, AIMessage):
+                final_response = message
+    return final_response
+
+
+async def afinal_reply(chatapp, inputs, config) -> Optional[AIMessage]:
+    """`final_reply` 的异步版本。"""
+    final_response = None
+    async for update in chatapp.astream(inputs, config, stream_mode="updates"):
+        for message in iter_new_messages(update):
+            if isinstance(message, AIMessage):
+                final_response = message
+    return final_response
@@ -0,0 +1,258 @@
+# -----------------------------------------------------------------------------
+# 并行工具执行节点
+#
+# 当 LLM 在一条 AIMessage 中请求多个工具调用时，本节点并发执行它们:
+#   - 同步调用 (`invoke`) 使用线程；
+#   - 异步调用 (`ainvoke`) 使用 asyncio 任务。
+# 每个工具可以设置超时时间；超时或出错的调用会返回一条 status="error" 的 ToolMessage，
+# 而不会让整个图失败。返回的 ToolMessage 始终按 tool_calls 的原始顺序排列。
+#
+# 线程无法被强制终止: 超时的同步调用只是不再等待，它的线程会继续运行到工具返回为止（“被放弃的线程”）。
+# 为了不让这些线程占住后续调用的位置，每一批调用使用自己的线程池（大小等于本批的调用数），
+# 同时运行的调用数由 `max_workers` 限制，而被放弃的线程不计入这个限制；
+# 超时时间从调用真正开始运行时算起，排队等待的时间不算。
+# `stats()` 和可选的 `metrics`（见 tracing.py）报告超时次数和仍在运行的被放弃线程数，用来发现卡住的工具；
+# 同步和异步调用的超时都会计入 chat_tool_timeouts_total。
+#
+# 本节点的输入输出与 LangGraph 预构建的 `ToolNode` 相同（读 `messages[-1].tool_calls`，
+# 返回 `{"messages": [ToolMessage, ...]}`），可以直接替换图中的 "tools" 节点。
+# -----------------------------------------------------------------------------
+
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.utils.runnable import RunnableCallable
+
+# 取消策略:
+#   "none":             某个调用超时或出错后，其他调用照常执行完毕。
+#   "cancel_remaining": 某个调用超时或出错后，立即取消其余尚未完成的调用。
+CANCEL_POLICIES = ("none", "cancel_remaining")
+
+
+class ParallelToolNode(RunnableCallable):
+    """并发执行工具调用、支持单个工具超时的 "tools" 节点。"""
+
+    def __init__(
+        self,
+        tools: Sequence[BaseTool],
+        *,
+        timeout: Optional[float] = None,
+        timeouts: Optional[Dict[str, float]] = None,
+        cancel_policy: str = "none",
+        max_workers: int = 8,
+        name: str = "tools",
+        metrics=None,
+    ):
+        if cancel_policy not in CANCEL_POLICIES:
+            raise ValueError(f"未知的取消策略: {cancel_policy}")
+        super().__init__(self._func, self._afunc, name=name, trace=False)
+        self.tools_by_name: Dict[str, BaseTool] = {t.name: t for t in tools}
+        # `timeout` 是所有工具的默认超时（秒），`timeouts` 可以按工具名单独覆盖。
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        self.cancel_policy = cancel_policy
+        # 一批调用中同时运行的同步调用数上限（不包括已被放弃的线程）。
+        self.max_workers = max_workers
+        self.metrics = metrics
+        self._stats_lock = threading.Lock()
+        self._abandoned = 0
+        self._abandoned_total = 0
+        self._timeouts = 0
+
+    # --- 公共辅助方法 ---
+    def timeout_for(self, tool_name: str) -> Optional[float]:
+        return self.timeouts.get(tool_name, self.timeout)
+
+    def _tool_calls(self, input) -> List[dict]:
+        last_message = input["messages"][-1]
+        if not isinstance(last_message, AIMessage):
+            raise ValueError("tools 节点的输入中，最后一条消息必须是 AIMessage")
+        return list(last_message.tool_calls)
+
+    # --- 被放弃的线程 ---
+    def _abandon(self, future: Future):
+        """记录一个超时或被取消、但线程仍在运行的调用；线程结束时自动减少计数。"""
+        with self._stats_lock:
+            self._abandoned += 1
+            self._abandoned_total += 1
+        self._report()
+        future.add_done_callback(self._release)
+
+    def _release(self, future: Future):
+        with self._stats_lock:
+            self._abandoned -= 1
+        self._report()
+
+    def _record_timeout(self, call: dict):
+        with self._stats_lock:
+            self._timeouts += 1
+        if self.metrics is not None:
+            self.metrics.inc("chat_tool_timeouts_total", tool=call["name"])
+
+    def _report(self):
+        if self.metrics is not None:
+            self.metrics.set("chat_tool_abandoned_threads", self._abandoned, node=self.name)
+
+    def stats(self) -> dict:
+        """超时次数，以及被放弃但仍在运行的线程数。`saturated` 表示卡住的线程已经达到 `max_workers`。"""
+        with self._stats_lock:
+            return {
+                "timeouts": self._timeouts,
+                "abandoned": self._abandoned,
+                "abandoned_total": self._abandoned_total,
+                "saturated": self._abandoned >= self.max_workers,
+            }
+
+    @staticmethod
+    def _error_message(call: dict, content: str) -> ToolMessage:
+        return ToolMessage(content=content, tool_call_id=call["id"], name=call["name"], status="error")
+
+    def _timeout_message(self, call: dict) -> ToolMessage:
+        return self._error_message(call, f"工具 {call['name']} 执行超时（{self.timeout_for(call['name'])} 秒），已放弃本次调用。")
+
+    def _cancelled_message(self, call: dict) -> ToolMessage:
+        return self._error_message(call, f"由于同一批次中的其他工具调用失败，工具 {call['name']} 的调用已被取消。")
+
+    def _lookup(self, call: dict) -> Optional[BaseTool]:
+        return self.tools_by_name.get(call["name"])
+
+    @staticmethod
+    def _to_message(call: dict, output) -> ToolMessage:
+        if isinstance(output, ToolMessage):
+            return output
+        return ToolMessage(content=str(output), tool_call_id=call["id"], name=call["name"])
+
+    # --- 执行单个调用 ---
+    def _run_one(self, call: dict, config: RunnableConfig) -> ToolMessage:
+        tool = self._lookup(call)
+        if tool is None:
+            return self._error_message(call, f"Error: {call['name']} is not a valid tool.")
+        try:
+            return self._to_message(call, tool.invoke({**call, "type": "tool_call"}, config))
+        except Exception as e:
+            return self._error_message(call, f"Error: {e!r}\n Please fix your mistakes.")
+
+    async def _arun_one(self, call: dict, config: RunnableConfig) -> ToolMessage:
+        tool = self._lookup(call)
+        if tool is None:
+            return self._error_message(call, f"Error: {call['name']} is not a valid tool.")
+        try:
+            return self._to_message(call, await tool.ainvoke({**call, "type": "tool_call"}, config))
+        except Exception as e:
+            return self._error_message(call, f"Error: {e!r}\n Please fix your mistakes.")
+
+    def _deadlines(self, calls: List[dict], start: float) -> List[Optional[float]]:
+        deadlines = []
+        for call in calls:
+            timeout = self.timeout_for(call["name"])
+            deadlines.append(None if timeout is None else start + timeout)
+        return deadlines
+
+    def _deadline(self, call: dict) -> Optional[float]:
+        timeout = self.timeout_for(call["name"])
+        return None if timeout is None else time.monotonic() + timeout
+
+    def _give_up(self, future: Future):
+        # 还在排队的调用可以直接取消；已经开始运行的线程只能放弃。
+        if not future.cancel():
+            self._abandon(future)
+
+    # --- 同步: 线程 ---
+    def _func(self, input, config: RunnableConfig):
+        calls = self._tool_calls(input)
+        results: List[Optional[ToolMessage]] = [None] * len(calls)
+        deadlines: List[Optional[float]] = [None] * len(calls)
+        waiting = list(range(len(calls)))
+        pending: Dict[Future, int] = {}
+        failed = False
+        # 每批调用使用自己的线程池，线程数等于调用数: 本批或其他批次中被放弃的线程不会占住空位，
+        # 所以提交的调用总是立即开始运行，超时时间从提交（即开始运行）时算起。
+        pool = ThreadPoolExecutor(max_workers=max(len(calls), 1), thread_name_prefix="tool")
+        try:
+            while pending or waiting:
+                # 0. 在 `max_workers` 的限制内开始新的调用。被放弃的调用已经不在 pending 中，不占名额。
+                while waiting and len(pending) < self.max_workers:
+                    i = waiting.pop(0)
+                    deadlines[i] = self._deadline(calls[i])
+                    pending[pool.submit(self._run_one, calls[i], config)] = i
+                now = time.monotonic()
+                # 1. 处理已经超时的调用。线程无法被强制终止，超时后只是不再等待它的结果。
+                for future, i in list(pending.items()):
+                    if deadlines[i] is not None and now >= deadlines[i]:
+                        self._give_up(future)
+                        results[i] = self._timeout_message(calls[i])
+                        del pending[future]
+                        failed = True
+                        self._record_timeout(calls[i])
+                # 2. 按取消策略处理其余调用。
+                if failed and self.cancel_policy == "cancel_remaining":
+                    for future, i in pending.items():
+                        self._give_up(future)
+                        results[i] = self._cancelled_message(calls[i])
+                    for i in waiting:
+                        results[i] = self._cancelled_message(calls[i])
+                    break
+                if not pending:
+                    continue
+                # 3. 等待任意一个调用完成，或者等到最近的超时时间点。
+                active = [deadlines[i] for i in pending.values() if deadlines[i] is not None]
+                wait_for = max(min(active) - now, 0) if active else None
+                done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    results[i] = future.result()
+                    failed = failed or results[i].status == "error"
+        finally:
+            # 不等待被放弃的线程: 它们在工具返回后自行退出。
+            pool.shutdown(wait=False)
+
+        return {"messages": results}
+
+    # --- 异步: asyncio 任务 ---
+    async def _afunc(self, input, config: RunnableConfig):
+        calls = self._tool_calls(input)
+        results: List[Optional[ToolMessage]] = [None] * len(calls)
+        deadlines = self._deadlines(calls, time.monotonic())
+        pending: Dict[asyncio.Task, int] = {
+            asyncio.ensure_future(self._arun_one(call, config)): i for i, call in enumerate(calls)
+        }
+        failed = False
+
+        try:
+            while pending:
+                now = time.monotonic()
+                for task, i in list(pending.items()):
+                    if deadlines[i] is not None and now >= deadlines[i]:
+                        # 与线程不同，asyncio 任务可以被真正取消。
+                        task.cancel()
+                        results[i] = self._timeout_message(calls[i])
+                        del pending[task]
+                        failed = True
+                        self._record_timeout(calls[i])
+                if failed and self.cancel_policy == "cancel_remaining":
+                    for task, i in pending.items():
+                        task.cancel()
+                        results[i] = self._cancelled_message(calls[i])
+                    pending.clear()
+                    break
+                if not pending:
+                    break
+                active = [deadlines[i] for i in pending.values() if deadlines[i] is not None]
+                wait_for = max(min(active) - now, 0) if active else None
+                done, _ = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    i = pending.pop(task)
+                    results[i] = task.result()
+                    failed = failed or results[i].status == "error"
+        finally:
+            # 节点本身被取消时（例如整个图运行被取消），不要留下孤儿任务。
+            for task in pending:
+                task.cancel()
+
+        return {"messages": results}
@@ -0,0 +1,464 @@
+# -----------------------------------------------------------------------------
+# 本地追踪与按节点的性能剖析 (Local Tracing)
+#
+# phase4 的 LangSmith 集成需要远程项目和 LANGCHAIN_API_KEY；其余代码里唯一的“监控”是 print。
+# 这里提供一个不依赖任何外部服务的 LangChain 回调处理器 `LocalTracer`，按每次运行（以及 thread_id）记录:
+#   - 每个节点的耗时（LangGraph 节点的运行带有 `graph:step:N` 标签）；
+#   - LLM 调用次数、耗时和 token 用量（来自 AIMessage.usage_metadata 或 llm_output["token_usage"]）；
+#   - 每次工具调用的耗时和是否出错；
+#   - 检查点写入（put / put_writes）的次数和耗时，通过包装检查点后端的方法得到；
+#     开启 write_behind 的后端 put 只是入队，改由后台写线程报告每次真正写入的耗时。
+#
+# 导出方式:
+#   - JSONL: 每次顶层运行结束后写一行，文件超过大小上限时自动轮转（RotatingFileHandler）；
+#     序列化和写文件都在后台线程完成，请求路径上只有一次入队。
+#   - Prometheus: `Metrics` 维护计数器、仪表 (gauge) 和直方图，`render()` 输出文本格式，
+#     `MetricsServer` 在 /metrics 上提供给 Prometheus 抓取。
+#
+# 开销: 每个回调只做几次字典操作和一次 perf_counter，不做 I/O，也不加全局锁以外的等待，
+# 可以在生产环境中一直开启。
+#
+# 用法:
+#   tracer = LocalTracer("traces/chat.jsonl")
+#   chatapp = get_compiled_app(tracer=tracer)          # 或 get_app(tracer=tracer)
+#   server = MetricsServer(tracer.metrics, port=9464).start()
+# -----------------------------------------------------------------------------
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 延迟直方图的默认分桶（秒），覆盖从亚毫秒级的检查点写入到数十秒的 LLM 调用。
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 指标名 -> (类型, 说明)
+METRICS = {
+    "chat_runs_total": ("counter", "顶层图运行次数"),
+    "chat_run_duration_seconds": ("histogram", "顶层图运行的总耗时"),
+    "chat_node_duration_seconds": ("histogram", "每个图节点的执行耗时"),
+    "chat_llm_duration_seconds": ("histogram", "LLM 调用耗时"),
+    "chat_llm_tokens_total": ("counter", "LLM token 用量"),
+    "chat_tool_duration_seconds": ("histogram", "工具调用耗时"),
+    "chat_tool_errors_total": ("counter", "工具调用出错次数"),
+    "chat_tool_timeouts_total": ("counter", "工具调用超时次数"),
+    "chat_tool_abandoned_threads": ("gauge", "超时后被放弃、但仍在运行的工具线程数"),
+    "chat_checkpoint_write_duration_seconds": ("histogram", "检查点写入耗时"),
+    "chat_ratelimit_queue_depth": ("gauge", "限流调度器中排队的请求数"),
+    "chat_ratelimit_wait_seconds": ("histogram", "请求在限流调度器中的排队耗时"),
+    "chat_ratelimit_rejected_total": ("counter", "因队列已满或排队超时被拒绝的请求数"),
+    "chat_prerouter_turns_total": ("counter", "预路由处理的轮数，按去向（rule / faq / classifier / llm）分类"),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """进程内的计数器、仪表和直方图，按 Prometheus 文本格式导出。"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counters: Dict[Tuple, float] = {}
+        self._gauges: Dict[Tuple, float] = {}
+        # (名称, 标签) -> [每个分桶的计数..., 总和, 总数]
+        self._histograms: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += seconds
+            series[-1] += 1
+
+    def value(self, name: str, **labels) -> float:
+        """计数器或仪表的当前值，或直方图的观测次数。主要用于测试。"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key][-1]
+            if key in self._gauges:
+                return self._gauges[key]
+            return self._counters.get(key, 0)
+
+    def render(self) -> str:
+        """返回 Prometheus 文本格式 (text/plain; version=0.0.4)。"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, list(series)) for key, series in self._histograms.items())
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind in ("counter", "gauge"):
+                series = counters if kind == "counter" else gauges
+                lines.extend(f"{name}{_format_labels(labels)} {value}" for (n, labels), value in series if n == name)
+                continue
+            for (n, labels), series in histograms:
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels, 'le="%s"' % bound)
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _format_labels(labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{bucket_labels} {series[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {series[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """在 http://host:port/metrics 上提供 Prometheus 指标的后台 HTTP 服务器。"""
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9464):
+        self.metrics = metrics
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = server.metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}/metrics"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class _JsonlFileHandler(logging.handlers.RotatingFileHandler):
+    """按大小轮转的文件处理器。遇到 flush 标记时把缓冲写入磁盘并通知等待方。"""
+
+    def handle(self, record: logging.LogRecord):
+        done = getattr(record, "flush", None)
+        if done is not None:
+            self.flush()
+            done.set()
+            return True
+        return super().handle(record)
+
+
+class JsonlExporter:
+    """把追踪记录异步写入按大小轮转的 JSONL 文件。
+
+    `export()` 只把记录放进队列；序列化和写文件由 QueueListener 的后台线程完成。
+    文件超过 `max_bytes` 时轮转为 `path.1`、`path.2` ...，最多保留 `backups` 个旧文件。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 5):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._handler = _JsonlFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        self._handler.setFormatter(_JsonFormatter())
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(self._queue, self._handler)
+        self._listener.start()
+        self._closed = False
+
+    def export(self, record: dict):
+        self._queue.put(logging.makeLogRecord({"msg": record}))
+
+    def flush(self):
+        """等待队列中的记录全部写入文件。"""
+        done = threading.Event()
+        self._queue.put(logging.makeLogRecord({"msg": None, "flush": done}))
+        done.wait()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._listener.stop()
+            self._handler.close()
+
+
+class LocalTracer(BaseCallbackHandler):
+    """记录每次图运行的节点耗时、LLM token 用量、工具延迟和检查点写入耗时。
+
+    `path` 不为空时每次顶层运行结束后向 JSONL 文件写一条记录；指标始终汇总到 `metrics`。
+    同一个 tracer 可以同时用于多个应用和多个线程。
+    """
+
+    # 直接在触发回调的线程中执行，不经过线程池（异步运行时也是如此），省去一次调度。
+    run_inline = True
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        *,
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 5,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.metrics = metrics or Metrics()
+        self.exporter = JsonlExporter(path, max_bytes, backups) if path else None
+        # run_id -> 所属顶层运行的追踪记录（嵌套的运行通过 parent_run_id 找到它）
+        self._traces: Dict[UUID, dict] = {}
+        # run_id -> (开始时间, 名称, super-step)，只记录需要计时的运行
+        self._starts: Dict[UUID, tuple] = {}
+        # thread_id -> 正在运行的追踪记录，用于把检查点写入归到对应的运行
+        self._active: Dict[str, dict] = {}
+        # 最近完成的追踪记录，便于测试和调试查看
+        self.last_trace: Optional[dict] = None
+
+    # --- 运行的开始与结束 ---
+    def _enter(self, run_id: UUID, parent_run_id: Optional[UUID]) -> Optional[dict]:
+        trace = self._traces.get(parent_run_id) if parent_run_id is not None else None
+        if trace is not None:
+            self._traces[run_id] = trace
+        return trace
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        if parent_run_id is None:
+            metadata = metadata or {}
+            thread_id = metadata.get("thread_id")
+            trace = {
+                "run_id": str(run_id),
+                "thread_id": thread_id,
+                "graph": kwargs.get("name") or "graph",
+                "started_at": time.time(),
+                "nodes": [],
+                "llm": {"calls": 0, "input_tokens": 0, "output_tokens": 0, "ms": 0.0},
+                "tools": [],
+                "checkpoint": {"writes": 0, "ms": 0.0},
+            }
+            self._traces[run_id] = trace
+            self._starts[run_id] = (time.perf_counter(), None, None)
+            if thread_id is not None:
+                self._active[thread_id] = trace
+            return
+        if self._enter(run_id, parent_run_id) is not None and tags and any(t.startswith("graph:step:") for t in tags):
+            metadata = metadata or {}
+            self._starts[run_id] = (time.perf_counter(), metadata.get("langgraph_node"), metadata.get("langgraph_step"))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_chain(run_id, None)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_chain(run_id, error)
+
+    def _end_chain(self, run_id: UUID, error: Optional[BaseException]):
+        trace = self._traces.pop(run_id, None)
+        start = self._starts.pop(run_id, None)
+        if trace is None or start is None:
+            return
+        began, node, step = start
+        seconds = time.perf_counter() - began
+        if node is not None:
+            trace["nodes"].append({"node": node, "step": step, "ms": round(seconds * 1000, 3)})
+            self.metrics.observe("chat_node_duration_seconds", seconds, node=node)
+            return
+        # 顶层运行结束
+        status = "ok" if error is None else "error"
+        trace["duration_ms"] = round(seconds * 1000, 3)
+        trace["status"] = status
+        if error is not None:
+            trace["error"] = repr(error)
+        trace["llm"]["ms"] = round(trace["llm"]["ms"], 3)
+        trace["checkpoint"]["ms"] = round(trace["checkpoint"]["ms"], 3)
+        if self._active.get(trace["thread_id"]) is trace:
+            del self._active[trace["thread_id"]]
+        self.metrics.inc("chat_runs_total", status=status)
+        self.metrics.observe("chat_run_duration_seconds", seconds)
+        self.last_trace = trace
+        if self.exporter is not None:
+            self.exporter.export(trace)
+
+    # --- LLM ---
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self.on_llm_start(serialized, [], run_id=run_id, parent_run_id=parent_run_id, metadata=metadata, **kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        if self._enter(run_id, parent_run_id) is not None:
+            serialized = serialized or {}
+            model = (metadata or {}).get("ls_model_name") or serialized.get("name") or (serialized.get("id") or ["llm"])[-1]
+            self._starts[run_id] = (time.perf_counter(), model, None)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        trace = self._traces.pop(run_id, None)
+        start = self._starts.pop(run_id, None)
+        if trace is None or start is None:
+            return
+        began, model, _ = start
+        seconds = time.perf_counter() - began
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not (input_tokens or output_tokens):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        llm = trace["llm"]
+        llm["calls"] += 1
+        llm["input_tokens"] += input_tokens
+        llm["output_tokens"] += output_tokens
+        llm["ms"] += seconds * 1000
+        self.metrics.observe("chat_llm_duration_seconds", seconds, model=model)
+        if input_tokens:
+            self.metrics.inc("chat_llm_tokens_total", input_tokens, model=model, type="input")
+        if output_tokens:
+            self.metrics.inc("chat_llm_tokens_total", output_tokens, model=model, type="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._traces.pop(run_id, None)
+        self._starts.pop(run_id, None)
+
+    # --- 工具 ---
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        if self._enter(run_id, parent_run_id) is not None:
+            name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+            self._starts[run_id] = (time.perf_counter(), name, None)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, None)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, error)
+
+    def _end_tool(self, run_id: UUID, error: Optional[BaseException]):
+        trace = self._traces.pop(run_id, None)
+        start = self._starts.pop(run_id, None)
+        if trace is None or start is None:
+            return
+        began, name, _ = start
+        seconds = time.perf_counter() - began
+        record = {"name": name, "ms": round(seconds * 1000, 3), "status": "ok" if error is None else "error"}
+        trace["tools"].append(record)
+        self.metrics.observe("chat_tool_duration_seconds", seconds, tool=name)
+        if error is not None:
+            self.metrics.inc("chat_tool_errors_total", tool=name)
+
+    # --- 检查点 ---
+    def instrument(self, saver):
+        """包装检查点后端的写入方法，记录每次写入的耗时。
+
+        原始方法保存在后端上，重复调用（包括共享的后端被另一个追踪器再次包装）总是从原始方法重新包装，
+        只有最后一个追踪器计时，不会叠加。开启 write_behind 的后端 `put` / `put_writes` 只是入队，
+        不包装，改为通过 `write_observer` 记录后台写线程中真正写入的耗时。
+        """
+        if getattr(saver, "_local_tracer", None) is self:
+            return saver
+        originals = saver.__dict__.setdefault("_untimed_methods", {})
+        write_behind = getattr(saver, "write_behind", False)
+        for op in ("put", "put_writes"):
+            for name, wrap in ((op, self._timed), (f"a{op}", self._atimed)):
+                if write_behind and name == op:
+                    continue
+                if name not in originals:
+                    originals[name] = getattr(saver, name)
+                setattr(saver, name, wrap(op, originals[name]))
+        if write_behind:
+            saver.write_observer = self._record_checkpoint
+        saver._local_tracer = self
+        return saver
+
+    def _record_checkpoint(self, op: str, config: dict, seconds: float):
+        self.metrics.observe("chat_checkpoint_write_duration_seconds", seconds, op=op)
+        trace = self._active.get((config.get("configurable") or {}).get("thread_id"))
+        if trace is not None:
+            trace["checkpoint"]["writes"] += 1
+            trace["checkpoint"]["ms"] += seconds * 1000
+
+    def _timed(self, op: str, method):
+        def timed(config, *args, **kwargs):
+            began = time.perf_counter()
+            try:
+                return method(config, *args, **kwargs)
+            finally:
+                self._record_checkpoint(op, config, time.perf_counter() - began)
+        return timed
+
+    def _atimed(self, op: str, method):
+        async def timed(config, *args, **kwargs):
+            began = time.perf_counter()
+            try:
+                return await method(config, *args, **kwargs)
+            finally:
+                self._record_checkpoint(op, config, time.perf_counter() - began)
+        return timed
+
+    def flush(self):
+        """等待已完成运行的记录全部写入 JSONL 文件。"""
+        if self.exporter is not None:
+            self.exporter.flush()
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+def tracer_from_env() -> Optional[LocalTracer]:
+    """根据环境变量创建追踪器: `CHAT_TRACE_FILE` 指定 JSONL 文件，`CHAT_METRICS_PORT` 开启 /metrics。
+
+    两者都没有设置时返回 None（不追踪）。
+    """
+    path = os.getenv("CHAT_TRACE_FILE")
+    port = os.getenv("CHAT_METRICS_PORT")
+    if not (path or port):
+        return None
+    tracer = LocalTracer(path)
+    if port:
+        tracer.metrics_server = MetricsServer(tracer.metrics, host=os.getenv("CHAT_METRICS_HOST", "127.0.0.1"), port=int(port)).start()
+    return tracer
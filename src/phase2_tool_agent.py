@@ -2,58 +2,78 @@
 # 本示例代码对应 plan 文件夹中的以下文档：
 # - 阶段二：实践项目 | 6.1. 构建 Ollama 工具调用 Agent (phase2_6_1_project_ollama_agent.md)
 
-import os
-from dotenv import load_dotenv
 import operator
 from typing import TypedDict, Annotated, List
 from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
 from langchain_core.tools import tool
-from langchain_tavily import TavilySearch
-from langchain_deepseek import ChatDeepSeek
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph
-from langgraph.prebuilt import ToolNode
-
-# --- API Key Setup ---
-# 在真实项目中，请从环境变量中读取这些值。
-# 为了方便本次交互式学习，我们在此处直接设置。
-load_dotenv()
-
-# 从环境变量中获取 API Key，如果未设置则抛出异常
-if not os.getenv("TAVILY_API_KEY"):
-    raise ValueError("TAVILY_API_KEY not set")
-if not os.getenv("DEEPSEEK_API_KEY"):
-    raise ValueError("DEEPSEEK_API_KEY not set")
-if not os.getenv("GEMINI_API_KEY"):
-    raise ValueError("GEMINI_API_KEY not set")
+from chat.cache import CachedSearch
+from chat.llm_cache import LLMResponseCache
+from chat.llm_router import LLMRouter
+# ChatDeepSeek / ChatGoogleGenerativeAI 在第一次创建模型时才导入对应的库（见 chat/providers.py），
+# 只用 DeepSeek 时不会导入 Google 的 SDK，反之亦然。
+from chat.providers import PROVIDERS, make_chat_model, require_env
+from chat.rate_limit import scheduler_from_env
+from chat.search_client import get_search_client
+from chat.tool_executor import ParallelToolNode
 
 # --- 模型选择 ---
-# 在这里切换你想要使用的模型: 'deepseek' 或 'gemini'
+# 在这里切换你想要使用的模型: 'deepseek'、'gemini'，
+# 或者 'router': 同时使用两者，按延迟选择更快的健康提供方，出错或超时时自动回退（实现见 chat/llm_router.py）。
 MODEL_TO_USE = "gemini"
+ROUTER_PROVIDERS = ["deepseek", "gemini"]
+# 是否开启 LLM 回复缓存（实现见 chat/llm_cache.py）。两个模型都使用 temperature=0，
+# 相同的问题可以直接复用上次的回复；缓存按模型区分，切换模型不会拿到另一个模型的回复。
+USE_LLM_CACHE = False
+LLM_CACHE_PATH = "llm_cache.sqlite"
+# 各提供方的配额（实现见 chat/rate_limit.py）: 超出配额的请求排队等待，而不是撞上 429 再重试。
+# 配额因账号而异，所以不写在代码里，而是从环境变量（或 .env 文件）CHAT_RATE_LIMITS 中读取，例如:
+#   CHAT_RATE_LIMITS="gemini:rps=0.25,tpm=1000000;tavily:rps=1"
+# 未设置时不限流；没有列出的提供方也不限流。
+scheduler = scheduler_from_env()
 
 # 1. 定义工具
+# 搜索结果缓存（实现见 chat/cache.py）: 重复的问题在有效期内不会再次请求 Tavily。
+# 未命中时通过共享客户端（chat/search_client.py）搜索，复用 HTTP 连接池。
+search_cache = CachedSearch(
+    lambda query: get_search_client().search(query, max_results=3),
+    namespace="tavily:max_results=3",
+    scheduler=scheduler,
+    provider="tavily",
+)
+
 @tool
 def simple_search(query: str):
     """一个简单的网页搜索工具，用于查找关于技术、事件或人物的最新信息。"""
     try:
-        search_tool = TavilySearch(max_results=3)
-        return search_tool.invoke(query)
+        return search_cache(query)
     except Exception as e:
         return f"搜索工具遇到错误: {e}"
 
 tools = [simple_search]
 
+# --- API Key Setup ---
+# 在真实项目中，请从环境变量（或 .env 文件）中读取这些值。
+# 只检查所选模型真正需要的 Key（模型对应的 Key 见 chat/providers.py 中的 PROVIDERS）: 如果未设置则抛出异常。
+require_env("TAVILY_API_KEY")
+
 # 2. 根据选择初始化 LLM 并绑定工具
-if MODEL_TO_USE == 'deepseek':
-    print("--- 使用 DeepSeek 模型 ---")
-    llm = ChatDeepSeek(model="deepseek-chat", temperature=0)
-elif MODEL_TO_USE == 'gemini':
-    print("--- 使用 Gemini 模型 ---")
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0, google_api_key=os.getenv("GEMINI_API_KEY"))
+if MODEL_TO_USE == 'router':
+    print(f"--- 在 {', '.join(ROUTER_PROVIDERS)} 之间路由 ---")
+    llm = LLMRouter({name: make_chat_model(name) for name in ROUTER_PROVIDERS}, timeout=60, hedge=True)
+elif MODEL_TO_USE in PROVIDERS:
+    print(f"--- 使用 {MODEL_TO_USE} 模型 ---")
+    llm = make_chat_model(MODEL_TO_USE)
 else:
     raise ValueError(f"未知的模型: {MODEL_TO_USE}")
 
 llm_with_tools = llm.bind_tools(tools)
+if scheduler is not None:
+    print(f"--- 已开启限流: {', '.join(scheduler.limits)} ---")
+    llm_with_tools = scheduler.wrap_model(llm, llm_with_tools)
+if USE_LLM_CACHE:
+    print(f"--- 已开启 LLM 回复缓存: {LLM_CACHE_PATH} ---")
+    llm_with_tools = LLMResponseCache(db_path=LLM_CACHE_PATH).wrap(llm, tools, llm_with_tools)
 
 # 3. 定义 Agent 状态
 class AgentState(TypedDict):
@@ -65,7 +85,8 @@ def agent_node(state: AgentState):
     response = llm_with_tools.invoke(state['messages'])
     return {"messages": [response]}
 
-tool_node = ToolNode(tools)
+# 并发执行同一批次的工具调用，单个搜索最多等待 30 秒（实现见 chat/tool_executor.py）。
+tool_node = ParallelToolNode(tools, timeout=30)
 
 # 5. 定义条件路由
 def router(state: AgentState) -> str:
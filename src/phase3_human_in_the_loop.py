@@ -4,6 +4,7 @@
 # - 阶段三：实践项目 | 9.1. 构建带用户确认的 Agent (phase3_9_1_project_agent_with_confirmation.md)
 
 import os
+import sys
 from dotenv import load_dotenv
 import operator
 import uuid
@@ -13,7 +14,8 @@ from langchain_core.tools import tool
 from langchain_deepseek import ChatDeepSeek
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.sqlite import SqliteSaver
+from chat.approvals import ApprovalQueue, review
+from chat.checkpointer import PooledSqliteSaver
 
 # --- API Key Setup ---
 load_dotenv()
@@ -58,11 +60,9 @@ def router(state: AgentState) -> str:
         print("决策：结束")
         return "__end__"
 
-import sqlite3
-
 # 5. 构建并编译带中断的图
-conn = sqlite3.connect("checkpoints.sqlite", check_same_thread=False)
-memory = SqliteSaver(conn=conn)
+# WAL + 读连接池 + 单写连接的检查点后端（见 src/chat/checkpointer.py）
+memory = PooledSqliteSaver("checkpoints.sqlite")
 
 workflow = StateGraph(AgentState)
 workflow.add_node("agent", agent_node)
@@ -74,6 +74,9 @@ workflow.add_edge("tools", "__end__") # 工具执行完就结束
 # 核心：在编译时设置中断点！
 app = workflow.compile(checkpointer=memory, interrupt_before=["tools"])
 
+# 待审批的工具调用与检查点放在同一个数据库里（见 src/chat/approvals.py）
+approvals = ApprovalQueue(memory.conn, lock=memory.lock)
+
 # 6. 编写交互式运行逻辑
 def run_agent():
     session_id = str(uuid.uuid4())
@@ -97,26 +100,15 @@ def run_agent():
         event["messages"][-1].pretty_print()
 
     # --- 人工干预环节 ---
-    current_state = app.get_state(config)
-    last_message = current_state.values['messages'][-1]
-    tool_call = last_message.tool_calls[0]
-
-    print("\n--- AGENT 已暂停 ---")
-    print(f"Agent 准备调用工具: {tool_call['name']}")
-    print(f"参数: {tool_call['args']}")
-
-    while True:
-        user_approval = input("是否批准执行此操作？ (yes/no): ")
-        if user_approval.lower() in ["yes", "no"]:
-            break
-
-    if user_approval.lower() == "yes":
-        print("--- 用户已批准，继续执行 ---")
-        for event in app.stream(None, config, stream_mode="values"):
-            event['messages'][-1].pretty_print()
-        print("--- 流程结束 ---")
-    else:
-        print("--- 用户已拒绝，操作取消 ---")
+    # 待执行的工具调用放进审批队列后立即返回，不再用 input() 阻塞整个进程等待回答。
+    for pending in approvals.enqueue(app, config):
+        print(f"\n--- AGENT 已暂停，等待审批 #{pending.id} ---")
+        print(f"Agent 准备调用工具: {pending.tool_name}")
+        print(f"参数: {pending.args}")
+    print("运行 `python src/phase3_human_in_the_loop.py review` 审批所有待执行的操作。")
 
 if __name__ == "__main__":
-    run_agent()
+    if sys.argv[1:] == ["review"]:
+        review(approvals, app)
+    else:
+        run_agent()
@@ -0,0 +1,204 @@
+import operator
+import threading
+import time
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.graph import StateGraph
+from langgraph.prebuilt import ToolNode
+
+from src.chat.approvals import SKIPPED_MESSAGE, ApprovalQueue, review
+from src.chat.checkpointer import PooledSqliteSaver
+from src.chat.fakes import FakeChatModel, ToolCallingFakeChatModel
+
+executed = []
+executed_lock = threading.Lock()
+
+
+@tool
+def write_file(query: str):
+    """假的“危险”工具: 只记录被执行的参数。"""
+    with executed_lock:
+        executed.append(query)
+    return f"已写入 {query}"
+
+
+class AgentState(TypedDict):
+    messages: Annotated[List[AnyMessage], operator.add]
+
+
+def build_app(saver, llm, back_to_agent: bool = False):
+    """与 phase3_human_in_the_loop.py 相同结构的图: 在工具节点之前中断。"""
+    llm_with_tools = llm.bind_tools([write_file])
+    workflow = StateGraph(AgentState)
+    workflow.add_node("agent", lambda state: {"messages": [llm_with_tools.invoke(state["messages"])]})
+    workflow.add_node("tools", ToolNode([write_file]))
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", lambda state: "tools" if state["messages"][-1].tool_calls else "__end__")
+    workflow.add_edge("tools", "agent" if back_to_agent else "__end__")
+    return workflow.compile(checkpointer=saver, interrupt_before=["tools"])
+
+
+def _setup(tmp_path, **kwargs):
+    executed.clear()
+    saver = PooledSqliteSaver(str(tmp_path / "checkpoints.sqlite"))
+    app = build_app(saver, ToolCallingFakeChatModel(tool_name="write_file"), **kwargs)
+    return saver, app, ApprovalQueue(saver.conn, lock=saver.lock)
+
+
+def _config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_submit_returns_immediately_and_persists_pending_calls(tmp_path):
+    saver, app, queue = _setup(tmp_path)
+    pending = queue.submit(app, {"messages": [HumanMessage(content="a.md")]}, _config("t1"))
+
+    assert [(p.thread_id, p.tool_name, p.args, p.status) for p in pending] == [("t1", "write_file", {"query": "a.md"}, "pending")]
+    assert executed == []
+    # 重复入队不会产生新行；重新打开队列（进程重启）后仍然可以看到。
+    queue.enqueue(app, _config("t1"))
+    assert ApprovalQueue(saver.conn, lock=saver.lock).count() == 1
+    # 没有停在中断点的会话不会入队。
+    plain = build_app(saver, FakeChatModel(responses=[AIMessage(content="好的")]))
+    assert queue.submit(plain, {"messages": [HumanMessage(content="你好")]}, _config("t2")) == []
+    saver.close()
+
+
+def test_bulk_approve_and_reject_then_resume_concurrently(tmp_path):
+    saver, app, queue = _setup(tmp_path)
+    for i in range(40):
+        queue.submit(app, {"messages": [HumanMessage(content=f"file-{i}.md")]}, _config(f"t{i}"))
+
+    pending = queue.list(limit=100)
+    assert len(pending) == 40 and [p.thread_id for p in queue.list(limit=5, offset=5)] == [f"t{i}" for i in range(5, 10)]
+    approved = [p.id for p in pending if int(p.thread_id[1:]) % 4]
+    rejected = [p.id for p in pending if not int(p.thread_id[1:]) % 4]
+    assert queue.approve(approved) == 30
+    assert queue.reject(rejected, reason="路径不允许") == 10
+    # 已经审批过的调用不会被再次修改。
+    assert queue.approve(rejected) == 0
+
+    report = queue.resume(app, concurrency=8)
+    assert len(report.resumed) == 30 and len(report.rejected) == 10 and not report.failed
+    assert sorted(executed) == sorted(f"file-{i}.md" for i in range(40) if i % 4)
+    assert queue.count("done") == 40 and queue.count(None) == 40
+    assert queue.resume(app).threads == 0
+
+    rejected_state = app.get_state(_config("t0"))
+    assert not rejected_state.next
+    assert rejected_state.values["messages"][-1].content == "用户拒绝执行 write_file: 路径不允许"
+    saver.close()
+
+
+def test_thread_waits_for_every_call_and_rejection_reaches_the_model(tmp_path):
+    saver, app, queue = _setup(tmp_path, back_to_agent=True)
+    config = _config("multi")
+    # 一次请求两个工具调用: 两个都审批完之前不会恢复。
+    app.update_state(config, {"messages": [
+        HumanMessage(content="写两个文件"),
+        AIMessage(content="", tool_calls=[
+            {"name": "write_file", "args": {"query": "x.md"}, "id": "call-x"},
+            {"name": "write_file", "args": {"query": "y.md"}, "id": "call-y"},
+        ]),
+    ]}, as_node="agent")
+    first, second = queue.enqueue(app, config)
+
+    queue.approve([first.id])
+    assert queue.resume(app).threads == 0
+    queue.reject([second.id])
+    report = queue.resume(app)
+    assert report.rejected == ["multi"]
+
+    # 被拒绝时不执行任何调用；工具节点之后回到 agent，模型看到了拒绝的结果。
+    assert executed == []
+    messages = app.get_state(config).values["messages"]
+    tool_results = [m.content for m in messages if isinstance(m, ToolMessage)]
+    assert tool_results == [SKIPPED_MESSAGE, "用户拒绝执行 write_file"]
+    assert messages[-1].content.startswith("根据搜索结果回答")
+    saver.close()
+
+
+def test_failed_resume_is_recorded_without_affecting_other_threads(tmp_path):
+    saver, app, queue = _setup(tmp_path)
+    for thread_id in ("ok", "broken"):
+        queue.submit(app, {"messages": [HumanMessage(content=thread_id)]}, _config(thread_id))
+    queue.approve([p.id for p in queue.list()])
+
+    original = queue.resume_thread
+
+    def resume_thread(app, thread_id, approvals):
+        if thread_id == "broken":
+            raise RuntimeError("磁盘已满")
+        return original(app, thread_id, approvals)
+
+    queue.resume_thread = resume_thread
+    report = queue.resume(app)
+    assert report.resumed == ["ok"]
+    assert report.failed == {"broken": "RuntimeError: 磁盘已满"}
+    assert queue.list("failed")[0].reason == "RuntimeError: 磁盘已满"
+    saver.close()
+
+
+def test_stale_resuming_claim_is_reclaimed_without_running_twice(tmp_path):
+    saver, app, queue = _setup(tmp_path)
+    for thread_id in ("crashed", "finished"):
+        queue.submit(app, {"messages": [HumanMessage(content=thread_id)]}, _config(thread_id))
+    queue.approve([p.id for p in queue.list()])
+
+    # 模拟进程在恢复途中退出: 两个会话都被认领，"finished" 已经恢复完但没来得及标记为 done。
+    claimed = queue._claim(10)
+    app.invoke(None, _config("finished"))
+    assert executed == ["finished"] and queue.count("resuming") == 2
+    # 租约未过期时不会被重新认领。
+    assert queue.resume(app).threads == 0
+
+    # 租约过期（认领时间早于 lease 秒之前）后被下一次 resume 收回。
+    with queue.lock:
+        queue.conn.execute("UPDATE pending_approvals SET claimed_at = claimed_at - ?", (queue.lease + 1,))
+        queue.conn.commit()
+    report = queue.resume(app)
+    assert sorted(report.resumed) == ["crashed", "finished"] and set(claimed) == {"crashed", "finished"}
+    assert sorted(executed) == ["crashed", "finished"]
+    assert queue.count("done") == 2 and queue.count("resuming") == 0
+    saver.close()
+
+
+def test_slow_thread_does_not_hold_back_the_others(tmp_path):
+    saver, app, queue = _setup(tmp_path)
+    for i in range(6):
+        queue.submit(app, {"messages": [HumanMessage(content=f"t{i}")]}, _config(f"t{i}"))
+    queue.approve([p.id for p in queue.list()])
+
+    original = queue.resume_thread
+    finished = {}
+
+    def resume_thread(app, thread_id, approvals):
+        if thread_id == "t0":
+            time.sleep(0.5)
+        result = original(app, thread_id, approvals)
+        finished[thread_id] = time.perf_counter()
+        return result
+
+    queue.resume_thread = resume_thread
+    report = queue.resume(app, concurrency=2)
+    assert len(report.resumed) == 6
+    # 其余 5 个会话都在另一个线程上跑完，不需要等最慢的那个。
+    assert report.resumed[-1] == "t0"
+    assert max(v for k, v in finished.items() if k != "t0") < finished["t0"]
+    saver.close()
+
+
+def test_review_approves_chosen_calls_and_rejects_the_rest(tmp_path, capsys):
+    saver, app, queue = _setup(tmp_path)
+    for thread_id in ("a", "b"):
+        queue.submit(app, {"messages": [HumanMessage(content=thread_id)]}, _config(thread_id))
+    chosen = queue.list(thread_id="a")[0].id
+
+    report = review(queue, app, ask=lambda prompt: f"{chosen}")
+    assert (report.resumed, report.rejected) == (["a"], ["b"])
+    assert executed == ["a"]
+    assert review(queue, app) is None
+    assert "没有待审批的操作" in capsys.readouterr().out
+    saver.close()
@@ -0,0 +1,40 @@
+import asyncio
+import os
+import time
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from src.chat.async_app import async_chat_app, async_search_tool
+from src.chat.async_main import chat_turn
+from src.chat.fakes import FakeChatModel
+
+
+def test_async_search_tool_keeps_tool_schema():
+    """测试异步搜索工具与同步版本对 LLM 暴露相同的名字。"""
+    assert async_search_tool.name == "search_tool"
+    assert async_search_tool.coroutine is not None
+
+
+def test_concurrent_sessions_do_not_block_each_other(tmp_path):
+    """测试多个会话并发执行时，总耗时接近单次 LLM 延迟而不是其总和。"""
+    latency = 0.2
+    sessions = 20
+
+    async def run():
+        llm = FakeChatModel(latency=latency)
+        async with async_chat_app(llm=llm, db_path=str(tmp_path / "chat.sqlite")) as chatapp:
+            start = time.perf_counter()
+            replies = await asyncio.gather(
+                *(chat_turn(chatapp, f"thread-{i}", f"你好 {i}") for i in range(sessions))
+            )
+            elapsed = time.perf_counter() - start
+            state = await chatapp.aget_state({"configurable": {"thread_id": "thread-3"}})
+        return replies, elapsed, state
+
+    replies, elapsed, state = asyncio.run(run())
+    assert [r.content for r in replies] == [f"回复: 你好 {i}" for i in range(sessions)]
+    assert elapsed < latency * sessions / 4
+    # 每个会话的历史记录互不干扰
+    assert [m.content for m in state.values["messages"]] == ["你好 3", "回复: 你好 3"]
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from src.chat.app import get_compiled_app
+from src.chat.batch import GRAPHS, read_jsonl, run_batch, run_graph_batch, run_one
+from src.chat.fakes import FakeChatModel
+
+
+def _write_questions(path, n):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(json.dumps({"id": f"q{i}", "question": f"问题 {i}"}, ensure_ascii=False) + "\n")
+
+
+def _results(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_chat_batch_runs_concurrently_in_completion_order(tmp_path):
+    questions, output = tmp_path / "q.jsonl", tmp_path / "out.jsonl"
+    _write_questions(questions, 40)
+    latency = 0.05
+    app = get_compiled_app(llm=FakeChatModel(latency=latency), db_path=str(tmp_path / "chat.sqlite"))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        stats = run_batch(
+            read_jsonl(questions), str(output),
+            lambda record: pool.submit(run_one, app, GRAPHS["chat"], record), concurrency=8,
+        )
+
+    results = _results(output)
+    assert stats.succeeded == 40 and stats.failed == 0
+    assert sorted(r["id"] for r in results) == sorted(f"q{i}" for i in range(40))
+    assert all(r["output"] == f"回复: 问题 {r['id'][1:]}" for r in results)
+    assert stats.elapsed < latency * 40 / 3
+    assert stats.throughput > 0
+    # 每个问题使用独立的会话
+    state = app.get_state({"configurable": {"thread_id": "batch-q7"}})
+    assert len(state.values["messages"]) == 2
+
+
+def test_input_is_read_lazily_with_bounded_in_flight(tmp_path):
+    pulled, finished, backlog = 0, 0, []
+    lock = threading.Lock()
+
+    def records():
+        nonlocal pulled
+        for i in range(100):
+            pulled += 1
+            yield {"id": i, "question": str(i)}
+
+    def work(record):
+        nonlocal finished
+        time.sleep(0.002)
+        with lock:
+            finished += 1
+        return {"id": record["id"], "ok": True, "output": None}
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        def submit(record):
+            # 已经读入但尚未完成的问题数
+            with lock:
+                backlog.append(pulled - finished)
+            return pool.submit(work, record)
+
+        stats = run_batch(records(), str(tmp_path / "out.jsonl"), submit, concurrency=4)
+
+    assert stats.succeeded == 100
+    assert max(backlog) <= 4 * 2
+
+
+def test_resume_after_crash_skips_finished_and_repairs_partial_line(tmp_path):
+    questions, output = tmp_path / "q.jsonl", tmp_path / "out.jsonl"
+    _write_questions(questions, 10)
+    # 模拟崩溃: 写完了 3 个问题，第 4 行只写了一半。
+    with open(output, "w", encoding="utf-8") as f:
+        for i in (2, 0, 5):
+            f.write(json.dumps({"id": f"q{i}", "ok": True, "output": "旧结果", "ms": 1}) + "\n")
+        f.write('{"id": "q7", "ok": tr')
+
+    stats = run_graph_batch("phase1", str(questions), str(output), concurrency=2)
+
+    results = _results(output)
+    assert stats.skipped == 3 and stats.succeeded == 7
+    assert sorted(r["id"] for r in results) == sorted(f"q{i}" for i in range(10))
+    assert [r["output"] for r in results[:3]] == ["旧结果"] * 3
+
+
+def test_failed_questions_are_recorded_and_can_be_retried(tmp_path):
+    output = tmp_path / "out.jsonl"
+    attempts = {}
+
+    class FlakyApp:
+        """每 3 个问题中有一个第一次调用时失败。"""
+
+        def invoke(self, inputs, config):
+            n = int(inputs["question"].split()[-1])
+            attempts[n] = attempts.get(n, 0) + 1
+            if n % 3 == 0 and attempts[n] == 1:
+                raise RuntimeError("上游超时")
+            return {"answer": inputs["question"]}
+
+    spec = GRAPHS["phase1"]
+    records = [{"id": i, "question": f"问题 {i}"} for i in range(9)]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        submit = lambda record: pool.submit(run_one, FlakyApp(), spec, record)
+        first = run_batch(iter(records), str(output), submit, concurrency=2)
+        # 默认继续时不重跑失败的问题
+        again = run_batch(iter(records), str(output), submit, concurrency=2)
+        retried = run_batch(iter(records), str(output), submit, concurrency=2, retry_failed=True)
+
+    assert (first.succeeded, first.failed) == (6, 3)
+    assert [r["error"] for r in _results(output) if not r["ok"]] == ["RuntimeError: 上游超时"] * 3
+    assert again.skipped == 9 and again.completed == 0
+    assert retried.skipped == 6 and retried.succeeded == 3
+
+
+def test_rerun_after_mid_turn_crash_starts_from_a_clean_thread(tmp_path):
+    questions, output = tmp_path / "q.jsonl", tmp_path / "out.jsonl"
+    _write_questions(questions, 3)
+    app = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    # 模拟崩溃: q1 的问题已经写入检查点，但回复之前进程退出，输出文件里还没有 q1。
+    config = {"configurable": {"thread_id": "batch-q1"}}
+    app.update_state(config, {"messages": [HumanMessage(content="问题 1")]})
+    # 调用方指定的会话不属于批量运行，不会被清空。
+    own = {"configurable": {"thread_id": "mine"}}
+    app.update_state(own, {"messages": [HumanMessage(content="之前的问题")]})
+    with open(questions, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "q3", "question": "继续", "thread_id": "mine"}, ensure_ascii=False) + "\n")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        stats = run_batch(
+            read_jsonl(questions), str(output),
+            lambda record: pool.submit(run_one, app, GRAPHS["chat"], record), concurrency=2,
+        )
+
+    assert stats.succeeded == 4
+    contents = [m.content for m in app.get_state(config).values["messages"]]
+    assert contents == ["问题 1", "回复: 问题 1"]
+    assert [m.content for m in app.get_state(own).values["messages"]][:2] == ["之前的问题", "继续"]
+    app.checkpointer.close()
+
+
+def test_malformed_input_line_is_reported_without_aborting_the_run(tmp_path):
+    questions, output = tmp_path / "q.jsonl", tmp_path / "out.jsonl"
+    with open(questions, "w", encoding="utf-8") as f:
+        f.write('{"id": "a", "question": "问题 a"}\n')
+        f.write('{"id": "b", "question": \n')
+        f.write('["不是对象"]\n')
+        f.write('{"id": "c", "question": "问题 c"}\n')
+
+    stats = run_graph_batch("phase1", str(questions), str(output), concurrency=2)
+
+    results = {r["id"]: r for r in _results(output)}
+    assert (stats.succeeded, stats.failed) == (2, 2)
+    assert results["a"]["ok"] and results["c"]["ok"]
+    assert results[1]["error"].startswith("JSONDecodeError") and not results[1]["ok"]
+    assert not results[2]["ok"]
+    # 继续时坏行和其他失败的问题一样被跳过
+    again = run_graph_batch("phase1", str(questions), str(output), concurrency=2)
+    assert again.skipped == 4
@@ -0,0 +1,47 @@
+import json
+
+from benchmarks import suite
+
+
+def test_suite_reports_nodes_overhead_checkpoints_and_throughput(tmp_path):
+    output = tmp_path / "bench.json"
+    code = suite.main([
+        "--graphs", "workflow", "chat",
+        "--iterations", "3", "--invocations", "4", "--concurrency", "1", "2",
+        "--llm-latency", "0", "--tool-latency", "0",
+        "--output", str(output),
+    ])
+    assert code == 0
+
+    results = json.loads(output.read_text(encoding="utf-8"))
+    chat = results["graphs"]["chat"]
+    # agent -> tools -> agent: 三个 super-step，模型调用两次，搜索一次。
+    assert chat["supersteps_per_invoke"] == 3
+    assert chat["nodes"]["agent"]["calls_per_invoke"] == 2
+    assert chat["nodes"]["tools"]["calls_per_invoke"] == 1
+    assert chat["checkpoint"]["writes_per_invoke"] > 0
+    assert set(chat["throughput"]) == {"1", "2"}
+    assert set(results["graphs"]["workflow"]["nodes"]) == {"agent", "tool"}
+
+    # 与自身比较没有退化。
+    assert suite.main(["--graphs", "workflow", "--iterations", "3", "--invocations", "2", "--concurrency", "1",
+                       "--baseline", str(output), "--threshold", "100"]) == 0
+
+
+def test_compare_flags_latency_and_throughput_regressions():
+    baseline = {"graphs": {"chat": {
+        "invoke_p50_ms": 10.0,
+        "graph_overhead_per_step_ms": 0.01,
+        "supersteps_per_invoke": 3,
+        "throughput": {"4": 100.0},
+    }}}
+    current = {"graphs": {"chat": {
+        "invoke_p50_ms": 14.0,                # +40%
+        "graph_overhead_per_step_ms": 0.03,   # +200%，但绝对变化低于噪声下限
+        "supersteps_per_invoke": 5,           # 结构性指标不参与比较
+        "throughput": {"4": 70.0},            # -30%
+    }}}
+
+    regressions = {r["metric"]: r["change"] for r in suite.compare(current, baseline, threshold=0.25)}
+    assert regressions == {"chat.invoke_p50_ms": 0.4, "chat.throughput.4": 0.3}
+    assert suite.compare(current, baseline, threshold=0.5) == []
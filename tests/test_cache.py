@@ -0,0 +1,130 @@
+import asyncio
+
+from src.chat.cache import (
+    MISSING,
+    CachedSearch,
+    MemoryCache,
+    SqliteCache,
+    TieredCache,
+    normalize_query,
+)
+from src.chat.fakes import FakeSearchBackend
+
+
+class FakeClock:
+    """可以手动拨动的时钟，用于测试过期逻辑。"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_query():
+    assert normalize_query("  What is   LangGraph?\n") == "what is langgraph?"
+
+
+def test_cached_search_hits_backend_once_for_equivalent_queries():
+    """测试规范化后相同的查询只调用一次后端，并记录命中和未命中次数。"""
+    backend = FakeSearchBackend()
+    search = CachedSearch(backend)
+
+    first = search("LangGraph")
+    second = search("  langgraph ")
+
+    assert first == second
+    assert backend.calls == 1
+    assert (search.stats.hits, search.stats.misses) == (1, 1)
+
+
+def test_memory_cache_ttl_and_lru_eviction():
+    """测试过期条目失效，超出容量时淘汰最久未使用的条目。"""
+    clock = FakeClock()
+    cache = MemoryCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")          # a 成为最近使用
+    cache.set("c", 3)       # 淘汰 b
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+
+    clock.now += 11
+    assert cache.get("a") is MISSING
+
+
+def test_sqlite_tier_survives_new_memory_tier(tmp_path):
+    """测试磁盘层在新的进程内缓存中依然可以命中，并回填到内存层。"""
+    path = str(tmp_path / "cache.sqlite")
+    backend = FakeSearchBackend()
+    CachedSearch(backend, TieredCache(disk=SqliteCache(path)))("LangGraph")
+
+    search = CachedSearch(backend, TieredCache(disk=SqliteCache(path)))
+    search("LangGraph")
+    search("LangGraph")
+
+    assert backend.calls == 1
+    assert (search.stats.disk_hits, search.stats.memory_hits) == (1, 1)
+
+
+def test_sqlite_cache_evicts_least_recently_used(tmp_path):
+    clock = FakeClock()
+    cache = SqliteCache(str(tmp_path / "cache.sqlite"), maxsize=2, clock=clock)
+    cache.set("a", {"v": 1})
+    clock.now += 1
+    cache.set("b", {"v": 2})
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.set("c", {"v": 3})
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == {"v": 1}
+
+
+def test_backend_errors_are_not_cached():
+    calls = []
+
+    def flaky(query):
+        calls.append(query)
+        if len(calls) == 1:
+            raise RuntimeError("网络错误")
+        return "ok"
+
+    search = CachedSearch(flaky)
+    try:
+        search("q")
+    except RuntimeError:
+        pass
+    assert search("q") == "ok"
+    assert len(calls) == 2
+
+
+def test_async_cached_search_uses_async_backend():
+    backend = FakeSearchBackend()
+    search = CachedSearch(backend)
+
+    async def run():
+        await search.ainvoke("LangGraph", backend.ainvoke)
+        return await search.ainvoke("langgraph", backend.ainvoke)
+
+    assert asyncio.run(run())["query"] == "LangGraph"
+    assert backend.calls == 1
+
+
+def test_singleflight_leader_rechecks_cache_before_calling_backend():
+    """测试调用方未命中之后、上一个领头者刚好写入缓存时，新的领头者不会再调用一次后端。"""
+    backend = FakeSearchBackend()
+    search = CachedSearch(backend)
+    search("LangGraph")
+
+    # 模拟竞争: 调用方查缓存时上一个领头者还没写入（未命中），加入 single-flight 时它已经写完并退出。
+    real_get = search.cache.get
+    search.cache.get = lambda key: (real_get(key), MISSING)[1]
+
+    async def run():
+        return await search.ainvoke("langgraph", backend.ainvoke)
+
+    assert search("langgraph")["query"] == "LangGraph"
+    assert asyncio.run(run())["query"] == "LangGraph"
+    assert backend.calls == 1
+    assert search.flight.stats.leaders == 3
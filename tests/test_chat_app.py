@@ -10,11 +10,12 @@ os.environ["TAVILY_API_KEY"] = "test_key"
 from src.chat.app import get_compiled_app, router, AgentState
 
 @patch('src.chat.app.ChatDeepSeek')
-@patch('src.chat.app.TavilySearch')
-def test_get_compiled_app_initialization(mock_tavily, mock_deepseek):
+@patch('src.chat.app.get_search_client')
+def test_get_compiled_app_initialization(mock_tavily, mock_deepseek, tmp_path):
     """测试 get_compiled_app 是否可以被成功调用并返回一个已编译的应用。"""
-    app = get_compiled_app()
+    app = get_compiled_app(db_path=str(tmp_path / "chat.sqlite"))
     assert app is not None
+    app.checkpointer.close()
 
 def test_router_with_tool_calls():
     """测试当最后一条消息包含工具调用时，路由器返回 'tools'。"""
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+
+from src.chat.app import get_compiled_app
+from src.chat.checkpointer import PooledSqliteSaver
+from src.chat.fakes import FakeChatModel
+
+
+def _put(saver, thread_id, step):
+    checkpoint = create_checkpoint(empty_checkpoint(), {}, step)
+    checkpoint["channel_values"] = {"step": step}
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    return saver.put(config, checkpoint, {"step": step}, {})
+
+
+def test_wal_and_durability_pragmas(tmp_path):
+    saver = PooledSqliteSaver(str(tmp_path / "c.sqlite"), durability="full")
+    assert saver.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert saver.conn.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
+    saver.close()
+
+    with pytest.raises(ValueError):
+        PooledSqliteSaver(str(tmp_path / "c.sqlite"), durability="sometimes")
+    with pytest.raises(ValueError):
+        PooledSqliteSaver(":memory:")
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_concurrent_writers_and_readers(tmp_path, write_behind):
+    saver = PooledSqliteSaver(str(tmp_path / "c.sqlite"), readers=3, write_behind=write_behind)
+
+    def worker(n):
+        for step in range(20):
+            _put(saver, f"t{n}", step)
+            # 读自己刚写入的检查点: 后写模式下读取会先等待队列提交。
+            latest = saver.get_tuple({"configurable": {"thread_id": f"t{n}"}})
+            assert latest.checkpoint["channel_values"]["step"] == step
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(list(saver.list({"configurable": {"thread_id": "t3"}}))) == 20
+    assert len(saver._all_readers) <= 3
+    saver.close()
+
+
+def test_close_flushes_write_behind_queue(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    saver = PooledSqliteSaver(path, write_behind=True)
+    for step in range(100):
+        _put(saver, "t", step)
+    saver.close()
+    saver.close()  # 重复关闭是安全的
+
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0] == 100
+    with pytest.raises(RuntimeError):
+        _put(saver, "t", 100)
+
+
+def test_write_behind_errors_surface_on_next_call(tmp_path):
+    saver = PooledSqliteSaver(str(tmp_path / "c.sqlite"), write_behind=True)
+    saver.put({"configurable": {"thread_id": "t", "checkpoint_ns": ""}}, {"id": None}, {}, {})
+    with pytest.raises(RuntimeError):
+        saver.flush()
+    # 错误只抛出一次，之后可以继续写入。
+    _put(saver, "t", 1)
+    saver.close()
+
+
+def test_chat_app_with_write_behind(tmp_path):
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"), write_behind=True)
+    config = {"configurable": {"thread_id": "a"}}
+    chatapp.invoke({"messages": [HumanMessage(content="你好")]}, config)
+    chatapp.invoke({"messages": [HumanMessage(content="再见")]}, config)
+
+    assert [m.content for m in chatapp.get_state(config).values["messages"]] == ["你好", "回复: 你好", "再见", "回复: 再见"]
+    chatapp.checkpointer.flush()
+    assert chatapp.checkpointer.catalog.get("a").message_count == 4
+    chatapp.checkpointer.close()
+
+
+def test_failed_write_behind_op_is_rolled_back_alone(tmp_path):
+    """测试批次中失败的写入只回滚它自己: 已经执行的部分不会随批次提交，其他写入照常提交。"""
+    path = str(tmp_path / "c.sqlite")
+    saver = PooledSqliteSaver(path, write_behind=True)
+
+    def half_written(config):
+        saver.conn.execute("INSERT INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) "
+                           "VALUES ('t', '', 'x', 'task', 0, 'c', 'json', x'00')")
+        raise RuntimeError("写到一半失败")
+
+    _put(saver, "t", 1)
+    saver._submit("t", half_written, {"configurable": {"thread_id": "t"}})
+    _put(saver, "t", 2)
+    with pytest.raises(RuntimeError):
+        saver.flush()
+    saver.close()
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM writes").fetchone()[0] == 0
+
+
+def test_write_behind_batch_holds_the_write_lock(tmp_path):
+    """测试批次执行期间一直持有写锁，共用写连接的其他代码看不到、也不会提交未完成的批次。"""
+    saver = PooledSqliteSaver(str(tmp_path / "c.sqlite"), write_behind=True)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(config):
+        started.set()
+        release.wait(5)
+
+    saver._submit("t", slow, {"configurable": {"thread_id": "t"}})
+    assert started.wait(5)
+    assert not saver.lock.acquire(timeout=0.1)
+    release.set()
+    saver.flush()
+    assert saver.lock.acquire(timeout=1)
+    saver.lock.release()
+    saver.close()
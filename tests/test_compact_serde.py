@@ -0,0 +1,193 @@
+import asyncio
+import os
+import sqlite3
+from unittest.mock import patch
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from src.chat.app import cached_search, get_compiled_app
+from src.chat.async_app import async_chat_app
+from src.chat.checkpointer import PooledCatalogSqliteSaver
+from src.chat.compact_serde import BLOB_PREFIX, CompactSerializer, blob_stats, compact_options
+from src.chat.fakes import FakeChatModel, ToolCallingFakeChatModel
+from src.chat.retention import CheckpointRetention
+
+
+def _large_results(query: str) -> dict:
+    """与 Tavily 返回格式相同、正文较长的假搜索结果。"""
+    return {
+        "query": query,
+        "results": [{"title": f"{query} 的结果 {i}", "content": f"{query} 的详细内容 {i}。" * 80} for i in range(3)],
+    }
+
+
+def _chat(app, thread_id: str, questions):
+    for question in questions:
+        app.invoke({"messages": [HumanMessage(content=question)]}, {"configurable": {"thread_id": thread_id}})
+    return app.get_state({"configurable": {"thread_id": thread_id}}).values["messages"]
+
+
+def _checkpoint_bytes(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    (total,) = conn.execute("SELECT SUM(LENGTH(checkpoint)) FROM checkpoints").fetchone()
+    conn.close()
+    return total
+
+
+def test_serializer_round_trip_and_reads_uncompressed_data():
+    serde = CompactSerializer()
+    value = {"messages": [HumanMessage(content="你好" * 500), AIMessage(content="好的")]}
+    type_, data = serde.dumps_typed(value)
+    assert type_ == "msgpack+zstd"
+    assert len(data) < len(JsonPlusSerializer().dumps_typed(value)[1]) / 10
+    assert serde.loads_typed((type_, data)) == value
+
+    # 小数据不压缩；默认序列化器写入的旧数据和 zlib 压缩的数据都可以读取。
+    assert serde.dumps_typed({"a": 1})[0] == "msgpack"
+    assert serde.loads_typed(JsonPlusSerializer().dumps_typed(value)) == value
+    zlib_type, zlib_data = CompactSerializer(codec="zlib").dumps_typed(value)
+    assert zlib_type == "msgpack+zlib" and serde.loads_typed((zlib_type, zlib_data)) == value
+    with pytest.raises(ValueError):
+        CompactSerializer(codec="lz4")
+
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_message_that_looks_like_a_blob_reference_is_kept_verbatim(tmp_path, compact):
+    """用户输入恰好以引用前缀开头时原样保存和读取，不会被当成引用让会话无法读取。"""
+    chatapp = get_compiled_app(
+        llm=FakeChatModel(responses=[AIMessage(content="好的")]),
+        db_path=str(tmp_path / "chat.sqlite"),
+        compact_checkpoints=compact,
+    )
+    config = {"configurable": {"thread_id": "t"}}
+    fake = BLOB_PREFIX + "deadbeef"
+    long_fake = BLOB_PREFIX + "长" * 2000
+    chatapp.invoke({"messages": [HumanMessage(content=fake)]}, config)
+    chatapp.invoke({"messages": [HumanMessage(content=long_fake)]}, config)
+
+    messages = chatapp.get_state(config).values["messages"]
+    assert [m.content for m in messages if isinstance(m, HumanMessage)] == [fake, long_fake]
+    assert len(list(chatapp.get_state_history(config))) > 0
+    chatapp.checkpointer.close()
+
+
+def test_compact_checkpoints_store_each_long_message_once(tmp_path):
+    questions = ["紧凑存储问题一", "紧凑存储问题二", "紧凑存储问题三"]
+    with patch.object(cached_search, "backend", _large_results):
+        plain = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=str(tmp_path / "plain.sqlite"))
+        compact = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=str(tmp_path / "compact.sqlite"), compact_checkpoints=True)
+        expected = _chat(plain, "t1", questions)
+        messages = _chat(compact, "t1", questions)
+
+    # 读出的状态与默认格式完全相同，检查点和会话目录里都没有残留的引用。
+    assert [(type(m), m.content) for m in messages] == [(type(m), m.content) for m in expected]
+    catalog = compact.checkpointer.catalog.messages("t1", limit=100)
+    assert [m.content for _, m in catalog] == [m.content for m in messages]
+    history = list(compact.get_state_history({"configurable": {"thread_id": "t1"}}))
+    assert all(not str(m.content).startswith(BLOB_PREFIX) for s in history for m in s.values.get("messages", []))
+
+    # 三条长的搜索结果各存一份，而不是在之后的每个检查点里重复。
+    assert sum(isinstance(m, ToolMessage) for m in messages) == 3
+    assert blob_stats(compact.checkpointer.conn)["blobs"] == 3
+    plain_bytes = _checkpoint_bytes(str(tmp_path / "plain.sqlite"))
+    compact_bytes = _checkpoint_bytes(str(tmp_path / "compact.sqlite")) + blob_stats(compact.checkpointer.conn)["blob_bytes"]
+    assert compact_bytes < plain_bytes / 5
+
+    # 删除会话时一起删除它的正文。
+    compact.checkpointer.delete_thread("t1")
+    assert blob_stats(compact.checkpointer.conn)["blobs"] == 0
+    plain.checkpointer.close()
+    compact.checkpointer.close()
+
+
+def test_existing_databases_stay_readable_in_both_directions(tmp_path):
+    db_path = str(tmp_path / "chat.sqlite")
+    with patch.object(cached_search, "backend", _large_results):
+        # 先用默认格式写入，再开启紧凑格式继续同一个会话。
+        old = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=db_path)
+        _chat(old, "t1", ["兼容性问题一"])
+        old.checkpointer.close()
+        new = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=db_path, compact_checkpoints=True, write_behind=True)
+        messages = _chat(new, "t1", ["兼容性问题二"])
+        new.checkpointer.close()
+
+    assert len(messages) == 8
+    # 关闭紧凑格式后，新旧两种检查点都仍然可以读取。
+    saver = PooledCatalogSqliteSaver(db_path)
+    state = get_compiled_app(llm=ToolCallingFakeChatModel(), checkpointer=saver).get_state({"configurable": {"thread_id": "t1"}})
+    assert [m.content for m in state.values["messages"]] == [m.content for m in messages]
+    saver.close()
+
+
+def test_retention_prunes_blobs_of_deleted_threads(tmp_path):
+    db_path = str(tmp_path / "chat.sqlite")
+    saver = PooledCatalogSqliteSaver(db_path, **compact_options())
+    app = get_compiled_app(llm=ToolCallingFakeChatModel(), checkpointer=saver)
+    with patch.object(cached_search, "backend", _large_results):
+        _chat(app, "keep", ["保留的会话"])
+        _chat(app, "drop", ["删除的会话"])
+    assert blob_stats(saver.conn)["blobs"] == 2
+
+    CheckpointRetention(saver.conn, lock=saver.lock).delete_thread("drop")
+    assert blob_stats(saver.conn)["blobs"] == 1
+    assert "保留的会话" in app.get_state({"configurable": {"thread_id": "keep"}}).values["messages"][2].content
+    saver.close()
+
+
+def test_async_app_reads_and_writes_the_same_compact_format(tmp_path):
+    db_path = str(tmp_path / "chat.sqlite")
+    config = {"configurable": {"thread_id": "t1"}}
+    with patch.object(cached_search, "backend", _large_results):
+        sync_app = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=db_path, compact_checkpoints=True)
+        expected = _chat(sync_app, "t1", ["同步写入的问题"])
+        sync_app.checkpointer.close()
+
+    async def run(compact: bool):
+        async with async_chat_app(llm=ToolCallingFakeChatModel(), db_path=db_path, compact_checkpoints=compact) as chatapp:
+            state = await chatapp.aget_state(config)
+            history = [s async for s in chatapp.aget_state_history(config)]
+            return state.values["messages"], history
+
+    # 默认设置和紧凑设置的异步应用都能读到同步应用写入的压缩检查点和外置正文。
+    for compact in (False, True):
+        messages, history = asyncio.run(run(compact))
+        assert [m.content for m in messages] == [m.content for m in expected]
+        assert all(not str(m.content).startswith(BLOB_PREFIX) for s in history for m in s.values.get("messages", []))
+
+    # 异步应用以紧凑格式继续写入，同步应用可以读取；删除会话时一起删除正文。
+    async def write():
+        async with async_chat_app(llm=ToolCallingFakeChatModel(), db_path=db_path, compact_checkpoints=True) as chatapp:
+            await chatapp.ainvoke({"messages": [HumanMessage(content="异步写入的问题")]}, config)
+
+    async def _alarge_results(query: str):
+        return _large_results(query)
+
+    with patch("src.chat.async_app._atavily_search", _alarge_results):
+        asyncio.run(write())
+    saver = PooledCatalogSqliteSaver(db_path)
+    assert blob_stats(saver.conn)["blobs"] == 2
+    state = get_compiled_app(llm=ToolCallingFakeChatModel(), checkpointer=saver).get_state(config)
+    assert "异步写入的问题" in state.values["messages"][-2].content
+    saver.close()
+
+    async def delete():
+        async with async_chat_app(llm=ToolCallingFakeChatModel(), db_path=db_path) as chatapp:
+            await chatapp.checkpointer.adelete_thread("t1")
+            async with chatapp.checkpointer.conn.execute("SELECT COUNT(*) FROM checkpoint_blobs") as cursor:
+                return (await cursor.fetchone())[0]
+
+    assert asyncio.run(delete()) == 0
+
+
+def test_compact_flag_conflicts_with_explicit_checkpointer(tmp_path):
+    saver = PooledCatalogSqliteSaver(str(tmp_path / "chat.sqlite"))
+    with pytest.raises(ValueError):
+        get_compiled_app(llm=ToolCallingFakeChatModel(), checkpointer=saver, compact_checkpoints=True)
+    saver.close()
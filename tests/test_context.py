@@ -0,0 +1,119 @@
+import asyncio
+import io
+import os
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from src.chat.app import get_compiled_app
+from src.chat.async_app import async_chat_app
+from src.chat.context import ContextManager, trim_to_budget
+from src.chat.fakes import FakeChatModel
+from src.chat.llm_cache import LLMResponseCache
+from src.chat.streaming import stream_reply
+
+
+def _conversation(turns: int):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"第 {i} 个问题" * 5))
+        messages.append(AIMessage(content="", tool_calls=[{"name": "search_tool", "args": {"query": str(i)}, "id": f"call-{i}"}]))
+        messages.append(ToolMessage(content=f"搜索结果 {i}" * 10, tool_call_id=f"call-{i}", name="search_tool"))
+        messages.append(AIMessage(content=f"第 {i} 个回答" * 5))
+    return messages
+
+
+def _assert_tool_pairs_intact(messages):
+    call_ids = {call["id"] for m in messages if isinstance(m, AIMessage) for call in m.tool_calls}
+    result_ids = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    assert call_ids == result_ids
+
+
+def test_trim_to_budget_keeps_tool_pairs_and_budget():
+    """测试裁剪后不超过预算，从 HumanMessage 开始，且工具调用与结果成对出现。"""
+    messages = [SystemMessage(content="你是助手")] + _conversation(20)
+    trimmed = trim_to_budget(messages, 300)
+
+    assert count_tokens_approximately(trimmed) <= 300
+    assert isinstance(trimmed[0], SystemMessage)
+    assert isinstance(trimmed[1], HumanMessage)
+    assert trimmed[-1] is messages[-1]
+    _assert_tool_pairs_intact(trimmed)
+
+
+def test_trim_to_budget_keeps_current_turn_even_if_too_long():
+    """测试当前这一轮超出预算时仍然保留，不能把用户的问题丢掉。"""
+    messages = _conversation(3)
+    trimmed = trim_to_budget(messages, 10)
+    assert trimmed == messages[-4:]
+
+
+def test_summarize_strategy_rolls_old_messages_into_summary():
+    """测试 summarize 策略会总结早期消息，并在状态中记录总结到的位置。"""
+    llm = FakeChatModel(responses=[AIMessage(content="早期对话总结")])
+    manager = ContextManager(200, strategy="summarize")
+    state = {"messages": _conversation(10)}
+
+    prompt, update = manager.prepare(state, llm)
+
+    assert update["summary"] == "早期对话总结"
+    assert isinstance(state["messages"][update["summary_index"]], HumanMessage)
+    assert prompt[0].content.endswith("早期对话总结")
+    assert count_tokens_approximately(prompt) <= 200
+    _assert_tool_pairs_intact(prompt)
+
+
+def test_get_compiled_app_applies_context_budget(tmp_path):
+    """测试 get_compiled_app 的 context_budget 会限制发给 LLM 的提示长度。"""
+    llm = FakeChatModel()
+    chatapp = get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"), context_budget=100)
+    config = {"configurable": {"thread_id": "t1"}}
+    for i in range(30):
+        chatapp.invoke({"messages": [HumanMessage(content=f"这是第 {i} 个比较长的问题")]}, config)
+
+    assert count_tokens_approximately(llm.prompts[-1]) <= 100
+    assert len(chatapp.get_state(config).values["messages"]) == 60
+
+
+def test_async_app_applies_context_budget(tmp_path):
+    """测试异步应用同样支持 context_budget。"""
+    llm = FakeChatModel()
+
+    async def run():
+        async with async_chat_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"), context_budget=100) as chatapp:
+            config = {"configurable": {"thread_id": "t1"}}
+            for i in range(30):
+                await chatapp.ainvoke({"messages": [HumanMessage(content=f"这是第 {i} 个比较长的问题")]}, config)
+
+    asyncio.run(run())
+    assert count_tokens_approximately(llm.prompts[-1]) <= 100
+
+
+def test_summary_call_uses_wrapped_model_and_is_not_streamed(tmp_path):
+    """测试生成总结的调用经过 LLM 缓存，且它的 token 不出现在流式输出中。"""
+    llm = FakeChatModel()
+    chatapp = get_compiled_app(
+        llm=llm, db_path=str(tmp_path / "chat.sqlite"), context_budget=60, context_strategy="summarize",
+        llm_cache=LLMResponseCache(),
+    )
+
+    def converse(thread_id: str) -> str:
+        out = io.StringIO()
+        for i in range(6):
+            config = {"configurable": {"thread_id": thread_id}}
+            stream_reply(chatapp, {"messages": [HumanMessage(content=f"这是第 {i} 个比较长的问题")]}, config, out=out)
+        return out.getvalue()
+
+    streamed = converse("t1")
+    state = chatapp.get_state({"configurable": {"thread_id": "t1"}}).values
+    assert "human:" in state["summary"]
+    assert "human:" not in streamed
+    # 第二个会话的提示（包括生成总结的请求）与第一个完全相同，全部命中缓存。
+    calls = llm.calls
+    converse("t2")
+    assert llm.calls == calls
+    chatapp.checkpointer.close()
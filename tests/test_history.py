@@ -0,0 +1,80 @@
+import gc
+import os
+import sqlite3
+import time
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+from src.chat.app import get_compiled_app
+from src.chat.fakes import FakeChatModel
+from src.chat.history import HistoryPager
+from src.chat.session_catalog import CatalogSqliteSaver
+
+
+def _conversation(n):
+    return [HumanMessage(content=f"问题 {i}") if i % 2 == 0 else AIMessage(content=f"回答 {i}" * 5) for i in range(n)]
+
+
+def test_pager_walks_back_through_history(tmp_path):
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    config = {"configurable": {"thread_id": "t"}}
+    for i in range(5):
+        chatapp.invoke({"messages": [HumanMessage(content=f"第 {i} 轮")]}, config)
+
+    pager = HistoryPager(chatapp.checkpointer.catalog, "t", page_size=4)
+    pages = list(pager.pages())
+    assert [len(p) for p in pages] == [4, 4, 2]
+    assert not pager.has_more and pager.older() == []
+    # 各页倒序拼接起来就是完整的历史。
+    replayed = [m for page in reversed(pages) for m in page]
+    assert [m.content for m in replayed] == [m.content for m in chatapp.get_state(config).values["messages"]]
+    # latest() 会把分页位置重置到最近一页。
+    assert [m.content for m in pager.latest()] == [m.content for m in pages[0]]
+
+
+def test_message_index_follows_forks(tmp_path):
+    saver = CatalogSqliteSaver(sqlite3.connect(str(tmp_path / "chat.sqlite"), check_same_thread=False))
+    config = {"configurable": {"thread_id": "t", "checkpoint_ns": ""}}
+    for messages in (_conversation(6), _conversation(3), _conversation(4)):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"messages": messages}
+        saver.put(config, checkpoint, {}, {"messages": 1})
+
+    assert [m.content for m in HistoryPager(saver.catalog, "t", page_size=10).latest()] == [
+        m.content for m in _conversation(4)
+    ]
+
+
+def test_resume_latest_page_of_50k_message_thread_is_fast(tmp_path):
+    """恢复一个有 5 万条消息的会话时，只加载最近一页，不反序列化整段对话。"""
+    saver = CatalogSqliteSaver(sqlite3.connect(str(tmp_path / "chat.sqlite"), check_same_thread=False))
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": _conversation(50_000)}
+    config = {"configurable": {"thread_id": "long", "checkpoint_ns": ""}}
+    saver.put(config, checkpoint, {}, {"messages": 1})
+
+    begin = time.perf_counter()
+    full = saver.get_tuple({"configurable": {"thread_id": "long"}}).checkpoint["channel_values"]["messages"]
+    full_seconds = time.perf_counter() - begin
+
+    # 先回收上面产生的大量临时对象，避免一次完整的垃圾回收恰好落在下面计时的区间里。
+    gc.collect()
+    pager = HistoryPager(saver.catalog, "long", page_size=20)
+    begin = time.perf_counter()
+    page = pager.latest()
+    lazy_seconds = time.perf_counter() - begin
+
+    assert [m.content for m in page] == [m.content for m in full[-20:]]
+    assert lazy_seconds < 0.05
+    assert lazy_seconds * 10 < full_seconds
+
+    # 继续向前翻页同样只读取一页。
+    begin = time.perf_counter()
+    older = pager.older()
+    assert time.perf_counter() - begin < 0.05
+    assert [m.content for m in older] == [m.content for m in full[-40:-20]]
@@ -0,0 +1,56 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# 导入 src.chat.app / src.chat.async_app / src.chat.main 时不应该加载的模块: 它们只在第一次真正使用时才导入。
+LAZY_MODULES = ("langchain_deepseek", "langchain_google_genai", "langchain_tavily", "langgraph.prebuilt", "openai")
+
+# 导入 src.chat.app 的累计耗时上限（秒）。懒加载之前约为 1.2 秒，之后约为 0.8 秒，
+# 这里留出足够的余量以适应较慢的机器，只用来拦截把重量级依赖重新放回导入路径的改动。
+IMPORT_BUDGET_SECONDS = 2.0
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+
+
+def _importtime(module: str) -> dict:
+    """在一个没有任何 API Key 的子进程中导入模块，返回 {模块名: 累计耗时（秒）}。"""
+    env = {k: v for k, v in os.environ.items() if not k.endswith("_API_KEY")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2)) / 1_000_000
+    return timings
+
+
+@pytest.mark.parametrize("module", ["src.chat.app", "src.chat.async_app", "src.chat.main"])
+def test_import_does_not_load_providers_or_require_keys(module):
+    timings = _importtime(module)
+    assert module in timings
+    loaded = [name for name in timings if name.split(".")[0] in LAZY_MODULES or name in LAZY_MODULES]
+    assert loaded == []
+
+
+def test_import_time_budget():
+    timings = _importtime("src.chat.app")
+    assert timings["src.chat.app"] < IMPORT_BUDGET_SECONDS
+
+
+def test_missing_keys_are_reported_when_the_app_is_built(monkeypatch):
+    from src.chat.app import get_compiled_app
+
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    monkeypatch.setattr("src.chat.providers._dotenv_loaded", True)
+    with pytest.raises(ValueError, match="DEEPSEEK_API_KEY not set"):
+        get_compiled_app()
@@ -0,0 +1,72 @@
+import os
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.chat.app import get_compiled_app, tools
+from src.chat.fakes import FakeChatModel
+from src.chat.llm_cache import LLMResponseCache, messages_fingerprint
+
+
+def test_fingerprint_ignores_message_ids():
+    """测试消息 ID 不影响缓存键，而内容变化会影响。"""
+    a = [HumanMessage(content="你好", id="1"), AIMessage(content="嗨", id="run-1")]
+    b = [HumanMessage(content="你好", id="2"), AIMessage(content="嗨", id="run-2")]
+    c = [HumanMessage(content="你好"), AIMessage(content="嗨!")]
+    assert messages_fingerprint(a) == messages_fingerprint(b)
+    assert messages_fingerprint(a) != messages_fingerprint(c)
+
+
+def test_cached_model_reuses_response_for_same_history():
+    llm = FakeChatModel()
+    cache = LLMResponseCache()
+    model = cache.wrap(llm, tools)
+
+    first = model.invoke([HumanMessage(content="常见问题")])
+    second = model.invoke([HumanMessage(content="常见问题")])
+
+    assert first.content == second.content
+    assert first is not second
+    assert llm.calls == 1
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_cache_key_depends_on_model_and_tools():
+    cache = LLMResponseCache()
+    llm = FakeChatModel()
+    cache.wrap(llm, tools).invoke([HumanMessage(content="q")])
+    cache.wrap(llm, []).invoke([HumanMessage(content="q")])
+    assert llm.calls == 2
+
+
+def test_invalidation_api(tmp_path):
+    """测试单条失效、按模型失效，以及 SQLite 磁盘层在新实例中依然可用。"""
+    path = str(tmp_path / "llm_cache.sqlite")
+    llm = FakeChatModel()
+    history = [HumanMessage(content="q")]
+
+    LLMResponseCache(db_path=path).wrap(llm, tools).invoke(history)
+    cache = LLMResponseCache(db_path=path)
+    cache.wrap(llm, tools).invoke(history)
+    assert llm.calls == 1
+
+    cache.invalidate(llm, tools, history)
+    cache.wrap(llm, tools).invoke(history)
+    assert llm.calls == 2
+
+    cache.invalidate_model(llm, tools)
+    cache.wrap(llm, tools).invoke(history)
+    assert llm.calls == 3
+
+
+def test_get_compiled_app_uses_llm_cache_across_threads(tmp_path):
+    """测试不同会话中相同的问题只调用一次模型。"""
+    llm = FakeChatModel()
+    chatapp = get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"), llm_cache=LLMResponseCache())
+    for thread_id in ("a", "b", "c"):
+        result = chatapp.invoke({"messages": [HumanMessage(content="如何重置密码？")]}, {"configurable": {"thread_id": thread_id}})
+        assert result["messages"][-1].content == "回复: 如何重置密码？"
+    assert llm.calls == 1
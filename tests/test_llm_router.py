@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.chat.app import get_compiled_app
+from src.chat.fakes import FakeChatModel
+from src.chat.llm_cache import LLMResponseCache
+from src.chat.llm_router import LLMRouter
+
+
+class FlakyChatModel(FakeChatModel):
+    """前 `failures` 次调用抛出异常的假模型。"""
+
+    failures: int = 10**9
+
+    def _next_response(self, messages):
+        response = super()._next_response(messages)
+        if self.calls <= self.failures:
+            raise ConnectionError("提供方不可用")
+        return response
+
+
+def _model(name, latency=0.0, **kwargs):
+    return FakeChatModel(responses=[AIMessage(content=name)], latency=latency, **kwargs)
+
+
+def _ask(llm):
+    return llm.invoke([HumanMessage(content="你好")]).content
+
+
+def test_routes_to_the_fastest_provider():
+    slow, fast = _model("slow", 0.03), _model("fast", 0.005)
+    router = LLMRouter({"slow": slow, "fast": fast})
+
+    # 没有样本的提供方先被尝试，之后按延迟选择。
+    answers = [_ask(router) for _ in range(10)]
+    assert answers[:2] == ["slow", "fast"]
+    assert set(answers[2:]) == {"fast"}
+    assert router.ranked() == ["fast", "slow"]
+    assert router.snapshot()["fast"]["samples"] == 9
+
+
+def test_falls_back_on_errors_and_cools_down_failing_provider():
+    broken = FlakyChatModel(responses=[AIMessage(content="broken")])
+    router = LLMRouter({"broken": broken, "backup": _model("backup", 0.01)}, failure_threshold=2, cooldown=60)
+
+    assert [_ask(router) for _ in range(4)] == ["backup"] * 4
+    # 连续失败两次后进入冷却期，不再排在前面。
+    assert broken.calls == 2
+    assert router.ranked() == ["backup", "broken"]
+    assert router.snapshot()["broken"] == {"samples": 0, "p50": None, "p95": None, "error_rate": 1.0, "healthy": False}
+
+
+def test_all_providers_failing_raises_the_last_error():
+    router = LLMRouter({"a": FlakyChatModel(), "b": FlakyChatModel()})
+    with pytest.raises(ConnectionError):
+        _ask(router)
+
+
+def test_timeout_moves_on_to_the_next_provider():
+    router = LLMRouter({"stuck": _model("stuck", 1.0), "ok": _model("ok")}, timeout=0.1)
+    begin = time.perf_counter()
+    assert _ask(router) == "ok"
+    assert time.perf_counter() - begin < 0.5
+    assert router.stats["stuck"].error_rate == 1.0
+
+
+def test_hedges_after_primary_p95():
+    primary, secondary = _model("primary", 0.005), _model("secondary", 0.05)
+    router = LLMRouter({"primary": primary, "secondary": secondary}, hedge=True, min_samples=5)
+    router.stats["secondary"].record_success(0.05)
+    for _ in range(5):
+        assert _ask(router) == "primary"
+    assert secondary.calls == 0
+
+    # 首选提供方突然变慢: 超过它的 p95 后发出对冲请求，由备用提供方先返回。
+    primary.latency = 1.0
+    begin = time.perf_counter()
+    assert _ask(router) == "secondary"
+    assert time.perf_counter() - begin < 0.5
+
+
+def test_timed_out_attempt_is_recorded_once():
+    """测试超时的调用只记一次失败，之后它自己返回时不再记录。"""
+    router = LLMRouter({"stuck": _model("stuck", 0.3), "ok": _model("ok")}, timeout=0.1)
+    assert _ask(router) == "ok"
+    assert router.abandoned() == 1
+
+    time.sleep(0.4)
+    assert router.abandoned() == 0
+    stuck = router.stats["stuck"]
+    assert (list(stuck.outcomes), stuck.samples) == ([False], 0)
+
+
+def test_losing_hedges_are_not_recorded_and_are_bounded():
+    """测试落选的对冲请求不计入统计，仍在运行的落选请求达到上限时暂停对冲。"""
+    primary, secondary = _model("primary", 0.005), _model("secondary", 0.02)
+    router = LLMRouter({"primary": primary, "secondary": secondary}, hedge=True, min_samples=5, max_abandoned=1)
+    router.stats["secondary"].record_success(0.02)
+    for _ in range(5):
+        _ask(router)
+
+    primary.latency = 0.3
+    assert _ask(router) == "secondary"
+    assert router.abandoned() == 1
+    # 落选的请求还在运行: 这一次不再对冲，等待首选提供方返回。
+    assert _ask(router) == "primary"
+    assert secondary.calls == 1
+
+    time.sleep(0.4)
+    assert router.abandoned() == 0
+    assert router.stats["primary"].samples == 6
+
+
+def test_async_hedge_cancels_the_losing_request():
+    primary, secondary = _model("primary", 0.005), _model("secondary", 0.02)
+    router = LLMRouter({"primary": primary, "secondary": secondary}, hedge=True, min_samples=3)
+    router.stats["secondary"].record_success(0.02)
+
+    async def run():
+        for _ in range(3):
+            assert (await router.ainvoke([HumanMessage(content="你好")])).content == "primary"
+        primary.latency = 1.0
+        begin = time.perf_counter()
+        reply = await router.ainvoke([HumanMessage(content="你好")])
+        return reply.content, time.perf_counter() - begin
+
+    content, elapsed = asyncio.run(run())
+    assert content == "secondary" and elapsed < 0.5
+    # 落选的请求被取消，不计为失败。
+    assert router.stats["primary"].error_rate == 0.0
+
+
+def test_router_drives_the_chat_graph_with_tools_bound_on_every_provider(tmp_path):
+    bound = []
+
+    class RecordingChatModel(FakeChatModel):
+        def bind_tools(self, tools, **kwargs):
+            bound.append([t.name for t in tools])
+            return self
+
+    router = LLMRouter({
+        "a": RecordingChatModel(responses=[AIMessage(content="来自 a")]),
+        "b": RecordingChatModel(responses=[AIMessage(content="来自 b")]),
+    })
+    cache = LLMResponseCache()
+    chatapp = get_compiled_app(llm=router, db_path=str(tmp_path / "chat.sqlite"), llm_cache=cache)
+    state = chatapp.invoke({"messages": [HumanMessage(content="你好")]}, {"configurable": {"thread_id": "r1"}})
+
+    assert bound == [["search_tool"], ["search_tool"]]
+    assert state["messages"][-1].content == "来自 a"
@@ -0,0 +1,102 @@
+import asyncio
+import io
+import json
+import os
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.chat.app import get_compiled_app
+from src.chat.async_app import async_chat_app
+from src.chat.fakes import FakeChatModel
+from src.chat.prerouter import FAQIndex, NaiveBayesClassifier, PreRouter, Rule
+from src.chat.streaming import final_reply, stream_reply
+from src.chat.tracing import Metrics
+
+CHITCHAT = [
+    ("你是谁", "identity"), ("你叫什么名字", "identity"), ("你是什么模型", "identity"), ("介绍一下你自己", "identity"),
+    ("今天天气怎么样", "other"), ("帮我查一下最新的新闻", "other"), ("LangGraph 的检查点怎么用", "other"),
+    ("Python 怎么读文件", "other"), ("介绍一下 SQLite 的 WAL 模式", "other"), ("明天北京下雨吗", "other"),
+]
+
+
+def _turn(chatapp, thread_id: str, question: str):
+    return final_reply(chatapp, {"messages": [HumanMessage(content=question)]}, {"configurable": {"thread_id": thread_id}})
+
+
+def test_rules_and_faq_match_normalized_input(tmp_path):
+    faq_path = tmp_path / "faq.jsonl"
+    faq_path.write_text(json.dumps({"question": "支持哪些模型？", "answer": "DeepSeek 和 Gemini。"}, ensure_ascii=False) + "\n", encoding="utf-8")
+    prerouter = PreRouter(
+        rules=(Rule("version", r"/version", lambda m: "v1"), *PreRouter().rules),
+        faq=FAQIndex.from_file(str(faq_path)),
+    )
+    assert prerouter.match("  你好！ ") == ("rule:greeting", "你好！有什么可以帮你的吗？")
+    assert prerouter.match("Thanks!")[0] == "rule:thanks"
+    assert prerouter.match("/HELP")[0] == "rule:help"
+    assert prerouter.match("/version") == ("rule:version", "v1")
+    assert prerouter.match("  支持哪些模型?") == ("faq", "DeepSeek 和 Gemini。")
+    # 规则是整句匹配: 包含问候语的真正问题仍然交给模型。
+    assert prerouter.match("你好，今天有什么新闻") is None
+    assert prerouter.match("支持哪些模型以及价格") is None
+    assert prerouter.match("   ") is None
+
+
+def test_classifier_answers_only_confident_short_inputs():
+    classifier = NaiveBayesClassifier().fit(CHITCHAT)
+    assert classifier.predict("你是谁呀")[0] == "identity"
+    prerouter = PreRouter(rules=(), classifier=classifier, answers={"identity": "我是 AI 助手。"}, min_confidence=0.8)
+    assert prerouter.match("你是谁呀") == ("classifier:identity", "我是 AI 助手。")
+    # "other" 没有固定回答，总是交给模型；过长的输入不经过分类器。
+    assert prerouter.match("今天天气怎么样") is None
+    assert prerouter.match("你是谁" + "，" * 30 + "能不能帮我查一下明天的天气") is None
+
+
+def test_graph_short_circuits_without_llm_call(tmp_path):
+    metrics = Metrics()
+    llm = FakeChatModel(responses=[AIMessage(content="LangGraph 是一个库")])
+    prerouter = PreRouter(faq=FAQIndex({"怎么退出": "输入 /exit 退出。"}), metrics=metrics)
+    chatapp = get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"), prerouter=prerouter)
+
+    assert _turn(chatapp, "t1", "你好").content == "你好！有什么可以帮你的吗？"
+    assert _turn(chatapp, "t1", "怎么退出？").content == "输入 /exit 退出。"
+    assert llm.calls == 0
+    assert _turn(chatapp, "t1", "什么是 LangGraph").content == "LangGraph 是一个库"
+    assert llm.calls == 1
+
+    # 直接回答的轮次和普通轮次一样写入检查点，之后的对话能看到它们。
+    messages = chatapp.get_state({"configurable": {"thread_id": "t1"}}).values["messages"]
+    assert [m.content for m in messages][:4] == ["你好", "你好！有什么可以帮你的吗？", "怎么退出？", "输入 /exit 退出。"]
+    assert messages[1].response_metadata["prerouter"] == "rule:greeting"
+
+    stats = prerouter.stats()
+    assert (stats["turns"], stats["short_circuited"]) == (3, 2)
+    assert stats["routes"] == {"rule:greeting": 1, "faq": 1, "llm": 1}
+    assert abs(stats["saved_rate"] - 2 / 3) < 1e-9
+    assert metrics.value("chat_prerouter_turns_total", route="rule") == 1
+    assert metrics.value("chat_prerouter_turns_total", route="llm") == 1
+    chatapp.checkpointer.close()
+
+
+def test_streamed_reply_includes_prerouted_answer(tmp_path):
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"), prerouter=PreRouter())
+    out = io.StringIO()
+    stats = stream_reply(chatapp, {"messages": [HumanMessage(content="/help")]}, {"configurable": {"thread_id": "t1"}}, out=out)
+    assert "/exit" in out.getvalue() and stats.reply.startswith("可用的命令")
+    assert stats.time_to_first_token is not None
+    chatapp.checkpointer.close()
+
+
+def test_async_graph_uses_prerouter(tmp_path):
+    llm = FakeChatModel()
+
+    async def run():
+        async with async_chat_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"), prerouter=PreRouter()) as chatapp:
+            result = await chatapp.ainvoke({"messages": [HumanMessage(content="谢谢")]}, {"configurable": {"thread_id": "t1"}})
+            return result["messages"][-1].content
+
+    assert asyncio.run(run()) == "不客气！还有其他问题随时问我。"
+    assert llm.calls == 0
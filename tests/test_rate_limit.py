@@ -0,0 +1,242 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from unittest.mock import patch
+
+from src.chat.app import cached_search, get_compiled_app
+from src.chat.cache import CachedSearch
+from src.chat.fakes import FakeChatModel, FakeSearchBackend, ToolCallingFakeChatModel
+from src.chat.llm_router import LLMRouter
+from src.chat.rate_limit import ProviderLimit, RateLimitedModel, RateLimitExceeded, RateLimitScheduler, parse_limits, scheduler_from_env
+from src.chat.tracing import Metrics
+
+
+def _blocked_scheduler(**limit):
+    """请求桶只有一个令牌且已经用掉的调度器: 之后的请求都要排队，每 1/rps 秒放行一个。"""
+    scheduler = RateLimitScheduler({"llm": ProviderLimit(burst=1, **limit)})
+    scheduler.acquire("llm")
+    return scheduler
+
+
+def _enqueue_in_order(scheduler, requests):
+    """按顺序让每个请求进入队列（前一个排上队之后再发下一个），返回放行的顺序。"""
+    order, lock, threads = [], threading.Lock(), []
+
+    def run(name, **kwargs):
+        scheduler.acquire("llm", **kwargs)
+        with lock:
+            order.append(name)
+
+    for i, (name, kwargs) in enumerate(requests):
+        thread = threading.Thread(target=run, args=(name,), kwargs=kwargs)
+        thread.start()
+        threads.append(thread)
+        while scheduler.snapshot()["llm"]["queued"] < i + 1:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_requests_per_second_limit_is_enforced():
+    scheduler = RateLimitScheduler({"llm": ProviderLimit(requests_per_s=50, burst=2)})
+    begin = time.monotonic()
+    threads = [threading.Thread(target=scheduler.acquire, args=("llm",)) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 2 个突发请求立即放行，其余 10 个每 20ms 放行一个。
+    assert time.monotonic() - begin >= 0.18
+    assert scheduler.snapshot()["llm"]["granted"] == 12
+    # 没有配置的提供方不限流。
+    assert scheduler.acquire("unknown") == 0.0
+    scheduler.close()
+
+
+def test_tokens_per_minute_limit_and_usage_reconciliation():
+    scheduler = RateLimitScheduler({"llm": ProviderLimit(tokens_per_min=6000)})
+    # 一分钟的配额可以一次用完，之后按每秒 100 个 token 补充。
+    assert scheduler.acquire("llm", tokens=6000) == 0.0
+    assert 0.04 <= scheduler.acquire("llm", tokens=5) < 1
+    # 按实际用量退还 token 后立即有余量。
+    scheduler.adjust("llm", -100)
+    assert scheduler.acquire("llm", tokens=50) == 0.0
+    scheduler.close()
+
+
+def test_interactive_requests_are_served_before_batch():
+    scheduler = _blocked_scheduler(requests_per_s=20)
+    order = _enqueue_in_order(scheduler, [
+        ("batch-1", {"priority": "batch"}),
+        ("batch-2", {"priority": "batch"}),
+        ("chat-1", {}),
+        ("chat-2", {"priority": "interactive"}),
+    ])
+    assert order == ["chat-1", "chat-2", "batch-1", "batch-2"]
+    with pytest.raises(ValueError):
+        scheduler.acquire("llm", priority="urgent")
+    scheduler.close()
+
+
+def test_fair_queuing_across_thread_ids():
+    scheduler = _blocked_scheduler(requests_per_s=20)
+    # 会话 a 先排了 4 个请求，会话 b 后来的 2 个请求不需要等 a 全部完成。
+    order = _enqueue_in_order(scheduler, [("a", {"thread_id": "a"})] * 4 + [("b", {"thread_id": "b"})] * 2)
+    assert order == ["a", "b", "a", "b", "a", "a"]
+    scheduler.close()
+
+
+def test_backpressure_when_queue_is_full_or_wait_times_out():
+    metrics = Metrics()
+    scheduler = RateLimitScheduler({"llm": ProviderLimit(requests_per_s=2, burst=1, max_queue=1, timeout=0.05)}, metrics=metrics)
+    scheduler.acquire("llm")
+
+    waiting = threading.Thread(target=lambda: scheduler.acquire("llm", timeout=5))
+    waiting.start()
+    while scheduler.queue_depth() < 1:
+        time.sleep(0.001)
+    assert metrics.value("chat_ratelimit_queue_depth", provider="llm") == 1
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire("llm")
+    waiting.join()
+
+    # 排队超时的请求离开队列，不会再被放行。
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire("llm")
+    assert scheduler.queue_depth("llm") == 0
+    snapshot = scheduler.snapshot()["llm"]
+    assert (snapshot["granted"], snapshot["rejected"]) == (2, 2)
+
+    assert metrics.value("chat_ratelimit_rejected_total", provider="llm", reason="queue_full") == 1
+    assert metrics.value("chat_ratelimit_rejected_total", provider="llm", reason="timeout") == 1
+    assert metrics.value("chat_ratelimit_wait_seconds", provider="llm", priority="interactive") == 2
+    text = metrics.render()
+    assert "# TYPE chat_ratelimit_queue_depth gauge" in text
+    assert 'chat_ratelimit_queue_depth{provider="llm"} 0' in text
+    scheduler.close()
+
+
+def test_async_callers_wait_without_blocking_the_loop():
+    scheduler = RateLimitScheduler({"llm": ProviderLimit(requests_per_s=50, burst=1, timeout=0.5)})
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        background = asyncio.ensure_future(ticker())
+        waits = await asyncio.gather(*(scheduler.aacquire("llm", thread_id=i % 3) for i in range(10)))
+        # 被取消的调用方离开队列。
+        cancelled = asyncio.ensure_future(scheduler.aacquire("llm"))
+        await asyncio.sleep(0.001)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        background.cancel()
+        return waits, ticks
+
+    waits, ticks = asyncio.run(run())
+    assert max(waits) >= 0.15 and ticks >= 10
+    assert scheduler.queue_depth() == 0
+    assert scheduler.snapshot()["llm"]["rejected"] == 1
+    scheduler.close()
+
+
+def test_wrap_limits_sync_and_async_functions():
+    scheduler = RateLimitScheduler({"tavily": ProviderLimit(requests_per_s=1000)})
+    backend = FakeSearchBackend()
+    search = scheduler.wrap(backend, "tavily")
+    asearch = scheduler.wrap(backend.ainvoke, "tavily")
+    search("a")
+    asyncio.run(asearch("b"))
+    assert backend.calls == 2 and scheduler.snapshot()["tavily"]["granted"] == 2
+    scheduler.close()
+
+
+def test_cached_search_only_spends_quota_on_misses():
+    scheduler = RateLimitScheduler({"tavily": ProviderLimit(requests_per_s=1000)})
+    search = CachedSearch(FakeSearchBackend(), scheduler=scheduler, provider="tavily")
+    search("问题")
+    search("问题")
+    asyncio.run(search.ainvoke("另一个问题"))
+    assert scheduler.snapshot()["tavily"]["granted"] == 2
+    scheduler.close()
+
+
+def test_agent_llm_calls_use_thread_id_and_priority_from_config(tmp_path):
+    llm = FakeChatModel(responses=[AIMessage(content="好的", usage_metadata={"input_tokens": 40, "output_tokens": 60, "total_tokens": 100})])
+    scheduler = RateLimitScheduler({"fake-chat": ProviderLimit(requests_per_s=1000, tokens_per_min=60000)})
+    seen = []
+    original = scheduler.acquire
+
+    def acquire(provider, tokens=0, priority=None, thread_id=None, timeout=None):
+        seen.append((provider, priority, thread_id, tokens > 0))
+        return original(provider, tokens, priority, thread_id, timeout)
+
+    scheduler.acquire = acquire
+    chatapp = get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"), scheduler=scheduler)
+    chatapp.invoke({"messages": [HumanMessage(content="你好")]}, {"configurable": {"thread_id": "t1"}})
+    chatapp.invoke({"messages": [HumanMessage(content="你好")]}, {"configurable": {"thread_id": "t2", "priority": "batch"}})
+    assert seen == [("fake-chat", "interactive", "t1", True), ("fake-chat", "batch", "t2", True)]
+    # 实际用量（每次 100 个 token）已经从 token 桶中扣除。
+    assert scheduler.snapshot()["fake-chat"]["tokens"] < 60000 - 150
+    chatapp.checkpointer.close()
+    scheduler.close()
+
+
+def test_router_providers_are_limited_separately():
+    scheduler = RateLimitScheduler({"a": ProviderLimit(requests_per_s=1000), "b": ProviderLimit(requests_per_s=1000)})
+    llm = LLMRouter({"a": FakeChatModel(), "b": FakeChatModel()})
+    limited = scheduler.wrap_model(llm, llm.bind_tools([]))
+    assert isinstance(limited, LLMRouter) and limited.stats is llm.stats
+    assert all(isinstance(model, RateLimitedModel) for model in limited.providers.values())
+    limited.invoke([HumanMessage(content="你好")])
+    snapshot = scheduler.snapshot()
+    assert snapshot["a"]["granted"] + snapshot["b"]["granted"] == 1
+    scheduler.close()
+
+
+def test_search_limiting_is_scoped_to_the_app(tmp_path):
+    scheduler = RateLimitScheduler({"tavily": ProviderLimit(requests_per_s=1000)})
+    limited = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=str(tmp_path / "a.sqlite"), scheduler=scheduler)
+    plain = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=str(tmp_path / "b.sqlite"))
+    # 构建应用不修改共享的搜索缓存对象。
+    assert cached_search.scheduler is None
+    with patch.object(cached_search, "backend", FakeSearchBackend()):
+        plain.invoke({"messages": [HumanMessage(content="作用域问题一")]}, {"configurable": {"thread_id": "t1"}})
+        assert scheduler.snapshot()["tavily"]["granted"] == 0
+        limited.invoke({"messages": [HumanMessage(content="作用域问题二")]}, {"configurable": {"thread_id": "t1"}})
+        assert scheduler.snapshot()["tavily"]["granted"] == 1
+    limited.checkpointer.close()
+    plain.checkpointer.close()
+    scheduler.close()
+
+
+def test_limits_from_environment(monkeypatch):
+    limits = parse_limits("deepseek:rps=5,tpm=60000; tavily:rps=2,timeout=none,queue=10")
+    assert limits["deepseek"] == ProviderLimit(requests_per_s=5, tokens_per_min=60000)
+    assert limits["tavily"] == ProviderLimit(requests_per_s=2, max_queue=10, timeout=None)
+    with pytest.raises(ValueError):
+        parse_limits("deepseek:qps=5")
+
+    monkeypatch.setenv("CHAT_RATE_LIMITS", "gemini:rps=0.25")
+    scheduler = scheduler_from_env()
+    assert list(scheduler.limits) == ["gemini"]
+    scheduler.close()
+    monkeypatch.setenv("CHAT_RATE_LIMITS", "")
+    assert scheduler_from_env() is None
@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import HumanMessage
+
+from src.chat.fakes import FakeChatModel
+from src.chat.registry import GraphRegistry
+
+
+@pytest.fixture
+def registry():
+    registry = GraphRegistry()
+    yield registry
+    registry.close()
+
+
+def test_same_configuration_is_compiled_once_across_threads(registry, tmp_path):
+    llm = FakeChatModel()
+    db_path = str(tmp_path / "chat.sqlite")
+    seen = []
+    barrier = threading.Barrier(8)
+
+    def acquire():
+        barrier.wait()
+        seen.append(registry.get(db_path, llm=llm))
+
+    threads = [threading.Thread(target=acquire) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert registry.builds == 1
+    assert all(app is seen[0] for app in seen)
+
+    # 编译好的图在会话之间共享，状态按 thread_id 隔离。
+    app = seen[0]
+    app.invoke({"messages": [HumanMessage(content="一")]}, {"configurable": {"thread_id": "a"}})
+    app.invoke({"messages": [HumanMessage(content="二")]}, {"configurable": {"thread_id": "b"}})
+    assert len(app.get_state({"configurable": {"thread_id": "a"}}).values["messages"]) == 2
+
+
+def test_repeated_acquisition_is_constant_time(registry, tmp_path):
+    db_path = str(tmp_path / "chat.sqlite")
+    llm = FakeChatModel()
+
+    begin = time.perf_counter()
+    first = registry.get(db_path, llm=llm, tool_timeout=5)
+    build_seconds = time.perf_counter() - begin
+
+    def per_call(n):
+        begin = time.perf_counter()
+        for _ in range(n):
+            assert registry.get(db_path, llm=llm, tool_timeout=5) is first
+        return (time.perf_counter() - begin) / n
+
+    small, large = per_call(1_000), per_call(20_000)
+    assert registry.builds == 1
+    # 获取只是一次字典查找: 远快于编译，且不随获取次数增长。
+    assert large < build_seconds / 100
+    assert large < small * 3 + 20e-6
+
+
+def test_configurations_share_one_checkpointer_per_database(registry, tmp_path):
+    db_path = str(tmp_path / "chat.sqlite")
+    llm = FakeChatModel()
+    plain = registry.get(db_path, llm=llm)
+    trimmed = registry.get(db_path, llm=llm, context_budget=100)
+
+    assert plain is not trimmed and registry.builds == 2
+    assert plain.checkpointer is trimmed.checkpointer is registry.checkpointer(db_path)
+    assert registry.get(str(tmp_path / "other.sqlite"), llm=llm).checkpointer is not plain.checkpointer
+
+
+def test_one_writer_per_database_file(registry, tmp_path):
+    db_path = str(tmp_path / "chat.sqlite")
+    llm = FakeChatModel()
+    app = registry.get(db_path, llm=llm, compact_checkpoints=True)
+    # 不指定时沿用已打开的设置；相对路径和绝对路径指向同一个文件。
+    assert registry.get(os.path.relpath(db_path), llm=llm) is app
+    assert registry.checkpointer(db_path, compact=True) is app.checkpointer
+    with pytest.raises(ValueError):
+        registry.get(db_path, llm=llm, compact_checkpoints=False)
+    with pytest.raises(ValueError):
+        registry.checkpointer(db_path, write_behind=True)
+
+
+def test_close_releases_connections(registry, tmp_path):
+    app = registry.get(str(tmp_path / "chat.sqlite"), llm=FakeChatModel())
+    conn = app.checkpointer.conn
+    registry.close()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert len(registry) == 0
+    # 关闭之后再次获取会重新编译。
+    assert registry.get(str(tmp_path / "chat.sqlite"), llm=FakeChatModel()) is not app
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base.id import uuid6
+
+from src.chat.app import get_compiled_app
+from src.chat.fakes import FakeChatModel
+from src.chat.retention import CheckpointRetention, checkpoint_id_at, checkpoint_timestamp, main
+
+
+def _count(conn, thread_id=None):
+    if thread_id is None:
+        return conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+    return conn.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+
+def _app_with_history(tmp_path, threads=("a", "b"), turns=5):
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    for thread_id in threads:
+        for i in range(turns):
+            chatapp.invoke({"messages": [HumanMessage(content=f"问题 {i}" * 50)]}, {"configurable": {"thread_id": thread_id}})
+    return chatapp
+
+
+def test_checkpoint_id_time_encoding_matches_uuid6():
+    """测试截止时间编码出的 ID 与真实 UUIDv6 检查点 ID 的排序一致。"""
+    before = checkpoint_id_at(time.time() - 1)
+    current = str(uuid6())
+    after = checkpoint_id_at(time.time() + 1)
+    assert before < current < after
+    assert abs(checkpoint_timestamp(current) - time.time()) < 5
+
+
+def test_keep_last_prunes_each_thread_and_keeps_latest_state(tmp_path):
+    chatapp = _app_with_history(tmp_path)
+    conn = chatapp.checkpointer.conn
+    latest = chatapp.get_state({"configurable": {"thread_id": "a"}}).values
+
+    report = CheckpointRetention(conn, lock=chatapp.checkpointer.lock).keep_last(2)
+
+    assert _count(conn, "a") == 2 and _count(conn, "b") == 2
+    assert report.checkpoints_deleted > 0
+    assert chatapp.get_state({"configurable": {"thread_id": "a"}}).values == latest
+    # 清理后会话可以继续对话
+    chatapp.invoke({"messages": [HumanMessage(content="继续")]}, {"configurable": {"thread_id": "a"}})
+    assert chatapp.get_state({"configurable": {"thread_id": "a"}}).values["messages"][-1].content == "回复: 继续"
+
+
+def test_age_expiry_and_thread_deletion(tmp_path):
+    chatapp = _app_with_history(tmp_path)
+    conn = chatapp.checkpointer.conn
+    retention = CheckpointRetention(conn)
+
+    # 以一小时之后为“现在”，所有检查点都已过期，但每个会话的最新检查点保留。
+    retention.expire_checkpoints(60, now=time.time() + 3600)
+    assert _count(conn, "a") == 1 and _count(conn, "b") == 1
+
+    retention.delete_thread("a")
+    assert _count(conn, "a") == 0
+    assert conn.execute("SELECT COUNT(*) FROM writes WHERE thread_id = 'a'").fetchone()[0] == 0
+
+    retention.expire_threads(60, now=time.time() + 3600)
+    assert _count(conn) == 0
+
+
+def test_cli_prunes_and_vacuums(tmp_path, capsys):
+    chatapp = _app_with_history(tmp_path, threads=[f"t{i}" for i in range(5)], turns=5)
+    chatapp.checkpointer.close()
+    db = str(tmp_path / "chat.sqlite")
+    size_before = CheckpointRetention(db).size_bytes()
+
+    main([db, "--keep-last", "1", "--vacuum"])
+
+    retention = CheckpointRetention(db)
+    assert _count(retention.conn) == 5
+    assert retention.size_bytes() < size_before
+    assert retention.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert "删除检查点" in capsys.readouterr().out
+
+
+def test_vacuum_while_app_is_writing(tmp_path):
+    """测试与后写队列共用连接时，持有锁的 vacuum / size_bytes / 目录清理不会与检查点写入冲突。"""
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"), write_behind=True)
+    saver = chatapp.checkpointer
+    retention = CheckpointRetention(saver.conn, lock=saver.lock)
+    errors = []
+
+    def chat():
+        try:
+            for i in range(20):
+                chatapp.invoke({"messages": [HumanMessage(content=f"问题 {i}" * 50)]}, {"configurable": {"thread_id": "a"}})
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=chat)
+    writer.start()
+    while writer.is_alive():
+        retention.vacuum()
+        retention.size_bytes()
+        retention.delete_thread("missing")
+    writer.join()
+
+    assert errors == []
+    saver.flush()
+    assert len(chatapp.get_state({"configurable": {"thread_id": "a"}}).values["messages"]) == 40
+    saver.close()
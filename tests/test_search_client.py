@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.chat import search_client
+from src.chat.fakes import StubSearchServer
+from src.chat.search_client import TavilyClient, close_search_client, get_search_client
+
+
+def test_sync_search_reuses_one_connection():
+    """测试连续多次同步搜索复用同一个 keep-alive 连接。"""
+    with StubSearchServer() as server:
+        client = TavilyClient(api_key="test", base_url=server.url)
+        results = [client.search(f"问题 {i}") for i in range(10)]
+        client.close()
+
+    assert results[3]["query"] == "问题 3"
+    assert server.requests == 10
+    assert server.connections == 1
+
+
+def test_concurrent_threads_share_a_bounded_pool():
+    """测试多线程并发搜索时，连接数不超过连接池上限。"""
+    with StubSearchServer(latency=0.01) as server:
+        client = TavilyClient(api_key="test", base_url=server.url, max_connections=4)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(client.search, [f"q{i}" for i in range(40)]))
+        client.close()
+
+    assert server.requests == 40
+    assert server.connections <= 4
+
+
+def test_async_search_reuses_connection_per_event_loop():
+    with StubSearchServer() as server:
+        client = TavilyClient(api_key="test", base_url=server.url)
+
+        async def run():
+            for i in range(5):
+                await client.asearch(f"q{i}")
+            await client.aclose()
+
+        asyncio.run(run())
+
+    assert server.requests == 5
+    assert server.connections == 1
+
+
+def test_get_search_client_is_a_lazy_singleton(monkeypatch):
+    """测试共享客户端只会被创建一次，即使多个线程同时获取。"""
+    monkeypatch.setenv("TAVILY_API_KEY", "test")
+    close_search_client()
+    assert search_client._shared_client is None
+
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(get_search_client())) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(c) for c in seen}) == 1
+    close_search_client()
+
+
+def test_client_identifies_itself_truthfully():
+    client = TavilyClient(api_key="test")
+    assert client.client.headers["X-Client-Source"] == "langgraphlearn"
+    client.close()
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import socket
+from urllib.parse import urlparse
+from unittest.mock import patch
+
+import httpx
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage
+
+from src.chat.app import cached_search, get_compiled_app
+from src.chat.asgi_server import serve_in_thread
+from src.chat.fakes import FakeChatModel, FakeSearchBackend, ToolCallingFakeChatModel
+from src.chat.server import ChatServer
+
+
+def _events(body: str):
+    """把 SSE 响应体解析为 [(event, data), ...]。"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def _request(server: ChatServer, *requests):
+    async def run():
+        transport = httpx.ASGITransport(app=server)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.request(method, url, **kwargs) for method, url, kwargs in requests]
+
+    return asyncio.run(run())
+
+
+def test_thread_lifecycle_and_message_history(tmp_path):
+    llm = FakeChatModel(responses=[AIMessage(content="你好，我是助手")])
+    server = ChatServer(get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite")))
+    try:
+        created, reply, listed, info, history = _request(
+            server,
+            ("POST", "/threads", {"json": {"thread_id": "t1"}}),
+            ("POST", "/threads/t1/messages", {"json": {"content": "你好"}}),
+            ("GET", "/threads", {}),
+            ("GET", "/threads/t1", {}),
+            ("GET", "/threads/t1/messages?limit=1", {}),
+        )
+        assert created.status_code == 201 and created.json() == {"thread_id": "t1"}
+        assert reply.json()["reply"] == "你好，我是助手"
+        assert [t["thread_id"] for t in listed.json()["threads"]] == ["t1"]
+        assert info.json()["thread_id"] == "t1"
+        page = history.json()
+        assert [m["data"]["content"] for m in page["messages"]] == ["你好，我是助手"]
+        assert page["before"] == 1
+
+        deleted, missing = _request(server, ("DELETE", "/threads/t1", {}), ("GET", "/threads/t1", {}))
+        assert deleted.status_code == 204
+        assert missing.status_code == 404
+    finally:
+        server.close()
+
+
+def test_errors_are_reported_as_json(tmp_path):
+    server = ChatServer(get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite")))
+    try:
+        unknown, wrong_method, empty, bad_limit, negative_limit, zero_limit, negative_offset, negative_before = _request(
+            server,
+            ("GET", "/nope", {}),
+            ("PUT", "/threads/t1", {}),
+            ("POST", "/threads/t1/stream", {"json": {"content": " "}}),
+            ("GET", "/threads?limit=x", {}),
+            ("GET", "/threads?limit=-1", {}),
+            ("GET", "/threads/t1/messages?limit=0", {}),
+            ("GET", "/threads?offset=-5", {}),
+            ("GET", "/threads/t1/messages?before=-1", {}),
+        )
+        assert unknown.status_code == 404
+        assert wrong_method.status_code == 405
+        assert empty.status_code == 400 and "content" in empty.json()["error"]
+        assert bad_limit.status_code == 400
+        for response in (negative_limit, zero_limit, negative_offset, negative_before):
+            assert response.status_code == 400 and "不能小于" in response.json()["error"]
+    finally:
+        server.close()
+
+
+def test_stream_pushes_tokens_and_tool_events(tmp_path):
+    llm = ToolCallingFakeChatModel()
+    server = ChatServer(get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite")))
+    try:
+        # 使用独立的查询，避免命中其他测试留在进程内搜索缓存中的结果。
+        with patch.object(cached_search, "backend", FakeSearchBackend()):
+            (response,) = _request(server, ("POST", "/threads/s1/stream", {"json": {"content": "server-test 查询"}}))
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = _events(response.text)
+        names = [name for name, _ in events]
+        assert names[0] == "start" and names[-1] == "done"
+        assert names.index("tool_call") < names.index("tool_result") < names.index("token")
+        done = events[-1][1]
+        assert done["tool_calls"] == ["search_tool"]
+        assert done["reply"].startswith("根据搜索结果回答")
+        assert done["tokens"] >= 1 and done["ttft_ms"] is not None
+    finally:
+        server.close()
+
+
+def test_builtin_server_streams_over_a_real_socket(tmp_path):
+    llm = FakeChatModel(responses=[AIMessage(content="流式回复")], token_latency=0.01)
+    server = ChatServer(get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite")), max_workers=8)
+
+    async def run(base_url):
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            health = await client.get("/healthz")
+            async with client.stream("POST", "/threads/r1/stream", json={"content": "你好"}) as response:
+                assert response.headers["transfer-encoding"] == "chunked"
+                body = "".join([text async for text in response.aiter_text()])
+            return health.json(), _events(body)
+
+    with serve_in_thread(server) as base_url:
+        health, events = asyncio.run(run(base_url))
+    assert health == {"status": "ok"}
+    assert events[-1][0] == "done" and events[-1][1]["reply"] == "流式回复"
+    assert [name for name, _ in events].count("token") == events[-1][1]["tokens"] > 1
+
+
+def test_builtin_server_rejects_malformed_and_oversized_requests(tmp_path):
+    server = ChatServer(get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite")))
+
+    def raw(address, data: bytes) -> bytes:
+        with socket.create_connection(address, timeout=5) as sock:
+            sock.sendall(data)
+            return sock.recv(4096)
+
+    with serve_in_thread(server, max_body=64) as base_url:
+        url = urlparse(base_url)
+        address = (url.hostname, url.port)
+        assert raw(address, b"GARBAGE\r\n\r\n").startswith(b"HTTP/1.1 400")
+        assert raw(address, b"POST /threads HTTP/1.1\r\ncontent-length: abc\r\n\r\n").startswith(b"HTTP/1.1 400")
+        assert raw(address, b"POST /threads HTTP/1.1\r\ncontent-length: -3\r\n\r\n").startswith(b"HTTP/1.1 400")
+        assert raw(address, b"POST /threads HTTP/1.1\r\ncontent-length: 1000000\r\n\r\n").startswith(b"HTTP/1.1 413")
+        # 服务器在拒绝之后仍然正常工作。
+        assert raw(address, b"GET /healthz HTTP/1.1\r\nconnection: close\r\n\r\n").startswith(b"HTTP/1.1 200")
+    server.close()
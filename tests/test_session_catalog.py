@@ -0,0 +1,154 @@
+import asyncio
+import os
+import sqlite3
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+import pytest
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from src.chat.app import get_compiled_app
+from src.chat.async_app import async_chat_app
+from src.chat.fakes import FakeChatModel
+from src.chat.retention import CheckpointRetention
+from src.chat.session_catalog import EDIT_WINDOW, CatalogSqliteSaver, SessionCatalog
+
+
+def _say(chatapp, thread_id, text):
+    chatapp.invoke({"messages": [HumanMessage(content=text)]}, {"configurable": {"thread_id": thread_id}})
+
+
+def test_catalog_tracks_title_order_and_message_count(tmp_path):
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    _say(chatapp, "a", "北京今天的天气怎么样")
+    _say(chatapp, "b", "写一首诗")
+    _say(chatapp, "a", "明天呢")
+
+    catalog = chatapp.checkpointer.catalog
+    assert catalog.count() == 2
+    sessions = catalog.list()
+    # 最近更新的会话排在最前面；标题始终是第一条用户消息。
+    assert [s.thread_id for s in sessions] == ["a", "b"]
+    assert sessions[0].title == "北京今天的天气怎么样"
+    assert sessions[0].message_count == 4
+    assert sessions[0].created_at <= sessions[0].updated_at
+
+
+def test_catalog_pagination_and_search(tmp_path):
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    for i in range(5):
+        _say(chatapp, f"thread-{i}", f"问题 {i}")
+    catalog = chatapp.checkpointer.catalog
+
+    first, second, third = catalog.list(limit=2), catalog.list(limit=2, offset=2), catalog.list(limit=2, offset=4)
+    assert [s.thread_id for s in first + second + third] == [f"thread-{i}" for i in reversed(range(5))]
+    assert [s.thread_id for s in catalog.search("问题 3")] == ["thread-3"]
+    assert catalog.search("不存在") == []
+
+
+def test_catalog_backfills_existing_database(tmp_path):
+    db_path = str(tmp_path / "chat.sqlite")
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=db_path)
+    _say(chatapp, "old", "旧会话")
+    # 模拟升级前创建的数据库: 只有检查点，没有会话目录。
+    chatapp.checkpointer.conn.execute("DROP TABLE sessions")
+    chatapp.checkpointer.conn.commit()
+
+    saver = CatalogSqliteSaver(sqlite3.connect(db_path, check_same_thread=False))
+    saver.setup()
+    [session] = saver.catalog.list()
+    assert (session.thread_id, session.title, session.message_count) == ("old", "旧会话", 2)
+
+
+def test_catalog_follows_thread_deletion(tmp_path):
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    _say(chatapp, "a", "一")
+    _say(chatapp, "b", "二")
+
+    chatapp.checkpointer.delete_thread("a")
+    CheckpointRetention(chatapp.checkpointer.conn).delete_thread("b")
+    assert chatapp.checkpointer.catalog.count() == 0
+
+
+def test_async_app_updates_catalog(tmp_path):
+    db_path = str(tmp_path / "chat.sqlite")
+
+    async def run():
+        async with async_chat_app(llm=FakeChatModel(), db_path=db_path) as chatapp:
+            await chatapp.ainvoke({"messages": [HumanMessage(content="异步会话")]}, {"configurable": {"thread_id": "x"}})
+
+    asyncio.run(run())
+    catalog = SessionCatalog(sqlite3.connect(db_path))
+    [session] = catalog.list()
+    assert (session.thread_id, session.title) == ("x", "异步会话")
+
+
+def test_catalog_refreshes_forked_messages_with_same_count(tmp_path):
+    """测试从旧检查点分叉、消息数量不变时，目录中的消息同样被更新。"""
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    _say(chatapp, "a", "第一个问题")
+    _say(chatapp, "a", "第二个问题")
+    config = {"configurable": {"thread_id": "a"}}
+    [fork_point] = [s for s in chatapp.get_state_history(config) if len(s.values.get("messages", [])) == 2 and not s.next]
+
+    chatapp.update_state(fork_point.config, {"messages": [HumanMessage(content="改过的问题"), AIMessage(content="改过的回答")]})
+
+    catalog = chatapp.checkpointer.catalog
+    assert [m.content for _, m in catalog.messages("a")] == ["第一个问题", "回复: 第一个问题", "改过的问题", "改过的回答"]
+    assert catalog.get("a").message_count == 4
+
+
+def test_catalog_and_checkpoint_commit_together(tmp_path, monkeypatch):
+    """测试更新目录失败时，检查点也不会被提交。"""
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    _say(chatapp, "a", "一")
+    saver = chatapp.checkpointer
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("目录写入失败")
+
+    monkeypatch.setattr(saver.catalog, "record", broken)
+    with pytest.raises(RuntimeError):
+        _say(chatapp, "a", "二")
+    # 只有不含新消息的输入检查点被提交，最新状态里没有“二”。
+    messages = saver.get_tuple({"configurable": {"thread_id": "a"}}).checkpoint["channel_values"]["messages"]
+    assert [m.content for m in messages] == ["一", "回复: 一"]
+    monkeypatch.undo()
+    assert [m.content for _, m in saver.catalog.messages("a")] == ["一", "回复: 一"]
+
+
+def test_catalog_adds_digest_column_to_old_tables(tmp_path):
+    """测试升级前没有 digest 列的 session_messages 表会被自动迁移。"""
+    db_path = str(tmp_path / "chat.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE session_messages (thread_id TEXT NOT NULL, idx INTEGER NOT NULL, type TEXT, message BLOB, PRIMARY KEY (thread_id, idx))")
+    conn.commit()
+    conn.close()
+
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=db_path)
+    _say(chatapp, "a", "一")
+    assert [m.content for _, m in chatapp.checkpointer.catalog.messages("a")] == ["一", "回复: 一"]
+
+
+def test_record_serializes_only_new_messages_and_a_bounded_window(tmp_path, monkeypatch):
+    """测试每次写入序列化的消息数与历史长度无关: 只有新增的消息和末尾的 EDIT_WINDOW 条。"""
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    for i in range(30):
+        _say(chatapp, "a", f"问题 {i}")
+    catalog = chatapp.checkpointer.catalog
+    dumped = []
+    dumps_typed = catalog.serde.dumps_typed
+
+    def counting(obj):
+        if isinstance(obj, BaseMessage):
+            dumped.append(obj)
+        return dumps_typed(obj)
+
+    monkeypatch.setattr(catalog.serde, "dumps_typed", counting)
+    _say(chatapp, "a", "最后一个问题")
+    # 本轮写入了两次目录（用户消息、回复），每次至多 EDIT_WINDOW 条旧消息加上新增的一条。
+    assert 0 < len(dumped) <= 2 * (EDIT_WINDOW + 1)
+    assert catalog.get("a").message_count == 62
+    assert [m.content for _, m in catalog.messages("a", limit=2)] == ["最后一个问题", "回复: 最后一个问题"]
@@ -0,0 +1,78 @@
+import os
+from collections import Counter
+
+import pytest
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage
+
+from src.chat.fakes import FakeChatModel
+from src.chat.history import HistoryPager
+from src.chat.main import get_all_sessions, get_session_history
+from src.chat.sharding import ShardedRuntime, shard_db_path, shard_index
+
+
+@pytest.fixture(scope="module")
+def runtime(tmp_path_factory):
+    # 启动工作进程需要几秒，整个模块共用一个运行时。
+    db_path = str(tmp_path_factory.mktemp("shards") / "chat.sqlite")
+    llm = FakeChatModel(responses=[AIMessage(content="好的")])
+    with ShardedRuntime(shards=3, db_path=db_path, app_options={"llm": llm}, threads_per_shard=4) as runtime:
+        yield runtime
+
+
+def test_shard_index_is_stable_and_spreads_threads():
+    assert shard_index("thread-1", 4) == shard_index("thread-1", 4)
+    counts = Counter(shard_index(f"thread-{i}", 4) for i in range(1000))
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 200
+    assert shard_db_path("data/chat_history.sqlite", 2) == "data/chat_history.shard2.sqlite"
+
+
+def test_threads_live_on_their_own_shard(runtime):
+    threads = [f"route-{i}" for i in range(12)]
+    futures = [runtime.submit("invoke", thread_id, "你好") for thread_id in threads]
+    assert [f.result() for f in futures] == ["好的"] * 12
+
+    for index in range(runtime.shards):
+        on_shard = {s.thread_id for s in runtime.submit_to(index, "list", 100, 0).result()}
+        assert {t for t in threads if shard_index(t, runtime.shards) == index} <= on_shard
+        assert all(shard_index(t, runtime.shards) == index for t in on_shard)
+    for index in range(runtime.shards):
+        assert os.path.exists(shard_db_path(runtime.db_path, index))
+
+
+def test_session_list_and_history_are_shard_aware(runtime):
+    threads = [f"list-{i}" for i in range(7)]
+    for thread_id in threads:
+        runtime.invoke(thread_id, f"问题 {thread_id}")
+    runtime.invoke("list-0", "第二个问题")
+
+    # 跨分片归并后仍然是全局的最后更新时间倒序，并且分页之间不重不漏。
+    catalog = runtime.catalog
+    everything = get_all_sessions(limit=100, catalog=catalog)
+    assert [s.updated_at for s in everything] == sorted((s.updated_at for s in everything), reverse=True)
+    assert everything[0].thread_id == "list-0"
+    pages = [s.thread_id for offset in range(0, len(everything), 3) for s in get_all_sessions(limit=3, offset=offset, catalog=catalog)]
+    assert pages == [s.thread_id for s in everything]
+    assert catalog.count() == len(everything)
+    assert {s.thread_id for s in get_all_sessions(query="list-", limit=100, catalog=catalog)} == set(threads)
+
+    pager = get_session_history("list-0", catalog, page_size=2)
+    assert isinstance(pager, HistoryPager)
+    assert [m.content for m in pager.latest()] == ["第二个问题", "好的"]
+    assert [m.content for m in pager.older()] == ["问题 list-0", "好的"]
+    assert not pager.has_more
+    assert catalog.get("list-0").message_count == 4
+
+    catalog.delete("list-0")
+    assert catalog.get("list-0") is None
+    assert catalog.messages("list-0") == []
+
+
+def test_errors_in_workers_are_raised_to_the_caller(runtime):
+    with pytest.raises(AttributeError):
+        runtime.submit("no_such_op", "t1").result(timeout=10)
@@ -0,0 +1,197 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.chat.app import get_compiled_app
+from src.chat.cache import CachedSearch
+from src.chat.fakes import FakeChatModel, FakeSearchBackend
+from src.chat.singleflight import SingleFlight
+
+N = 100
+
+
+def _concurrently(fn, n=N):
+    """用 n 个线程同时调用 fn(i)，返回按 i 排列的结果或异常。"""
+    barrier = threading.Barrier(n)
+
+    def run(i):
+        barrier.wait()
+        try:
+            return fn(i)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        return list(executor.map(run, range(n)))
+
+
+def test_concurrent_identical_sync_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    backend = FakeSearchBackend(latency=0.2)
+
+    results = _concurrently(lambda i: flight.do("q", backend, "热门问题"))
+    assert backend.calls == 1
+    assert all(r is results[0] for r in results)
+    assert (flight.stats.leaders, flight.stats.followers) == (1, N - 1)
+    assert len(flight) == 0
+
+    # 请求结束后键被释放，之后的调用会重新执行。
+    flight.do("q", backend, "热门问题")
+    assert backend.calls == 2
+
+
+def test_errors_are_propagated_to_every_waiter():
+    flight = SingleFlight()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.2)
+        raise ConnectionError("上游不可用")
+
+    results = _concurrently(lambda i: flight.do("q", failing))
+    assert len(calls) == 1
+    assert all(isinstance(r, ConnectionError) for r in results)
+    assert len(flight) == 0
+
+
+def test_concurrent_identical_async_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    backend = FakeSearchBackend(latency=0.1)
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("q", backend.ainvoke, "热门问题") for _ in range(N)))
+
+    results = asyncio.run(run())
+    assert backend.calls == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_async_errors_propagate_and_cancelled_waiter_does_not_cancel_the_call():
+    flight = SingleFlight()
+    backend = FakeSearchBackend(latency=0.1)
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise ValueError("坏请求")
+
+    async def run():
+        errors = await asyncio.gather(*(flight.ado("bad", failing) for _ in range(10)), return_exceptions=True)
+        # 第一个调用方（leader）被取消后，其他调用方仍然拿到结果。
+        leader = asyncio.ensure_future(flight.ado("q", backend.ainvoke, "热门问题"))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.ado("q", backend.ainvoke, "热门问题")) for _ in range(5)]
+        leader.cancel()
+        return errors, leader, await asyncio.gather(*followers)
+
+    errors, leader, results = asyncio.run(run())
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert leader.cancelled()
+    assert backend.calls == 1 and len(results) == 5
+
+
+
+def test_cancelled_request_is_retried_by_a_follower_instead_of_cancelling_them():
+    """测试 leader 的请求被取消时，follower 不会收到 CancelledError，而是由其中一个重新执行。"""
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        if len(calls) == 1:
+            raise asyncio.CancelledError()  # 相当于请求任务被取消
+        return "结果"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.ado("q", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.ado("q", fetch)) for _ in range(5)]
+        results = await asyncio.gather(*followers)
+        return await asyncio.gather(leader, return_exceptions=True), results
+
+    (leader_result,), results = asyncio.run(run())
+    assert isinstance(leader_result, asyncio.CancelledError)
+    # 重新加入后只有一个调用方成为新的 leader，其余的共享它的结果。
+    assert results == ["结果"] * 5
+    assert len(calls) == 2 and len(flight) == 0
+
+
+def test_sync_leader_cancellation_is_not_propagated_to_followers():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        if len(calls) == 1:
+            raise asyncio.CancelledError()
+        return "结果"
+
+    def call(i):
+        try:
+            return flight.do("q", fetch)
+        except asyncio.CancelledError as e:
+            return e
+
+    results = _concurrently(call, n=10)
+    # 只有 leader 自己看到取消；其余 9 个调用方由新的 leader 再执行一次并共享结果。
+    assert len(calls) == 2
+    assert results.count("结果") == 9
+    assert sum(isinstance(r, asyncio.CancelledError) for r in results) == 1
+
+def test_sync_and_async_callers_are_coalesced_together():
+    flight = SingleFlight()
+    backend = FakeSearchBackend(latency=0.2)
+
+    async def run():
+        sync_caller = asyncio.to_thread(flight.do, "q", backend, "热门问题")
+        await asyncio.sleep(0.05)
+        return await asyncio.gather(sync_caller, *(flight.ado("q", backend.ainvoke, "热门问题") for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert backend.calls == 1 and len(results) == 11
+
+
+def test_cached_search_coalesces_concurrent_misses():
+    backend = FakeSearchBackend(latency=0.2)
+    search = CachedSearch(backend)
+
+    results = _concurrently(lambda i: search(" 热门问题 " if i % 2 else "热门问题"))
+    assert backend.calls == 1
+    assert all(r == results[0] for r in results)
+    # 之后的调用命中缓存。
+    search("热门问题")
+    assert backend.calls == 1
+
+
+def test_agent_node_coalesces_identical_llm_requests(tmp_path):
+    llm = FakeChatModel(responses=[AIMessage(content="今天的热门答案")], latency=0.3)
+    chatapp = get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"), llm_singleflight=SingleFlight())
+
+    def ask(i):
+        state = chatapp.invoke({"messages": [HumanMessage(content="今天的热门话题是什么?")]}, {"configurable": {"thread_id": f"s{i}"}})
+        return state["messages"][-1]
+
+    replies = _concurrently(ask)
+    assert llm.calls == 1
+    assert {r.content for r in replies} == {"今天的热门答案"}
+    # 每个会话拿到自己的消息副本。
+    assert len({id(r) for r in replies}) == N
+    chatapp.checkpointer.close()
+
+
+def test_different_requests_are_not_coalesced(tmp_path):
+    llm = FakeChatModel(responses=[AIMessage(content="答")], latency=0.1)
+    chatapp = get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"), llm_singleflight=SingleFlight())
+    _concurrently(lambda i: chatapp.invoke({"messages": [HumanMessage(content=f"问题 {i % 3}")]}, {"configurable": {"thread_id": f"d{i}"}}), n=9)
+    assert llm.calls == 3
+    chatapp.checkpointer.close()
@@ -0,0 +1,63 @@
+import io
+import os
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.chat.app import cached_search, get_compiled_app
+from src.chat.fakes import FakeChatModel, FakeSearchBackend
+from src.chat.streaming import final_reply, iter_new_messages, stream_reply
+
+
+def test_stream_reply_prints_tokens_and_tool_activity(tmp_path):
+    """测试流式输出会逐 token 打印回复，并在中途显示工具调用。"""
+    llm = FakeChatModel(responses=[
+        AIMessage(content="", tool_calls=[{"name": "search_tool", "args": {"query": "LangGraph"}, "id": "call-1"}]),
+        AIMessage(content="LangGraph 是一个库"),
+    ])
+    chatapp = get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"))
+    config = {"configurable": {"thread_id": "t1"}}
+    out = io.StringIO()
+
+    with patch.object(cached_search, "backend", FakeSearchBackend()):
+        stats = stream_reply(chatapp, {"messages": [HumanMessage(content="什么是 LangGraph")]}, config, out=out)
+
+    printed = out.getvalue()
+    assert "[调用工具: search_tool]" in printed
+    assert "[工具 search_tool 已返回结果]" in printed
+    assert printed.rstrip().endswith("LangGraph 是一个库")
+    assert stats.reply == "LangGraph 是一个库"
+    assert stats.tokens == len("LangGraph 是一个库")
+    assert stats.tool_calls == ["search_tool"]
+
+
+def test_time_to_first_token_is_shorter_than_total_latency(tmp_path):
+    """测试首字延迟只包含首个 token 之前的等待，而不是整段回复的生成时间。"""
+    llm = FakeChatModel(responses=[AIMessage(content="一二三四五六七八九十")], latency=0.05, token_latency=0.02)
+    chatapp = get_compiled_app(llm=llm, db_path=str(tmp_path / "chat.sqlite"))
+    config = {"configurable": {"thread_id": "t1"}}
+
+    stats = stream_reply(chatapp, {"messages": [HumanMessage(content="数数")]}, config, out=io.StringIO())
+
+    assert stats.time_to_first_token is not None
+    assert stats.total_latency - stats.time_to_first_token >= 9 * 0.02 * 0.9
+
+
+def test_final_reply_only_sees_new_messages(tmp_path):
+    """测试增量消费只处理本轮新增的消息，与已有历史的长度无关。"""
+    chatapp = get_compiled_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"))
+    config = {"configurable": {"thread_id": "t1"}}
+    history = [HumanMessage(content=f"问题 {i}") for i in range(500)]
+    chatapp.update_state(config, {"messages": history}, as_node="agent")
+
+    seen = []
+    for update in chatapp.stream({"messages": [HumanMessage(content="你好")]}, config, stream_mode="updates"):
+        seen.extend(iter_new_messages(update))
+
+    assert [m.content for m in seen] == ["回复: 你好"]
+    assert final_reply(chatapp, {"messages": [HumanMessage(content="再见")]}, config).content == "回复: 再见"
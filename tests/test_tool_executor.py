@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from src.chat.tool_executor import ParallelToolNode
+from src.chat.tracing import Metrics
+
+
+@tool
+def slow_echo(text: str, delay: float) -> str:
+    """等待 delay 秒后返回 text。"""
+    time.sleep(delay)
+    return text
+
+
+@tool
+async def aslow_echo(text: str, delay: float) -> str:
+    """异步等待 delay 秒后返回 text。"""
+    await asyncio.sleep(delay)
+    return text
+
+
+@tool
+def broken(text: str) -> str:
+    """总是抛出异常。"""
+    raise RuntimeError("坏了")
+
+
+def _state(*calls):
+    tool_calls = [{"name": name, "args": args, "id": f"call-{i}"} for i, (name, args) in enumerate(calls)]
+    return {"messages": [AIMessage(content="", tool_calls=tool_calls)]}
+
+
+def test_sync_calls_run_concurrently_in_original_order():
+    """测试多个工具调用并发执行，且结果顺序与 tool_calls 顺序一致。"""
+    node = ParallelToolNode([slow_echo])
+    state = _state(*[("slow_echo", {"text": f"t{i}", "delay": 0.3 - i * 0.1}) for i in range(3)])
+
+    start = time.perf_counter()
+    messages = node.invoke(state)["messages"]
+    elapsed = time.perf_counter() - start
+
+    assert [m.content for m in messages] == ["t0", "t1", "t2"]
+    assert [m.tool_call_id for m in messages] == ["call-0", "call-1", "call-2"]
+    assert elapsed < 0.5
+
+
+def test_per_tool_timeout_returns_error_message():
+    """测试超时的调用返回错误消息，其他调用正常返回。"""
+    node = ParallelToolNode([slow_echo, broken], timeouts={"slow_echo": 0.1})
+    state = _state(("slow_echo", {"text": "慢", "delay": 1.0}), ("broken", {"text": "x"}))
+
+    start = time.perf_counter()
+    messages = node.invoke(state)["messages"]
+
+    assert time.perf_counter() - start < 0.5
+    assert messages[0].status == "error" and "超时" in messages[0].content
+    assert messages[1].status == "error" and "坏了" in messages[1].content
+
+
+def test_cancel_remaining_policy_cancels_other_async_calls():
+    """测试 cancel_remaining 策略: 一个调用失败后，其余未完成的异步调用被取消。"""
+    node = ParallelToolNode([aslow_echo, broken], cancel_policy="cancel_remaining")
+    state = _state(("aslow_echo", {"text": "慢", "delay": 1.0}), ("broken", {"text": "x"}), ("aslow_echo", {"text": "快", "delay": 0}))
+
+    start = time.perf_counter()
+    messages = asyncio.run(node.ainvoke(state))["messages"]
+
+    assert time.perf_counter() - start < 0.5
+    assert "已被取消" in messages[0].content
+    assert "坏了" in messages[1].content
+    assert messages[2].content == "快"
+
+
+def test_async_calls_run_concurrently_with_timeout():
+    node = ParallelToolNode([aslow_echo], timeout=0.2)
+    state = _state(("aslow_echo", {"text": "a", "delay": 0.1}), ("aslow_echo", {"text": "b", "delay": 5}))
+
+    start = time.perf_counter()
+    messages = asyncio.run(node.ainvoke(state))["messages"]
+
+    assert time.perf_counter() - start < 0.5
+    assert messages[0].content == "a"
+    assert "超时" in messages[1].content
+
+
+def test_unknown_tool_returns_error_message():
+    messages = ParallelToolNode([slow_echo]).invoke(_state(("missing", {})))["messages"]
+    assert messages[0].status == "error"
+
+
+def test_deadline_starts_when_call_runs_not_when_queued():
+    """测试排在 max_workers 之后的调用在开始运行后才计算超时，不会因为排队而“超时”。"""
+    node = ParallelToolNode([slow_echo], timeout=0.3, max_workers=2)
+    state = _state(*[("slow_echo", {"text": f"t{i}", "delay": 0.2}) for i in range(4)])
+
+    messages = node.invoke(state)["messages"]
+
+    assert [m.content for m in messages] == ["t0", "t1", "t2", "t3"]
+    assert node.stats()["timeouts"] == 0
+
+
+def test_abandoned_threads_do_not_starve_later_calls():
+    """测试一批卡住的工具超时后，下一批调用仍然立即运行，被放弃的线程被统计并在结束后释放。"""
+    metrics = Metrics()
+    node = ParallelToolNode([slow_echo], timeout=0.1, max_workers=2, metrics=metrics)
+    hung = _state(*[("slow_echo", {"text": "卡住", "delay": 0.6}) for _ in range(2)])
+
+    assert all("超时" in m.content for m in node.invoke(hung)["messages"])
+    stats = node.stats()
+    assert (stats["timeouts"], stats["abandoned"], stats["saturated"]) == (2, 2, True)
+    assert metrics.value("chat_tool_abandoned_threads", node="tools") == 2
+    assert metrics.value("chat_tool_timeouts_total", tool="slow_echo") == 2
+
+    start = time.perf_counter()
+    messages = node.invoke(_state(("slow_echo", {"text": "快", "delay": 0.05})))["messages"]
+    assert messages[0].content == "快"
+    assert time.perf_counter() - start < 0.3
+
+    time.sleep(0.7)
+    assert node.stats()["abandoned"] == 0 and node.stats()["abandoned_total"] == 2
+    assert metrics.value("chat_tool_abandoned_threads", node="tools") == 0
@@ -0,0 +1,193 @@
+import asyncio
+import functools
+import json
+import os
+import statistics
+import time
+import urllib.request
+from unittest.mock import patch
+
+# 在导入 app 模块之前设置环境变量
+os.environ.setdefault("DEEPSEEK_API_KEY", "test_key")
+os.environ.setdefault("TAVILY_API_KEY", "test_key")
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+
+from src.chat.app import cached_search, get_compiled_app
+from src.chat.async_app import async_chat_app
+from src.chat.checkpointer import PooledCatalogSqliteSaver
+from src.chat.fakes import FakeChatModel, FakeSearchBackend, ToolCallingFakeChatModel
+from src.chat.session_catalog import CatalogSqliteSaver
+from src.chat.tracing import JsonlExporter, LocalTracer, Metrics, MetricsServer
+
+
+def _scripted_llm():
+    # 使用独立的查询，避免命中其他测试留在进程内搜索缓存中的结果。
+    usage = {"input_tokens": 12, "output_tokens": 3, "total_tokens": 15}
+    return FakeChatModel(responses=[
+        AIMessage(content="", tool_calls=[{"name": "search_tool", "args": {"query": "tracing-test LangGraph"}, "id": "call-1"}], usage_metadata=usage),
+        AIMessage(content="LangGraph 是一个库", usage_metadata=usage),
+    ])
+
+
+def test_trace_records_nodes_tokens_tools_and_checkpoints(tmp_path):
+    tracer = LocalTracer(str(tmp_path / "traces" / "chat.jsonl"))
+    with patch.object(cached_search, "backend", FakeSearchBackend(latency=0.01)):
+        chatapp = get_compiled_app(llm=_scripted_llm(), db_path=str(tmp_path / "chat.sqlite"), tracer=tracer)
+        chatapp.invoke({"messages": [HumanMessage(content="什么是 LangGraph?")]}, {"configurable": {"thread_id": "t1"}})
+    tracer.flush()
+    tracer.close()
+
+    lines = (tmp_path / "traces" / "chat.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    trace = json.loads(lines[0])
+    assert trace["thread_id"] == "t1" and trace["status"] == "ok"
+    assert [(n["node"], n["step"]) for n in trace["nodes"]] == [("agent", 1), ("tools", 2), ("agent", 3)]
+    assert trace["llm"]["calls"] == 2
+    assert (trace["llm"]["input_tokens"], trace["llm"]["output_tokens"]) == (24, 6)
+    assert [t["name"] for t in trace["tools"]] == ["search_tool"]
+    assert trace["tools"][0]["ms"] >= 10
+    assert trace["checkpoint"]["writes"] > 0
+    assert trace["duration_ms"] >= sum(n["ms"] for n in trace["nodes"])
+
+    metrics = tracer.metrics
+    assert metrics.value("chat_runs_total", status="ok") == 1
+    assert metrics.value("chat_node_duration_seconds", node="agent") == 2
+    assert metrics.value("chat_llm_tokens_total", model="FakeChatModel", type="input") == 24
+    assert metrics.value("chat_tool_duration_seconds", tool="search_tool") == 1
+    assert metrics.value("chat_checkpoint_write_duration_seconds", op="put") > 0
+
+
+
+def test_instrumenting_a_shared_saver_twice_does_not_double_count(tmp_path):
+    saver = PooledCatalogSqliteSaver(str(tmp_path / "chat.sqlite"))
+    first, second = LocalTracer(), LocalTracer()
+    config = {"configurable": {"thread_id": "t1"}}
+    get_compiled_app(llm=FakeChatModel(), checkpointer=saver, tracer=first)
+    chatapp = get_compiled_app(llm=FakeChatModel(), checkpointer=saver, tracer=second)
+    # 同一个追踪器再包装一次也不会叠加。
+    second.instrument(saver)
+    chatapp.invoke({"messages": [HumanMessage(content="你好")]}, config)
+
+    puts = len(list(saver.list(config)))
+    assert second.metrics.value("chat_checkpoint_write_duration_seconds", op="put") == puts
+    assert first.metrics.value("chat_checkpoint_write_duration_seconds", op="put") == 0
+    saver.close()
+
+
+def test_write_behind_records_the_real_write_not_the_enqueue(tmp_path):
+    saver = PooledCatalogSqliteSaver(str(tmp_path / "chat.sqlite"), write_behind=True)
+    tracer = LocalTracer()
+    chatapp = get_compiled_app(llm=FakeChatModel(), checkpointer=saver, tracer=tracer)
+    config = {"configurable": {"thread_id": "t1"}}
+    slow_put = CatalogSqliteSaver.put
+
+    @functools.wraps(slow_put)
+    def put(self, *args, **kwargs):
+        time.sleep(0.03)
+        return slow_put(self, *args, **kwargs)
+
+    with patch.object(CatalogSqliteSaver, "put", put):
+        chatapp.invoke({"messages": [HumanMessage(content="你好")]}, config)
+        saver.flush()
+
+    # 计时的是后台写线程中的写入: 每次 put 都至少 30ms，而入队只需要微秒级。
+    metrics = tracer.metrics
+    puts = len(list(saver.list(config)))
+    assert metrics.value("chat_checkpoint_write_duration_seconds", op="put") == puts
+    assert metrics._histograms[("chat_checkpoint_write_duration_seconds", (("op", "put"),))][-2] >= 0.03 * puts
+    saver.close()
+
+def test_async_app_is_traced(tmp_path):
+    tracer = LocalTracer()
+
+    async def run():
+        async with async_chat_app(llm=FakeChatModel(), db_path=str(tmp_path / "chat.sqlite"), tracer=tracer) as chatapp:
+            await chatapp.ainvoke({"messages": [HumanMessage(content="你好")]}, {"configurable": {"thread_id": "a1"}})
+
+    asyncio.run(run())
+    trace = tracer.last_trace
+    assert trace["thread_id"] == "a1"
+    assert [n["node"] for n in trace["nodes"]] == ["agent"]
+    assert trace["checkpoint"]["writes"] > 0
+
+
+
+@tool
+async def stuck_search(query: str) -> str:
+    """一直等不到结果的搜索。"""
+    await asyncio.sleep(5)
+    return query
+
+
+def test_async_app_exports_tool_metrics(tmp_path):
+    """测试异步应用与同步应用一样把追踪器的指标传给工具节点，超时的调用会被计数。"""
+    tracer = LocalTracer()
+    llm = ToolCallingFakeChatModel(tool_name="stuck_search")
+
+    async def run():
+        async with async_chat_app(
+            llm=llm, db_path=str(tmp_path / "chat.sqlite"), tools=[stuck_search], tool_timeout=0.05, tracer=tracer
+        ) as chatapp:
+            await chatapp.ainvoke({"messages": [HumanMessage(content="你好")]}, {"configurable": {"thread_id": "a1"}})
+
+    asyncio.run(run())
+    metrics = tracer.metrics
+    assert metrics.value("chat_tool_timeouts_total", tool="stuck_search") == 1
+    assert metrics.value("chat_node_duration_seconds", node="tools") == 1
+
+def test_jsonl_exporter_rotates(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    exporter = JsonlExporter(str(path), max_bytes=1000, backups=2)
+    for i in range(100):
+        exporter.export({"run_id": i, "payload": "x" * 50})
+    exporter.close()
+
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == ["chat.jsonl", "chat.jsonl.1", "chat.jsonl.2"]
+    assert all(p.stat().st_size <= 1000 for p in tmp_path.iterdir())
+    # 最新的记录在当前文件的末尾。
+    assert json.loads(path.read_text(encoding="utf-8").splitlines()[-1])["run_id"] == 99
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    metrics = Metrics(buckets=(0.01, 0.1))
+    metrics.observe("chat_node_duration_seconds", 0.05, node="agent")
+    metrics.inc("chat_llm_tokens_total", 7, model="m", type="output")
+    server = MetricsServer(metrics, port=0).start()
+    try:
+        body = urllib.request.urlopen(server.url, timeout=5).read().decode()
+    finally:
+        server.close()
+
+    assert "# TYPE chat_node_duration_seconds histogram" in body
+    assert 'chat_node_duration_seconds_bucket{node="agent",le="0.01"} 0' in body
+    assert 'chat_node_duration_seconds_bucket{node="agent",le="0.1"} 1' in body
+    assert 'chat_node_duration_seconds_bucket{node="agent",le="+Inf"} 1' in body
+    assert 'chat_node_duration_seconds_count{node="agent"} 1' in body
+    assert 'chat_llm_tokens_total{model="m",type="output"} 7' in body
+
+
+def test_tracing_overhead_is_small(tmp_path, capsys):
+    tracer = LocalTracer(str(tmp_path / "chat.jsonl"))
+    with patch.object(cached_search, "backend", FakeSearchBackend()):
+        plain = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=str(tmp_path / "plain.sqlite"))
+        traced = get_compiled_app(llm=ToolCallingFakeChatModel(), db_path=str(tmp_path / "traced.sqlite"), tracer=tracer)
+
+        def per_invoke(app, tag, n=30):
+            begin = time.perf_counter()
+            for i in range(n):
+                app.invoke({"messages": [HumanMessage(content=f"{tag} {i}")]}, {"configurable": {"thread_id": f"{tag}-{i}"}})
+            return (time.perf_counter() - begin) / n
+
+        per_invoke(plain, "warm-plain", 5)
+        per_invoke(traced, "warm-traced", 5)
+        # 交替测量，减少机器负载波动的影响。
+        rounds = [(per_invoke(plain, f"p{r}"), per_invoke(traced, f"t{r}")) for r in range(3)]
+    tracer.close()
+
+    plain_s = statistics.median(p for p, _ in rounds)
+    traced_s = statistics.median(t for _, t in rounds)
+    # 即使 LLM 和搜索都是零延迟（最不利的情况），追踪的额外开销也只是一次调用的一小部分。
+    assert traced_s < plain_s * 1.3 + 0.002